@@ -174,6 +174,20 @@ class ControllerConfig(object):
       raise RuntimeError("No IP address resolved for controller %s!" % self.label)
     return address
 
+  def rebind(self, port, sync_port=None):
+    ''' Move this controller onto a fresh OpenFlow port (or, for Unix domain
+    sockets, a fresh socket path derived from port) and optionally a fresh
+    sync port. Used to run several replays of the same config side by side.
+    '''
+    if self.port is not None:
+      self.port = port
+      self._server_info = (self.address, port)
+    else:
+      self.address = "%s_%d" % (self.address, port)
+      self._server_info = self.address
+    if sync_port is not None and self.sync:
+      self.sync = re.sub(r":\d+$", ":%d" % sync_port, self.sync)
+
   @property
   def cid(self):
     ''' Return this controller's id '''
@@ -0,0 +1,121 @@
+#!/usr/bin/env python2.7
+#
+# Copyright 2011-2013 Colin Scott
+# Copyright 2011-2013 Andreas Wundsam
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import sys
+if sys.version_info < (2, 7):
+  raise RuntimeError('''Must use python 2.7 or greater. '''
+                     '''See http://www.python.org/download/releases/2.7.4/''')
+
+from sts.util.rpc_forker import RemoteWorker
+from sts.control_flow.mcs_finder import play_forward_job
+
+import os
+import signal
+import argparse
+import logging
+import logging.config
+
+description = """
+Run a worker that executes replays on behalf of a RemoteForker, e.g. the
+replays of an MCSFinder configured with forker=RemoteForker(). Replays write
+their results to the same paths as they would on the master, so workers on
+other machines should share the experiments/ directory with it.
+
+By default we only listen on the loopback interface. Accepting jobs from other
+machines requires --allow-remote and a secret shared with the RemoteForker.
+Example usage:
+
+$ %s -f mcs-master.example.com:7561 -s 4 -a 0.0.0.0 --allow-remote --secret-file ~/.sts_secret
+""" % (sys.argv[0])
+
+parser = argparse.ArgumentParser(formatter_class=argparse.RawDescriptionHelpFormatter,
+                                 description=description)
+
+parser.add_argument('-f', '--forker', required=True,
+                    help='''host:port of the RemoteForker to take jobs from''')
+
+parser.add_argument('-a', '--address', default="127.0.0.1",
+                    help='''address to listen for jobs on''')
+
+parser.add_argument('--allow-remote', dest="allow_remote", action="store_true",
+                    default=False,
+                    help='''allow listening on a non-loopback address. Requires '''
+                         '''--secret-file''')
+
+parser.add_argument('--secret-file', dest="secret_file", default=None,
+                    help='''file holding the secret shared with the RemoteForker''')
+
+parser.add_argument('-t', '--task', action="append", default=[],
+                    metavar="NAME=MODULE.FUNCTION",
+                    help='''also accept jobs for this task, in addition to '''
+                         '''MCSFinder's play_forward''')
+
+parser.add_argument('-p', '--port', type=int, default=None,
+                    help='''port to listen for jobs on (default: any free port)''')
+
+parser.add_argument('-A', '--advertised-address', dest="advertised_address",
+                    default=None,
+                    help='''address the RemoteForker should use to reach us '''
+                         '''(default: our fully qualified hostname)''')
+
+parser.add_argument('-s', '--slots', type=int, default=1,
+                    help='''maximum number of replays to run at the same time''')
+
+parser.add_argument('-v', '--verbose', action="count", default=0,
+                    help='''increase verbosity''')
+
+parser.add_argument('-L', '--log-config',
+                    metavar="FILE", dest="log_config",
+                    help='''choose a python log configuration file''')
+
+args = parser.parse_args()
+
+if args.log_config:
+  logging.config.fileConfig(args.log_config)
+else:
+  logging.basicConfig(level=logging.DEBUG if args.verbose else logging.INFO)
+
+secret = None
+if args.secret_file:
+  with open(args.secret_file) as f:
+    secret = f.read().strip()
+
+(forker_address, forker_port) = args.forker.rsplit(":", 1)
+worker = RemoteWorker(forker_address, int(forker_port), address=args.address,
+                      port=args.port, advertised_address=args.advertised_address,
+                      slots=args.slots, secret=secret,
+                      allow_remote=args.allow_remote)
+worker.register_task("play_forward", play_forward_job)
+for task in args.task:
+  (task_name, task_path) = task.split("=", 1)
+  (module_name, function_name) = task_path.rsplit(".", 1)
+  __import__(module_name)
+  worker.register_task(task_name, getattr(sys.modules[module_name], function_name))
+
+# Set an interrupt handler
+def handle_int(signal, frame):
+  sys.stderr.write("Caught signal %d, stopping replay worker (pid %d)\n" %
+                    (signal, os.getpid()))
+  # kill fork()ed replays
+  worker.kill_all()
+  sys.exit(13)
+
+signal.signal(signal.SIGINT, handle_int)
+signal.signal(signal.SIGTERM, handle_int)
+signal.signal(signal.SIGQUIT, handle_int)
+
+worker.serve_forever()
@@ -28,6 +28,7 @@ from sts.simulation_state import SimulationConfig
 import sts.experiments.setup as experiment_setup
 import sts.experiments.lifecycle as exp_lifecycle
 
+import os
 import signal
 import argparse
 import logging
@@ -44,9 +45,16 @@ parser = argparse.ArgumentParser(formatter_class=argparse.RawDescriptionHelpForm
                                  description=description)
 
 parser.add_argument('-c', '--config',
-                    default='config.fuzz_pox_fattree',
+                    default=None,
                     help='''experiment config module in the config/ '''
-                         '''subdirectory, e.g. config.fuzz_pox_mesh''')
+                         '''subdirectory, e.g. config.fuzz_pox_mesh '''
+                         '''(default: config.fuzz_pox_fattree)''')
+
+parser.add_argument('-r', '--resume', metavar="RESULTS_DIR",
+                    default=None,
+                    help='''resume the interrupted experiment in RESULTS_DIR, '''
+                         '''e.g. an MCS run. Unless -c is given, its '''
+                         '''orig_config.py is used as the config''')
 
 parser.add_argument('-v', '--verbose', action="count", default=0,
                     help='''increase verbosity''')
@@ -69,6 +77,12 @@ parser.add_argument('-p', '--publish', action="store_true", default=False,
 
 args = parser.parse_args()
 
+if args.config is None:
+  if args.resume is not None:
+    args.config = os.path.join(args.resume.rstrip("/"), "orig_config.py")
+  else:
+    args.config = 'config.fuzz_pox_fattree'
+
 # Allow configs to be specified as paths as well as module names
 if args.config.endswith('.py'):
   args.config = args.config[:-3].replace("/", ".")
@@ -94,7 +108,6 @@ else:
 
 # Set an interrupt handler
 def handle_int(signal, frame):
-  import os
   from sts.util.rpc_forker import LocalForker
   sys.stderr.write("Caught signal %d, stopping sdndebug (pid %d)\n" %
                     (signal, os.getpid()))
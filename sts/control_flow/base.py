@@ -16,7 +16,7 @@
 import logging
 import pox.lib.revent
 from pox.lib.revent import EventMixin
-from sts.replay_event import ControllerStateChange, PendingStateChange, DeterministicValue
+from sts.replay_event import ControllerStateChange, PendingStateChange, DeterministicValue, PendingDeterministicValue
 from sts.syncproto.base import SyncTime
 from sts.syncproto.sts_syncer import STSSyncCallback
 from sts.controller_manager import ControllerManager
@@ -53,9 +53,14 @@ class StateChange(pox.lib.revent.Event):
     super(StateChange, self).__init__()
     self.pending_state_change = pending_state_change
 
+class DeterministicValueRequest(pox.lib.revent.Event):
+  def __init__(self, pending_request):
+    super(DeterministicValueRequest, self).__init__()
+    self.pending_request = pending_request
+
 class ReplaySyncCallback(STSSyncCallback, EventMixin):
 
-  _eventMixin_events = set([StateChange])
+  _eventMixin_events = set([StateChange, DeterministicValueRequest])
 
   def __init__(self, get_interpolated_time=None):
     ''' If get_interpolated_time is None, will always wait on deterministic
@@ -160,6 +165,8 @@ class ReplaySyncCallback(STSSyncCallback, EventMixin):
     else:
       self.cid2deterministic_value[controller.cid] =\
           partial(controller.sync_connection.send_deterministic_value, xid)
+      self.raiseEvent(DeterministicValueRequest(
+                        PendingDeterministicValue(controller.cid)))
 
   def pending_deterministic_value_request(self, controller_id):
     return controller_id in self.cid2deterministic_value
@@ -15,6 +15,10 @@
 
 from sts.replay_event import *
 from sts.util.convenience import is_flow_mod
+from sts.openflow_buffer import PendingMessage
+from sts.control_flow.base import StateChange, DeterministicValueRequest
+from sts.control_flow.quiescence import QuiescenceDetector, default_grace_seconds
+from pox.openflow.software_switch import DpPacketOut
 import time
 from collections import Counter
 import operator
@@ -22,6 +26,9 @@ import logging
 
 log = logging.getLogger("event_scheduler")
 
+# Seconds before the first event that the replay starts
+default_initial_wait = 0.5
+
 def format_time(time):
   mins = int(time/60)
   secs = int(time % 60)
@@ -32,6 +39,9 @@ class EventSchedulerStats(object):
   def __init__(self):
     self.event2matched = Counter()
     self.event2timeouts = Counter()
+    # { internal event label -> seconds beyond its recorded gap that the event
+    #   took to proceed, or, if it timed out, TimeoutModel.censored_delay() }
+    self.arrival_delays = {}
     self.replay_start = None
     self.record_start = None
 
@@ -48,6 +58,13 @@ class EventSchedulerStats(object):
     # TODO(cs): maybe want more info than just class name? (e.g. fingerprint)
     self.event2matched[event.__class__.__name__] += 1
 
+  def event_arrived(self, event, delay_seconds):
+    self.arrival_delays[event.label] = delay_seconds
+
+  def event_arrival_censored(self, event, delay_seconds):
+    ''' event timed out; count it as having arrived after delay_seconds '''
+    self.arrival_delays[event.label] = delay_seconds
+
   def event_timed_out(self, event):
     msg.replay_event_timeout(self.time(event) + " Event timed out "+str(event))
     self.event2timeouts[event.__class__.__name__] += 1
@@ -133,14 +150,54 @@ class DumbEventScheduler(EventSchedulerBase):
 
 class EventScheduler(EventSchedulerBase):
   '''An EventWatcher schedules events. It controls their admission and
-  any post-event delay '''
+  any post-event delay
+
+  Events with a wakeup_key are not polled: the scheduler listens for pending
+  items published by the OpenFlowBuffer, the ReplaySyncCallback and the
+  BufferedPatchPanel, and only retries proceed() when the item the event is
+  blocked on has arrived. Other events are polled every
+  sleep_interval_seconds, as are all events if event_driven_wakeups is False.
+
+  If a timeout_model (see sts/control_flow/timeout_model.py) is given, it
+  sets the timeout of each internal event in place of epsilon_seconds.
+
+  If as_fast_as_possible is set, the recorded gap before each input event is
+  only an upper bound: the input is injected as soon as the simulation has
+  been quiescent for quiescence_grace_seconds.
+
+  If the simulation runs on a VirtualClock, the recorded gaps between events
+  are measured and skipped in virtual time: before each event the clock
+  jumps forward to (at least) when the event was recorded. The clock only
+  ever moves forward, so it should start at (or before) the recording's
+  first timestamp; see Replayer.clock_start_seconds.
+  '''
 
   kwargs = set(['speedup', 'delay_input_events', 'initial_wait',
-                'epsilon_seconds', 'sleep_interval_seconds'])
+                'epsilon_seconds', 'sleep_interval_seconds',
+                'event_driven_wakeups', 'as_fast_as_possible',
+                'quiescence_grace_seconds', 'timeout_model'])
+
+  # (attribute of the simulation, revent event class, function from an
+  #  instance of that event to the pending item it announces, the types of
+  #  wakeup_key it can wake)
+  publishers = [
+    ("openflow_buffer", PendingMessage, lambda e: e.pending_message,
+     (PendingReceive, PendingSend)),
+    ("controller_sync_callback", StateChange, lambda e: e.pending_state_change,
+     (PendingStateChange,)),
+    ("controller_sync_callback", DeterministicValueRequest,
+     lambda e: e.pending_request, (PendingDeterministicValue,)),
+    # BufferedPatchPanel monkey patches a (DPFingerprint, dpid, port_no)
+    # fingerprint onto the events it buffers
+    ("patch_panel", DpPacketOut, lambda e: e.fingerprint, (tuple,)),
+  ]
 
   def __init__(self, simulation, speedup=1.0, delay_input_events=True,
-               initial_wait=0.5, epsilon_seconds=0.5, sleep_interval_seconds=0.2,
-               assertion_checking=False, show_flow_tables=True):
+               initial_wait=default_initial_wait, epsilon_seconds=0.5, sleep_interval_seconds=0.2,
+               assertion_checking=False, show_flow_tables=True,
+               event_driven_wakeups=True, as_fast_as_possible=False,
+               quiescence_grace_seconds=default_grace_seconds,
+               timeout_model=None):
     super(EventScheduler, self).__init__()
     self.simulation = simulation
     self.speedup = speedup
@@ -154,11 +211,35 @@ class EventScheduler(EventSchedulerBase):
     self.stats = EventSchedulerStats()
     self.assertion_checking = assertion_checking
     self.show_flow_tables = show_flow_tables
+    self.event_driven_wakeups = event_driven_wakeups
+    # Types of wakeup_key that some publisher announces; None until we have
+    # subscribed
+    self._published_key_types = None
+    # The wakeup_key of the event we are blocked on, and whether an item
+    # equal to it has been published since proceed() last ran
+    self._wakeup_key = None
+    self._woken = False
+    self.timeout_model = timeout_model
+    self.quiescence = None
+    if as_fast_as_possible:
+      self.quiescence = QuiescenceDetector(simulation, quiescence_grace_seconds)
+    self.clock = getattr(simulation, "clock", None)
+
+  def _now(self):
+    ''' Where we are on the replay's timeline: virtual time if we have a
+    clock, else real time '''
+    if self.clock is not None:
+      return self.clock.now()
+    return time.time()
 
   def schedule(self, event):
     if not self.started:
       self.stats.start_replay(event)
       self.started = True
+      if self.clock is not None:
+        # Catch up with the recording if the clock started before it.
+        # (initial_wait brings the clock up to the event's recorded time)
+        self.clock.advance_to(event.time.as_float() - self.initial_wait)
 
     if isinstance(event, InputEvent):
       self.inject_input(event)
@@ -174,7 +255,17 @@ class EventScheduler(EventSchedulerBase):
         log.debug("Delaying input_event %s for %.0f ms" %
             ( str(event).replace("\n", "") , (wait_time_seconds) * 1000 ))
 
-        self.simulation.io_master.sleep(wait_time_seconds)
+        if self.quiescence is not None:
+          self.quiescence.wait(wait_time_seconds)
+          if self.clock is not None:
+            self.clock.advance(wait_time_seconds)
+        else:
+          # (With a clock, this skips over the wait rather than sleeping)
+          self.simulation.io_master.sleep(wait_time_seconds)
+      elif self.clock is not None:
+        # Don't let the clock fall behind the recording by the gaps too
+        # short to wait out
+        self.clock.advance(wait_time_seconds)
     log.debug("Injecting %r", event)
     # TODO(cs): AFACT, this is essentially a dummy variable? Since event.time
     # is in the past... Andi, can you verify this?
@@ -183,9 +274,18 @@ class EventScheduler(EventSchedulerBase):
 
   def wait_for_internal(self, event):
     wait_time_seconds = self.wait_time(event)
+    if self.clock is not None:
+      # The event may be waiting on a timer (e.g. a flow expiring), so jump
+      # to when it was recorded rather than waiting for it in real time
+      self.clock.advance(wait_time_seconds)
+      wait_time_seconds = 0
     start = time.time()
     # TODO(cs): why - 0.01?
-    end = start + wait_time_seconds - 0.01 + self.epsilon_seconds
+    default_timeout = wait_time_seconds - 0.01 + self.epsilon_seconds
+    timeout = default_timeout
+    if self.timeout_model is not None:
+      timeout = self.timeout_model.timeout(event, wait_time_seconds, default_timeout)
+    end = start + timeout
     if event.timeout_disallowed:
       # Reaallllly far in the future
       end = 30000000000 # Fri, 30 Aug 2920 05:20:00 GMT
@@ -193,19 +293,43 @@ class EventScheduler(EventSchedulerBase):
                 ( repr(event).replace("\n", "")))
     else:
       log.debug("Waiting for %s (maximum wait time: %.0f ms)" %
-            ( repr(event).replace("\n", ""), self.epsilon_seconds * 1000) )
+            ( repr(event).replace("\n", ""), timeout * 1000) )
     self._poll_event(event, end)
+    # The model learns how long events take beyond their gap, since other
+    # events with the same fingerprint may have been recorded with other gaps
+    if not event.timed_out:
+      self.stats.event_arrived(event, time.time() - start - wait_time_seconds)
+    elif self.timeout_model is not None and not event.timeout_disallowed:
+      self.stats.event_arrival_censored(event,
+          self.timeout_model.censored_delay(timeout - wait_time_seconds,
+                                            default_timeout - wait_time_seconds))
+
+  def _subscribe(self):
+    ''' Listen for pending items from every publisher the simulation has.
+    Returns the types of wakeup_key that we will be woken for. '''
+    if self._published_key_types is not None:
+      return self._published_key_types
+    self._published_key_types = set()
+    for (attr, event_type, get_key, key_types) in self.publishers:
+      publisher = getattr(self.simulation, attr, None)
+      # e.g. a RecordingSyncCallback, or an unbuffered PatchPanel
+      if event_type not in getattr(publisher, "_eventMixin_events", ()):
+        continue
+      def handler(event, get_key=get_key):
+        if self._wakeup_key is not None and get_key(event) == self._wakeup_key:
+          self._woken = True
+      publisher.addListener(event_type, handler)
+      self._published_key_types.update(key_types)
+    return self._published_key_types
 
   def _poll_event(self, event, end_time):
-    proceed = False
-    while True:
-      now = time.time()
-      if event.proceed(self.simulation):
-        proceed = True
-        break
-      elif now > end_time:
-        break
-      self.simulation.io_master.select(self.sleep_interval_seconds)
+    wakeup_key = None
+    if self.event_driven_wakeups:
+      wakeup_key = event.wakeup_key
+    if wakeup_key is not None and type(wakeup_key) in self._subscribe():
+      proceed = self._wait_for_wakeup(event, wakeup_key, end_time)
+    else:
+      proceed = self._poll(event, end_time)
     if proceed:
       event.timed_out = False
       self.stats.event_matched(event)
@@ -221,9 +345,40 @@ class EventScheduler(EventSchedulerBase):
       self.stats.event_timed_out(event)
     event.replay_time = SyncTime.now()
 
+  def _poll(self, event, end_time):
+    while True:
+      now = time.time()
+      if event.proceed(self.simulation):
+        return True
+      elif now > end_time:
+        return False
+      self.simulation.io_master.select(self.sleep_interval_seconds)
+
+  def _wait_for_wakeup(self, event, wakeup_key, end_time):
+    ''' Like _poll, but only retry proceed() once an item equal to wakeup_key
+    has been published. The item may already be pending, so always try
+    once up front. '''
+    self._wakeup_key = wakeup_key
+    self._woken = True
+    try:
+      while True:
+        now = time.time()
+        if self._woken:
+          self._woken = False
+          if event.proceed(self.simulation):
+            return True
+        if now > end_time:
+          return False
+        # Publishers run from within select(), which returns as soon as they
+        # have been handled
+        self.simulation.io_master.select(min(self.sleep_interval_seconds,
+                                             end_time - now))
+    finally:
+      self._wakeup_key = None
+
   def update_event_time(self, event):
     """ update our bearing on where we currently our in the timeline """
-    self.last_real_time = time.time()
+    self.last_real_time = self._now()
     self.last_rec_time = event.time
 
   def wait_time(self, event):
@@ -232,7 +387,7 @@ class EventScheduler(EventSchedulerBase):
       return self.initial_wait
 
     rec_delta = (event.time.as_float() - self.last_rec_time.as_float()) / self.speedup
-    real_delta = time.time() - self.last_real_time
+    real_delta = self._now() - self.last_real_time
 
     to_wait = rec_delta - real_delta
     if self.assertion_checking and to_wait > 10000:
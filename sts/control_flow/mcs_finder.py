@@ -21,15 +21,18 @@ find the minimal causal sequence (MCS) of a failure.
 '''
 
 from sts.util.console import msg, color, Tee
-from sts.util.convenience import timestamp_string, ExitCode, create_clean_python_dir
+from sts.util.convenience import timestamp_string, ExitCode, create_clean_python_dir, find_port, find_index
 from sts.util.rpc_forker import LocalForker, test_serialize_response
-from sts.util.precompute_cache import PrecomputeCache
+from sts.util.precompute_cache import PrecomputeCache, ReplayOutcomeCache, LatticeOutcomeCache, SharedReplayMemo, hash_file, hash_string
+from sts.util.sequential_testing import SPRT, ReproductionEstimator
 from sts.replay_event import *
 from sts.event_dag import EventDag, split_list
 import sts.input_traces.log_parser as log_parser
 from sts.input_traces.input_logger import InputLogger
 from sts.control_flow.base import ControlFlow
 from sts.control_flow.replayer import Replayer
+from sts.control_flow.quiescence import QuiescenceDetector, default_grace_seconds
+from sts.control_flow.timeout_model import TimeoutModel, timeout_model_path
 from sts.control_flow.peeker import Peeker
 from config.invariant_checks import name_to_invariant_check
 
@@ -52,7 +55,12 @@ class MCSFinder(ControlFlow):
                no_violation_verification_runs=1,
                optimized_filtering=False, forker=LocalForker(),
                replay_final_trace=True, strict_assertion_checking=False,
-               delay_flow_mods=False,
+               delay_flow_mods=False, max_parallel_replays=1,
+               replay_outcome_cache_path=None, speculate=False,
+               early_check_event_types=None, early_check_interval_seconds=None,
+               adaptive_verification=False, verification_error_bounds=(0.05, 0.05),
+               max_verification_runs=20, monotonicity_assumption=None,
+               bug_signatures=None, learn_timeouts=False, timeout_quantile=0.95,
                **kwargs):
     super(MCSFinder, self).__init__(simulation_cfg)
     # number of subsequences delta debugging has examined so far, for
@@ -70,8 +78,10 @@ class MCSFinder(ControlFlow):
       raise ValueError('''Unknown invariant check %s.\n'''
                        '''Invariant check name must be defined in config.invariant_checks''',
                        invariant_check_name)
+    self.invariant_check_name = invariant_check_name
     self.invariant_check = name_to_invariant_check[invariant_check_name]
 
+    self.superlog_path = None
     if type(superlog_path_or_dag) == str:
       self.superlog_path = superlog_path_or_dag
       # The dag is codefied as a list, where each element has
@@ -84,7 +94,21 @@ class MCSFinder(ControlFlow):
     if last_invariant_violation is None:
       raise ValueError("No invariant violation found in dag...")
     violations = last_invariant_violation.violations
-    if len(violations) > 1:
+    # Several bug signatures may be minimized in one run, sharing replays:
+    # either a list of signatures, or "all" for every violation at the end of
+    # the trace. Each signature gets its own MCS, in its own subdirectory of
+    # the results dir.
+    if bug_signatures == "all":
+      bug_signatures = violations
+    if bug_signatures is not None:
+      self.bug_signatures = []
+      for signature in bug_signatures:
+        if signature not in self.bug_signatures:
+          self.bug_signatures.append(signature)
+      if self.bug_signatures == []:
+        raise ValueError("No bug signatures to match")
+      self.bug_signature = self.bug_signatures[0]
+    elif len(violations) > 1:
       self.bug_signature = None
       while self.bug_signature is None:
         msg.interactive("\n------------------------------------------\n")
@@ -100,7 +124,19 @@ class MCSFinder(ControlFlow):
         self.bug_signature = violations[int(violation_index)-1]
     else:
       self.bug_signature = violations[0]
-    msg.success("\nBug signature to match is %s. Proceeding with MCS finding!\n" % self.bug_signature)
+    if bug_signatures is None:
+      self.bug_signatures = [self.bug_signature]
+    if len(self.bug_signatures) > 1:
+      msg.success("\nBug signatures to match are %s. Proceeding with MCS finding!\n" %
+                  ", ".join(str(s) for s in self.bug_signatures))
+    else:
+      msg.success("\nBug signature to match is %s. Proceeding with MCS finding!\n" % self.bug_signature)
+    # When there are several bug signatures: one MCSFinder per signature, set
+    # by init_results(), and the violations seen by all of their replays.
+    self._searches = None
+    self._shared_replays = None
+    self._results_dir = None
+    self._input_sequences_marked = False
 
     self.transform_dag = transform_dag
     # A second log with just our MCS progress log messages
@@ -110,6 +146,14 @@ class MCSFinder(ControlFlow):
     self.wait_on_deterministic_values = wait_on_deterministic_values
     # `no' means "number"
     self.no_violation_verification_runs = no_violation_verification_runs
+    # Rather than a fixed no_violation_verification_runs, decide how many
+    # replays it takes to rule out a subset with a sequential probability ratio
+    # test, given how often replays of reproducing sequences have hit the bug
+    # so far. verification_error_bounds is (alpha, beta) for the test, and
+    # max_verification_runs caps the number of replays per subset.
+    self.adaptive_verification = adaptive_verification
+    self.verification_error_bounds = verification_error_bounds
+    self.max_verification_runs = max_verification_runs
     self._runtime_stats = RuntimeStats(self.subsequence_id, runtime_stats_path=runtime_stats_path)
     # Whether to try alternate trace splitting techiques besides splitting by time.
     self.optimized_filtering = optimized_filtering
@@ -117,6 +161,79 @@ class MCSFinder(ControlFlow):
     self.replay_final_trace = replay_final_trace
     self.strict_assertion_checking = strict_assertion_checking
     self.delay_flow_mods = delay_flow_mods
+    # How many replays of a single delta debugging round to run at the same
+    # time. 1 means replay one subset at a time.
+    self.max_parallel_replays = max_parallel_replays
+    # Set by init_results()
+    self._checkpointer = None
+    # Whether to replay likely future subset tests ahead of time
+    # (EfficientMCSFinder only). Runs up to max_parallel_replays at once.
+    self.speculate = speculate
+    # { input labels -> (bug found, replay duration) } for speculative
+    # replays whose outcome hasn't been used yet
+    self._speculated = {}
+    # If either is set, replays check the invariant as they go (after events
+    # of the given class names, or every so many seconds), and stop as soon as
+    # the bug signature shows up.
+    self.early_check_event_types = early_check_event_types
+    self.early_check_interval_seconds = early_check_interval_seconds
+    # Skip replays whose outcome follows from earlier ones, assuming that
+    # subsets of non-reproducing input sets don't reproduce ('failures'), that
+    # supersets of reproducing ones do ('reproductions'), or 'both'. Skipped
+    # replays are logged to skipped_replays.json in the results dir.
+    if monotonicity_assumption not in (None, 'failures', 'reproductions', 'both'):
+      raise ValueError("Unknown monotonicity assumption %s" % monotonicity_assumption)
+    self.monotonicity_assumption = monotonicity_assumption
+    self._lattice = self._new_lattice()
+    # If learn_timeouts is set, each internal event's replay timeout is the
+    # timeout_quantile'th quantile of how long events like it took to show up
+    # in earlier replays (see sts/control_flow/timeout_model.py). The model is
+    # shared by all searches, and saved next to the trace after every replay.
+    self.timeout_model = None
+    if learn_timeouts:
+      self.timeout_model = TimeoutModel(quantile=timeout_quantile)
+      if self.superlog_path is not None:
+        self.timeout_model.load(timeout_model_path(self.superlog_path))
+    # Set by init_results()
+    self._skipped_replay_log = None
+    # Outcomes of earlier replays, possibly from other (or crashed) MCS runs
+    # of the same trace.
+    self.replay_outcome_cache = None
+    if replay_outcome_cache_path is not None:
+      self.replay_outcome_cache = ReplayOutcomeCache(replay_outcome_cache_path)
+      if self.superlog_path is not None:
+        self._trace_hash = hash_file(self.superlog_path)
+      else:
+        self._trace_hash = hash_string("\n".join(json.dumps(e.to_json())
+                                                 for e in self.dag.events))
+      self._config_hash = hash_string(str(self.simulation_cfg))
+
+  def _new_lattice(self):
+    if self.monotonicity_assumption is None:
+      return None
+    return LatticeOutcomeCache(
+      failures_downward_closed=self.monotonicity_assumption in ('failures', 'both'),
+      reproductions_upward_closed=self.monotonicity_assumption in ('reproductions', 'both'))
+
+  def _new_search(self, bug_signature):
+    ''' Return a copy of ourselves that minimizes just bug_signature, with
+    fresh per-search state. Everything else (the dag, the forker, caches,
+    options) is shared. '''
+    search = copy.copy(self)
+    search.bug_signature = bug_signature
+    search.bug_signatures = [bug_signature]
+    search._searches = None
+    search.subsequence_id = 0
+    search.mcs_log_tracker = None
+    search.replay_log_tracker = None
+    search.mcs_trace_path = None
+    search._extra_log = None
+    search._runtime_stats = RuntimeStats(0)
+    search._checkpointer = None
+    search._speculated = {}
+    search._lattice = self._new_lattice()
+    search._skipped_replay_log = None
+    return search
 
   def log(self, s):
     ''' Output a message to both self._log and self._extra_log '''
@@ -142,8 +259,15 @@ class MCSFinder(ControlFlow):
   def init_results(self, results_dir):
     ''' Precondition: results_dir exists, and is clean (preferably
     initialized by experiments/setup.py).'''
+    self._results_dir = results_dir
+    if len(self.bug_signatures) > 1:
+      self._init_searches(results_dir)
+      return
+    checkpoint_path = os.path.join(results_dir, "mcs_checkpoint.json")
+    resuming = os.path.exists(checkpoint_path)
     if self._extra_log is None:
-      self._extra_log = open("%s/mcs_finder.log" % results_dir, "w")
+      self._extra_log = open("%s/mcs_finder.log" % results_dir,
+                             "a" if resuming else "w")
     if self._runtime_stats.get_runtime_stats_path() is None:
       runtime_stats_path = "%s/runtime_stats.json" % results_dir
       self._runtime_stats.set_runtime_stats_path(runtime_stats_path)
@@ -156,15 +280,41 @@ class MCSFinder(ControlFlow):
                                          self._runtime_stats,
                                          self.simulation_cfg, peeker_exists)
     self.replay_log_tracker = ReplayLogTracker(results_dir)
+    if self._lattice is not None:
+      self._skipped_replay_log = open(os.path.join(results_dir, "skipped_replays.json"),
+                                      "a" if resuming else "w")
+    self._checkpointer = MCSCheckpointer(checkpoint_path, self)
+    if resuming:
+      self._checkpointer.load()
+      self.log("Resuming from %s: fast-forwarding through %d decided subsets" %
+               (checkpoint_path, self._checkpointer.decisions_remaining))
+
+  def _init_searches(self, results_dir):
+    self._shared_replays = SharedReplayMemo()
+    self._searches = []
+    for i, bug_signature in enumerate(self.bug_signatures):
+      search_dir = os.path.join(results_dir, "signature_%d" % i)
+      if not os.path.exists(search_dir):
+        os.makedirs(search_dir)
+      with open(os.path.join(search_dir, "bug_signature.json"), "w") as f:
+        json.dump(bug_signature, f)
+      search = self._new_search(bug_signature)
+      search.init_results(search_dir)
+      self._searches.append(search)
 
   # N.B. only called in the parent process.
   def simulate(self, check_reproducability=True):
-    self._runtime_stats.set_dag_stats(self.dag)
-
     # apply domain knowledge: treat failure/recovery pairs atomically, and
     # filter event types we don't want to include in the MCS
     # (e.g. CheckInvariants)
-    self.dag.mark_invalid_input_sequences()
+    if not self._input_sequences_marked:
+      self.dag.mark_invalid_input_sequences()
+      self._input_sequences_marked = True
+
+    if self._searches is not None:
+      return self._simulate_searches(check_reproducability)
+
+    self._runtime_stats.set_dag_stats(self.dag)
     # TODO(cs): invoke dag.filter_unsupported_input_types()
 
     if len(self.dag) == 0:
@@ -174,12 +324,20 @@ class MCSFinder(ControlFlow):
       # First, run through without pruning to verify that the violation exists
       self._runtime_stats.record_replay_start()
 
-      for i in range(0, self.no_violation_verification_runs):
-        bug_found = self.replay(self.dag, "reproducibility",
-                                ignore_runtime_stats=True)
-        if bug_found:
-          break
-      self._runtime_stats.set_initial_verification_runs_needed(i)
+      def reproduce():
+        for i in range(0, self._verification_runs()):
+          bug_found = self._shared_outcome(self.dag, i)
+          if bug_found is None:
+            bug_found = self.replay(self.dag, "reproducibility",
+                                    ignore_runtime_stats=True)
+          if bug_found:
+            break
+        self._runtime_stats.set_initial_verification_runs_needed(i)
+        self._runtime_stats.record_subset_verification(
+            [ e.label for e in self.dag.input_events ], 1 if bug_found else 0, i+1)
+        return bug_found
+      bug_found = self._checkpointed("reproducibility", reproduce)
+      self._record_implied_outcomes(self.dag, bug_found)
       self._runtime_stats.record_replay_end()
       if not bug_found:
         msg.fail("Unable to reproduce correctness violation!")
@@ -233,6 +391,38 @@ class MCSFinder(ControlFlow):
       self.mcs_log_tracker.dump_mcs_trace(self.dag, self)
     return ExitCode(0)
 
+  def _simulate_searches(self, check_reproducability):
+    ''' Minimize each bug signature in turn. Later searches answer most of
+    their subset tests from the replays of earlier ones. '''
+    summary = []
+    for i, search in enumerate(self._searches):
+      self.log("=== Minimizing bug signature %d/%d: %s ===" %
+               (i+1, len(self._searches), search.bug_signature))
+      search._input_sequences_marked = True
+      mcs_size = None
+      try:
+        search.simulate(check_reproducability=check_reproducability)
+        mcs_size = len(search.dag.input_events)
+      except SystemExit:
+        # Couldn't reproduce this one. Carry on with the rest.
+        self.log("Giving up on bug signature %s" % search.bug_signature)
+      stats = search._runtime_stats
+      summary.append({
+        'bug_signature' : search.bug_signature,
+        'results_dir' : "signature_%d" % i,
+        'mcs_size' : mcs_size,
+        'replays' : stats.total_replays,
+        'shared_replay_outcomes' : stats.shared_replay_outcomes,
+      })
+      self.log("MCS for %s: %s inputs, %d replays, %d answered by other searches" %
+               (search.bug_signature, mcs_size, stats.total_replays,
+                stats.shared_replay_outcomes))
+    with open(os.path.join(self._results_dir, "bug_signatures.json"), "w") as f:
+      json.dump(summary, f, indent=2, separators=(',', ': '))
+    self.log("=== Total replays across %d bug signatures: %d ===" %
+             (len(summary), sum(s['replays'] for s in summary)))
+    return ExitCode(0)
+
   # N.B. always called within a child process.
   def _ddmin(self, dag, split_ways, precompute_cache=None, label_prefix=(),
              total_inputs_pruned=0):
@@ -252,155 +442,435 @@ class MCSFinder(ControlFlow):
 
     subsets = split_list(dag.input_events, split_ways)
     self.log("Subsets:\n"+"\n".join(print_subset(local_label(i), s) for i, s in enumerate(subsets)))
-    for i, subset in enumerate(subsets):
-      label = local_label(i)
-      new_dag = dag.input_subset(subset)
+
+    def subset_candidates():
+      for i, subset in enumerate(subsets):
+        label = local_label(i)
+        new_dag = dag.input_subset(subset)
+        self.log("Current subset: %s" % print_subset(label, new_dag.input_events))
+        yield (i, label, new_dag)
+
+    found = self._check_candidates(subset_candidates(), precompute_cache,
+                                   total_inputs_pruned, subset_label)
+    if found is not None:
+      (i, label, new_dag) = found
+      self.log_violation("Subset %s reproduced violation. Subselecting." % subset_label(label))
+      self.mcs_log_tracker.maybe_dump_intermediate_mcs(new_dag,
+                                                       subset_label(label), self)
+
+      total_inputs_pruned += len(dag.input_events) - len(new_dag.input_events)
+      return self._ddmin(new_dag, 2, precompute_cache=precompute_cache,
+                         label_prefix = label_prefix + (label, ),
+                         total_inputs_pruned=total_inputs_pruned)
+
+    self.log_no_violation("No subsets with violations. Checking complements")
+
+    def complement_candidates():
+      for i, subset in enumerate(subsets):
+        label = local_label(i, True)
+        new_dag = dag.input_complement(subset)
+        self.log("Current complement: %s" % print_subset(label, new_dag.input_events))
+        yield (i, label, new_dag)
+
+    found = self._check_candidates(complement_candidates(), precompute_cache,
+                                   total_inputs_pruned, subset_label)
+    if found is not None:
+      (i, label, new_dag) = found
+      prefix = label_prefix + (label, )
+      self.log_violation("Subset %s reproduced violation. Subselecting." % subset_label(label))
+      self.mcs_log_tracker.maybe_dump_intermediate_mcs(new_dag,
+                                                       subset_label(label), self)
+      total_inputs_pruned += len(dag.input_events) - len(new_dag.input_events)
+      return self._ddmin(new_dag, max(split_ways - 1, 2),
+                         precompute_cache=precompute_cache,
+                         label_prefix=prefix,
+                         total_inputs_pruned=total_inputs_pruned)
+
+    self.log_no_violation("No complements with violations.")
+    if split_ways < len(dag.input_events):
+      self.log("Increasing granularity.")
+      return self._ddmin(dag, min(len(dag.input_events), split_ways*2),
+                         precompute_cache=precompute_cache,
+                         label_prefix=label_prefix,
+                         total_inputs_pruned=total_inputs_pruned)
+    return (dag, total_inputs_pruned)
+
+  def _check_candidates(self, candidates, precompute_cache,
+                        total_inputs_pruned, subset_label):
+    ''' candidates is an iterable of (subset index, label, dag) tuples, in
+    index order. Return the first candidate that reproduces the violation, or
+    None if none of them do. '''
+    if self.max_parallel_replays > 1:
+      return self._check_candidates_parallel(candidates, precompute_cache,
+                                             total_inputs_pruned, subset_label)
+
+    for (i, label, new_dag) in candidates:
       input_sequence = tuple(new_dag.input_events)
-      self.log("Current subset: %s" % print_subset(label, input_sequence))
       if precompute_cache.already_done(input_sequence):
         self.log("Already computed. Skipping")
         continue
       precompute_cache.update(input_sequence)
       if input_sequence == ():
-        self.log("Subset after pruning dependencies was empty. Skipping")
+        self.log("Subset %s after pruning dependencies was empty. Skipping" %
+                 subset_label(label))
         continue
 
       self._track_iteration_size(total_inputs_pruned)
-      violation = self._check_violation(new_dag, i, label)
-      if violation:
-        self.log_violation("Subset %s reproduced violation. Subselecting." % subset_label(label))
-        self.mcs_log_tracker.maybe_dump_intermediate_mcs(new_dag,
-                                                         subset_label(label), self)
-
-        total_inputs_pruned += len(dag.input_events) - len(new_dag.input_events)
-        return self._ddmin(new_dag, 2, precompute_cache=precompute_cache,
-                           label_prefix = label_prefix + (label, ),
-                           total_inputs_pruned=total_inputs_pruned)
-
-    self.log_no_violation("No subsets with violations. Checking complements")
-    for i, subset in enumerate(subsets):
-      label = local_label(i, True)
-      prefix = label_prefix + (label, )
-      new_dag = dag.input_complement(subset)
+      if self._check_violation(new_dag, i, label):
+        return (i, label, new_dag)
+    return None
+
+  def _check_candidates_parallel(self, candidates, precompute_cache,
+                                 total_inputs_pruned, subset_label):
+    ''' Same as the serial loop in _check_candidates, but replays all
+    candidates of the round at once. We still pick the first reproducing
+    candidate in index order, so the outcome matches the serial search.'''
+    # [(input_sequence, candidate or None if skipped)], in index order
+    considered = []
+    to_test = []
+    seen = set()
+    for (i, label, new_dag) in candidates:
       input_sequence = tuple(new_dag.input_events)
-      self.log("Current complement: %s" % print_subset(label, input_sequence))
-      if precompute_cache.already_done(input_sequence):
+      if precompute_cache.already_done(input_sequence) or input_sequence in seen:
         self.log("Already computed. Skipping")
         continue
-      precompute_cache.update(input_sequence)
-
+      seen.add(input_sequence)
       if input_sequence == ():
-        self.log("Subset %s after pruning dependencies was empty. Skipping", subset_label(label))
+        self.log("Subset %s after pruning dependencies was empty. Skipping" %
+                 subset_label(label))
+        considered.append((input_sequence, None))
         continue
+      considered.append((input_sequence, (i, label, new_dag)))
+      to_test.append(considered[-1][1])
 
-      self._track_iteration_size(total_inputs_pruned)
-      violation = self._check_violation(new_dag, i, label)
-      if violation:
-        self.log_violation("Subset %s reproduced violation. Subselecting." % subset_label(label))
-        self.mcs_log_tracker.maybe_dump_intermediate_mcs(new_dag,
-                                                         subset_label(label), self)
-        total_inputs_pruned += len(dag.input_events) - len(new_dag.input_events)
-        return self._ddmin(new_dag, max(split_ways - 1, 2),
-                           precompute_cache=precompute_cache,
-                           label_prefix=prefix,
-                           total_inputs_pruned=total_inputs_pruned)
+    self._track_iteration_size(total_inputs_pruned)
+    found = self._check_violations(to_test)
 
-    self.log_no_violation("No complements with violations.")
-    if split_ways < len(dag.input_events):
-      self.log("Increasing granularity.")
-      return self._ddmin(dag, min(len(dag.input_events), split_ways*2),
-                         precompute_cache=precompute_cache,
-                         label_prefix=label_prefix,
-                         total_inputs_pruned=total_inputs_pruned)
-    return (dag, total_inputs_pruned)
+    # Only remember what the serial search would have looked at.
+    for (input_sequence, candidate) in considered:
+      precompute_cache.update(input_sequence)
+      if found is not None and candidate is to_test[found]:
+        break
+    if found is None:
+      return None
+    return to_test[found]
 
   # N.B. always called within a child process.
   def _track_iteration_size(self, total_inputs_pruned):
+    if self._checkpointer is not None and self._checkpointer.fast_forwarding:
+      # Already tracked before the checkpoint was written
+      return
     self._runtime_stats.record_iteration_size(len(self.dag.input_events) - total_inputs_pruned)
 
+  def _checkpointed(self, inputs, check):
+    ''' Return check(), unless the checkpoint we are resuming from already
+    knows its outcome. inputs identifies the check. '''
+    if self._checkpointer is None:
+      return check()
+    return self._checkpointer.decide(inputs, check)
+
   # N.B. always called within a child process.
   def _check_violation(self, new_dag, subset_index, label):
     ''' Check if there were violations '''
-    # Try no_violation_verification_runs times to see if the bug shows up
-    for i in range(0, self.no_violation_verification_runs):
-      bug_found = self.replay(new_dag, label)
+    bug_found = self._checkpointed([ e.label for e in new_dag.input_events ],
+        lambda: self._replay_subset(new_dag, subset_index, label))
+    self._record_implied_outcomes(new_dag, bug_found)
+    return bug_found
+
+  def _replay_subset(self, new_dag, subset_index, label):
+    cached = self._cached_outcome(new_dag)
+    if cached is None:
+      cached = self._implied_outcome(new_dag)
+    if cached is not None:
+      if cached:
+        self.log_violation("Violation! Considering %d'th (cached)" % subset_index)
+      else:
+        self.log_no_violation("No violation in %d'th (cached)..." % subset_index)
+      return cached
+
+    inputs = [ e.label for e in new_dag.input_events ]
+    first_run = 0
+    speculated = self._speculated.pop(tuple(inputs), None)
+    if speculated is not None:
+      # Counts as the first verification run
+      (bug_found, duration) = speculated
+      self._runtime_stats.record_useful_speculative_replay(duration)
+      if bug_found:
+        self.log_violation("Violation! Considering %d'th (speculated)" % subset_index)
+        self._runtime_stats.record_violation_found(0)
+        self._runtime_stats.record_subset_verification(inputs, 1, 1)
+        self._cache_outcome(new_dag, True)
+        return True
+      first_run = 1
+
+    # Try verification_runs times to see if the bug shows up
+    verification_runs = self._verification_runs()
+    for i in range(first_run, verification_runs):
+      bug_found = self._shared_outcome(new_dag, i)
+      if bug_found is None:
+        bug_found = self.replay(new_dag, label)
 
       if bug_found:
         # Violation in the subset
         self.log_violation("Violation! Considering %d'th" % subset_index)
         self._runtime_stats.record_violation_found(i)
+        self._runtime_stats.record_subset_verification(inputs, 1, i+1)
+        self._cache_outcome(new_dag, True)
         return True
 
     # No violation!
     self.log_no_violation("No violation in %d'th..." % subset_index)
+    self._runtime_stats.record_subset_verification(inputs, 0,
+                                                   max(verification_runs, first_run))
+    self._cache_outcome(new_dag, False)
     return False
 
+  def _verification_runs(self):
+    ''' How many replays without the violation it takes to decide that a
+    subset doesn't reproduce it. '''
+    if not self.adaptive_verification:
+      return self.no_violation_verification_runs
+    # A replay that ends in the bug signature is conclusive, so H0 is "the
+    # subset never reproduces", and H1 "it reproduces as often as the
+    # sequences we've seen reproduce so far". With each failed replay the
+    # likelihood ratio drops by (1 - p1), until the test accepts H0.
+    p1 = self._runtime_stats.reproduction_probability_estimate()
+    (alpha, beta) = self.verification_error_bounds
+    sprt = SPRT(0.0, p1, alpha=alpha, beta=beta)
+    for runs in range(1, self.max_verification_runs + 1):
+      if sprt.decide(0, runs) is False:
+        return runs
+    return self.max_verification_runs
+
+  def _check_violations(self, candidates):
+    ''' Parallel version of _check_violation. candidates is a list of
+    (subset index, label, dag) tuples. Return the position in candidates of
+    the first one that reproduces the violation, or None. '''
+    found = self._checkpointed([ [ e.label for e in new_dag.input_events ]
+                                 for (_, _, new_dag) in candidates ],
+        lambda: self._replay_subsets(candidates))
+    for p in range(len(candidates) if found is None else found + 1):
+      self._record_implied_outcomes(candidates[p][2], p == found)
+    return found
+
+  def _replay_subsets(self, candidates):
+    cached = []
+    for (_, _, new_dag) in candidates:
+      outcome = self._cached_outcome(new_dag)
+      if outcome is None:
+        outcome = self._implied_outcome(new_dag)
+      cached.append(outcome)
+      if outcome is True:
+        # Nothing after this one matters
+        break
+    cached += [ None ] * (len(candidates) - len(cached))
+    found = find_index(lambda outcome: outcome is True, cached)
+    # Positions that could still turn out to be the first reproducing one
+    pending = [ p for p in range(len(candidates) if found is None else found)
+                if cached[p] is None ]
+    replayed = list(pending)
+    # { position -> replays that completed }
+    trials = dict((p, 0) for p in pending)
+    for run in range(0, self._verification_runs()):
+      if pending == []:
+        break
+      bugs_found = [ self._shared_outcome(candidates[p][2], run) for p in pending ]
+      # Nothing after a known reproduction needs replaying
+      known = find_index(lambda bug_found: bug_found, bugs_found)
+      to_replay = [ i for i in range(len(pending) if known is None else known)
+                    if bugs_found[i] is None ]
+      if to_replay != []:
+        outcomes = self.replay_all([ (candidates[pending[i]][2],
+                                      candidates[pending[i]][1])
+                                     for i in to_replay ])
+        for i, bug_found in zip(to_replay, outcomes):
+          bugs_found[i] = bug_found
+      for p, bug_found in zip(pending, bugs_found):
+        if bug_found is not None:
+          trials[p] += 1
+      first = find_index(lambda bug_found: bug_found, bugs_found)
+      if first is not None:
+        found = pending[first]
+        self.log_violation("Violation! Considering %d'th" % candidates[found][0])
+        self._runtime_stats.record_violation_found(run)
+        # Only earlier candidates can still take precedence
+        pending = pending[:first]
+
+    for p in replayed:
+      self._runtime_stats.record_subset_verification(
+          [ e.label for e in candidates[p][2].input_events ], int(p == found), trials[p])
+
+    if found is not None and cached[found]:
+      self.log_violation("Violation! Considering %d'th (cached)" % candidates[found][0])
+    for p in replayed:
+      if p == found:
+        self._cache_outcome(candidates[p][2], True)
+      elif found is None or p < found:
+        # Replayed in every verification run
+        self._cache_outcome(candidates[p][2], False)
+    for p in range(len(candidates) if found is None else found):
+      self.log_no_violation("No violation in %d'th%s..." %
+                            (candidates[p][0], " (cached)" if cached[p] is False else ""))
+    return found
+
+  def _replay_outcome_key(self, new_dag):
+    return ReplayOutcomeCache.make_key(self._trace_hash, self._config_hash,
+                                       self.invariant_check_name,
+                                       [ e.label for e in new_dag.input_events ])
+
+  def _cached_outcome(self, new_dag):
+    ''' Return whether new_dag is already known to reproduce the violation, or
+    None if we have to replay it to find out. '''
+    if self.replay_outcome_cache is None:
+      return None
+    outcome = self.replay_outcome_cache.lookup(self._replay_outcome_key(new_dag),
+                                               self.bug_signature,
+                                               self._verification_runs())
+    if outcome is not None:
+      self._runtime_stats.record_cached_replay_outcome()
+    return outcome
+
+  def _implied_outcome(self, new_dag):
+    ''' Return whether new_dag reproduces the violation if that follows from
+    earlier outcomes under self.monotonicity_assumption, otherwise None. '''
+    if self._lattice is None:
+      return None
+    inputs = [ e.label for e in new_dag.input_events ]
+    implied = self._lattice.lookup(inputs)
+    if implied is None:
+      return None
+    (bug_found, implied_by) = implied
+    self._runtime_stats.record_implied_replay_outcome()
+    if self._skipped_replay_log is not None:
+      self._skipped_replay_log.write(json.dumps({
+        'inputs' : inputs,
+        'reproduced' : bug_found,
+        'implied_by' : implied_by,
+        'monotonicity_assumption' : self.monotonicity_assumption,
+        'subsequence_id' : self.subsequence_id,
+      }) + "\n")
+      self._skipped_replay_log.flush()
+    return bug_found
+
+  def _record_implied_outcomes(self, new_dag, bug_found):
+    if self._lattice is None:
+      return
+    self._lattice.record([ e.label for e in new_dag.input_events ], bug_found)
+
+  def _cache_outcome(self, new_dag, bug_found):
+    if self.replay_outcome_cache is None:
+      return
+    self.replay_outcome_cache.record(self._replay_outcome_key(new_dag), bug_found,
+                                     self.bug_signature,
+                                     self._verification_runs())
+
   def replay(self, new_dag, label, ignore_runtime_stats=False):
     # Run the simulation forward
     if self.transform_dag:
       new_dag = self.transform_dag(new_dag)
 
-    self._runtime_stats.record_replay_stats(len(new_dag.input_events))
-
-    # N.B. this function is run as a child process.
-    def play_forward(results_dir, subsequence_id):
-      # TODO(cs): need to serialize the parameters to Replayer rather than
-      # wrapping them in a closure... otherwise, can't use RemoteForker
-      # TODO(aw): MCSFinder needs to configure Simulation to always let DataplaneEvents pass through
-      create_clean_python_dir(results_dir)
-
-      # Copy stdout and stderr to a file "replay.out"
-      tee = Tee(open(os.path.join(results_dir, "replay.out"), "w"))
-      tee.tee_stdout()
-      tee.tee_stderr()
-
-      # Set up replayer.
-      input_logger = InputLogger()
-      replayer = Replayer(self.simulation_cfg, new_dag,
-                          wait_on_deterministic_values=self.wait_on_deterministic_values,
-                          input_logger=input_logger,
-                          allow_unexpected_messages=False,
-                          pass_through_whitelisted_messages=True,
-                          delay_flow_mods=self.delay_flow_mods,
-                          **self.kwargs)
-      replayer.init_results(results_dir)
-      self._runtime_stats = RuntimeStats(subsequence_id)
-      violations = []
-      simulation = None
-      try:
-        simulation = replayer.simulate()
-        self._track_new_internal_events(simulation, replayer)
-        # Wait a bit in case the bug takes awhile to happen
-        self.log("Sleeping %d seconds after run" % self.end_wait_seconds)
-        time.sleep(self.end_wait_seconds)
-        violations = self.invariant_check(simulation)
-        if violations != []:
-          input_logger.log_input_event(InvariantViolation(violations))
-      except SystemExit:
-        # One of the invariant checks bailed early. Oddly, this is not an
-        # error for us, it just means that there were no violations...
-        # [this logic is arguably broken]
-        # Return no violations, and let Forker handle system exit for us.
-        violations = []
-      finally:
-        input_logger.close(replayer, self.simulation_cfg, skip_mcs_cfg=True)
-        if simulation is not None:
-          simulation.clean_up()
-        tee.close()
-      if self.strict_assertion_checking:
-        test_serialize_response(violations, self._runtime_stats.client_dict())
-      timed_out_internal = [ e.label for e in new_dag.events if e.timed_out ]
-      return (violations, self._runtime_stats.client_dict(), timed_out_internal)
-
-    # TODO(cs): once play_forward() is no longer a closure, register it only once
-    self.forker.register_task("play_forward", play_forward)
     results_dir = self.replay_log_tracker.get_replay_logger_dir(label)
     self.subsequence_id += 1
-    (violations, client_runtime_stats,
-                 timed_out_internal) = self.forker.fork("play_forward",
-                                                        results_dir,
-                                                        self.subsequence_id)
+    self._register_play_forward({ self.subsequence_id : new_dag })
+    child_return = self.forker.fork("play_forward",
+                                    *self._play_forward_args(new_dag, results_dir,
+                                                             self.subsequence_id, {}))
+    return self._replay_finished(new_dag, child_return, ignore_runtime_stats)
+
+  def replay_all(self, dags_and_labels, ignore_runtime_stats=False,
+                 cancel=None, durations=None):
+    ''' Replay every (dag, label) pair in dags_and_labels, running up to
+    max_parallel_replays of them at once. Return a list of whether each replay
+    found the bug. As soon as a replay finds the bug, replays later in the
+    list are cancelled; their entries are None.
+
+    If cancel is given, it replaces that policy: cancel(index, bug found)
+    returns the indices of replays that are no longer needed. durations is
+    passed on to Forker.fork_parallel(). '''
+    subsequence_id2dag = {}
+    subsequence_ids = []
+    jobs = []
+    claimed_ports = set()
+    for (new_dag, label) in dags_and_labels:
+      if self.transform_dag:
+        new_dag = self.transform_dag(new_dag)
+      results_dir = self.replay_log_tracker.get_replay_logger_dir(label)
+      self.subsequence_id += 1
+      subsequence_id2dag[self.subsequence_id] = new_dag
+      subsequence_ids.append(self.subsequence_id)
+      # Ports have to be free where the replay runs. Remote workers pick
+      # their own.
+      port_assignments = None
+      if self.forker.shares_host:
+        port_assignments = self._allocate_controller_ports(claimed_ports)
+      jobs.append(self._play_forward_args(new_dag, results_dir, self.subsequence_id,
+                                          port_assignments))
+
+    # N.B. children are forked after subsequence_id2dag is populated, so they
+    # see all of the dags.
+    self._register_play_forward(subsequence_id2dag)
+    bug_found = lambda child_return: self.bug_signature in child_return[0]
+    if cancel is None:
+      policy = { 'cutoff' : lambda _, child_return: bug_found(child_return) }
+    else:
+      policy = { 'cancel' : lambda i, child_return: cancel(i, bug_found(child_return)) }
+    if not self.forker.shares_host:
+      policy['ports_per_child'] = 2 * len(self.simulation_cfg.controller_configs)
+    child_returns = self.forker.fork_parallel("play_forward", jobs,
+        max_parallel=self.max_parallel_replays, durations=durations, **policy)
+
+    bugs_found = []
+    for subsequence_id, child_return in zip(subsequence_ids, child_returns):
+      if child_return is None:
+        bugs_found.append(None)
+        continue
+      bugs_found.append(self._replay_finished(subsequence_id2dag[subsequence_id],
+                                              child_return, ignore_runtime_stats))
+    return bugs_found
+
+  def _register_play_forward(self, subsequence_id2dag):
+    if self.forker.remote:
+      # Closures can't be shipped to other machines. Send a serialized job
+      # instead.
+      self.forker.register_task("play_forward", play_forward_job)
+    else:
+      # TODO(cs): once play_forward() is no longer a closure, register it only once
+      self.forker.register_task("play_forward",
+          lambda results_dir, subsequence_id, port_assignments:
+            self._play_forward(subsequence_id2dag[subsequence_id], results_dir,
+                               subsequence_id, port_assignments))
+
+  def _play_forward_args(self, new_dag, results_dir, subsequence_id,
+                         port_assignments):
+    if self.forker.remote:
+      return (self._replay_job(new_dag), results_dir, subsequence_id,
+              port_assignments)
+    return (results_dir, subsequence_id, port_assignments)
+
+  def _allocate_controller_ports(self, claimed_ports):
+    ''' Choose fresh OpenFlow and sync ports for each controller, so that
+    concurrent replays don't clash. Returns { controller label -> [port,
+    sync port] } '''
+    port_assignments = {}
+    for c in self.simulation_cfg.controller_configs:
+      ports = []
+      for _ in range(2):
+        port = find_port([ p for p in xrange(7000, 12000) if p not in claimed_ports ])
+        claimed_ports.add(port)
+        ports.append(port)
+      port_assignments[c.label] = ports
+    return port_assignments
+
+  def _replay_finished(self, new_dag, child_return, ignore_runtime_stats):
+    ''' Process the return value of a play_forward() child. Returns whether
+    the bug was found. '''
+    (violations, client_runtime_stats, timed_out_internal, arrival_delays) = child_return
+    self._runtime_stats.record_replay_stats(len(new_dag.input_events))
     new_dag.set_events_as_timed_out(timed_out_internal)
+    if self.timeout_model is not None:
+      self.timeout_model.record_replay(new_dag.events, arrival_delays)
+      if self.superlog_path is not None:
+        self.timeout_model.save(timeout_model_path(self.superlog_path))
 
     bug_found = False
     if violations != []:
@@ -415,8 +885,66 @@ class MCSFinder(ControlFlow):
     if not ignore_runtime_stats:
       self._runtime_stats.merge_client_dict(client_runtime_stats)
 
+    # A replay that ended as soon as our bug showed up might have missed
+    # other searches' bugs.
+    ended_early = client_runtime_stats.get('early_violation_event_index', {}) != {}
+    self._record_replay(new_dag, violations, complete=not ended_early)
     return bug_found
 
+  def _record_replay(self, new_dag, violations, complete=True):
+    ''' Make a replay's violations available to the other searches '''
+    if self._shared_replays is None:
+      return
+    self._shared_replays.record([ e.label for e in new_dag.input_events ],
+                                violations, complete=complete)
+
+  def _shared_outcome(self, new_dag, run):
+    ''' Return whether the run'th replay of new_dag (by any search) found our
+    bug, or None if it has to be replayed. '''
+    if self._shared_replays is None:
+      return None
+    bug_found = self._shared_replays.outcome([ e.label for e in new_dag.input_events ],
+                                             self.bug_signature, run)
+    if bug_found is not None:
+      self._runtime_stats.record_shared_replay_outcome()
+    return bug_found
+
+  # N.B. this function is run as a child process.
+  def _play_forward(self, new_dag, results_dir, subsequence_id, port_assignments):
+    return play_forward(self.simulation_cfg, new_dag, results_dir,
+                        subsequence_id, self.invariant_check,
+                        superlog_path=self.superlog_path,
+                        end_wait_seconds=self.end_wait_seconds,
+                        wait_on_deterministic_values=self.wait_on_deterministic_values,
+                        delay_flow_mods=self.delay_flow_mods,
+                        strict_assertion_checking=self.strict_assertion_checking,
+                        port_assignments=port_assignments, log=self.log,
+                        bug_signature=self.bug_signature,
+                        early_check_event_types=self.early_check_event_types,
+                        early_check_interval_seconds=self.early_check_interval_seconds,
+                        timeout_model=self.timeout_model,
+                        **self.kwargs)
+
+  def _replay_job(self, new_dag):
+    ''' Serialize everything play_forward() needs, so that the replay can run
+    in a process that doesn't share our memory (see play_forward_job()) '''
+    return {
+      'simulation_cfg' : str(self.simulation_cfg),
+      'events' : [ e.to_json() for e in new_dag.events ],
+      'invariant_check_name' : self.invariant_check_name,
+      'superlog_path' : self.superlog_path,
+      'end_wait_seconds' : self.end_wait_seconds,
+      'wait_on_deterministic_values' : self.wait_on_deterministic_values,
+      'delay_flow_mods' : self.delay_flow_mods,
+      'strict_assertion_checking' : self.strict_assertion_checking,
+      'bug_signature' : self.bug_signature,
+      'early_check_event_types' : self.early_check_event_types,
+      'early_check_interval_seconds' : self.early_check_interval_seconds,
+      'timeout_model' : (self.timeout_model.to_json()
+                         if self.timeout_model is not None else None),
+      'kwargs' : self.kwargs,
+    }
+
   def _optimize_event_dag(self):
     ''' Employs domain knowledge of event classes to reduce the size of event
     dag. Currently prunes event types.'''
@@ -431,43 +959,12 @@ class MCSFinder(ControlFlow):
         self.log("\t** No events pruned for event type %s. Next!" % event_type)
         continue
       pruned_dag = self.dag.input_complement(pruned)
-      bug_found = self.replay(pruned_dag, "opt_%s" % event_type.__name__)
+      bug_found = self._checkpointed([ e.label for e in pruned_dag.input_events ],
+          lambda: self.replay(pruned_dag, "opt_%s" % event_type.__name__))
       if bug_found:
         self.log("\t** VIOLATION for pruning event type %s! Resizing original dag" % event_type)
         self.dag = pruned_dag
 
-  # N.B. always called within a child process.
-  def _track_new_internal_events(self, simulation, replayer):
-    ''' Pre: simulation must have been run through a replay'''
-    # We always check against internal events that were buffered at the end of
-    # the original run (don't want to overcount)
-    prev_buffered_receives = []
-    try:
-      path = self.superlog_path + ".unacked"
-      if not os.path.exists(path):
-        log.warn("unacked internal events file from original run does not exist")
-        return
-      prev_buffered_receives = set([ e.pending_receive for e in
-                                     [ f for f in EventDag(log_parser.parse_path(path)).events
-                                       if type(f) == ControlMessageReceive ] ])
-    except ValueError as e:
-      log.warn("unacked internal events is corrupt? %r" % e)
-      return
-    buffered_message_receipts = []
-    for p in simulation.openflow_buffer.pending_receives():
-      if p not in prev_buffered_receives:
-        buffered_message_receipts.append(repr(p))
-      else:
-        prev_buffered_receives.remove(p)
-
-    self._runtime_stats.record_buffered_message_receipts(buffered_message_receipts)
-    new_internal_events = replayer.unexpected_state_changes + replayer.passed_unexpected_messages
-    self._runtime_stats.record_new_internal_events(new_internal_events)
-    self._runtime_stats.record_early_internal_events(replayer.early_state_changes)
-    self._runtime_stats.record_timed_out_events(dict(replayer.event_scheduler_stats.event2timeouts))
-    self._runtime_stats.record_matched_events(dict(replayer.event_scheduler_stats.event2matched))
-
-
 # TODO(cs): Hack alert. Shouldn't be a subclass
 class EfficientMCSFinder(MCSFinder):
   ''' Exactly the same functionality as MCSFinder, but assumes that
@@ -498,6 +995,9 @@ class EfficientMCSFinder(MCSFinder):
     (left, right) = split_list(dag.atomic_input_events, 2)
     self.log("Subsets:\n"+"\n".join(print_subset(local_label(i), s)
                                     for i, s in enumerate([left,right])))
+    if self.speculate and not (self._checkpointer is not None and
+                               self._checkpointer.fast_forwarding):
+      self._speculate(dag, left, right, carryover_inputs, recursion_level)
     # This is: [dag.input_subset(left), dag.input_subset(right)]
     left_right_dag = []
 
@@ -543,6 +1043,235 @@ class EfficientMCSFinder(MCSFinder):
     return (left_result.insert_atomic_inputs(right_result.atomic_input_events),
             total_inputs_pruned)
 
+  def _speculate(self, dag, left, right, carryover_inputs, recursion_level):
+    ''' Replay the tests that this level of _ddmin and the next one may need
+    all at once, and remember their outcomes for _check_violation(). Replays
+    are cancelled as soon as the left and right tests rule them out. '''
+    left_dag = dag.atomic_input_subset(left)
+    right_dag = dag.atomic_input_subset(right)
+
+    def first_tests(sub_dag, carryover):
+      # The tests _ddmin(sub_dag, carryover) starts with
+      if len(sub_dag.atomic_input_events) <= 1:
+        return []
+      return [ sub_dag.atomic_input_subset(half).insert_atomic_inputs(carryover)
+               for half in split_list(sub_dag.atomic_input_events, 2) ]
+
+    # In order of how likely we are to need them
+    groups = [
+      ("left", [left_dag.insert_atomic_inputs(carryover_inputs)]),
+      ("right", [right_dag.insert_atomic_inputs(carryover_inputs)]),
+      # The left test reproduced
+      ("left_recursion", first_tests(left_dag, carryover_inputs)),
+      # Only the right test reproduced
+      ("right_recursion", first_tests(right_dag, carryover_inputs)),
+      # Neither reproduced
+      ("interference", first_tests(left_dag,
+          right_dag.insert_atomic_inputs(carryover_inputs).atomic_input_events)),
+    ]
+    tests = []
+    test_groups = []
+    seen = set(self._speculated.keys())
+    for (group, test_dags) in groups:
+      for test_dag in test_dags:
+        key = tuple(e.label for e in test_dag.input_events)
+        if key in seen or self._cached_outcome(test_dag) is not None:
+          continue
+        seen.add(key)
+        tests.append((test_dag, "spec_%s/%d" % (group, recursion_level)))
+        test_groups.append(group)
+    if len(tests) < 2:
+      # Nothing to overlap
+      return
+
+    def cancel(index, bug_found):
+      if test_groups[index] == "left":
+        moot = ["right", "right_recursion", "interference"] if bug_found else ["left_recursion"]
+      elif test_groups[index] == "right":
+        moot = ["interference"] if bug_found else ["right_recursion"]
+      else:
+        moot = []
+      return [ i for i, group in enumerate(test_groups) if group in moot ]
+
+    self.log("Speculatively replaying %d subsets" % len(tests))
+    durations = [None] * len(tests)
+    bugs_found = self.replay_all(tests, cancel=cancel, durations=durations)
+    for (test_dag, _), bug_found, duration in zip(tests, bugs_found, durations):
+      if duration is not None:
+        # Counted as wasted until _check_violation() uses it
+        self._runtime_stats.record_speculative_replay(duration)
+      if bug_found is not None:
+        self._speculated[tuple(e.label for e in test_dag.input_events)] = (bug_found, duration)
+
+
+# N.B. always run within a child process.
+def play_forward(simulation_cfg, new_dag, results_dir, subsequence_id,
+                 invariant_check, superlog_path=None, end_wait_seconds=0.5,
+                 wait_on_deterministic_values=False, delay_flow_mods=False,
+                 strict_assertion_checking=False, port_assignments=None,
+                 log=msg.mcs_event, bug_signature=None,
+                 early_check_event_types=None, early_check_interval_seconds=None,
+                 timeout_model=None, **kwargs):
+  ''' Replay new_dag once and check the invariant at the end. Returns
+  (violations, runtime stats client dict, labels of timed out internal
+  events, { internal event label -> arrival delay seconds }). kwargs are
+  passed on to the Replayer.
+
+  If early_check_event_types or early_check_interval_seconds is set, the
+  invariant is also checked during the replay, which ends as soon as
+  bug_signature is observed. '''
+  # TODO(aw): MCSFinder needs to configure Simulation to always let DataplaneEvents pass through
+  create_clean_python_dir(results_dir)
+
+  # Copy stdout and stderr to a file "replay.out"
+  tee = Tee(open(os.path.join(results_dir, "replay.out"), "w"))
+  tee.tee_stdout()
+  tee.tee_stderr()
+
+  # When running alongside other replays, move onto our own ports.
+  if port_assignments is not None:
+    for c in simulation_cfg.controller_configs:
+      if c.label in port_assignments:
+        (port, sync_port) = port_assignments[c.label]
+        c.rebind(port, sync_port)
+
+  if early_check_event_types or early_check_interval_seconds is not None:
+    kwargs = dict(kwargs, early_invariant_check=invariant_check,
+                  early_check_event_types=early_check_event_types,
+                  early_check_interval_seconds=early_check_interval_seconds,
+                  early_check_signature=bug_signature)
+  if timeout_model is not None:
+    kwargs = dict(kwargs, timeout_model=timeout_model)
+
+  # Set up replayer.
+  input_logger = InputLogger()
+  replayer = Replayer(simulation_cfg, new_dag,
+                      wait_on_deterministic_values=wait_on_deterministic_values,
+                      input_logger=input_logger,
+                      allow_unexpected_messages=False,
+                      pass_through_whitelisted_messages=True,
+                      delay_flow_mods=delay_flow_mods,
+                      **kwargs)
+  replayer.init_results(results_dir)
+  runtime_stats = RuntimeStats(subsequence_id)
+  violations = []
+  simulation = None
+  try:
+    simulation = replayer.simulate()
+    track_new_internal_events(runtime_stats, superlog_path, simulation, replayer)
+    if replayer.early_violations is not None:
+      log("Violation observed after event %d of %d. Skipping the rest of the replay" %
+          (replayer.early_violation_event_index, len(new_dag.events)))
+      runtime_stats.record_early_violation(replayer.early_violation_event_index)
+      violations = replayer.early_violations
+    else:
+      # Wait a bit in case the bug takes awhile to happen
+      if kwargs.get('as_fast_as_possible', False):
+        log("Waiting up to %d seconds for quiescence after run" % end_wait_seconds)
+        QuiescenceDetector(simulation,
+                           kwargs.get('quiescence_grace_seconds',
+                                      default_grace_seconds),
+                           expected_messages=replayer.expected_messages).wait(end_wait_seconds)
+      else:
+        log("Sleeping %d seconds after run" % end_wait_seconds)
+        time.sleep(end_wait_seconds)
+      violations = invariant_check(simulation)
+    if violations != []:
+      input_logger.log_input_event(InvariantViolation(violations))
+  except SystemExit:
+    # One of the invariant checks bailed early. Oddly, this is not an
+    # error for us, it just means that there were no violations...
+    # [this logic is arguably broken]
+    # Return no violations, and let Forker handle system exit for us.
+    violations = []
+  finally:
+    input_logger.close(replayer, simulation_cfg, skip_mcs_cfg=True)
+    if simulation is not None:
+      simulation.clean_up()
+    tee.close()
+  if strict_assertion_checking:
+    test_serialize_response(violations, runtime_stats.client_dict())
+  timed_out_internal = [ e.label for e in new_dag.events if e.timed_out ]
+  arrival_delays = {}
+  if replayer.event_scheduler_stats is not None:
+    arrival_delays = replayer.event_scheduler_stats.arrival_delays
+  return (violations, runtime_stats.client_dict(), timed_out_internal,
+          arrival_delays)
+
+# The names needed to eval() str(SimulationConfig), as in the generated
+# replay_config.py files.
+_simulation_cfg_imports = \
+'''
+from config.experiment_config_lib import ControllerConfig
+from sts.topology import *
+from sts.simulation_state import SimulationConfig
+'''
+
+# N.B. always run within a (possibly remote) child process.
+def play_forward_job(job, results_dir, subsequence_id, port_assignments,
+                     ports=None):
+  ''' Entry point for replays dispatched through a RemoteForker. job is the
+  dict built by MCSFinder._replay_job(). If ports is given, it holds an
+  OpenFlow and a sync port for each controller, picked by the worker. '''
+  namespace = {}
+  exec _simulation_cfg_imports in namespace
+  simulation_cfg = eval(job['simulation_cfg'], namespace)
+  if ports is not None:
+    port_assignments = {}
+    for i, c in enumerate(simulation_cfg.controller_configs):
+      port_assignments[c.label] = ports[2*i:2*i+2]
+  new_dag = EventDag(log_parser.parse(job['events']))
+  invariant_check = name_to_invariant_check[job['invariant_check_name']]
+  timeout_model = None
+  if job.get('timeout_model') is not None:
+    timeout_model = TimeoutModel.from_json(job['timeout_model'])
+  return play_forward(simulation_cfg, new_dag, results_dir, subsequence_id,
+                      invariant_check,
+                      superlog_path=job['superlog_path'],
+                      end_wait_seconds=job['end_wait_seconds'],
+                      wait_on_deterministic_values=job['wait_on_deterministic_values'],
+                      delay_flow_mods=job['delay_flow_mods'],
+                      strict_assertion_checking=job['strict_assertion_checking'],
+                      port_assignments=port_assignments,
+                      bug_signature=job['bug_signature'],
+                      early_check_event_types=job['early_check_event_types'],
+                      early_check_interval_seconds=job['early_check_interval_seconds'],
+                      timeout_model=timeout_model,
+                      **job['kwargs'])
+
+# N.B. always called within a child process.
+def track_new_internal_events(runtime_stats, superlog_path, simulation, replayer):
+  ''' Pre: simulation must have been run through a replay'''
+  # We always check against internal events that were buffered at the end of
+  # the original run (don't want to overcount)
+  prev_buffered_receives = []
+  try:
+    if superlog_path is None:
+      log.warn("No superlog path, so no unacked internal events file to compare against")
+      return
+    path = superlog_path + ".unacked"
+    if not os.path.exists(path):
+      log.warn("unacked internal events file from original run does not exist")
+      return
+    prev_buffered_receives = set([ e.pending_receive for e in
+                                   [ f for f in EventDag(log_parser.parse_path(path)).events
+                                     if type(f) == ControlMessageReceive ] ])
+  except ValueError as e:
+    log.warn("unacked internal events is corrupt? %r" % e)
+    return
+  buffered_message_receipts = []
+  for p in simulation.openflow_buffer.pending_receives():
+    if p not in prev_buffered_receives:
+      buffered_message_receipts.append(repr(p))
+    else:
+      prev_buffered_receives.remove(p)
+
+  runtime_stats.record_buffered_message_receipts(buffered_message_receipts)
+  new_internal_events = replayer.unexpected_state_changes + replayer.passed_unexpected_messages
+  runtime_stats.record_new_internal_events(new_internal_events)
+  runtime_stats.record_early_internal_events(replayer.early_state_changes)
+  runtime_stats.record_timed_out_events(dict(replayer.event_scheduler_stats.event2timeouts))
+  runtime_stats.record_matched_events(dict(replayer.event_scheduler_stats.event2matched))
 
 class ReplayLogTracker(object):
   ''' Logs intermediate and final replay traces chosen by delta debugging'''
@@ -555,6 +1284,105 @@ class ReplayLogTracker(object):
     self.count += 1
     return dst
 
+class MCSCheckpointer(object):
+  ''' Journals the outcome of every subset test delta debugging decides, so
+  that a killed MCS run can be resumed from the same point.
+
+  Delta debugging is deterministic given those outcomes, so on resume we
+  rerun it from the start, answering subset tests from the journal instead of
+  replaying, until we run out of journaled outcomes. At that point the
+  remaining state (runtime stats, replay counters) is restored as it was when
+  the last outcome was journaled. '''
+  def __init__(self, checkpoint_path, mcs_finder):
+    self.checkpoint_path = checkpoint_path
+    self.mcs_finder = mcs_finder
+    # [ { 'inputs' : identifies the check, 'outcome' : its result } ]
+    self._decisions = []
+    # How many of self._decisions we have consumed
+    self._position = 0
+    # State to restore when we've fast-forwarded through self._decisions
+    self._state = None
+
+  @property
+  def fast_forwarding(self):
+    return self._position < len(self._decisions)
+
+  @property
+  def decisions_remaining(self):
+    return len(self._decisions) - self._position
+
+  def load(self):
+    with open(self.checkpoint_path) as f:
+      checkpoint = json.load(f)
+    if checkpoint['bug_signature'] != json.loads(json.dumps(self.mcs_finder.bug_signature)):
+      raise RuntimeError("Checkpoint %s is for bug signature %s, not %s" %
+                         (self.checkpoint_path, checkpoint['bug_signature'],
+                          self.mcs_finder.bug_signature))
+    self._decisions = checkpoint['decisions']
+    self._position = 0
+    self._state = checkpoint['state']
+    # Don't redump intermediate MCSes while fast-forwarding
+    self.mcs_finder.mcs_log_tracker.count = self._state['mcs_log_count']
+    self.mcs_finder.mcs_log_tracker.min_size = self._state['mcs_log_min_size']
+    if not self.fast_forwarding:
+      self._restore()
+
+  def decide(self, inputs, check):
+    ''' Return the journaled outcome of the next check if there is one,
+    otherwise run check() and journal its outcome. '''
+    # Normalize tuples to lists, as they would be after a round trip
+    inputs = json.loads(json.dumps(inputs))
+    if self.fast_forwarding:
+      decision = self._decisions[self._position]
+      if decision['inputs'] != inputs:
+        raise RuntimeError("Checkpoint %s diverges from this run at decision %d "
+                           "(expected %s, got %s). Was the trace or config changed?" %
+                           (self.checkpoint_path, self._position,
+                            decision['inputs'], inputs))
+      self._position += 1
+      if not self.fast_forwarding:
+        self._restore()
+        self.mcs_finder.log("Caught up with checkpoint. Resuming replays")
+      return decision['outcome']
+
+    outcome = check()
+    self._decisions.append({ 'inputs' : inputs, 'outcome' : outcome })
+    self._position += 1
+    self.write()
+    return outcome
+
+  def write(self):
+    mcs_finder = self.mcs_finder
+    checkpoint = {
+      'bug_signature' : mcs_finder.bug_signature,
+      'decisions' : self._decisions,
+      'state' : {
+        'subsequence_id' : mcs_finder.subsequence_id,
+        'runtime_stats' : mcs_finder._runtime_stats.snapshot(),
+        'replay_log_count' : mcs_finder.replay_log_tracker.count,
+        'mcs_log_count' : mcs_finder.mcs_log_tracker.count,
+        'mcs_log_min_size' : mcs_finder.mcs_log_tracker.min_size,
+      },
+    }
+    # Write to a temporary file and rename, so that a crash never leaves a
+    # half-written checkpoint behind.
+    tmp_path = self.checkpoint_path + ".tmp"
+    with open(tmp_path, "w") as f:
+      json.dump(checkpoint, f)
+      f.flush()
+      os.fsync(f.fileno())
+    os.rename(tmp_path, self.checkpoint_path)
+
+  def _restore(self):
+    state = self._state
+    if state is None:
+      return
+    mcs_finder = self.mcs_finder
+    mcs_finder.subsequence_id = state['subsequence_id']
+    mcs_finder._runtime_stats.restore(state['runtime_stats'])
+    mcs_finder.replay_log_tracker.count = state['replay_log_count']
+    self._state = None
+
 class MCSLogTracker(object):
   ''' Logs intermedate and final MCS results that are the outcome(s) of delta
   debugging'''
@@ -610,7 +1438,8 @@ class RuntimeStats(object):
 
   child_fields = ['iteration_size', 'violation_found_in_run', 'new_internal_events',
                   'early_internal_events', 'timed_out_events',
-                  'matched_events', 'buffered_message_receipts']
+                  'matched_events', 'buffered_message_receipts',
+                  'early_violation_event_index']
   child_counters = ['violation_found_in_run']
 
   def __init__(self, subsequence_id, runtime_stats_path=None):
@@ -637,6 +1466,9 @@ class RuntimeStats(object):
     self.timed_out_events = {}
     # { replay iteration -> { event type -> successful matches } }
     self.matched_events = {}
+    # { replay iteration -> index of the event after which the violation was
+    #                       observed, for replays that ended early }
+    self.early_violation_event_index = {}
     # -------------------- Stats set by parent process -------------------- #
     self.total_inputs = 0
     self.total_events = 0
@@ -651,6 +1483,27 @@ class RuntimeStats(object):
     self.config = ""
     self.total_replays = 0
     self.total_inputs_replayed = 0
+    # Replays skipped because their outcome was in the replay outcome cache
+    self.cached_replay_outcomes = 0
+    # Replays skipped because their outcome followed from earlier ones by
+    # monotonicity
+    self.implied_replay_outcomes = 0
+    # Replays skipped because the search for another bug signature had
+    # already replayed the same inputs
+    self.shared_replay_outcomes = 0
+    # Speculative replays (EfficientMCSFinder), and how much of their
+    # wall-clock time went towards tests that delta debugging ended up using.
+    self.speculative_replays = 0
+    self.useful_speculative_replays = 0
+    self.useful_speculative_replay_seconds = 0
+    self.wasted_speculative_replay_seconds = 0
+    # { input labels of a tested subset -> { 'successes' : replays that hit the
+    #   bug, 'trials' : replays } }, for every subset delta debugging replayed
+    self.subset_verification = {}
+    # Replays (and successes) of subsets that did reproduce the bug. Used to
+    # estimate how hard the bug is to hit.
+    self.reproducing_subset_trials = 0
+    self.reproducing_subset_successes = 0
     # { % of inferred fingerprints that were ambiguous ->
     #   # of replays where this % occurred }
     self.ambiguous_counts = {}
@@ -680,6 +1533,18 @@ class RuntimeStats(object):
   def get_runtime_stats_path(self):
     return self._runtime_stats_path
 
+  def snapshot(self):
+    ''' Return a JSON-serializable copy of all stats, for checkpointing '''
+    snapshot = dict(self.__dict__)
+    del snapshot['_runtime_stats_path']
+    return snapshot
+
+  def restore(self, snapshot):
+    for field, value in snapshot.iteritems():
+      setattr(self, field, value)
+    self.violation_found_in_run = Counter(dict((int(k), v) for k, v in
+                                               self.violation_found_in_run.iteritems()))
+
   # N.B. always invoked within a child process.
   def clone(self, runtime_stats_path):
     clone = copy.deepcopy(self)
@@ -726,6 +1591,39 @@ class RuntimeStats(object):
     self.total_replays += 1
     self.total_inputs_replayed += number_inputs_replayed
 
+  def record_subset_verification(self, input_labels, successes, trials):
+    key = " ".join(input_labels)
+    stats = self.subset_verification.setdefault(key, { 'successes' : 0, 'trials' : 0 })
+    stats['successes'] += successes
+    stats['trials'] += trials
+    if successes > 0:
+      self.reproducing_subset_successes += successes
+      self.reproducing_subset_trials += trials
+
+  def reproduction_probability_estimate(self):
+    ''' Estimated probability that a replay of a reproducing subset hits the
+    bug '''
+    return ReproductionEstimator(self.reproducing_subset_successes,
+                                 self.reproducing_subset_trials).probability
+
+  def record_cached_replay_outcome(self):
+    self.cached_replay_outcomes += 1
+
+  def record_implied_replay_outcome(self):
+    self.implied_replay_outcomes += 1
+
+  def record_shared_replay_outcome(self):
+    self.shared_replay_outcomes += 1
+
+  def record_speculative_replay(self, duration_seconds):
+    self.speculative_replays += 1
+    self.wasted_speculative_replay_seconds += duration_seconds
+
+  def record_useful_speculative_replay(self, duration_seconds):
+    self.useful_speculative_replays += 1
+    self.useful_speculative_replay_seconds += duration_seconds
+    self.wasted_speculative_replay_seconds -= duration_seconds
+
   # -------------------- Stats set by child processes  -------------------- #
 
   def record_iteration_size(self, iteration_size):
@@ -751,6 +1649,9 @@ class RuntimeStats(object):
   def record_matched_events(self, matched_events):
     self.matched_events[self.subsequence_id] = matched_events
 
+  def record_early_violation(self, event_index):
+    self.early_violation_event_index[self.subsequence_id] = event_index
+
   # -------------------- RPC helper methods -------------------- #
 
   def client_dict(self):
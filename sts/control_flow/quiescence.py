@@ -0,0 +1,91 @@
+# Copyright 2011-2013 Colin Scott
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+'''
+Detects when a simulation has gone idle, so that replays can move on as soon
+as the controllers have finished reacting rather than sleeping out
+wall-clock guesses.
+'''
+
+import time
+import logging
+
+log = logging.getLogger("quiescence")
+
+# How long the simulation has to stay idle before it is declared quiescent
+default_grace_seconds = 0.1
+
+class QuiescenceDetector(object):
+  '''
+  The simulation is quiescent once, for grace_seconds in a row:
+    - IOMaster has handled no I/O and has nothing waiting to be sent,
+    - the OpenFlowBuffer holds no pending receives or sends, and
+    - the sync callback has no unacknowledged state changes or unanswered
+      deterministic value requests.
+
+  If expected_messages (the Replayer's ExpectedMessageWindow) is set, only
+  pending receives and sends that it expects count. Replayers that don't
+  allow unexpected messages never release the others, so they would
+  otherwise keep the simulation busy forever.
+  '''
+  def __init__(self, simulation, grace_seconds=default_grace_seconds,
+               expected_messages=None):
+    self.simulation = simulation
+    self.grace_seconds = grace_seconds
+    self.expected_messages = expected_messages
+
+  def _pending_messages(self, openflow_buffer):
+    ''' Return whether openflow_buffer holds messages that count as in
+    flight '''
+    pending = openflow_buffer.pending_receives() + openflow_buffer.pending_sends()
+    if self.expected_messages is None:
+      return pending != []
+    return any(self.expected_messages.expects(m) for m in pending)
+
+  def busy(self):
+    ''' Return whether something is in flight right now '''
+    if self.simulation.io_master.pending_io():
+      return True
+    openflow_buffer = getattr(self.simulation, "openflow_buffer", None)
+    if openflow_buffer is not None and self._pending_messages(openflow_buffer):
+      return True
+    # Not all sync callbacks (e.g. RecordingSyncCallback) buffer anything
+    sync_callback = getattr(self.simulation, "controller_sync_callback", None)
+    if (hasattr(sync_callback, "pending_state_changes") and
+        (sync_callback.pending_state_changes() or
+         sync_callback.cid2deterministic_value)):
+      return True
+    return False
+
+  def wait(self, timeout):
+    ''' Run the io loop until the simulation has been quiescent for
+    grace_seconds, or timeout seconds have passed. Returns whether it became
+    quiescent. '''
+    io_master = self.simulation.io_master
+    start = time.time()
+    end = start + timeout
+    quiet_since = start
+    while True:
+      now = time.time()
+      if self.busy():
+        quiet_since = now
+      elif io_master.last_activity is not None:
+        quiet_since = max(quiet_since, io_master.last_activity)
+      if now - quiet_since >= self.grace_seconds:
+        log.debug("Quiescent after %.0f ms" % ((now - start) * 1000))
+        return True
+      if now >= end:
+        return False
+      # select() returns early on any I/O, which resets the grace period
+      io_master.select(min(self.grace_seconds - (now - quiet_since), end - now))
@@ -20,18 +20,20 @@ control flow for running the simulation forward.
 '''
 
 from sts.control_flow.interactive import Interactive
-from sts.control_flow.event_scheduler import EventScheduler
+from sts.control_flow.event_scheduler import EventScheduler, default_initial_wait
 from sts.replay_event import *
 from sts.event_dag import EventDag
 import sts.input_traces.log_parser as log_parser
 from sts.util.console import color
 from sts.control_flow.base import ControlFlow, ReplaySyncCallback
-from sts.util.convenience import find, find_index, base64_encode
+from sts.util.convenience import base64_encode
 from sts.topology import BufferedPatchPanel
 from sts.entities import FuzzSoftwareSwitch
 
 import signal
 import logging
+import time
+from collections import deque
 
 log = logging.getLogger("Replayer")
 
@@ -53,7 +55,14 @@ class Replayer(ControlFlow):
                allow_unexpected_messages=False,
                pass_through_whitelisted_messages=True,
                delay_flow_mods=False,
+               early_invariant_check=None, early_check_event_types=None,
+               early_check_interval_seconds=None, early_check_signature=None,
                **kwargs):
+    ''' If early_invariant_check is given, it is invoked during the replay:
+    after each event whose class name is in early_check_event_types, and at
+    most every early_check_interval_seconds otherwise. As soon as it reports
+    early_check_signature (or any violation, if that is None), the replay
+    stops; see early_violations and early_violation_event_index. '''
     ControlFlow.__init__(self, simulation_cfg)
     if wait_on_deterministic_values:
       self.sync_callback = ReplaySyncCallback()
@@ -85,6 +94,10 @@ class Replayer(ControlFlow):
 
     # compute interpolate to time to be just before first event
     self.compute_interpolated_time(self.dag.events[0])
+    # With virtual time, the clock starts initial_wait before the recording,
+    # so that nothing stamped during bootstrap is ahead of the replay
+    self.clock_start_seconds = (self.dag.events[0].time.as_float() -
+                                kwargs.get("initial_wait", default_initial_wait))
     # String repesentations of unexpected state changes we've passed through, for
     # statistics purposes.
     self.unexpected_state_changes = []
@@ -103,7 +116,18 @@ class Replayer(ControlFlow):
     # String repesentations of unexpected messages we've passed through, for
     # statistics purposes.
     self.passed_unexpected_messages = []
+    # ExpectedMessageWindow over the dag being replayed
+    self._expected_messages = None
     self.delay_flow_mods = delay_flow_mods
+    self.early_invariant_check = early_invariant_check
+    self.early_check_event_types = set(early_check_event_types or [])
+    self.early_check_interval_seconds = early_check_interval_seconds
+    self.early_check_signature = early_check_signature
+    self._last_early_check = None
+    # The violations that ended the replay early, and the index of the event
+    # after which they were observed. None if the replay ran to completion.
+    self.early_violations = None
+    self.early_violation_event_index = None
 
     if self.pass_through_whitelisted_messages:
       for event in self.dag.events:
@@ -118,6 +142,12 @@ class Replayer(ControlFlow):
             **{ k: v for k,v in kwargs.items()
                 if k in EventScheduler.kwargs })
 
+  @property
+  def expected_messages(self):
+    ''' ExpectedMessageWindow of the control messages that the rest of the
+    replay expects. None before the replay starts. '''
+    return self._expected_messages
+
   def _log_input_event(self, event, **kws):
     if self._input_logger is not None:
       self._input_logger.log_input_event(event, **kws)
@@ -152,7 +182,8 @@ class Replayer(ControlFlow):
 
   def simulate(self, post_bootstrap_hook=None):
     ''' Caller *must* call simulation.clean_up() '''
-    self.simulation = self.simulation_cfg.bootstrap(self.sync_callback)
+    self.simulation = self.simulation_cfg.bootstrap(self.sync_callback,
+                          clock_start_seconds=self.clock_start_seconds)
     assert(isinstance(self.simulation.patch_panel, BufferedPatchPanel))
     # TODO(aw): remove this hack
     self.simulation.fail_to_interactive = self.fail_to_interactive
@@ -182,6 +213,10 @@ class Replayer(ControlFlow):
     event_scheduler = self.create_event_scheduler(self.simulation)
     event_scheduler.set_input_logger(self._input_logger)
     self.event_scheduler_stats = event_scheduler.stats
+    self._expected_messages = ExpectedMessageWindow(dag.events,
+                                                    self.expected_message_round_window)
+    if getattr(event_scheduler, "quiescence", None) is not None:
+      event_scheduler.quiescence.expected_messages = self._expected_messages
     if post_bootstrap_hook is not None:
       post_bootstrap_hook()
 
@@ -192,6 +227,7 @@ class Replayer(ControlFlow):
       raise KeyboardInterrupt()
     self.old_interrupt = signal.signal(signal.SIGINT, interrupt)
 
+    self._last_early_check = time.time()
     try:
       for i, event in enumerate(dag.events):
         try:
@@ -201,6 +237,7 @@ class Replayer(ControlFlow):
           if isinstance(event, InputEvent):
             self._check_early_state_changes(dag, i, event)
           self._check_new_state_changes(dag, i)
+          self._expected_messages.advance(i)
           self._check_unexpected_cp_messages(dag, i)
           # TODO(cs): quasi race-condition here. If unexpected state change
           # happens *while* we're waiting for event, we basically have a
@@ -213,11 +250,21 @@ class Replayer(ControlFlow):
           if self.logical_time != event.round:
             self.logical_time = event.round
             self.increment_round()
+          violations = self._check_invariant_early(event)
+          if violations is not None:
+            msg.event(color.B_BLUE+"Violation observed after event %d (%s). "
+                      "Ending replay early" % (i, event.label))
+            self.early_violations = violations
+            self.early_violation_event_index = i
+            break
         except KeyboardInterrupt:
           interactive = Interactive(self.simulation_cfg,
                                     input_logger=self._input_logger)
           interactive.simulate(self.simulation, bound_objects=( ('replayer', self), ))
           self.old_interrupt = signal.signal(signal.SIGINT, interrupt)
+      else:
+        # Nothing is expected anymore
+        self._expected_messages.advance(len(dag.events))
     finally:
       if self.old_interrupt:
         signal.signal(signal.SIGINT, self.old_interrupt)
@@ -229,6 +276,27 @@ class Replayer(ControlFlow):
           input_logger=self._input_logger)
       interactive.simulate(self.simulation, bound_objects=( ('replayer', self), ))
 
+  def _check_invariant_early(self, event):
+    ''' Return the violations if the invariant check is due and reports the
+    violation we are looking for, otherwise None. '''
+    if self.early_invariant_check is None:
+      return None
+    now = time.time()
+    due = type(event).__name__ in self.early_check_event_types
+    if (self.early_check_interval_seconds is not None and
+        now - self._last_early_check >= self.early_check_interval_seconds):
+      due = True
+    if not due:
+      return None
+    self._last_early_check = now
+    violations = self.early_invariant_check(self.simulation)
+    if violations == []:
+      return None
+    if (self.early_check_signature is not None and
+        self.early_check_signature not in violations):
+      return None
+    return violations
+
   def _check_early_state_changes(self, dag, current_index, input):
     ''' Check whether any pending state change that were supposed to come
     *after* the current input have occured. If so, we have violated causality.'''
@@ -284,43 +352,107 @@ class Replayer(ControlFlow):
     # Currently it appears that this method is too liberal, and ends up
     # causing timouts as a result of letting messages through.
 
-    # First, build a set of expected ControlMessageSends/Receives fingerprints
-    # within the next expected_message_round_window rounds.
-    start_round = dag.events[current_index].round
-    expected_receive_fingerprints = set()
-    expected_send_fingerprints = set()
-    for i in xrange(current_index, len(dag.events)):
-      event = dag.events[i]
-      if event.round - start_round > self.expected_message_round_window:
-        break
-      if type(event) == ControlMessageReceive:
-        (_, of_fingerprint, dpid, cid) = event.fingerprint
-        expected_receive_fingerprints.add((of_fingerprint, dpid, cid))
-      if type(event) == ControlMessageSend:
-        (_, of_fingerprint, dpid, cid) = event.fingerprint
-        expected_send_fingerprints.add((of_fingerprint, dpid, cid))
+    # First, slide the window of expected ControlMessageSends/Receives
+    # fingerprints to cover the next expected_message_round_window rounds.
+    if (self._expected_messages is None or
+        self._expected_messages.events is not dag.events):
+      self._expected_messages = ExpectedMessageWindow(dag.events,
+                                                      self.expected_message_round_window)
+    self._expected_messages.advance(current_index)
 
     # Now check pending messages.
-    for expected_fingerprints, messages in [
-         (expected_receive_fingerprints, self.simulation.openflow_buffer.pending_receives()),
-         (expected_send_fingerprints, self.simulation.openflow_buffer.pending_sends())]:
-      for pending_message in messages:
-        fingerprint = (pending_message.fingerprint,
-                       pending_message.dpid,
-                       pending_message.controller_id)
-        if fingerprint not in expected_fingerprints:
-          message = self.simulation.openflow_buffer.schedule(pending_message)
-          log.debug("Sending unexpected %s" % message)
-          b64_packet = base64_encode(message)
-          # Monkeypatch a "new internal event" marker to be logged to the JSON trace
-          # (All fields picked up by event.to_json())
-          event_type = ControlMessageReceive if type(pending_message) == PendingReceive else ControlMessageSend
-          log_event = event_type(pending_message.dpid, pending_message.controller_id,
-                                 pending_message.fingerprint, b64_packet=b64_packet)
-          log_event.new_internal_event = True
-          log_event.replay_time = SyncTime.now()
-          self.passed_unexpected_messages.append(repr(log_event))
-          self._log_input_event(log_event)
+    openflow_buffer = self.simulation.openflow_buffer
+    for pending_message in openflow_buffer.unexpected_pending_messages(self._expected_messages):
+      message = openflow_buffer.schedule(pending_message)
+      log.debug("Sending unexpected %s" % message)
+      b64_packet = base64_encode(message)
+      # Monkeypatch a "new internal event" marker to be logged to the JSON trace
+      # (All fields picked up by event.to_json())
+      event_type = ControlMessageReceive if type(pending_message) == PendingReceive else ControlMessageSend
+      log_event = event_type(pending_message.dpid, pending_message.controller_id,
+                             pending_message.fingerprint, b64_packet=b64_packet)
+      log_event.new_internal_event = True
+      log_event.replay_time = SyncTime.now()
+      self.passed_unexpected_messages.append(repr(log_event))
+      self._log_input_event(log_event)
+
+class ExpectedMessageWindow(object):
+  ''' Multiset of the (dpid, controller id, OFFingerprint) of the
+  ControlMessageReceives and ControlMessageSends among the events within
+  round_window rounds of a cursor into events. Pending messages compare equal
+  to these keys, so membership checks are a single dict lookup.
+
+  As the cursor moves forward, only the events that enter or leave the window
+  are added or dropped. '''
+  def __init__(self, events, round_window):
+    self.events = events
+    self.round_window = round_window
+    # The window is events[_start:_end]
+    self._start = 0
+    self._end = 0
+    self._start_round = None
+    # { key -> count }
+    self._receives = {}
+    self._sends = {}
+
+  def _multiset(self, event):
+    if type(event) == ControlMessageReceive:
+      return self._receives
+    if type(event) == ControlMessageSend:
+      return self._sends
+    return None
+
+  @staticmethod
+  def _key(event):
+    (_, of_fingerprint, dpid, cid) = event.fingerprint
+    return (dpid, cid, of_fingerprint)
+
+  def _add(self, event):
+    multiset = self._multiset(event)
+    if multiset is not None:
+      key = self._key(event)
+      multiset[key] = multiset.get(key, 0) + 1
+
+  def _drop(self, event):
+    multiset = self._multiset(event)
+    if multiset is not None:
+      key = self._key(event)
+      multiset[key] -= 1
+      if multiset[key] == 0:
+        del multiset[key]
+
+  def advance(self, index):
+    ''' Move the window to start at events[index]. With index ==
+    len(events), the window is empty. '''
+    if index >= len(self.events):
+      self._receives.clear()
+      self._sends.clear()
+      self._start = self._end = len(self.events)
+      self._start_round = None
+      return
+    start_round = self.events[index].round
+    if index < self._start or (self._start_round is not None and
+                               start_round < self._start_round):
+      # Events already in the window might now fall outside of it. Rare
+      # (rounds are normally non-decreasing), so just start over.
+      self._receives.clear()
+      self._sends.clear()
+      self._start = self._end = index
+    for i in xrange(self._start, min(index, self._end)):
+      self._drop(self.events[i])
+    self._start = index
+    self._end = max(self._end, index)
+    self._start_round = start_round
+    while (self._end < len(self.events) and
+           self.events[self._end].round - start_round <= self.round_window):
+      self._add(self.events[self._end])
+      self._end += 1
+
+  def expects(self, pending_message):
+    ''' Return whether a PendingReceive or PendingSend is in the window '''
+    if type(pending_message) == PendingReceive:
+      return pending_message in self._receives
+    return pending_message in self._sends
 
 # --- Note: use DataplaneChecker at your own risk. I have observed it fail to
 #     reproduce a bug that was reproducible with dataplane timeouts.
@@ -344,15 +476,19 @@ class DataplaneChecker(object):
     # Note it is not sufficient to simply track the entire list of drops/permits from
     # the original run, since the sequence of dataplane events may be different
     # in the pruned run.
-    self.events = list(event_dag.events)
-    self.stats = DataplaneCheckerStats(self.events)
-    # The current sequence of dataplane events we expect within the current
-    # window
-    self.current_dp_fingerprints = []
-    # Mapping from fingerprint in current_dp_fingerprints to the index of the
-    # event in self.events
-    self.fingerprint_2_event_idx = {}
+    self.stats = DataplaneCheckerStats(event_dag.events)
+    # The dataplane events from the original run that we haven't matched yet,
+    # indexed by their fingerprint (minus the Event class name):
+    # { fingerprint -> deque([(round, event fingerprint)]) }, in trace order
+    self.fingerprint2pending = {}
+    for e in event_dag.events:
+      if type(e) == DataplanePermit or type(e) == DataplaneDrop:
+        key = e.fingerprint[1:]
+        if key not in self.fingerprint2pending:
+          self.fingerprint2pending[key] = deque()
+        self.fingerprint2pending[key].append((e.round, e.fingerprint))
     self.slop_buffer = slop_buffer
+    self.current_round = 0
 
   def decide_drop(self, dp_event):
     ''' Returns True if this event should be dropped, False otherwise '''
@@ -362,43 +498,39 @@ class DataplaneChecker(object):
     # rate fuzzer_params
     dp_fingerprint = (DPFingerprint.from_pkt(dp_event.packet),
                       dp_event.node.dpid, dp_event.port.port_no)
-
-    # Skip over the class name (first element of the tuple)
-    event_fingerprint = find(lambda f: f[1:] == dp_fingerprint,
-                             self.current_dp_fingerprints)
+    event_fingerprint = self._pop_expected(dp_fingerprint)
     if event_fingerprint is None:
       # Default to permit if we didn't expect this dp event
+      self.stats.record_miss()
       return False
-    # Flush this event from both our current window and our events list, so
-    # that we don't accidentally conflate distinct dp_events with the same
-    # fingerprint
-    self.current_dp_fingerprints.remove(event_fingerprint)
-    event_idx = self.fingerprint_2_event_idx[event_fingerprint]
-    self.events.pop(event_idx)
+    self.stats.record_hit()
     # First element of the tuple is the Event class name
     if event_fingerprint[0] == "DataplanePermit":
       return False
     self.stats.record_drop(event_fingerprint)
     return True # DataplaneDrop
 
+  def _pop_expected(self, dp_fingerprint):
+    ''' Return the fingerprint of the first unmatched dataplane event within
+    the current window that matches dp_fingerprint, or None. The event is
+    flushed, so that we don't accidentally conflate distinct dp_events with
+    the same fingerprint. '''
+    pending = self.fingerprint2pending.get(dp_fingerprint)
+    if not pending:
+      return None
+    # The window only moves forward, so events that fell behind it will
+    # never be matched
+    while pending and pending[0][0] < self.current_round - self.slop_buffer:
+      pending.popleft()
+    if not pending or pending[0][0] >= self.current_round + self.slop_buffer:
+      return None
+    return pending.popleft()[1]
+
   def update_window(self, current_round):
-    ''' Update the current slop buffer ("the dp_events we expect to see") '''
-    self.current_dp_fingerprints = []
-    self.fingerprint_2_event_idx = {}
-    # TODO(cs): O(n) operation
-    head_idx = find_index(lambda e: e.round == current_round - self.slop_buffer,
-                          self.events)
-    head_idx = max(head_idx, 0)
-    tail_idx = find_index(lambda e: e.round == current_round + self.slop_buffer,
-                          self.events)
-    if tail_idx is None:
-      tail_idx = len(self.events)
-    for i in xrange(head_idx, tail_idx):
-      if (type(self.events[i]) == DataplanePermit or
-          type(self.events[i]) == DataplaneDrop):
-        fingerprint = self.events[i].fingerprint
-        self.current_dp_fingerprints.append(fingerprint)
-        self.fingerprint_2_event_idx[fingerprint] = i
+    ''' Update the current slop buffer ("the dp_events we expect to see"):
+    those from rounds [current_round - slop_buffer, current_round +
+    slop_buffer) '''
+    self.current_round = current_round
 
   def check_dataplane(self, current_round, simulation):
     ''' Check dataplane events for before playing then next event.
@@ -421,14 +553,25 @@ class DataplaneCheckerStats(object):
   def __init__(self, events):
     self.expected_drops = [e.fingerprint for e in events if type(e) == DataplaneDrop]
     self.actual_drops = []
+    # How many dataplane events did (hits) or did not (misses) match an
+    # expected event within the window
+    self.hits = 0
+    self.misses = 0
 
   def record_drop(self, fingerprint):
     self.actual_drops.append(fingerprint)
 
+  def record_hit(self):
+    self.hits += 1
+
+  def record_miss(self):
+    self.misses += 1
+
   def __str__(self):
     ''' Warning: not idempotent! '''
     s = ["Expected drops (%d), Actual drops (%d)" % (len(self.expected_drops),
-                                                     len(self.actual_drops)) ]
+                                                     len(self.actual_drops)),
+         "Window hits (%d), misses (%d)" % (self.hits, self.misses) ]
     s.append("Missed Drops (expected if TrafficInjections pruned):")
     for drop in self.expected_drops:
       if len(self.actual_drops) == 0 or drop != self.actual_drops[0]:
@@ -0,0 +1,167 @@
+# Copyright 2011-2013 Colin Scott
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+'''
+Per-event-class timeouts for replay, learned from how long internal events
+actually took to show up in earlier replays.
+
+EventSchedulerStats records each matched internal event's arrival delay: how
+much longer than its recorded gap (the time since the previous event in the
+original run) the event took to proceed. Events that time out are censored
+observations: all we know is that they would have taken longer than we
+waited. For those, the scheduler records TimeoutModel.censored_delay(),
+which backs off past the timeout that was too short. MCSFinder feeds the
+delays into a TimeoutModel, which EventScheduler asks for each internal
+event's timeout. The model is saved next to the trace
+(timeout_model_path()), so that later runs start out calibrated.
+'''
+
+import json
+import logging
+import math
+import os
+
+log = logging.getLogger("timeout_model")
+
+def timeout_model_path(superlog_path):
+  return superlog_path + ".timeouts"
+
+def _jsonable(value):
+  if hasattr(value, "to_dict"):
+    return value.to_dict()
+  if type(value) in (list, tuple):
+    return [ _jsonable(v) for v in value ]
+  return value
+
+def fingerprint_key(event):
+  ''' A string that identifies event's fingerprint across processes and
+  runs '''
+  return json.dumps(_jsonable(event.fingerprint), sort_keys=True, default=str)
+
+def quantile(samples, q):
+  ''' The q'th quantile (0 <= q <= 1) of samples, by linear interpolation '''
+  samples = sorted(samples)
+  position = q * (len(samples) - 1)
+  lower = int(math.floor(position))
+  upper = int(math.ceil(position))
+  return samples[lower] + (samples[upper] - samples[lower]) * (position - lower)
+
+class TimeoutModel(object):
+  '''
+  The timeout for an event is its recorded gap plus the `quantile' of the
+  arrival delays observed for its fingerprint, or, if fewer than min_samples
+  of those have been observed, for its class. Without min_samples
+  observations of either, the scheduler's default (epsilon_seconds based)
+  timeout is used. Timeouts are never shorter than min_timeout_seconds.
+
+  A timeout counts as a delay of backoff_factor times what we waited beyond
+  the gap, at least the default's and at most max_backoff_seconds (unless
+  the default's is more), so timeouts that turn out to be too short grow.
+
+  Only the max_samples most recent delays are kept per fingerprint.
+  '''
+  def __init__(self, quantile=0.95, min_samples=5, min_timeout_seconds=0.05,
+               max_samples=100, backoff_factor=2.0, max_backoff_seconds=5.0):
+    if not 0 <= quantile <= 1:
+      raise ValueError("quantile must be between 0 and 1, not %s" % quantile)
+    self.quantile = quantile
+    self.min_samples = min_samples
+    self.min_timeout_seconds = min_timeout_seconds
+    self.max_samples = max_samples
+    self.backoff_factor = backoff_factor
+    self.max_backoff_seconds = max_backoff_seconds
+    # { class name -> { fingerprint key -> [delay seconds] } }
+    self.class2fingerprint2delays = {}
+
+  def record(self, event, delay_seconds):
+    fingerprint2delays = self.class2fingerprint2delays.setdefault(
+        event.__class__.__name__, {})
+    delays = fingerprint2delays.setdefault(fingerprint_key(event), [])
+    delays.append(delay_seconds)
+    if len(delays) > self.max_samples:
+      del delays[:len(delays) - self.max_samples]
+
+  def record_replay(self, events, label2delay):
+    ''' Record the arrival delays of a replay of events, as returned by
+    play_forward(): { event label -> delay seconds } '''
+    for event in events:
+      if event.label in label2delay:
+        self.record(event, label2delay[event.label])
+
+  def timeout(self, event, gap_seconds, default_seconds):
+    ''' How long to wait for event, which was recorded gap_seconds after the
+    previous event '''
+    fingerprint2delays = self.class2fingerprint2delays.get(event.__class__.__name__)
+    if fingerprint2delays is None:
+      return default_seconds
+    delays = fingerprint2delays.get(fingerprint_key(event), [])
+    if len(delays) < self.min_samples:
+      delays = [ d for ds in fingerprint2delays.values() for d in ds ]
+      if len(delays) < self.min_samples:
+        return default_seconds
+    return max(gap_seconds + quantile(delays, self.quantile),
+               self.min_timeout_seconds)
+
+  def censored_delay(self, waited_seconds, default_seconds):
+    ''' The delay to record for an event that timed out after waiting
+    waited_seconds beyond its gap, where the default timeout would have
+    waited default_seconds beyond it '''
+    return max(min(self.backoff_factor * waited_seconds, self.max_backoff_seconds),
+               default_seconds)
+
+  def to_json(self):
+    return {
+      'quantile' : self.quantile,
+      'min_samples' : self.min_samples,
+      'min_timeout_seconds' : self.min_timeout_seconds,
+      'max_samples' : self.max_samples,
+      'backoff_factor' : self.backoff_factor,
+      'max_backoff_seconds' : self.max_backoff_seconds,
+      'delays' : self.class2fingerprint2delays,
+    }
+
+  @staticmethod
+  def from_json(json_hash):
+    model = TimeoutModel(quantile=json_hash['quantile'],
+                         min_samples=json_hash['min_samples'],
+                         min_timeout_seconds=json_hash['min_timeout_seconds'],
+                         max_samples=json_hash['max_samples'],
+                         backoff_factor=json_hash.get('backoff_factor', 2.0),
+                         max_backoff_seconds=json_hash.get('max_backoff_seconds', 5.0))
+    model.class2fingerprint2delays = json_hash['delays']
+    return model
+
+  def save(self, path):
+    ''' Atomically replace path with this model '''
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+      json.dump(self.to_json(), f)
+    os.rename(tmp_path, path)
+
+  def load(self, path):
+    ''' Merge in the delays saved at path, if any. Our own parameters are
+    kept. '''
+    if not os.path.exists(path):
+      return
+    try:
+      with open(path) as f:
+        saved = TimeoutModel.from_json(json.load(f))
+    except (ValueError, KeyError) as e:
+      log.warn("Ignoring corrupt timeout model %s: %r" % (path, e))
+      return
+    for class_name, fingerprint2delays in saved.class2fingerprint2delays.iteritems():
+      ours = self.class2fingerprint2delays.setdefault(class_name, {})
+      for key, delays in fingerprint2delays.iteritems():
+        merged = delays + ours.get(key, [])
+        ours[key] = merged[-self.max_samples:]
@@ -16,6 +16,7 @@ import pickle
 from pox.lib.util import assert_type
 from pox.lib.packet.ethernet import *
 from sts.entities import HostInterface
+from sts.util.compression import open_trace_file
 
 import base64
 import logging
@@ -51,7 +52,8 @@ class Trace(object):
   '''Encapsulates a sequence of dataplane events to inject into a simulated network.'''
 
   def __init__(self, tracefile_path, topology=None):
-    with file(tracefile_path, 'r') as tracefile:
+    # The trace may be compressed (see sts/util/compression.py)
+    with open_trace_file(tracefile_path, 'rb') as tracefile:
       self.dataplane_trace = pickle.load(tracefile)
 
     if topology is not None:
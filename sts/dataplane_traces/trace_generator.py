@@ -26,13 +26,18 @@ import sts.topology as topo
 from collections import defaultdict
 import pickle
 from trace import DataplaneEvent
+from sts.util.compression import open_trace_file
 
-def write_trace_log(dataplane_events, filename):
+def write_trace_log(dataplane_events, filename, codec=None):
   '''
   Given a list of DataplaneEvents and a log filename, writes out a log.
   For manual trace generation rather than replay logging
+
+  If codec is given, the log is compressed with it (see
+  sts/util/compression.py). Trace reads either.
   '''
-  pickle.dump(dataplane_events, file(filename, "w"))
+  with open_trace_file(filename, "w", codec=codec) as output:
+    pickle.dump(dataplane_events, output)
 
 def generate_example_trace():
   trace = []
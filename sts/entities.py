@@ -296,6 +296,15 @@ class FuzzSoftwareSwitch (NXSoftwareSwitch):
     if seed is not None:
       self.random.seed(seed)
 
+  def use_virtual_clock(self, clock, expiry_interval_seconds=1.0):
+    ''' Expire flow entries as a VirtualClock (sts/util/virtual_clock.py)
+    advances, rather than as real time passes '''
+    clock.call_every(expiry_interval_seconds, self.expire_flows)
+
+  def expire_flows(self, now=None):
+    ''' Remove flow entries whose idle or hard timeout has passed by now '''
+    self.table.remove_expired_entries(now)
+
   @property
   def current_cmd_queue(self):
     ''' Alias for the current epoch's pending flow_mods. '''
@@ -18,6 +18,9 @@ from sts.fingerprints.messages import *
 from sts.replay_event import *
 import logging
 import time
+import bisect
+import itertools
+import string
 from collections import defaultdict
 log = logging.getLogger("event_dag")
 
@@ -57,21 +60,41 @@ class AtomicInput(object):
     return "AtomicInput:%r%r" % (self.failure, self.recovery)
 
 class EventDagView(object):
-  def __init__(self, parent, events_list):
-    ''' subset is a list '''
+  ''' A subsequence of an EventDag's events, represented as a bitmask over the
+  indices of the parent's events, so that views are cheap to derive from one
+  another. HostMigrations whose locations had to be rewritten for this view
+  are kept in replacements, { parent index -> replacement event }. '''
+  def __init__(self, parent, mask, replacements=None):
     self._parent = parent
-    self._events_list = list(events_list)
-    self._events_set = set(self._events_list)
+    self._mask = mask
+    self._replacements = replacements if replacements is not None else {}
+    # Materialized lazily
+    self._events = None
+    self._input_events = None
+    self._len = None
+    self._successors = None
 
   @property
   def events(self):
     '''Return the events in the DAG'''
-    return self._events_list
+    if self._events is None:
+      self._events = self._parent._events_of(self._mask, self._replacements)
+    return self._events
+
+  @property
+  def _events_list(self):
+    return self.events
+
+  @property
+  def _events_set(self):
+    return set(self.events)
 
   @property
   def input_events(self):
-    # TODO(cs): memoize?
-    return [ e for e in self._events_list if isinstance(e, InputEvent) and e.prunable ]
+    if self._input_events is None:
+      self._input_events = self._parent._events_of(self._mask & self._parent._input_mask,
+                                                   self._replacements)
+    return self._input_events
 
   @property
   def atomic_input_events(self):
@@ -86,16 +109,38 @@ class EventDagView(object):
     return self._parent.atomic_input_subset(subset)
 
   def input_complement(self, subset):
-    return self._parent.input_complement(subset, self._events_list)
+    return self._parent._input_complement(subset, self._mask, self._replacements)
 
   def insert_atomic_inputs(self, inputs):
-    return self._parent.insert_atomic_inputs(inputs, events_list=self._events_list)
+    return self._parent._insert_atomic_inputs(inputs, self._mask, self._replacements)
+
+  def union(self, other):
+    ''' Return a view with the events of both views, in their original order.
+    Where both views rewrote the same migration, ours wins. '''
+    replacements = dict(other._replacements)
+    replacements.update(self._replacements)
+    return self._parent._straighten_inserted_migrations(self._mask | other._mask,
+                                                        replacements)
 
   def add_inputs(self, inputs):
-    return self._parent.add_inputs(inputs, self._events_list)
+    return self._parent.add_inputs(inputs, self.events)
+
+  @property
+  def successors(self):
+    if self._successors is None:
+      self._successors = ViewSuccessorIndex(self._parent.successors,
+                                            self._parent._indices_of(self._mask),
+                                            self.events)
+    return self._successors
 
-  def next_state_change(self, index):
-    return self._parent.next_state_change(index, events=self.events)
+  def next_state_change(self, index, controller_id=None):
+    return self.successors.next_state_change(index, controller_id=controller_id)
+
+  def next_input(self, index):
+    return self.successors.next_input(index)
+
+  def next_controller_event(self, controller_id, index):
+    return self.successors.next_controller_event(controller_id, index)
 
   def get_original_index_for_event(self, event):
     return self._parent.get_original_index_for_event(event)
@@ -107,10 +152,12 @@ class EventDagView(object):
     return self._parent.set_events_as_timed_out(timed_out_event_labels)
 
   def filter_timeouts(self):
-    return self._parent.filter_timeouts(events_list=self._events_list)
+    return self._parent.filter_timeouts(events_list=self.events)
 
   def __len__(self):
-    return len(self._events_list)
+    if self._len is None:
+      self._len = bin(self._mask).count("1")
+    return self._len
 
 # TODO(cs): move these somewhere else
 def migrations_per_host(events):
@@ -120,18 +167,110 @@ def migrations_per_host(events):
       host2migrations[e.host_id].append(e)
   return host2migrations
 
-def replace_migration(replacee, old_location, new_location, event_list):
+def replaced_migration(replacee, old_location, new_location):
   # `replacee' is the migration to be replaced
   # Don't mutate replacee -- instead, replace it
-  new_migration = HostMigration(old_location[0], old_location[1],
-                                new_location[0], new_location[1],
-                                host_id=replacee.host_id,
-                                time=replacee.time, label=replacee.label)
-  # TODO(cs): O(n^2)
+  return HostMigration(old_location[0], old_location[1],
+                       new_location[0], new_location[1],
+                       host_id=replacee.host_id,
+                       time=replacee.time, label=replacee.label)
+
+def replace_migration(replacee, old_location, new_location, event_list):
+  new_migration = replaced_migration(replacee, old_location, new_location)
   index = event_list.index(replacee)
   event_list[index] = new_migration
   return new_migration
 
+class SuccessorIndex(object):
+  ''' For each position in an event list, the position of the next event
+  (at or after it) of a few kinds that the replayer looks ahead for: state
+  changes, inputs, and events involving a particular controller. Built in
+  one backwards pass, so that each lookahead is a list lookup. '''
+  def __init__(self, events):
+    self._events = events
+    keys_per_event = [ self._keys(e) for e in events ]
+    # key -> [index of the next matching event, or None]
+    self._successors = {}
+    # key -> [indices of the matching events], in order
+    self.positions = defaultdict(list)
+    for i, keys in enumerate(keys_per_event):
+      for key in keys:
+        if key not in self._successors:
+          self._successors[key] = [None] * (len(events) + 1)
+        self.positions[key].append(i)
+    current = {}
+    for i in xrange(len(events) - 1, -1, -1):
+      for key in keys_per_event[i]:
+        current[key] = i
+      for key, successor in current.iteritems():
+        self._successors[key][i] = successor
+
+  @staticmethod
+  def _keys(event):
+    keys = []
+    controller_id = getattr(event, "controller_id", None)
+    if isinstance(event, InputEvent):
+      keys.append("input")
+    if type(event) == ControllerStateChange:
+      keys.append("state_change")
+      keys.append(("state_change", controller_id))
+    if controller_id is not None:
+      keys.append(("controller", controller_id))
+    return keys
+
+  def _next(self, key, index):
+    successors = self._successors.get(key)
+    if successors is None or index >= len(self._events):
+      return None
+    successor = successors[index]
+    if successor is None:
+      return None
+    return self._events[successor]
+
+  def next_state_change(self, index, controller_id=None):
+    ''' Return the next ControllerStateChange at or after index, optionally
+    only considering those of controller_id '''
+    if controller_id is None:
+      return self._next("state_change", index)
+    return self._next(("state_change", controller_id), index)
+
+  def next_input(self, index):
+    return self._next("input", index)
+
+  def next_controller_event(self, controller_id, index):
+    ''' Return the next event at or after index that involves controller_id
+    (state changes, control channel events, controller failures...) '''
+    return self._next(("controller", controller_id), index)
+
+class ViewSuccessorIndex(SuccessorIndex):
+  ''' SuccessorIndex over the events of an EventDagView, derived from its
+  parent's index rather than rebuilt: the matching events of each kind are
+  the parent's, minus those outside the view. view_indices are the parent
+  indices of the view's events, in order. '''
+  def __init__(self, parent_index, view_indices, events):
+    self._events = events
+    self._parent_index = parent_index
+    self._view_indices = view_indices
+    # key -> [view indices of the matching events], computed on first use
+    self._positions = {}
+
+  def _view_positions(self, key):
+    if key not in self._positions:
+      view_positions = []
+      for parent_position in self._parent_index.positions.get(key, ()):
+        i = bisect.bisect_left(self._view_indices, parent_position)
+        if i < len(self._view_indices) and self._view_indices[i] == parent_position:
+          view_positions.append(i)
+      self._positions[key] = view_positions
+    return self._positions[key]
+
+  def _next(self, key, index):
+    view_positions = self._view_positions(key)
+    i = bisect.bisect_left(view_positions, index)
+    if i == len(view_positions):
+      return None
+    return self._events[view_positions[i]]
+
 class EventDag(object):
   '''A collection of Event objects. EventDags are primarily used to present a
   view of the underlying events with some subset of the input events pruned
@@ -154,19 +293,15 @@ class EventDag(object):
   _ignored_input_types = set([WaitTime])
 
   def __init__(self, events, prefix_trie=None):
-    '''events is a list of EventWatcher objects. Refer to log_parser.parse to
-    see how this is assembled.'''
+    '''events is a list (or iterable, e.g. log_parser.iter_parse) of Event
+    objects. Refer to log_parser.parse to see how this is assembled.'''
     # TODO(cs): ugly that the superclass has to keep track of
     # PeekingEventDag's data
     self._prefix_trie = prefix_trie
-    self._events_list = events
-    self._events_set = set(self._events_list)
-    self._label2event = {
-      event.label : event
-      for event in self._events_list
-    }
-    self._event2idx = {
-      event : i
+    self._events_list = events if type(events) == list else list(events)
+    # The only per-event index: labels are unique, and events hash by label
+    self._label2idx = {
+      event.label : i
       for i, event in enumerate(self._events_list)
     }
     # TODO(cs): this should be moved to a dag transformer class
@@ -175,25 +310,95 @@ class EventDag(object):
       for host, migrations in migrations_per_host(self._events_list).iteritems()
     }
     self._last_violation = None
+    # Bitmasks over indices into self._events_list, from which views are
+    # derived. N.B. assumes that events' prunable flags don't change once
+    # they are in a dag.
+    self._full_mask = (1 << len(self._events_list)) - 1
+    self._input_mask = 0
+    self._recovery_mask = 0
+    self._migration_indices = []
+    for i, e in enumerate(self._events_list):
+      if isinstance(e, InputEvent) and e.prunable:
+        self._input_mask |= 1 << i
+      if type(e) in self._recovery_types:
+        self._recovery_mask |= 1 << i
+      if type(e) == HostMigration:
+        self._migration_indices.append(i)
+    self._index_dependents()
+    self._input_events = None
+    self._successors = None
+
+  def _index_dependents(self):
+    # [ (index, mask of the inputs that depend on it) ], in index order
+    self._dependents = []
+    for i, e in enumerate(self._events_list):
+      dependent_labels = getattr(e, "dependent_labels", [])
+      if dependent_labels:
+        mask = 0
+        for label in dependent_labels:
+          mask |= 1 << self._label2idx[label]
+        self._dependents.append((i, mask))
 
   @property
   def events(self):
     '''Return the events in the DAG'''
     return self._events_list
 
+  @property
+  def _events_set(self):
+    return set(self._events_list)
+
   @property
   def input_events(self):
-    # TODO(cs): memoize?
-    return [ e for e in self._events_list if isinstance(e, InputEvent) and e.prunable ]
+    if self._input_events is None:
+      self._input_events = self._events_of(self._input_mask, {})
+    return self._input_events
 
   @property
   def atomic_input_events(self):
     return self._atomic_input_events(self.input_events)
 
   def _get_event(self, label):
-    if label not in self._label2event:
+    if label not in self._label2idx:
       raise ValueError("Unknown label %s" % str(label))
-    return self._label2event[label]
+    return self._events_list[self._label2idx[label]]
+
+  def _index_of(self, event):
+    ''' Return the index of event in the original trace. Migrations rewritten
+    by a view are found through their label. '''
+    if event.label in self._label2idx:
+      return self._label2idx[event.label]
+    raise ValueError("Event %s not present in original events list" % str(event))
+
+  def _mask_of(self, events):
+    ''' Return (mask, replacements) for a list of events from this dag or
+    its views '''
+    mask = 0
+    replacements = {}
+    for e in events:
+      i = self._index_of(e)
+      mask |= 1 << i
+      if e is not self._events_list[i]:
+        replacements[i] = e
+    return (mask, replacements)
+
+  # Translates a reversed bin() string into bytes for itertools.compress
+  _bits_to_bytes = string.maketrans("01", "\x00\x01")
+
+  def _selectors(self, mask):
+    return bytearray(bin(mask)[:1:-1].translate(self._bits_to_bytes))
+
+  def _indices_of(self, mask):
+    ''' Return the indices selected by mask, in order '''
+    selectors = self._selectors(mask)
+    return list(itertools.compress(xrange(len(selectors)), selectors))
+
+  def _events_of(self, mask, replacements):
+    ''' Return the events selected by mask, in their original order '''
+    if not replacements:
+      return list(itertools.compress(self._events_list, self._selectors(mask)))
+    return [ replacements.get(i) or self._events_list[i]
+             for i in self._indices_of(mask) ]
 
   def _atomic_input_events(self, inputs):
     # TODO(cs): memoize?
@@ -203,10 +408,10 @@ class EventDag(object):
       if e in skipped_recoveries:
         continue
 
-      if type(e) in self._failure_types and e.dependent_labels != []:
+      if type(e) in self._failure_types and e.dependent_labels:
         if len(e.dependent_labels) != 1:
           raise RuntimeError("Not expected to have more than one dependent label")
-        recovery = self._label2event[e.dependent_labels[0]]
+        recovery = self._get_event(e.dependent_labels[0])
         skipped_recoveries.add(recovery)
         atomic_inputs.append(AtomicInput(e, recovery))
       else:
@@ -221,34 +426,44 @@ class EventDag(object):
         inputs.append(e.recovery)
       else:
         inputs.append(e)
-    inputs.sort(key=lambda e: self._event2idx[e])
+    inputs.sort(key=self._index_of)
     return inputs
 
   def filter_unsupported_input_types(self):
-    return EventDagView(self, (e for e in self._events_list
-                               if type(e) not in self._ignored_input_types))
+    mask = self._full_mask
+    for i, e in enumerate(self._events_list):
+      if type(e) in self._ignored_input_types:
+        mask &= ~(1 << i)
+    return EventDagView(self, mask)
 
   def compute_remaining_input_events(self, ignored_portion, events_list=None):
     ''' ignore all input events in ignored_inputs,
     as well all of their dependent input events'''
     if events_list is None:
       events_list = self.events
-    remaining = []
-    for event in events_list:
-      if event not in ignored_portion:
-        remaining.append(event)
-      else:
-        # Add dependent to ignored_portion
-        for label in event.dependent_labels:
-          # Note that recoveries will be a dependent of preceding failures
-          dependent_event = self._label2event[label]
-          ignored_portion.add(dependent_event)
-
+    (base_mask, base_replacements) = self._mask_of(events_list)
+    (ignored_mask, _) = self._mask_of(ignored_portion)
+    (mask, replacements) = self._remaining(ignored_mask, base_mask, base_replacements)
+    return self._events_of(mask, replacements)
+
+  def _remaining(self, ignored_mask, base_mask, base_replacements):
+    ''' Return (mask, replacements) for the events of the base view, minus
+    ignored_mask and the inputs that depend on them '''
+    ignored_mask &= base_mask
+    for (i, dependents_mask) in self._dependents:
+      # Note that recoveries will be a dependent of preceding failures
+      if ignored_mask & (1 << i):
+        ignored_mask |= dependents_mask
+    remaining_mask = base_mask & ~ignored_mask
+    replacements = dict((i, e) for i, e in base_replacements.iteritems()
+                        if remaining_mask & (1 << i))
     # Update the migration locations in remaining
-    self.update_migrations(remaining, ignored_portion, events_list)
-    return remaining
+    self._update_migrations(remaining_mask, replacements, ignored_mask,
+                            base_mask, base_replacements)
+    return (remaining_mask, replacements)
 
-  def update_migrations(self, remaining, ignored_portion, events_list):
+  def _update_migrations(self, remaining_mask, replacements, ignored_mask,
+                         base_mask, base_replacements):
     ''' Walk through remaining input events, and update the source location of
     the host migration. For example, if one host migrates twice:
 
@@ -259,7 +474,7 @@ class EventDag(object):
 
     location A -> location C
 
-    Note: mutates remaining
+    Note: mutates replacements
     '''
     # TODO(cs): this should be moved outside of EventDag
     # TODO(cs): this algorithm could be simplified substantially by invoking
@@ -270,10 +485,13 @@ class EventDag(object):
     # location is: (ingress dpid, ingress port no)
     currentloc2unprunedloc = {}
 
-    for m in [e for e in events_list if type(e) == HostMigration]:
+    for i in self._migration_indices:
+      if not base_mask & (1 << i):
+        continue
+      m = base_replacements.get(i) or self._events_list[i]
       src = m.old_location
       dst = m.new_location
-      if m in ignored_portion:
+      if ignored_mask & (1 << i):
         if src in currentloc2unprunedloc:
           # There was a prior migration in ignored_portion
           # Update the new dst to point back to the unpruned location
@@ -292,67 +510,66 @@ class EventDag(object):
           unpruned_loc = currentloc2unprunedloc[src]
           del currentloc2unprunedloc[src]
           new_loc = dst
-          replace_migration(m, unpruned_loc, new_loc, remaining)
+          replacements[i] = replaced_migration(m, unpruned_loc, new_loc)
 
-  def _ignored_except_internals_and_recoveries(self, ignored_portion):
+  def _ignored_except_internals_and_recoveries(self, ignored_mask):
     # Note that dependent_labels only contains dependencies between input
     # events. Dependencies with internal events are inferred by EventScheduler.
     # Also note that we treat failure/recovery as an atomic pair, so we don't prune
     # recovery events on their own.
-    return set(e for e in ignored_portion
-               if (isinstance(e, InputEvent) and e.prunable and
-                   type(e) not in self._recovery_types))
+    return ignored_mask & self._input_mask & ~self._recovery_mask
 
-  def _ignored_except_internals(self, ignored_portion):
-    return set(e for e in ignored_portion if isinstance(e, InputEvent) and
-               e.prunable)
+  def _ignored_except_internals(self, ignored_mask):
+    return ignored_mask & self._input_mask
 
   def input_subset(self, subset):
     ''' Return a view of the dag with only the subset and subset dependents
     remaining'''
-    ignored = self._events_set - set(subset)
-    ignored = self._ignored_except_internals_and_recoveries(ignored)
-    remaining_events = self.compute_remaining_input_events(ignored)
-    return EventDagView(self, remaining_events)
+    (subset_mask, _) = self._mask_of(subset)
+    ignored = self._ignored_except_internals_and_recoveries(self._full_mask & ~subset_mask)
+    return EventDagView(self, *self._remaining(ignored, self._full_mask, {}))
 
   def atomic_input_subset(self, subset):
     ''' Return a view of the dag with only the subset remaining, where
     dependent input pairs remain together'''
     # Relatively simple: expand atomic pairs into individual inputs, take
     # all input events in result, and compute_remaining_input_events as normal
-    subset = self._expand_atomics(subset)
-    ignored = self._events_set - set(subset)
-    ignored = self._ignored_except_internals(ignored)
-    remaining_events = self.compute_remaining_input_events(ignored)
-    return EventDagView(self, remaining_events)
+    (subset_mask, _) = self._mask_of(self._expand_atomics(subset))
+    ignored = self._ignored_except_internals(self._full_mask & ~subset_mask)
+    return EventDagView(self, *self._remaining(ignored, self._full_mask, {}))
 
   def input_complement(self, subset, events_list=None):
     ''' Return a view of the dag with everything except the subset and
     subset dependencies'''
-    subset = self._ignored_except_internals_and_recoveries(subset)
-    remaining_events = self.compute_remaining_input_events(subset, events_list)
-    return EventDagView(self, remaining_events)
+    if events_list is None:
+      return self._input_complement(subset, self._full_mask, {})
+    return self._input_complement(subset, *self._mask_of(events_list))
+
+  def _input_complement(self, subset, base_mask, base_replacements):
+    (subset_mask, _) = self._mask_of(subset)
+    ignored = self._ignored_except_internals_and_recoveries(subset_mask)
+    return EventDagView(self, *self._remaining(ignored, base_mask, base_replacements))
 
-  def _straighten_inserted_migrations(self, remaining_events):
+  def _straighten_inserted_migrations(self, mask, replacements):
     ''' This is a bit hairy: when migrations are added back in, there may be
     gaps in host locations. We need to straighten out those gaps -- i.e. make
     the series of host migrations for any given host a line.
 
-    Pre: remaining_events is sorted in the same relative order as the original
-    trace
+    Returns a view of mask, with replacements updated as needed.
     '''
-    host2migrations = migrations_per_host(remaining_events)
-    for host, migrations in host2migrations.iteritems():
-      # Prime the loop with the initial location
-      previous_location = self._host2initial_location[host]
-      for m in migrations:
-        if m.old_location != previous_location:
-          replacement = replace_migration(m, previous_location,
-                                          m.new_location, remaining_events)
-        else:
-          replacement = m
-        previous_location = replacement.new_location
-    return remaining_events
+    replacements = dict(replacements)
+    # Prime with the initial locations
+    host2previous_location = dict(self._host2initial_location)
+    for i in self._migration_indices:
+      if not mask & (1 << i):
+        continue
+      m = replacements.get(i) or self._events_list[i]
+      previous_location = host2previous_location[m.host_id]
+      if m.old_location != previous_location:
+        m = replaced_migration(m, previous_location, m.new_location)
+        replacements[i] = m
+      host2previous_location[m.host_id] = m.new_location
+    return EventDagView(self, mask, replacements)
 
   def insert_atomic_inputs(self, atomic_inputs, events_list=None):
     '''Insert inputs into events_list in the same relative order as the
@@ -362,32 +579,14 @@ class EventDag(object):
     # sense to insert inputs into the original sequence that are already present
     if events_list is None:
       raise ValueError("Shouldn't be adding inputs to the original trace")
+    return self._insert_atomic_inputs(atomic_inputs, *self._mask_of(events_list))
 
-    inputs = self._expand_atomics(atomic_inputs)
-
-    if not all(e in self._event2idx for e in inputs):
-      raise ValueError("Not all inputs present in original events list %s" %
-                       [e for e in input if e not in self._event2idx])
-    if not all(e in self._event2idx for e in events_list):
-      raise ValueError("Not all events in original events list %s" %
-                       [e for e in events_list if e not in self._event2idx])
-
-    result = []
-    for _, successor in enumerate(events_list):
-      orig_successor_idx = self._event2idx[successor]
-      while len(inputs) > 0 and orig_successor_idx > self._event2idx[inputs[0]]:
-        # If the current successor did in fact come after the next input in the
-        # original trace, insert next input here
-        input = inputs.pop(0)
-        result.append(input)
-      result.append(successor)
-
-    # Any remaining inputs should be appended at the end -- they had no
-    # successors
-    result += inputs
+  def _insert_atomic_inputs(self, atomic_inputs, base_mask, base_replacements):
+    (inputs_mask, inputs_replacements) = self._mask_of(self._expand_atomics(atomic_inputs))
+    replacements = dict(inputs_replacements)
+    replacements.update(base_replacements)
     # Deal with newly added host migrations
-    result = self._straighten_inserted_migrations(result)
-    return EventDagView(self, result)
+    return self._straighten_inserted_migrations(base_mask | inputs_mask, replacements)
 
   def mark_invalid_input_sequences(self):
     '''Fill in domain knowledge about valid input
@@ -414,24 +613,33 @@ class EventDag(object):
           # Check if there were any failure predecessors
           if fingerprint in fingerprint2previousfailure:
             failure = fingerprint2previousfailure[fingerprint]
-            failure.dependent_labels.append(event.label)
+            failure.dependent_labels = list(failure.dependent_labels) + [event.label]
         #elif type(event) in self._ignored_input_types:
         #  raise RuntimeError("No support for %s dependencies" %
         #                      type(event).__name__)
+    self._index_dependents()
+
+  @property
+  def successors(self):
+    if self._successors is None:
+      self._successors = SuccessorIndex(self._events_list)
+    return self._successors
 
-  def next_state_change(self, index, events=None):
+  def next_state_change(self, index, events=None, controller_id=None):
     ''' Return the next ControllerStateChange that occurs at or after
     index.'''
-    if events is None:
-      events = self.events
-    # TODO(cs): for now, assumes a single controller
-    for event in events[index:]:
-      if type(event) == ControllerStateChange:
-        return event
-    return None
+    if events is not None and events is not self._events_list:
+      return SuccessorIndex(events).next_state_change(index, controller_id)
+    return self.successors.next_state_change(index, controller_id=controller_id)
+
+  def next_input(self, index):
+    return self.successors.next_input(index)
+
+  def next_controller_event(self, controller_id, index):
+    return self.successors.next_controller_event(controller_id, index)
 
   def get_original_index_for_event(self, event):
-    return self._event2idx[event]
+    return self._index_of(event)
 
   def __len__(self):
     return len(self._events_list)
@@ -457,4 +665,4 @@ class EventDag(object):
     if events_list is None:
       events_list = self._events_list
     no_timeouts = [ e for e in events_list if not e.timed_out ]
-    return EventDagView(self, no_timeouts)
+    return EventDagView(self, *self._mask_of(no_timeouts))
@@ -24,6 +24,11 @@ import re
 import logging
 
 def setup_experiment(args, config):
+  resume = getattr(args, "resume", None)
+  if resume is not None:
+    # Pick up where the interrupted experiment left off.
+    config.results_dir = resume.rstrip("/")
+
   # Grab parameters
   if args.exp_name:
     config.exp_name = args.exp_name
@@ -37,16 +42,22 @@ def setup_experiment(args, config):
     # Note that argparse returns a list
     config.timestamp_results = args.timestamp_results[0]
 
-  if hasattr(config, 'timestamp_results') and config.timestamp_results:
+  if (hasattr(config, 'timestamp_results') and config.timestamp_results and
+      resume is None):
     now = timestamp_string()
     config.results_dir += "_" + str(now)
 
   # Set up results directory
   create_python_dir("./experiments")
-  create_clean_python_dir(config.results_dir)
+  if resume is not None:
+    if not os.path.isdir(config.results_dir):
+      raise ValueError("Cannot resume: %s does not exist" % config.results_dir)
+  else:
+    create_clean_python_dir(config.results_dir)
 
   # Copy stdout and stderr to a file "simulator.out"
-  tee = Tee(open(os.path.join(config.results_dir, "simulator.out"), "w"))
+  tee = Tee(open(os.path.join(config.results_dir, "simulator.out"),
+                 "a" if resume is not None else "w"))
   tee.tee_stdout()
   tee.tee_stderr()
 
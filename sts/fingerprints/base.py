@@ -15,8 +15,23 @@
 
 
 import abc
+import weakref
+
+# Flyweights: (fingerprint class, frozenset of field2value items) -> the
+# canonical instance. Weak, so that fingerprints die with their traces.
+_interned = weakref.WeakValueDictionary()
+# (Event fingerprint tuples, e.g. (class name, OFFingerprint, dpid,
+# controller id), are not interned: they can't be weakly referenced, and
+# their members already are.)
+
+def clear_interned():
+  _interned.clear()
 
 class Fingerprint(object):
+  '''
+  Fingerprints must not be mutated once constructed: they are shared
+  (see intern()), and cache their hash.
+  '''
   __metaclass__ = abc.ABCMeta
 
   # This should really be a protected constructor
@@ -26,6 +41,27 @@ class Fingerprint(object):
       if type(value) == list:
         field2value[field] = tuple(value)
     self._field2value = field2value
+    self._hash = None
+
+  @classmethod
+  def from_dict(cls, field2value):
+    ''' The inverse of to_dict. Returns the interned instance. '''
+    return cls(dict(field2value)).intern()
+
+  def intern(self):
+    ''' Return the canonical instance with the same fields as self, making
+    self canonical if there was none. Equality checks between interned
+    instances reduce to an identity check. '''
+    try:
+      key = (type(self), frozenset(self._field2value.iteritems()))
+      canonical = _interned.get(key)
+    except TypeError:
+      # Unhashable field
+      return self
+    if canonical is None:
+      _interned[key] = self
+      return self
+    return canonical
 
   def to_dict(self):
     flattened = {}
@@ -64,13 +100,28 @@ class Fingerprint(object):
     return nested_fingerprint.check_match(match)
 
   @abc.abstractmethod
-  def __hash__(self):
+  def _compute_hash(self):
     pass
 
+  def __hash__(self):
+    if self._hash is None:
+      self._hash = self._compute_hash()
+    return self._hash
+
   @abc.abstractmethod
-  def __eq__(self, other):
+  def _fields_equal(self, other):
+    ''' Whether other, of the same type as self, has equal fields '''
     pass
 
+  def __eq__(self, other):
+    if self is other:
+      return True
+    if type(other) != type(self):
+      return False
+    if self.__hash__() != other.__hash__():
+      return False
+    return self._fields_equal(other)
+
   def __getitem__(self, key):
     return self._field2value[key]
 
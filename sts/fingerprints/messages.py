@@ -131,7 +131,7 @@ class OFFingerprint(Fingerprint):
     # Convert matches to DPFingerprint objects
     for field, value in field2value.iteritems():
       if type(value) == dict:
-        field2value[field] = DPFingerprint(value)
+        field2value[field] = DPFingerprint.from_dict(value)
     super(OFFingerprint, self).__init__(field2value)
 
   @staticmethod
@@ -148,14 +148,14 @@ class OFFingerprint(Fingerprint):
       else:
         value = getattr(pkt, field)
       field2value[field] = value
-    return OFFingerprint(field2value)
+    return OFFingerprint(field2value).intern()
 
   def human_str(self):
     return "%s: " % self._field2value["class"] + \
         ", ".join("%s=%s" % (k, v) for (k,v) in self._field2value.iteritems() if k != "class" )
 
 
-  def __hash__(self):
+  def _compute_hash(self):
     hash = 0
     class_name = self._field2value["class"]
     hash += class_name.__hash__()
@@ -164,9 +164,7 @@ class OFFingerprint(Fingerprint):
       hash += self._field2value[field].__hash__()
     return hash
 
-  def __eq__(self, other):
-    if type(other) != OFFingerprint:
-      return False
+  def _fields_equal(self, other):
     if self._field2value["class"] != other._field2value["class"]:
       return False
     klass = self._field2value["class"]
@@ -193,20 +191,20 @@ class DPFingerprint(Fingerprint):
     eth = pkt
     ip = pkt.next
     if type(ip) == lldp:
-      return DPFingerprint({'class': 'lldp'})
+      return DPFingerprint.from_dict({'class': 'lldp'})
     elif type(ip) == ipv4:
       field2value = {'dl_src': eth.src.toStr(), 'dl_dst': eth.dst.toStr(),
                      'nw_src': ip.srcip.toStr(), 'nw_dst': ip.dstip.toStr()}
-      return DPFingerprint(field2value)
+      return DPFingerprint.from_dict(field2value)
     elif type(ip) == arp:
       # TODO(cs): should include more context
-      return DPFingerprint({'class': 'arp'})
+      return DPFingerprint.from_dict({'class': 'arp'})
     elif type(ip) == str:
-      return DPFingerprint({'dl_type' : eth.type })
+      return DPFingerprint.from_dict({'dl_type' : eth.type })
     else:
       raise ValueError("Unknown dataplane packet type %s (eth type 0x%x)" % (str(type(ip)), eth.type))
 
-  def __hash__(self):
+  def _compute_hash(self):
     hash = 0
     if 'class' in self._field2value and len(self._field2value) == 1:
       # This is not an IP packet -- it could be, e.g., an LLDAP packet
@@ -224,9 +222,7 @@ class DPFingerprint(Fingerprint):
       hash += self._field2value[field].__hash__()
     return hash
 
-  def __eq__(self, other):
-    if type(other) != DPFingerprint:
-      return False
+  def _fields_equal(self, other):
     if len(self._field2value) != len(other._field2value):
       return False
     if 'dl_type' in self._field2value:
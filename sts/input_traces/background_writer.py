@@ -0,0 +1,202 @@
+# Copyright 2011-2013 Colin Scott
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+'''
+Moves json encoding and trace I/O off the simulation's critical path.
+
+InputLogger hands each event's json_fields() snapshot to a BackgroundWriter,
+whose thread encodes whatever has queued up as one batch, writes it with a
+single call, and flushes according to a FlushPolicy.
+
+Queueing an event does not acknowledge it. An event is only acknowledged
+(see BackgroundWriter.flushed) once its batch has been written and flushed
+to the OS, and it is only durable once fsync'ed by sync(). Events that are
+still queued when the process is killed outright (SIGKILL, os._exit) are
+lost; a normal exit, or an uncaught exception, drains the queue.
+'''
+
+import atexit
+import json
+import logging
+import os
+import Queue
+import threading
+import time
+
+log = logging.getLogger("background_writer")
+
+class FlushPolicy(object):
+  ''' When to flush the trace: every `every' events, and/or whenever
+  `interval_ms' milliseconds have passed since the last flush. With
+  neither, the trace is only flushed by sync() and close(). '''
+  def __init__(self, every=None, interval_ms=None):
+    self.every = every
+    self.interval_ms = interval_ms
+    self._unflushed = 0
+    self._last_flush = time.time()
+
+  def record(self, events=1):
+    self._unflushed += events
+
+  def due(self):
+    if self._unflushed == 0:
+      return False
+    if self.every is not None and self._unflushed >= self.every:
+      return True
+    return (self.interval_ms is not None and
+            (time.time() - self._last_flush) * 1000.0 >= self.interval_ms)
+
+  def flushed(self):
+    self._unflushed = 0
+    self._last_flush = time.time()
+
+def sync_output(output, fsync=False):
+  ''' Flush output, and optionally fsync it, for any of the file-like objects
+  InputLogger writes to '''
+  output.flush()
+  if fsync and hasattr(output, "fileno"):
+    os.fsync(output.fileno())
+
+class _Sync(object):
+  ''' Queued by sync(): acknowledged once everything before it is on disk '''
+  def __init__(self, fsync):
+    self.fsync = fsync
+    self.done = threading.Event()
+
+_stop = object()
+
+class BackgroundWriter(object):
+  '''
+  Writes json_fields() snapshots to output, one json hash per line, from a
+  background thread.
+
+  The queue is bounded (queue_size), so a slow disk applies backpressure to
+  the simulation rather than growing memory without bound. Errors raised by
+  the writer thread are re-raised by the next call into the writer.
+
+  flushed counts the snapshots that have been written and flushed to the
+  OS, in the order they were written: the first `flushed' events are
+  acknowledged.
+  '''
+  def __init__(self, output, queue_size=10000, batch_size=512,
+               flush_policy=None):
+    self.output = output
+    self.batch_size = batch_size
+    self.flush_policy = flush_policy or FlushPolicy()
+    self._queue = Queue.Queue(maxsize=queue_size)
+    self._error = None
+    self._stopped = False
+    # Snapshots written to output, and how many of them have been flushed
+    self._written = 0
+    self.flushed = 0
+    self._thread = threading.Thread(target=self._run, name="BackgroundWriter")
+    self._thread.daemon = True
+    self._thread.start()
+    # If the simulation dies without closing us, still write out what has
+    # been acknowledged
+    atexit.register(self.close)
+
+  def write(self, json_fields):
+    ''' Queue a snapshot. This does not acknowledge it: see flushed, or
+    call sync() to wait until it is on disk. '''
+    self._check_error()
+    if self._stopped:
+      raise ValueError("I/O operation on closed BackgroundWriter")
+    self._queue.put(json_fields)
+
+  def sync(self, fsync=True):
+    ''' Block until everything written so far is flushed (and fsync'ed) '''
+    self._check_error()
+    if self._stopped:
+      return
+    request = _Sync(fsync)
+    self._queue.put(request)
+    while not request.done.wait(0.1):
+      self._check_error()
+      if not self._thread.is_alive():
+        break
+    self._check_error()
+
+  def close(self):
+    ''' Drain the queue and stop the thread. Does not close output. '''
+    if not self._stopped:
+      self._stopped = True
+      self._queue.put(_stop)
+      self._thread.join()
+    self._check_error()
+
+  def _check_error(self):
+    if self._error is not None:
+      error = self._error
+      self._error = None
+      raise error
+
+  def _take_batch(self):
+    ''' Block for the first item, then take whatever else is queued '''
+    policy = self.flush_policy
+    timeout = None
+    if policy.interval_ms is not None:
+      timeout = policy.interval_ms / 1000.0
+    try:
+      batch = [self._queue.get(timeout=timeout)]
+    except Queue.Empty:
+      return []
+    while len(batch) < self.batch_size:
+      try:
+        batch.append(self._queue.get_nowait())
+      except Queue.Empty:
+        break
+    return batch
+
+  def _run(self):
+    policy = self.flush_policy
+    lines = []
+    while True:
+      batch = self._take_batch()
+      try:
+        for item in batch:
+          if isinstance(item, dict):
+            lines.append(json.dumps(item) + '\n')
+            continue
+          # Everything before a control item must hit the output first
+          self._write_lines(lines)
+          if item is _stop:
+            self._flush()
+            return
+          self._flush(fsync=item.fsync)
+          item.done.set()
+        self._write_lines(lines)
+        if policy.due():
+          self._flush()
+      except Exception as e:
+        log.exception("Failed to write trace %s" % getattr(self.output, "name", ""))
+        self._error = e
+        for item in batch:
+          if isinstance(item, _Sync):
+            item.done.set()
+        if _stop in batch:
+          return
+      lines = []
+
+  def _write_lines(self, lines):
+    if lines:
+      self.output.write("".join(lines))
+      self.flush_policy.record(len(lines))
+      self._written += len(lines)
+      del lines[:]
+
+  def _flush(self, fsync=False):
+    sync_output(self.output, fsync=fsync)
+    self.flush_policy.flushed()
+    self.flushed = self._written
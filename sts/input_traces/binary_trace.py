@@ -0,0 +1,532 @@
+# Copyright 2011-2013 Colin Scott
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+'''
+Binary container for event traces, an alternative to json `superlog's.
+
+Each record holds the same json hash as a superlog line, but strings are
+replaced by references into a string dictionary, fingerprints by references
+into a fingerprint dictionary, and base64 packets are stored raw. Dictionary
+entries are written inline, just before the first record that refers to
+them. A footer indexes the entries and records by label (on-disk hash
+table), round and event class. Readers memory-map the file and only decode
+what they touch, so opening a trace and finding a label take constant time.
+
+A trace whose writer was never closed (e.g. because the run crashed) has no
+footer. Readers then rebuild the index by scanning the entries, and see
+every record that made it to disk.
+
+Layout:
+  header:  MAGIC, version
+  entries: [uint32 length]["S"][utf-8 string]          (string)
+           [uint32 length]["P"][encoded fingerprint]   (fingerprint)
+           [uint32 length][encoded json hash]          (record; starts with "m")
+           ...
+           [uint32 0]                                  (end of entries)
+  footer:  string offsets, fingerprint offsets, record index, label hash
+           table, round index, class index
+  trailer: counts, section offsets, TRAILER_MAGIC
+'''
+
+import base64
+import copy
+import json
+import mmap
+import os
+import struct
+import zlib
+
+MAGIC = "STSTRACE"
+TRAILER_MAGIC = "STSTRIDX"
+VERSION = 2
+
+_header = struct.Struct("!8sI")
+# (records, strings, fingerprints, string offsets, fingerprint offsets, record
+#  index, label hash table, label slots, round index, class index, magic)
+_trailer = struct.Struct("!QQQQQQQQQQ8s")
+_length = struct.Struct("!I")
+_offset = struct.Struct("!Q")
+_int64 = struct.Struct("!q")
+_double = struct.Struct("!d")
+# (record offset, label string id, round, class string id)
+_record_entry = struct.Struct("!QIiI")
+# (round, record number)
+_round_entry = struct.Struct("!iI")
+# (class string id, start, count)
+_class_entry = struct.Struct("!III")
+
+def is_binary_trace(path):
+  ''' Return whether path is a binary trace (as opposed to a json superlog) '''
+  with open(path, 'rb') as f:
+    return f.read(len(MAGIC)) == MAGIC
+
+def _is_canonical_base64(value):
+  try:
+    return base64.b64encode(base64.b64decode(value)) == value
+  except (TypeError, ValueError, UnicodeEncodeError):
+    return False
+
+class _Dictionary(object):
+  ''' Assigns ids to distinct values. New entries are queued on unwritten,
+  as (dictionary, encoded value), until the writer puts them in the trace.
+  '''
+  def __init__(self, tag, unwritten):
+    self.tag = tag
+    self.key2id = {}
+    # Offsets of the entries in the trace, by id
+    self.offsets = []
+    self._unwritten = unwritten
+
+  def id_for(self, key, encode):
+    if key not in self.key2id:
+      encoded = encode()
+      self.key2id[key] = len(self.key2id)
+      self._unwritten.append((self, encoded))
+    return self.key2id[key]
+
+  def serialize(self, output):
+    output.write(struct.pack("!%dQ" % len(self.offsets), *self.offsets))
+
+class BinaryTraceWriter(object):
+  ''' Writes a binary trace. Accepts json hashes (write_json_hash), or json
+  superlog lines (write), so that it can stand in for a superlog file. The
+  footer is written by close(). '''
+  def __init__(self, path):
+    self.path = path
+    self._output = open(path, 'wb')
+    self._output.write(_header.pack(MAGIC, VERSION))
+    self._unwritten = []
+    self._strings = _Dictionary("S", self._unwritten)
+    self._fingerprints = _Dictionary("P", self._unwritten)
+    # [(record offset, label id, round, class id)]
+    self._records = []
+    self._label_hashes = []
+    self._pending_line = ""
+
+  @property
+  def closed(self):
+    return self._output.closed
+
+  def write(self, data):
+    ''' Write newline-delimited json hashes '''
+    lines = (self._pending_line + data).split("\n")
+    self._pending_line = lines.pop()
+    for line in lines:
+      if line.strip() != "":
+        self.write_json_hash(json.loads(line))
+
+  def write_json_hash(self, json_hash):
+    chunks = []
+    chunks.append("m")
+    chunks.append(_length.pack(len(json_hash)))
+    for key, value in json_hash.iteritems():
+      chunks.append(_length.pack(self._string_id(key)))
+      if key == "fingerprint":
+        fingerprint_id = self._fingerprints.id_for(
+            json.dumps(value, sort_keys=True), lambda: self._encode(value))
+        chunks.append("p")
+        chunks.append(_length.pack(fingerprint_id))
+      elif (key == "b64_packet" and isinstance(value, basestring) and
+            _is_canonical_base64(value)):
+        raw = base64.b64decode(value)
+        chunks.append("b")
+        chunks.append(_length.pack(len(raw)))
+        chunks.append(raw)
+      else:
+        self._encode_into(value, chunks)
+    label_id = self._string_id(json_hash['label'])
+    class_id = self._string_id(json_hash['class'])
+    # Dictionary entries go before the first record that uses them
+    for (dictionary, encoded) in self._unwritten:
+      dictionary.offsets.append(self._write_entry(dictionary.tag + encoded))
+    del self._unwritten[:]
+    offset = self._write_entry("".join(chunks))
+    self._records.append((offset, label_id, json_hash.get('round', -1), class_id))
+    label = json_hash['label']
+    if isinstance(label, unicode):
+      label = label.encode('utf-8')
+    self._label_hashes.append(_label_hash(label))
+
+  def _write_entry(self, payload):
+    offset = self._output.tell()
+    self._output.write(_length.pack(len(payload)))
+    self._output.write(payload)
+    return offset
+
+  def flush(self):
+    ''' Flush the records written so far. Readers can make use of them even
+    if close() is never called. '''
+    self._output.flush()
+
+  def fileno(self):
+    return self._output.fileno()
+
+  def _string_id(self, value):
+    if isinstance(value, str):
+      value = value.decode('utf-8')
+    return self._strings.id_for(value, lambda: value.encode('utf-8'))
+
+  def _encode(self, value):
+    chunks = []
+    self._encode_into(value, chunks)
+    return "".join(chunks)
+
+  def _encode_into(self, value, chunks):
+    if value is None:
+      chunks.append("n")
+    elif value is True:
+      chunks.append("t")
+    elif value is False:
+      chunks.append("f")
+    elif isinstance(value, (int, long)):
+      if -2**63 <= value < 2**63:
+        chunks.append("i")
+        chunks.append(_int64.pack(value))
+      else:
+        chunks.append("L")
+        chunks.append(_length.pack(self._string_id(str(value))))
+    elif isinstance(value, float):
+      chunks.append("d")
+      chunks.append(_double.pack(value))
+    elif isinstance(value, basestring):
+      chunks.append("s")
+      chunks.append(_length.pack(self._string_id(value)))
+    elif isinstance(value, (list, tuple)):
+      chunks.append("l")
+      chunks.append(_length.pack(len(value)))
+      for item in value:
+        self._encode_into(item, chunks)
+    elif isinstance(value, dict):
+      chunks.append("m")
+      chunks.append(_length.pack(len(value)))
+      for key, item in value.iteritems():
+        chunks.append(_length.pack(self._string_id(key)))
+        self._encode_into(item, chunks)
+    else:
+      raise TypeError("Can't encode %s" % str(type(value)))
+
+  def close(self):
+    if self.closed:
+      return
+    if self._pending_line.strip() != "":
+      self.write_json_hash(json.loads(self._pending_line))
+    self._pending_line = ""
+    output = self._output
+    # End of entries
+    output.write(_length.pack(0))
+    strings_offset = output.tell()
+    self._strings.serialize(output)
+    fingerprints_offset = output.tell()
+    self._fingerprints.serialize(output)
+
+    records_offset = output.tell()
+    for entry in self._records:
+      output.write(_record_entry.pack(*entry))
+
+    # Open addressing, linear probing. Slots hold record number + 1.
+    label_slots = 1
+    while label_slots < 2 * len(self._records):
+      label_slots *= 2
+    slots = [0] * label_slots
+    for i, label_hash in enumerate(self._label_hashes):
+      slot = label_hash & (label_slots - 1)
+      while slots[slot] != 0:
+        slot = (slot + 1) & (label_slots - 1)
+      slots[slot] = i + 1
+    labels_offset = output.tell()
+    output.write(struct.pack("!%dI" % label_slots, *slots))
+
+    rounds_offset = output.tell()
+    for (round, i) in sorted((entry[2], i) for i, entry in enumerate(self._records)):
+      output.write(_round_entry.pack(round, i))
+
+    classes_offset = output.tell()
+    class_id2records = {}
+    for i, entry in enumerate(self._records):
+      class_id2records.setdefault(entry[3], []).append(i)
+    output.write(_length.pack(len(class_id2records)))
+    start = 0
+    for class_id, records in sorted(class_id2records.iteritems()):
+      output.write(_class_entry.pack(class_id, start, len(records)))
+      start += len(records)
+    for class_id, records in sorted(class_id2records.iteritems()):
+      output.write(struct.pack("!%dI" % len(records), *records))
+
+    output.write(_trailer.pack(len(self._records), len(self._strings.offsets),
+                               len(self._fingerprints.offsets), strings_offset,
+                               fingerprints_offset, records_offset,
+                               labels_offset, label_slots, rounds_offset,
+                               classes_offset, TRAILER_MAGIC))
+    output.close()
+
+def _label_hash(encoded_label):
+  return zlib.crc32(encoded_label) & 0xffffffff
+
+class _RecoveredIndex(object):
+  ''' In-memory replacement for the footer of a trace that wasn't closed '''
+  def __init__(self):
+    self.string_offsets = []
+    self.fingerprint_offsets = []
+    # [(record offset, label id, round, class id)]
+    self.records = []
+    self.label2index = {}
+    self.round2indices = {}
+    self.class2indices = {}
+
+class BinaryTrace(object):
+  ''' Read-only, memory-mapped view of a binary trace. Records are numbered
+  in trace order, and decoded into json hashes (the same ones
+  log_parser.parse would see) on demand. '''
+  def __init__(self, path):
+    self.path = path
+    self._file = open(path, 'rb')
+    if os.fstat(self._file.fileno()).st_size < _header.size:
+      self._file.close()
+      raise ValueError("Truncated binary trace %s" % path)
+    self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+    (magic, version) = _header.unpack_from(self._mmap, 0)
+    if magic != MAGIC:
+      raise ValueError("%s is not a binary trace" % path)
+    if version != VERSION:
+      raise ValueError("Unsupported binary trace version %d" % version)
+    # Decoded lazily
+    self._string_cache = {}
+    self._fingerprint_cache = {}
+    self._class2records = None
+    self._recovered = None
+    # Only meaningful for traces with a footer
+    (self._strings_offset, self._num_strings) = (None, 0)
+    (self._fingerprints_offset, self._num_fingerprints) = (None, 0)
+    trailer_magic = None
+    if len(self._mmap) >= _header.size + _trailer.size:
+      (self._num_records, self._num_strings, self._num_fingerprints,
+       self._strings_offset, self._fingerprints_offset, self._records_offset,
+       self._labels_offset, self._label_slots, self._rounds_offset,
+       self._classes_offset, trailer_magic) = \
+          _trailer.unpack_from(self._mmap, len(self._mmap) - _trailer.size)
+    if trailer_magic != TRAILER_MAGIC:
+      # Not closed properly: recover the complete entries
+      self._recover_index()
+
+  def _recover_index(self):
+    index = self._recovered = _RecoveredIndex()
+    mm = self._mmap
+    offset = _header.size
+    while offset + _length.size < len(mm):
+      (length,) = _length.unpack_from(mm, offset)
+      if length == 0 or offset + _length.size + length > len(mm):
+        break
+      tag = mm[offset + _length.size]
+      if tag == "S":
+        index.string_offsets.append(offset)
+      elif tag == "P":
+        index.fingerprint_offsets.append(offset)
+      elif tag == "m":
+        json_hash = self._decode(offset + _length.size)[0]
+        i = len(index.records)
+        round = json_hash.get('round', -1)
+        # label() and class_name() decode the record instead of using ids
+        index.records.append((offset, None, round, None))
+        index.label2index.setdefault(json_hash['label'], i)
+        index.round2indices.setdefault(round, []).append(i)
+        index.class2indices.setdefault(json_hash['class'], []).append(i)
+      else:
+        break
+      offset += _length.size + length
+    self._num_records = len(index.records)
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *args):
+    self.close()
+
+  def close(self):
+    self._mmap.close()
+    self._file.close()
+
+  def __len__(self):
+    return self._num_records
+
+  def _dictionary_entry(self, section_offset, count, recovered_offsets, i):
+    ''' Return (start, end) of the value of the i'th entry of a dictionary '''
+    if self._recovered is not None:
+      count = len(recovered_offsets)
+    if not 0 <= i < count:
+      raise ValueError("Corrupt binary trace %s: no dictionary entry %d" %
+                       (self.path, i))
+    if self._recovered is not None:
+      offset = recovered_offsets[i]
+    else:
+      (offset,) = _offset.unpack_from(self._mmap, section_offset + i * _offset.size)
+    (length,) = _length.unpack_from(self._mmap, offset)
+    # Skip the tag
+    return (offset + _length.size + 1, offset + _length.size + length)
+
+  def _string(self, i):
+    if i not in self._string_cache:
+      (start, end) = self._dictionary_entry(
+          self._strings_offset, self._num_strings,
+          self._recovered and self._recovered.string_offsets, i)
+      self._string_cache[i] = self._mmap[start:end].decode('utf-8')
+    return self._string_cache[i]
+
+  def _fingerprint(self, i):
+    ''' Fingerprints are shared between records, so hand out copies '''
+    if i not in self._fingerprint_cache:
+      (start, _) = self._dictionary_entry(
+          self._fingerprints_offset, self._num_fingerprints,
+          self._recovered and self._recovered.fingerprint_offsets, i)
+      self._fingerprint_cache[i] = self._decode(start)[0]
+    return copy.deepcopy(self._fingerprint_cache[i])
+
+  def _decode(self, offset):
+    ''' Return (value, offset after value) '''
+    mm = self._mmap
+    tag = mm[offset]
+    offset += 1
+    if tag == "n":
+      return (None, offset)
+    if tag == "t":
+      return (True, offset)
+    if tag == "f":
+      return (False, offset)
+    if tag == "i":
+      return (_int64.unpack_from(mm, offset)[0], offset + _int64.size)
+    if tag == "d":
+      return (_double.unpack_from(mm, offset)[0], offset + _double.size)
+    (n,) = _length.unpack_from(mm, offset)
+    offset += _length.size
+    if tag == "s":
+      return (self._string(n), offset)
+    if tag == "L":
+      return (long(self._string(n)), offset)
+    if tag == "p":
+      return (self._fingerprint(n), offset)
+    if tag == "b":
+      return (unicode(base64.b64encode(mm[offset:offset+n])), offset + n)
+    if tag == "l":
+      items = []
+      for _ in xrange(n):
+        (item, offset) = self._decode(offset)
+        items.append(item)
+      return (items, offset)
+    if tag == "m":
+      fields = {}
+      for _ in xrange(n):
+        (key_id,) = _length.unpack_from(mm, offset)
+        (value, offset) = self._decode(offset + _length.size)
+        fields[self._string(key_id)] = value
+      return (fields, offset)
+    raise ValueError("Corrupt binary trace %s: unknown tag %r" % (self.path, tag))
+
+  def _record_entry(self, i):
+    if not 0 <= i < self._num_records:
+      raise IndexError("No record %d" % i)
+    if self._recovered is not None:
+      return self._recovered.records[i]
+    return _record_entry.unpack_from(self._mmap, self._records_offset +
+                                                 i * _record_entry.size)
+
+  def json_hash(self, i):
+    ''' Return the json hash of the i'th record '''
+    offset = self._record_entry(i)[0]
+    return self._decode(offset + _length.size)[0]
+
+  def json_hashes(self, start=0):
+    ''' Yield the json hashes of records start.. in trace order '''
+    for i in xrange(start, self._num_records):
+      yield self.json_hash(i)
+
+  def label(self, i):
+    if self._recovered is not None:
+      return self.json_hash(i)['label']
+    return self._string(self._record_entry(i)[1])
+
+  def round(self, i):
+    return self._record_entry(i)[2]
+
+  def class_name(self, i):
+    if self._recovered is not None:
+      return self.json_hash(i)['class']
+    return self._string(self._record_entry(i)[3])
+
+  def index_of_label(self, label):
+    ''' Return the record number of label, or None '''
+    if self._recovered is not None:
+      if isinstance(label, str):
+        label = label.decode('utf-8')
+      return self._recovered.label2index.get(label)
+    if self._num_records == 0:
+      return None
+    if isinstance(label, unicode):
+      label = label.encode('utf-8')
+    mask = self._label_slots - 1
+    slot = _label_hash(label) & mask
+    while True:
+      (record,) = _length.unpack_from(self._mmap, self._labels_offset +
+                                                  slot * _length.size)
+      if record == 0:
+        return None
+      if self.label(record - 1).encode('utf-8') == label:
+        return record - 1
+      slot = (slot + 1) & mask
+
+  def json_hash_for_label(self, label):
+    i = self.index_of_label(label)
+    if i is None:
+      raise KeyError("Unknown label %s" % label)
+    return self.json_hash(i)
+
+  def indices_for_round(self, round):
+    ''' Return the record numbers of the events in round, in trace order '''
+    if self._recovered is not None:
+      return list(self._recovered.round2indices.get(round, []))
+    def round_at(k):
+      return _round_entry.unpack_from(self._mmap, self._rounds_offset +
+                                                  k * _round_entry.size)
+    # Binary search for the first entry of round
+    (start, end) = (0, self._num_records)
+    while start < end:
+      middle = (start + end) // 2
+      if round_at(middle)[0] < round:
+        start = middle + 1
+      else:
+        end = middle
+    indices = []
+    for k in xrange(start, self._num_records):
+      (r, i) = round_at(k)
+      if r != round:
+        break
+      indices.append(i)
+    return indices
+
+  def indices_for_class(self, class_name):
+    ''' Return the record numbers of the events of class_name, in trace order '''
+    if self._recovered is not None:
+      return list(self._recovered.class2indices.get(class_name, []))
+    if self._class2records is None:
+      self._class2records = {}
+      (count,) = _length.unpack_from(self._mmap, self._classes_offset)
+      records_start = (self._classes_offset + _length.size +
+                       count * _class_entry.size)
+      for k in xrange(count):
+        (class_id, start, n) = _class_entry.unpack_from(
+            self._mmap, self._classes_offset + _length.size + k * _class_entry.size)
+        self._class2records[self._string(class_id)] = \
+            (records_start + start * _length.size, n)
+    if class_name not in self._class2records:
+      return []
+    (offset, n) = self._class2records[class_name]
+    return list(struct.unpack_from("!%dI" % n, self._mmap, offset))
@@ -14,11 +14,15 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import atexit
 import os
 import time
 import logging
-from sts.replay_event import WaitTime
+from sts.replay_event import WaitTime, InvariantViolation
 from sts.syncproto.base import SyncTime
+from sts.input_traces.binary_trace import BinaryTraceWriter
+from sts.input_traces.background_writer import BackgroundWriter, FlushPolicy, sync_output
+from sts.util.compression import open_trace_file
 from sts.util.convenience import timestamp_string
 import sts.dataplane_traces.trace_generator as tg
 
@@ -95,15 +99,56 @@ control_flow = EfficientMCSFinder(simulation_config, "%s",
 
 log = logging.getLogger("input_logger")
 
+# Compressed traces are buffered a block (256KB) at a time, so unless told
+# otherwise, flush them at least this often
+default_compressed_flush_interval_ms = 1000
+
 class InputLogger(object):
   '''Log input events injected by a control_flow.Fuzzer'''
 
-  def __init__(self):
+  def __init__(self, binary=False, compression=None, background=False,
+               queue_size=10000, flush_every=None, flush_interval_ms=None,
+               sync_on_violation=True):
+    '''
+    Parameters:
+     - binary: write the trace in the indexed binary format (see
+       binary_trace.py) rather than as a json superlog.
+     - compression: the codec (see sts/util/compression.py) to compress the
+       json superlog and its .unacked side-log with, e.g. "zlib".
+     - background: encode and write events from a background thread (see
+       background_writer.py), with at most queue_size events pending. This
+       weakens what log_input_event() guarantees: on return, the event is
+       only queued. It reaches the trace once the writer flushes it (see
+       flushed_events), or on sync(), close() or a normal exit; if the
+       process is killed outright, the queued events are lost.
+     - flush_every, flush_interval_ms: flush the trace every N events and/or
+       every T milliseconds. With compression and neither set, defaults to
+       every default_compressed_flush_interval_ms.
+     - sync_on_violation: flush and fsync the trace whenever an
+       InvariantViolation is logged.
+    '''
+    if binary and compression is not None:
+      raise ValueError("Binary traces can't be compressed")
     self.last_time = SyncTime.now()
     self._disallow_timeouts = False
     self._events_after_close = []
     self.output = None
     self.output_path = ""
+    self.binary = binary
+    self.compression = compression
+    self.background = background
+    self.queue_size = queue_size
+    if (compression is not None and flush_every is None and
+        flush_interval_ms is None):
+      flush_interval_ms = default_compressed_flush_interval_ms
+    self.flush_policy = FlushPolicy(every=flush_every,
+                                    interval_ms=flush_interval_ms)
+    self.sync_on_violation = sync_on_violation
+    self._writer = None
+    # Events written to the trace (synchronously), and how many of them have
+    # been flushed
+    self._written_events = 0
+    self._flushed_events = 0
 
   def open(self, results_dir=None, output_filename="events.trace"):
     if results_dir is not None:
@@ -114,7 +159,16 @@ class InputLogger(object):
       self.openflow_replay_cfg_path = results_dir + "/openflow_replay_config.py"
     else:
       raise ValueError("Default results_dir currently not supported")
-    self.output = open(self.output_path, 'w')
+    if self.binary:
+      self.output = BinaryTraceWriter(self.output_path)
+    else:
+      self.output = open_trace_file(self.output_path, 'w', codec=self.compression)
+    if self.background:
+      self._writer = BackgroundWriter(self.output, queue_size=self.queue_size,
+                                      flush_policy=self.flush_policy)
+    # If the simulation dies without closing us, still write out the tail
+    # that is buffered (e.g. in a compressed block)
+    atexit.register(self.sync, fsync=False)
 
   def disallow_timeouts(self):
     self._disallow_timeouts = True
@@ -126,9 +180,17 @@ class InputLogger(object):
     if self._disallow_timeouts and hasattr(event, "disallow_timeouts"):
       event.timeout_disallowed = True
     self.last_time = event.time
-    json_hash = event.to_json()
-    log.debug("logging event %r" % event)
-    output.write(json_hash + '\n')
+    log.debug("logging event %r", event)
+    if output is self.output and self._writer is not None:
+      # Snapshot the fields now: the event may be mutated after we return
+      self._writer.write(event.json_fields())
+    else:
+      output.write(event.to_json() + '\n')
+      if output is self.output:
+        self._written_events += 1
+        self.flush_policy.record()
+        if self.flush_policy.due():
+          self._flush()
 
   def log_input_event(self, event):
     '''
@@ -138,20 +200,48 @@ class InputLogger(object):
       raise Exception("Not opened -- call InputLogger.open")
     if not self.output.closed:
       self._serialize_event(event, self.output)
+      if self.sync_on_violation and isinstance(event, InvariantViolation):
+        self.sync()
     else:
       self._events_after_close.append(event)
 
+  @property
+  def flushed_events(self):
+    ''' How many of the events logged to the trace so far have been written
+    and flushed to the OS: the acknowledged prefix of the trace '''
+    if self._writer is not None:
+      return self._writer.flushed
+    return self._flushed_events
+
+  def sync(self, fsync=True):
+    ''' Block until every event logged so far is flushed (and fsync'ed) to
+    the trace '''
+    if self.output is None or self.output.closed:
+      return
+    if self._writer is not None:
+      self._writer.sync(fsync=fsync)
+    else:
+      self._flush(fsync=fsync)
+
+  def _flush(self, fsync=False):
+    sync_output(self.output, fsync=fsync)
+    self.flush_policy.flushed()
+    self._flushed_events = self._written_events
+
   def dump_buffered_events(self, events):
     ''' If there were un-acknowledge message receives or state changes at the
     end of the run, dump them to a separate input trace ".unacked" '''
-    with open(self.output_path + ".unacked", 'w') as output:
+    with open_trace_file(self.output_path + ".unacked", 'w',
+                         codec=self.compression) as output:
       for event in events + self._events_after_close:
         self._serialize_event(event, output)
 
   def close(self, control_flow, simulation_cfg, skip_mcs_cfg=False):
     # First, insert a WaitTime, in case there was a controller crash
     self.log_input_event(WaitTime(1.0, time=self.last_time))
-    # Flush the json input log
+    if self._writer is not None:
+      self._writer.close()
+    # Flush the input log (for binary traces, this writes the index)
     self.output.close()
 
     # Write the config files
@@ -13,7 +13,8 @@
 # limitations under the License.
 
 '''
-Parses `superlog's and returns a list of sts.event.Event objects
+Parses `superlog's and returns a list of sts.event.Event objects, or yields
+them one at a time (iter_parse) without holding the whole trace in memory
 
 `superlog' format: Each line is a json hash representing either an internal
 event or an external input event.
@@ -30,8 +31,13 @@ must the following key:
                       event is pruned)
 '''
 
+import itertools
 import json
+import os
+import multiprocessing
 import sts.replay_event as event
+from sts.input_traces.binary_trace import BinaryTrace, is_binary_trace
+from sts.util.compression import open_trace_file, compression_of
 import logging
 log = logging.getLogger("superlog_parser")
 
@@ -79,14 +85,31 @@ def sanity_check_internal_event(existing_event_labels, dependent_labels,
   '''
   dependent_labels.discard(json_hash['label'])
 
-def parse_path(logfile_path):
-  '''Input: path to a logfile.
+def _superlog_size(logfile_path):
+  '''Uncompressed size of a json superlog, or None if it can't be seeked
+  through cheaply (gzip)'''
+  if compression_of(logfile_path) == "gzip":
+    return None
+  with open_trace_file(logfile_path, 'rb') as logfile:
+    logfile.seek(0, os.SEEK_END)
+    return logfile.tell()
+
+def parse_path(logfile_path, processes=1):
+  '''Input: path to a logfile, either a json superlog (optionally compressed,
+  see sts/util/compression.py) or a binary trace.
 
   Output: A list of all the internal and external events in the order in which
   they exist in the logfile. Each internal event is annotated with the set of
-  source events that are necessary conditions for its occurence.'''
-  with open(logfile_path) as logfile:
-    return parse(logfile)
+  source events that are necessary conditions for its occurence.
+
+  If processes > 1, the lines of a json superlog are decoded by a pool of
+  that many worker processes (see parse_path_parallel). gzip superlogs are
+  always parsed serially.'''
+  if is_binary_trace(logfile_path):
+    return list(iter_parse_path(logfile_path))
+  if processes > 1 and _superlog_size(logfile_path) is not None:
+    return parse_path_parallel(logfile_path, processes)
+  return list(iter_parse_path(logfile_path))
 
 def check_legacy_format(json_hash):
   if (hasattr(json_hash, 'controller_id') and
@@ -97,41 +120,129 @@ def check_legacy_format(json_hash):
     # Insert a dummy round number
     json_hash['round'] = -1
 
-def parse(logfile):
-  '''Input: logfile.
-
-  Output: A list of all the internal and external events in the order in which
-  they exist in the logfile. Each internal event is annotated with the set of
-  source events that are necessary conditions for its occurence.'''
-
-  # the return value of the parsed log
-  trace = []
+def iter_parse_path(logfile_path, event_classes=None):
+  '''Input: path to a logfile, either a json superlog or a binary trace. See
+  iter_parse.'''
+  if is_binary_trace(logfile_path):
+    with BinaryTrace(logfile_path) as trace:
+      for event in iter_parse_json_hashes(trace.json_hashes(),
+                                          event_classes=event_classes):
+        yield event
+  else:
+    with open_trace_file(logfile_path) as logfile:
+      for event in iter_parse(logfile, event_classes=event_classes):
+        yield event
+
+def iter_parse(logfile, event_classes=None):
+  '''Input: logfile, and optionally a collection of event class names.
+
+  Output: A generator of the internal and external events in the order in
+  which they exist in the logfile, built one line at a time. If event_classes
+  is given, events of other classes are validated but never built.
+
+  Only the labels seen so far (not the events) are kept for validation. The
+  check that all forward dependencies were satisfied happens once the
+  generator is exhausted.'''
+  return iter_parse_json_hashes((json.loads(line.rstrip()) for line in logfile),
+                                event_classes=event_classes)
+
+def iter_parse_json_hashes(json_hashes, event_classes=None):
+  '''Same as iter_parse, over already decoded json hashes.'''
   # a set of all event labels
   event_labels = set()
   # dependent labels that must be present somewhere in the log.
   dependent_labels = set()
 
-  for line in logfile:
-    json_hash = json.loads(line.rstrip())
+  for json_hash in json_hashes:
     check_unique_label(json_hash['label'], event_labels)
     check_legacy_format(json_hash)
-    if json_hash['class'] in input_name_to_class:
+    class_name = json_hash['class']
+    if class_name in input_name_to_class:
       sanity_check_external_input_event(event_labels,
                                         dependent_labels,
                                         json_hash)
-      event = input_name_to_class[json_hash['class']].from_json(json_hash)
-    elif json_hash['class'] in internal_event_name_to_class:
+      klass = input_name_to_class[class_name]
+    elif class_name in internal_event_name_to_class:
       sanity_check_internal_event(event_labels, dependent_labels,
                                   json_hash)
-      event = internal_event_name_to_class[json_hash['class']].from_json(json_hash)
-    elif json_hash['class'] in special_event_name_to_class:
-      event = special_event_name_to_class[json_hash['class']].from_json(json_hash)
+      klass = internal_event_name_to_class[class_name]
+    elif class_name in special_event_name_to_class:
+      klass = special_event_name_to_class[class_name]
     else:
-      print "Warning: Unknown class type %s" % json_hash['class']
+      print "Warning: Unknown class type %s" % class_name
+      continue
+    if event_classes is not None and class_name not in event_classes:
       continue
-    trace.append(event)
+    yield klass.from_json(json_hash)
 
   # all the foward dependencies should be satisfied!
   assert(len(dependent_labels) == 0)
 
-  return trace
+def build_event(json_hash):
+  '''Build the Event for a single json hash, without any validation against
+  the rest of the trace (e.g. for random access into a BinaryTrace). Returns
+  None for unknown event classes.'''
+  check_legacy_format(json_hash)
+  for name_to_class in [input_name_to_class, internal_event_name_to_class,
+                        special_event_name_to_class]:
+    if json_hash['class'] in name_to_class:
+      return name_to_class[json_hash['class']].from_json(json_hash)
+  return None
+
+def parse(logfile):
+  '''Input: logfile.
+
+  Output: A list of all the internal and external events in the order in which
+  they exist in the logfile. Each internal event is annotated with the set of
+  source events that are necessary conditions for its occurence.'''
+  return list(iter_parse(logfile))
+
+def _chunk_boundaries(logfile_path, chunks):
+  '''Split the file into about `chunks' byte ranges [start, end), each ending
+  just after a newline'''
+  size = _superlog_size(logfile_path)
+  boundaries = [0]
+  with open_trace_file(logfile_path, 'rb') as logfile:
+    for i in xrange(1, chunks):
+      target = max(size * i / chunks, boundaries[-1])
+      if target >= size:
+        break
+      logfile.seek(target)
+      logfile.readline()
+      boundary = logfile.tell()
+      if boundary > boundaries[-1] and boundary < size:
+        boundaries.append(boundary)
+  boundaries.append(size)
+  return zip(boundaries[:-1], boundaries[1:])
+
+def _decode_chunk(args):
+  '''Worker for parse_path_parallel: the json hashes of the lines in the
+  byte range [start, end)'''
+  (logfile_path, start, end) = args
+  json_hashes = []
+  with open_trace_file(logfile_path, 'rb') as logfile:
+    logfile.seek(start)
+    while logfile.tell() < end:
+      line = logfile.readline()
+      if line.strip() != "":
+        json_hashes.append(json.loads(line))
+  return json_hashes
+
+def parse_path_parallel(logfile_path, processes, chunks_per_process=4):
+  '''Same as parse_path, for a json superlog, but the file is split into
+  chunks at line boundaries, whose lines a pool of processes decodes. Only
+  json hashes cross the process boundary: the events are validated and built
+  here, in order, as the chunks come back.
+
+  Whether this beats parsing serially depends on how the cost of decoding
+  compares to the cost of building events and of shipping the hashes back;
+  see tests/benchmarks/log_parser_benchmark.py.'''
+  chunks = [ (logfile_path, start, end) for (start, end) in
+             _chunk_boundaries(logfile_path, processes * chunks_per_process) ]
+  pool = multiprocessing.Pool(processes)
+  try:
+    json_hashes = itertools.chain.from_iterable(pool.imap(_decode_chunk, chunks))
+    return list(iter_parse_json_hashes(json_hashes))
+  finally:
+    pool.terminate()
+    pool.join()
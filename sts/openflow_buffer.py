@@ -192,6 +192,14 @@ class OpenFlowBuffer(EventMixin):
     ''' Return the message sends which are waiting to be scheduled '''
     return self.pendingsend2conn_messages.keys()
 
+  def unexpected_pending_messages(self, expected_messages):
+    ''' Return the pending receives, then sends, that expected_messages (an
+    ExpectedMessageWindow) does not expect '''
+    return ([ m for m in self.pendingreceive2conn_messages.keys()
+              if not expected_messages.expects(m) ] +
+            [ m for m in self.pendingsend2conn_messages.keys()
+              if not expected_messages.expects(m) ])
+
   def flush(self):
     ''' Garbage collect any previous pending messages '''
     num_pending_messages = (len(self.pendingreceive2conn_messages) +
@@ -41,7 +41,6 @@ from sts.openflow_buffer import PendingReceive, PendingSend, OpenFlowBuffer
 from sts.dataplane_traces.trace import DataplaneEvent
 from sts.fingerprints.messages import *
 from config.invariant_checks import name_to_invariant_check
-import itertools
 import abc
 import logging
 import time
@@ -61,33 +60,68 @@ def dictify_fingerprint(fingerprint):
       mutable[i] = mutable[i].to_dict()
   return tuple(mutable)
 
+def decode_dp_fingerprint(fingerprint):
+  ''' Convert a DataplanePermit/DataplaneDrop fingerprint list, as parsed
+  from json, into the fingerprint tuple '''
+  return (fingerprint[0], DPFingerprint.from_dict(fingerprint[1]),
+          fingerprint[2], fingerprint[3])
+
+# class -> names of the __slots__ declared along its MRO
+_class2slot_names = {}
+
+def _slot_names(klass):
+  if klass not in _class2slot_names:
+    names = []
+    for base in reversed(klass.__mro__):
+      for name in base.__dict__.get('__slots__', ()):
+        if name not in ('__dict__', '__weakref__') and name not in names:
+          names.append(name)
+    _class2slot_names[klass] = tuple(names)
+  return _class2slot_names[klass]
+
 class Event(object):
-  ''' Superclass for all event types. '''
+  '''
+  Superclass for all event types.
+
+  Traces hold up to millions of events, so event classes declare all of
+  their fields (including those the replayer tags events with) in __slots__
+  rather than carrying a __dict__ each.
+  '''
   __metaclass__ = abc.ABCMeta
+  __slots__ = ('label', 'round', 'time', 'dependent_labels', 'prunable',
+               'timed_out', 'new_internal_event', 'replay_time')
+
+  # The pending item (PendingReceive, PendingStateChange, ...) whose arrival
+  # may allow proceed() to succeed, or None if proceed() has to be polled.
+  # EventScheduler only retries proceed() when an item equal to this key is
+  # published.
+  wakeup_key = None
 
-  # Create unique labels for events
-  _label_gen = itertools.count(1)
-  # Ensure globally unique labels
-  _all_label_ids = set()
+  # Generated labels are numbered above the largest label id seen so far,
+  # which keeps them globally unique without remembering every id
+  _max_label_id = 0
+
+  @staticmethod
+  def reserve_label_id(label_id):
+    ''' Make sure that no label with id label_id is generated '''
+    if label_id > Event._max_label_id:
+      Event._max_label_id = label_id
 
   def __init__(self, prefix="e", label=None, round=-1, time=None, dependent_labels=None,
                prunable=True):
     if label is None:
-      label_id = Event._label_gen.next()
-      label = prefix + str(label_id)
-      while label_id in Event._all_label_ids:
-        label_id = Event._label_gen.next()
-        label = prefix + str(label_id)
+      label = prefix + str(Event._max_label_id + 1)
     if time is None:
       # TODO(cs): compress time for interactive mode?
       time = SyncTime.now()
     self.label = label
-    Event._all_label_ids.add(int(label[1:]))
+    Event.reserve_label_id(int(label[1:]))
     self.round = round
     self.time = time
     # Add on dependent labels to appease log_processing.superlog_parser.
     # TODO(cs): Replayer shouldn't depend on superlog_parser
-    self.dependent_labels = dependent_labels if dependent_labels else []
+    # (Most events have none: share one immutable empty sequence)
+    self.dependent_labels = dependent_labels if dependent_labels else ()
     # Whether this event should be prunable by MCSFinder. Initialization
     # inputs are not pruned.
     self.prunable = True
@@ -111,15 +145,42 @@ class Event(object):
     later.'''
     pass
 
-  def to_json(self):
-    ''' Convert the event to json format '''
-    fields = dict(self.__dict__)
+  def _fields(self):
+    ''' The event's attributes (slots and otherwise) as a new dict '''
+    fields = {}
+    for name in _slot_names(type(self)):
+      try:
+        fields[name] = getattr(self, name)
+      except AttributeError:
+        # Never assigned
+        pass
+    # Subclasses that don't declare __slots__
+    if hasattr(self, '__dict__'):
+      fields.update(self.__dict__)
+    return fields
+
+  def __getstate__(self):
+    return self._fields()
+
+  def __setstate__(self, state):
+    for name, value in state.iteritems():
+      setattr(self, name, value)
+
+  def json_fields(self):
+    ''' Return a json-serializable snapshot of the event's fields (the
+    object to_json dumps). Only the top level fields are copied, so this is
+    cheap enough to call on the simulation's critical path, and defer the
+    json encoding. '''
+    fields = self._fields()
     fields['class'] = self.__class__.__name__
     # fingerprints are accessed through @property, not in __dict__:
     fields['fingerprint'] = dictify_fingerprint(self.fingerprint)
-    if '_fingerprint' in fields:
-      del fields['_fingerprint']
-    return json.dumps(fields)
+    fields.pop('_fingerprint', None)
+    return fields
+
+  def to_json(self):
+    ''' Convert the event to json format '''
+    return json.dumps(self.json_fields())
 
   def __hash__(self):
     # Assumption: labels are unique
@@ -150,6 +211,8 @@ class InternalEvent(Event):
   '''An InternalEvent is one that happens within the controller(s) under
   simulation. Derivatives of this class verify that the internal event has
   occured during replay in its proceed method before it returns.'''
+  __slots__ = ('timeout_disallowed',)
+
   def __init__(self, label=None, round=-1, time=None, timeout_disallowed=False,
                prunable=False):
     super(InternalEvent, self).__init__(prefix='i', label=label, round=round, time=time,
@@ -172,6 +235,8 @@ class InputEvent(Event):
 
   `InputEvents' may also be referred to as 'external
   events', elsewhere in documentation or code.'''
+  __slots__ = ()
+
   def __init__(self, label=None, round=-1, time=None, dependent_labels=None,
                prunable=True):
     super(InputEvent, self).__init__(prefix='e', label=label, round=round, time=time,
@@ -189,9 +254,21 @@ def assert_fields_exist(json_hash, *args):
     if field not in json_hash:
       raise ValueError("Field %s not in json_hash %s" % (field, str(json_hash)))
 
+def compact_string(value, shared=False):
+  ''' json decodes strings as unicode. Store ascii ones as (smaller) strs,
+  and if shared, as a single interned copy. '''
+  if type(value) == unicode:
+    try:
+      value = value.encode('ascii')
+    except UnicodeEncodeError:
+      return value
+  if shared and type(value) == str:
+    value = intern(value)
+  return value
+
 def extract_label_time(json_hash):
   assert_fields_exist(json_hash, 'label', 'time', 'round')
-  label = json_hash['label']
+  label = compact_string(json_hash['label'])
   time = SyncTime(json_hash['time'][0], json_hash['time'][1])
   round = json_hash['round']
   return (label, time, round)
@@ -199,6 +276,8 @@ def extract_label_time(json_hash):
 class SwitchFailure(InputEvent):
   ''' Crashes a switch, by disconnecting its TCP connection with the
   controller(s).'''
+  __slots__ = ('dpid',)
+
   def __init__(self, dpid, label=None, round=-1, time=None):
     '''
     Parameters:
@@ -233,6 +312,8 @@ class SwitchFailure(InputEvent):
 class SwitchRecovery(InputEvent):
   ''' Recovers a crashed switch, by reconnecting its TCP connection with the
   controller(s).'''
+  __slots__ = ('dpid',)
+
   def __init__(self, dpid, label=None, round=-1, time=None):
     '''
     Parameters:
@@ -283,6 +364,8 @@ class LinkFailure(InputEvent):
   ''' Cuts a link between switches. This causes the switch to send an
   ofp_port_status message to its parent(s). All packets forwarded over
   this link will be dropped until a LinkRecovery occurs.'''
+  __slots__ = ('start_dpid', 'start_port_no', 'end_dpid', 'end_port_no')
+
   def __init__(self, start_dpid, start_port_no, end_dpid, end_port_no,
                label=None, round=-1, time=None):
     '''
@@ -332,6 +415,8 @@ class LinkFailure(InputEvent):
 class LinkRecovery(InputEvent):
   ''' Recovers a failed link between switches. This causes the switch to send an
   ofp_port_status message to its parent(s). '''
+  __slots__ = ('start_dpid', 'start_port_no', 'end_dpid', 'end_port_no')
+
   def __init__(self, start_dpid, start_port_no, end_dpid, end_port_no,
                label=None, round=-1, time=None):
     '''
@@ -381,6 +466,8 @@ class LinkRecovery(InputEvent):
 
 class ControllerFailure(InputEvent):
   ''' Kills a controller process with `kill -9`'''
+  __slots__ = ('controller_id',)
+
   def __init__(self, controller_id, label=None, round=-1, time=None):
     '''
     Parameters:
@@ -415,6 +502,8 @@ class ControllerFailure(InputEvent):
 class ControllerRecovery(InputEvent):
   ''' Reboots a crashed controller by reinvoking its original command line
   parameters'''
+  __slots__ = ('controller_id',)
+
   def __init__(self, controller_id, label=None, round=-1, time=None):
     '''
     Parameters:
@@ -450,6 +539,8 @@ class HostMigration(InputEvent):
   ''' Migrates a host from one location in network to another. Creates a new
   virtual port on the new switch, and takes down the old port on the old switch.
   '''
+  __slots__ = ('old_ingress_dpid', 'old_ingress_port_no', 'new_ingress_dpid', 'new_ingress_port_no', 'host_id')
+
   def __init__(self, old_ingress_dpid, old_ingress_port_no,
                new_ingress_dpid, new_ingress_port_no, host_id, label=None, round=-1, time=None):
     '''
@@ -516,6 +607,8 @@ class HostMigration(InputEvent):
 
 class PolicyChange(InputEvent):
   ''' Not currently supported '''
+  __slots__ = ('request_type',)
+
   def __init__(self, request_type, label=None, round=-1, time=None):
     super(PolicyChange, self).__init__(label=label, round=round, time=time)
     self.request_type = request_type
@@ -533,6 +626,8 @@ class PolicyChange(InputEvent):
 
 class TrafficInjection(InputEvent):
   ''' Injects a dataplane packet into the network at the given host's access link '''
+  __slots__ = ('dp_event', 'host_id')
+
   def __init__(self, label=None, dp_event=None, host_id=None, round=-1, time=None, prunable=True):
     '''
     Parameters:
@@ -575,14 +670,13 @@ class TrafficInjection(InputEvent):
     '''
     return (self.__class__.__name__, self.dp_event, self.host_id)
 
-  def to_json(self):
-    fields = {}
-    fields = dict(self.__dict__)
+  def json_fields(self):
+    fields = self._fields()
     fields['class'] = self.__class__.__name__
     fields['dp_event'] = self.dp_event.to_json()
-    fields['fingerprint'] = (self.__class__.__name__, self.dp_event.to_json(), self.host_id)
+    fields['fingerprint'] = (self.__class__.__name__, fields['dp_event'], self.host_id)
     fields['host_id'] = self.host_id
-    return json.dumps(fields)
+    return fields
 
   @staticmethod
   def from_json(json_hash):
@@ -601,6 +695,8 @@ class TrafficInjection(InputEvent):
 class WaitTime(InputEvent):
   ''' Causes the simulation to sleep for the specified number of seconds.
   Controller processes continue running during this time.'''
+  __slots__ = ('wait_time',)
+
   def __init__(self, wait_time, label=None, round=-1, time=None):
     '''
     Parameters:
@@ -630,6 +726,8 @@ class WaitTime(InputEvent):
 class CheckInvariants(InputEvent):
   ''' Causes the simulation to pause itself and check the given invariant before
   proceeding. '''
+  __slots__ = ('legacy_invariant_check', 'invariant_check', 'invariant_check_name')
+
   def __init__(self, label=None, round=-1, time=None,
                invariant_check_name="InvariantChecker.check_correspondence"):
     '''
@@ -682,8 +780,8 @@ class CheckInvariants(InputEvent):
         raise KeyboardInterrupt("fail to interactive on persistent violation")
     return True
 
-  def to_json(self):
-    fields = dict(self.__dict__)
+  def json_fields(self):
+    fields = self._fields()
     fields['class'] = self.__class__.__name__
     if self.legacy_invariant_check:
       fields['invariant_check'] = marshal.dumps(self.invariant_check.func_code)\
@@ -693,7 +791,7 @@ class CheckInvariants(InputEvent):
       fields['invariant_name'] = self.invariant_check_name
       fields['invariant_check'] = None
     fields['fingerprint'] = "N/A"
-    return json.dumps(fields)
+    return fields
 
   @staticmethod
   def from_json(json_hash):
@@ -715,6 +813,8 @@ class ControlChannelBlock(InputEvent):
   queuing all messages sent on the switch<->controller TCP connection. No
   messages will be sent over the connection until a ControlChannelUnblock
   occurs. '''
+  __slots__ = ('dpid', 'controller_id')
+
   def __init__(self, dpid, controller_id, label=None, round=-1, time=None):
     '''
     Parameters:
@@ -757,6 +857,8 @@ class ControlChannelBlock(InputEvent):
 class ControlChannelUnblock(InputEvent):
   ''' Unblocks the control channel delay triggered by a ControlChannelUnblock.
   All queued messages will be sent.'''
+  __slots__ = ('dpid', 'controller_id')
+
   def __init__(self, dpid, controller_id, label=None, round=-1, time=None):
     '''
     Parameters:
@@ -798,6 +900,8 @@ class ControlChannelUnblock(InputEvent):
 class DataplaneDrop(InputEvent):
   ''' Removes an in-flight dataplane packet with the given fingerprint from
   the network. '''
+  __slots__ = ('_fingerprint', 'passive', 'host_id', 'dpid')
+
   def __init__(self, fingerprint, label=None, host_id=None, dpid=None, round=-1, time=None, passive=True):
     '''
     Parameters:
@@ -817,9 +921,7 @@ class DataplaneDrop(InputEvent):
     if fingerprint[0] != self.__class__.__name__:
       fingerprint = list(fingerprint)
       fingerprint.insert(0, self.__class__.__name__)
-    if type(fingerprint) == list:
-      fingerprint = (fingerprint[0], DPFingerprint(fingerprint[1]),
-                     fingerprint[2], fingerprint[3])
+    # Lists (parsed from json) are decoded on first access to fingerprint
     self._fingerprint = fingerprint
     # TODO(cs): passive is a bit of a hack, but this was easier.
     self.passive = passive
@@ -837,12 +939,21 @@ class DataplaneDrop(InputEvent):
        return True
      return False
 
+  @property
+  def wakeup_key(self):
+    # Buffered by BufferedPatchPanel under fingerprint[1:]
+    if self.passive:
+      return None
+    return self.fingerprint[1:]
+
   @property
   def fingerprint(self):
     ''' Fingerprint tuple format:
     (class name, DPFingerprint, switch dpid, port no)
     See fingerprints/messages.py for format of DPFingerprint.
     '''
+    if type(self._fingerprint) == list:
+      self._fingerprint = decode_dp_fingerprint(self._fingerprint)
     return self._fingerprint
 
   @property
@@ -856,16 +967,18 @@ class DataplaneDrop(InputEvent):
     fingerprint = json_hash['fingerprint']
     return DataplaneDrop(fingerprint, round=round, label=label, time=time)
 
-  def to_json(self):
-    fields = dict(self.__dict__)
+  def json_fields(self):
+    fields = self._fields()
     fields['class'] = self.__class__.__name__
     fields['fingerprint'] = (self.fingerprint[0], self.fingerprint[1].to_dict(),
                              self.fingerprint[2], self.fingerprint[3])
     del fields['_fingerprint']
-    return json.dumps(fields)
+    return fields
 
 class BlockControllerPair(InputEvent):
   ''' '''
+  __slots__ = ('cid1', 'cid2')
+
   def __init__(self, cid1, cid2, label=None, round=-1, time=None):
     super(BlockControllerPair, self).__init__(label=label, round=round, time=time)
     self.cid1 = cid1
@@ -898,6 +1011,8 @@ class BlockControllerPair(InputEvent):
     return BlockControllerPair(cid1, cid2, round=round, label=label, time=time)
 
 class UnblockControllerPair(InputEvent):
+  __slots__ = ('cid1', 'cid2')
+
   def __init__(self, cid1, cid2, label=None, round=-1, time=None):
     super(UnblockControllerPair, self).__init__(label=label, round=round, time=time)
     self.cid1 = cid1
@@ -932,6 +1047,8 @@ class UnblockControllerPair(InputEvent):
 # TODO(cs): Temporary hack until we figure out determinism
 class LinkDiscovery(InputEvent):
   ''' Deprecated '''
+  __slots__ = ('_fingerprint', 'controller_id', 'link_attrs')
+
   def __init__(self, controller_id, link_attrs, label=None, round=-1, time=None):
     super(LinkDiscovery, self).__init__(label=label, round=round, time=time)
     self._fingerprint = (self.__class__.__name__,
@@ -981,6 +1098,8 @@ class ControlMessageBase(InternalEvent):
   Logged whenever an OpenFlowBuffer decides to explicitly fail an OpenFlow packet, or
   allow a switch to receive or send an openflow packet.
   '''
+  __slots__ = ('dpid', 'controller_id', 'b64_packet', '_fingerprint', 'ignore_whitelisted_packets', '_packet')
+
   def __init__(self, dpid, controller_id, fingerprint, b64_packet="", label=None, round=-1, time=None, timeout_disallowed=False):
     '''
     Parameters:
@@ -1000,15 +1119,13 @@ class ControlMessageBase(InternalEvent):
     # OFFingerprint, not including dpid and controller_id
     super(ControlMessageBase, self).__init__(label=label, round=round, time=time, timeout_disallowed=timeout_disallowed)
     self.dpid = dpid
-    self.controller_id = controller_id
+    self.controller_id = compact_string(controller_id, shared=True)
     self.b64_packet = b64_packet
-    if type(fingerprint) == list:
-      fingerprint = (fingerprint[0], OFFingerprint(fingerprint[1]),
-                     fingerprint[2], tuple(fingerprint[3]))
-    if type(fingerprint) == dict or type(fingerprint) != tuple:
-      fingerprint = (self.__class__.__name__, OFFingerprint(fingerprint),
-                     dpid, controller_id)
-
+    if type(fingerprint) != list and type(fingerprint) != tuple:
+      if type(fingerprint) != OFFingerprint:
+        fingerprint = OFFingerprint.from_dict(fingerprint)
+      fingerprint = (self.__class__.__name__, fingerprint, dpid, controller_id)
+    # Lists (parsed from json) are decoded on first access to fingerprint
     self._fingerprint = fingerprint
     self.ignore_whitelisted_packets = False
 
@@ -1024,6 +1141,11 @@ class ControlMessageBase(InternalEvent):
     (class name, OFFingerprint, dpid, controller id)
     See fingerprints/messages.py for OFFingerprint format.
     '''
+    if type(self._fingerprint) == list:
+      fingerprint = self._fingerprint
+      self._fingerprint = (fingerprint[0],
+                           OFFingerprint.from_dict(fingerprint[1]),
+                           fingerprint[2], tuple(fingerprint[3]))
     return self._fingerprint
 
 class ControlMessageReceive(ControlMessageBase):
@@ -1031,6 +1153,8 @@ class ControlMessageReceive(ControlMessageBase):
   Logged whenever the GodScheduler decides to allow a switch to receive an
   openflow message.
   '''
+  __slots__ = ()
+
   def proceed(self, simulation):
     pending_receive = self.pending_receive
     if self.ignore_whitelisted_packets and OpenFlowBuffer.in_whitelist(pending_receive.fingerprint):
@@ -1046,6 +1170,10 @@ class ControlMessageReceive(ControlMessageBase):
     # TODO(cs): inefficient to keep reconrstructing this tuple.
     return PendingReceive(self.dpid, self.controller_id, self.fingerprint[1])
 
+  @property
+  def wakeup_key(self):
+    return self.pending_receive
+
   def manually_inject(self, simulation):
     switch = simulation.topology.get_switch(self.dpid)
     conn = switch.get_connection(self.controller_id)
@@ -1072,6 +1200,8 @@ class ControlMessageSend(ControlMessageBase):
   Logged whenever the GodScheduler decides to allow a switch to send an
   openflow message.
   '''
+  __slots__ = ()
+
   def proceed(self, simulation):
     pending_send = self.pending_send
     if self.ignore_whitelisted_packets and OpenFlowBuffer.in_whitelist(pending_send.fingerprint):
@@ -1087,6 +1217,10 @@ class ControlMessageSend(ControlMessageBase):
     # TODO(cs): inefficient to keep reconrstructing this tuple.
     return PendingSend(self.dpid, self.controller_id, self.fingerprint[1])
 
+  @property
+  def wakeup_key(self):
+    return self.pending_send
+
   def __str__(self):
     return "ControlMessageSend:%s c %s -> s %s [%s]" % (self.label, self.dpid, self.controller_id, self.fingerprint[1].human_str())
 
@@ -1141,6 +1275,8 @@ class PendingStateChange(namedtuple('PendingStateChange',
     # NOTE: __ne__ in python does *NOT* by default delegate to eq
     return not self.__eq__(other)
 
+# A controller blocked on a deterministic value request (e.g. gettimeofday)
+PendingDeterministicValue = namedtuple('PendingDeterministicValue', ['controller_id'])
 
 class ControllerStateChange(InternalEvent):
   '''
@@ -1148,6 +1284,8 @@ class ControllerStateChange(InternalEvent):
   mastership change). Visibility into controller state changes is obtained
   via syncproto.
   '''
+  __slots__ = ('controller_id', '_fingerprint', 'name', 'value')
+
   def __init__(self, controller_id, fingerprint, name, value, label=None, round=-1, time=None, timeout_disallowed=False):
     '''
     Parameters:
@@ -1164,7 +1302,7 @@ class ControllerStateChange(InternalEvent):
        this event to occur. Defaults to False.
     '''
     super(ControllerStateChange, self).__init__(label=label, round=round, time=time, timeout_disallowed=timeout_disallowed)
-    self.controller_id = controller_id
+    self.controller_id = compact_string(controller_id, shared=True)
     if type(fingerprint) == str or type(fingerprint) == unicode:
       fingerprint = (self.__class__.__name__, fingerprint)
     if type(fingerprint) == list:
@@ -1190,6 +1328,10 @@ class ControllerStateChange(InternalEvent):
                               self._get_message_fingerprint(),
                               self.name, self.value)
 
+  @property
+  def wakeup_key(self):
+    return self.pending_state_change
+
   def _get_message_fingerprint(self):
     return self._fingerprint[1]
 
@@ -1229,6 +1371,8 @@ class DeterministicValue(InternalEvent):
   Logged whenever the controller asks for a deterministic value (e.g.
   gettimeofday()
   '''
+  __slots__ = ('controller_id', 'name', 'value')
+
   def __init__(self, controller_id, name, value, label=None, round=-1, time=None, timeout_disallowed=False):
     '''
     Parameters:
@@ -1245,7 +1389,7 @@ class DeterministicValue(InternalEvent):
        this event to occur. Defaults to False.
     '''
     super(DeterministicValue, self).__init__(label=label, round=round, time=time, timeout_disallowed=timeout_disallowed)
-    self.controller_id = controller_id
+    self.controller_id = compact_string(controller_id, shared=True)
     self.name = name
     if name == "gettimeofday":
       value = SyncTime(seconds=value[0], microSeconds=value[1])
@@ -1261,6 +1405,10 @@ class DeterministicValue(InternalEvent):
       return True
     return False
 
+  @property
+  def wakeup_key(self):
+    return PendingDeterministicValue(self.controller_id)
+
   @staticmethod
   def from_json(json_hash):
     (label, time, round, timeout_disallowed) = extract_base_fields(json_hash)
@@ -1278,6 +1426,8 @@ class ConnectToControllers(InternalEvent):
   ''' Logged at the beginning of the execution. Causes all switches to open
   TCP connections their their parent controller(s).
   '''
+  __slots__ = ()
+
   def proceed(self, simulation):
     simulation.connect_to_controllers()
     return True
@@ -1293,6 +1443,8 @@ class DataplanePermit(InternalEvent):
   dataplane. We basically just keep this around for bookkeeping purposes. During
   replay, this let's us know which packets to let through, and which to drop.
   '''
+  __slots__ = ('_fingerprint', 'passive')
+
   def __init__(self, fingerprint, label=None, round=-1, time=None,
                passive=True):
     '''
@@ -1311,9 +1463,7 @@ class DataplanePermit(InternalEvent):
     if fingerprint[0] != self.__class__.__name__:
       fingerprint = list(fingerprint)
       fingerprint.insert(0, self.__class__.__name__)
-    if type(fingerprint) == list:
-      fingerprint = (fingerprint[0], DPFingerprint(fingerprint[1]),
-                     fingerprint[2], fingerprint[3])
+    # Lists (parsed from json) are decoded on first access to fingerprint
     self._fingerprint = fingerprint
     # TODO(cs): passive is a bit of a hack, but this was easier.
     self.passive = passive
@@ -1328,12 +1478,21 @@ class DataplanePermit(InternalEvent):
         return True
       return False
 
+  @property
+  def wakeup_key(self):
+    # Buffered by BufferedPatchPanel under fingerprint[1:]
+    if self.passive:
+      return None
+    return self.fingerprint[1:]
+
   @property
   def fingerprint(self):
     ''' Fingerprint tuple format:
     (class name, DPFingerprint, switch dpid, port no)
     See fingerprints/messages.py for format of DPFingerprint.
     '''
+    if type(self._fingerprint) == list:
+      self._fingerprint = decode_dp_fingerprint(self._fingerprint)
     return self._fingerprint
 
   @property
@@ -1347,19 +1506,21 @@ class DataplanePermit(InternalEvent):
     fingerprint = json_hash['fingerprint']
     return DataplanePermit(fingerprint, label=label, round=round, time=time)
 
-  def to_json(self):
-    fields = dict(self.__dict__)
+  def json_fields(self):
+    fields = self._fields()
     fields['class'] = self.__class__.__name__
     fields['fingerprint'] = (self.fingerprint[0], self.fingerprint[1].to_dict(),
                              self.fingerprint[2], self.fingerprint[3])
     del fields['_fingerprint']
-    return json.dumps(fields)
+    return fields
 
 class ProcessFlowMod(ControlMessageBase):
   ''' Logged whenever the network-wide OpenFlowBuffer decides to allow buffered (local
   to each switch) OpenFlow flow_mod message through and be processed by the switch '''
   # TODO(jl): Update visualization tool to recognize this replay event
 
+  __slots__ = ()
+
   def proceed(self, simulation):
     switch = simulation.topology.get_switch(self.dpid)
     message_waiting = switch.openflow_buffer.message_receipt_waiting(self.pending_receive)
@@ -1395,6 +1556,8 @@ class FailFlowMod(ControlMessageBase):
   buffered (local to each switch) OpenFlow flow_mod message instead of letting the switch process it '''
   # TODO(jl): Update visualization tool to recognize this replay event
 
+  __slots__ = ()
+
   def proceed(self, simulation):
     switch = simulation.topology.get_switch(self.dpid)
     message_waiting = switch.openflow_buffer.message_receipt_waiting(self.pending_receive)
@@ -1429,11 +1592,15 @@ all_internal_events = [ControlMessageReceive, ControlMessageSend,
 # Special events:
 
 class SpecialEvent(Event):
+  __slots__ = ()
+
   def proceed(self, _):
     raise RuntimeError("Should never be called!")
 
 class InvariantViolation(SpecialEvent):
   ''' Class for logging violations as json dicts '''
+  __slots__ = ('violations', 'persistent')
+
   def __init__(self, violations, label=None, round=-1, time=None, persistent=False):
     '''
     Parameters:
@@ -23,6 +23,7 @@ Encapsulates the state of the simulation, including:
 '''
 
 from sts.util.io_master import IOMaster
+from sts.util.virtual_clock import VirtualClock, install_clock, uninstall_clock
 from sts.dataplane_traces.trace import Trace
 from entities import DeferredOFConnection
 from sts.controller_manager import ControllerManager, UserSpaceControllerPatchPanel
@@ -35,6 +36,7 @@ import sts.snapshot as snapshot
 from sts.util.socket_mux.base import MultiplexedSelect
 from sts.util.socket_mux.sts_socket_multiplexer import STSSocketDemultiplexer, STSMockSocket
 from pox.lib.util import connect_socket_with_backoff
+import pox.openflow.flow_table as flow_table
 
 import select
 import socket
@@ -73,7 +75,8 @@ class SimulationConfig(object):
                multiplex_sockets=False,
                violation_persistence_threshold=None,
                kill_controllers_on_exit=True,
-               interpose_on_controllers=False):
+               interpose_on_controllers=False,
+               virtual_time=False):
     '''
     Constructor parameters:
       topology_class    => a sts.topology.Topology class (not object!)
@@ -93,6 +96,10 @@ class SimulationConfig(object):
       monkey_patch_select => whether to use STS's custom deterministic
                              select. Requires that the controller is
                              monkey-patched too
+      virtual_time => whether to run the simulation on a VirtualClock
+                      (sts/util/virtual_clock.py) instead of the wall
+                      clock. Idle periods are then skipped rather than
+                      waited out
     '''
     if controller_configs is None:
       controller_configs = []
@@ -115,13 +122,18 @@ class SimulationConfig(object):
     self.multiplex_sockets = multiplex_sockets
     self.interpose_on_controllers = interpose_on_controllers
     self.controller_patch_panel_class = controller_patch_panel_class
+    self.virtual_time = virtual_time
 
-  def bootstrap(self, sync_callback, boot_controllers=default_boot_controllers):
+  def bootstrap(self, sync_callback, boot_controllers=default_boot_controllers,
+                clock_start_seconds=None):
     '''Return a simulation object encapsulating the state of
        the system in its initial starting point:
        - boots controllers
        - connects switches to controllers
 
+       With virtual_time, the clock starts at clock_start_seconds (e.g. the
+       start of a recording being replayed), or the wall clock if None.
+
        May be invoked multiple times!
     '''
     def remove_monkey_patch():
@@ -140,6 +152,16 @@ class SimulationConfig(object):
       msg.set_io_master(_io_master)
       return _io_master
 
+    def initialize_clock(io_master):
+      if not self.virtual_time:
+        return None
+      clock = VirtualClock(clock_start_seconds)
+      install_clock(clock)
+      # Stamp and expire flow entries in virtual time
+      clock.patch_time_module(flow_table)
+      io_master.clock = clock
+      return clock
+
     def wire_controller_patch_panel(controller_manager, create_io_worker):
       patch_panel = None
       if not self.interpose_on_controllers:
@@ -166,6 +188,7 @@ class SimulationConfig(object):
     # Instantiate the pieces needed for Simulation's constructor
     remove_monkey_patch()
     io_master = initialize_io_loop()
+    clock = initialize_clock(io_master)
     sync_connection_manager = STSSyncConnectionManager(io_master,
                                                        sync_callback)
     controller_manager = boot_controllers(self.controller_configs,
@@ -174,6 +197,10 @@ class SimulationConfig(object):
     controller_patch_panel = wire_controller_patch_panel(controller_manager,
                                                          io_master.create_worker_for_socket)
     topology = instantiate_topology(io_master.create_worker_for_socket)
+    if clock is not None:
+      for switch in topology.switches:
+        if hasattr(switch, "use_virtual_clock"):
+          switch.use_virtual_clock(clock)
     patch_panel = self._patch_panel_class(topology.switches, topology.hosts,
                                           topology.get_connected_port)
     openflow_buffer = OpenFlowBuffer()
@@ -188,7 +215,8 @@ class SimulationConfig(object):
     simulation = Simulation(topology, controller_manager, dataplane_trace,
                             openflow_buffer, io_master, controller_patch_panel,
                             patch_panel, sync_callback, self.multiplex_sockets,
-                            violation_tracker, self._kill_controllers_on_exit)
+                            violation_tracker, self._kill_controllers_on_exit,
+                            clock=clock)
     self.current_simulation = simulation
     return simulation
 
@@ -202,10 +230,12 @@ class SimulationConfig(object):
             '''                 topology_params="%s",\n'''
             '''                 patch_panel_class=%s,\n'''
             '''                 multiplex_sockets=%s,\n'''
-            '''                 kill_controllers_on_exit=%s)''' %
+            '''                 kill_controllers_on_exit=%s,\n'''
+            '''                 virtual_time=%s)''' %
             (str(self.controller_configs),self._topology_class.__name__,
              self._topology_params, self._patch_panel_class.__name__,
-             str(self.multiplex_sockets), str(self._kill_controllers_on_exit)))
+             str(self.multiplex_sockets), str(self._kill_controllers_on_exit),
+             str(self.virtual_time)))
 
 class Simulation(object):
   '''
@@ -220,7 +250,7 @@ class Simulation(object):
   def __init__(self, topology, controller_manager, dataplane_trace,
                openflow_buffer, io_master, controller_patch_panel, patch_panel,
                controller_sync_callback, multiplex_sockets,
-               violation_tracker, kill_controllers_on_exit):
+               violation_tracker, kill_controllers_on_exit, clock=None):
     self.topology = topology
     self.controller_manager = controller_manager
     self.controller_manager.set_simulation(self)
@@ -234,6 +264,8 @@ class Simulation(object):
     self.violation_tracker = violation_tracker
     self._kill_controllers_on_exit = kill_controllers_on_exit
     self.exit_code = 0
+    # The simulation's VirtualClock, or None if it runs in real time
+    self.clock = clock
 
   def set_exit_code(self, code):
     self.exit_code = code
@@ -276,6 +308,9 @@ class Simulation(object):
     if self._io_master is not None:
       self._io_master.close_all()
 
+    if self.clock is not None:
+      uninstall_clock()
+
   @property
   def io_master(self):
     return self._io_master
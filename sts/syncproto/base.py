@@ -23,6 +23,8 @@ import logging
 import time
 import socket
 
+from sts.util.virtual_clock import installed_clock
+
 # TODO(cs): specific to POX!
 from pox.lib.ioworker.io_worker import JSONIOWorker
 
@@ -40,6 +42,10 @@ class SyncTime(collections.namedtuple('SyncTime', ('seconds', 'microSeconds'))):
 
   @staticmethod
   def now():
+    clock = installed_clock()
+    if clock is not None:
+      micros = clock.now_micros()
+      return SyncTime(micros // 1000000, micros % 1000000)
     # if time.time has been patched by sts then we don't want to fall into this
     # trap ourselves
     if(hasattr(time, "_orig_time")):
@@ -0,0 +1,318 @@
+# Copyright 2011-2013 Colin Scott
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+'''
+Transparent compression for trace files (superlogs, .unacked side-logs,
+dataplane traces).
+
+Compressed traces are split into independently compressed blocks, so that
+readers can seek to any uncompressed offset by decompressing a single block.
+Blocks are compressed by a codec, looked up by name in `codecs'; new codecs
+can be added with register_codec().
+
+Layout:
+  header:  MAGIC, version, codec name
+  blocks:  [uint32 compressed length][uint32 raw length][compressed data] ...
+  end:     an empty block header
+  index:   (raw offset, file offset) of every block
+  trailer: block count, index offset, raw size, TRAILER_MAGIC
+
+If the writer never got to close the file (e.g. the fuzzer crashed), the
+index is missing, and readers rebuild it by walking the block headers.
+
+open_trace_file() reads plain, block compressed, and gzip files alike.
+'''
+
+import bz2
+import gzip
+import os
+import struct
+import zlib
+
+MAGIC = "STSBLOCK"
+TRAILER_MAGIC = "STSBLIDX"
+VERSION = 1
+GZIP_MAGIC = "\x1f\x8b"
+
+# Raw bytes per block. Larger blocks compress better, but make seeks decompress
+# more.
+default_block_size = 256 * 1024
+
+_header = struct.Struct("!8sIB")
+_block_header = struct.Struct("!II")
+_index_entry = struct.Struct("!QQ")
+_trailer = struct.Struct("!QQQ8s")
+
+class Codec(object):
+  ''' A named pair of compress/decompress functions over strings '''
+  def __init__(self, name, compress, decompress):
+    self.name = name
+    self.compress = compress
+    self.decompress = decompress
+
+codecs = {}
+
+def register_codec(codec):
+  if len(codec.name) > 255:
+    raise ValueError("Codec name %s is too long" % codec.name)
+  codecs[codec.name] = codec
+
+register_codec(Codec("zlib", lambda data: zlib.compress(data, 6), zlib.decompress))
+register_codec(Codec("zlib-fast", lambda data: zlib.compress(data, 1), zlib.decompress))
+register_codec(Codec("bz2", bz2.compress, bz2.decompress))
+
+def _magic(path):
+  with open(path, 'rb') as f:
+    return f.read(len(MAGIC))
+
+def compression_of(path):
+  ''' Return the name of the codec path is compressed with, "gzip" for gzip
+  files, or None if path is not compressed '''
+  magic = _magic(path)
+  if magic.startswith(GZIP_MAGIC):
+    return "gzip"
+  if magic == MAGIC:
+    with BlockReader(path) as reader:
+      return reader.codec.name
+  return None
+
+def open_trace_file(path, mode='r', codec=None):
+  ''' Open a trace file. When reading, the compression (if any) is detected
+  from the file's contents. When writing, codec is the name of a registered
+  codec to compress with, "gzip" for a (non-seekable) gzip file, or None for
+  no compression. '''
+  if mode.startswith('r'):
+    magic = _magic(path)
+    if magic == MAGIC:
+      return BlockReader(path)
+    if magic.startswith(GZIP_MAGIC):
+      return gzip.open(path, 'rb')
+    return open(path, mode)
+  if mode.startswith('w'):
+    if codec is None:
+      return open(path, mode)
+    if codec == "gzip":
+      return gzip.open(path, 'wb')
+    return BlockWriter(path, codec=codec)
+  raise ValueError("Unsupported mode %s" % mode)
+
+class BlockWriter(object):
+  ''' File-like object that writes a block compressed file. The index is
+  written by close(). '''
+  def __init__(self, path, codec="zlib", block_size=None):
+    if codec not in codecs:
+      raise ValueError("Unknown codec %s" % codec)
+    self.name = path
+    self.codec = codecs[codec]
+    self.block_size = block_size or default_block_size
+    self._output = open(path, 'wb')
+    self._output.write(_header.pack(MAGIC, VERSION, len(codec)))
+    self._output.write(codec)
+    self._pending = []
+    self._pending_size = 0
+    self._raw_offset = 0
+    # [(raw offset, file offset)]
+    self._index = []
+
+  @property
+  def closed(self):
+    return self._output.closed
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *args):
+    self.close()
+
+  def write(self, data):
+    if self.closed:
+      raise ValueError("I/O operation on closed file")
+    self._pending.append(data)
+    self._pending_size += len(data)
+    if self._pending_size >= self.block_size:
+      self._write_blocks()
+
+  def flush(self):
+    ''' Compress and write out whatever is buffered, as a (possibly short)
+    block '''
+    self._write_blocks(partial=True)
+    self._output.flush()
+
+  def fileno(self):
+    return self._output.fileno()
+
+  def _write_blocks(self, partial=False):
+    data = "".join(self._pending)
+    start = 0
+    while (len(data) - start >= self.block_size or
+           (partial and start < len(data))):
+      raw = data[start:start + self.block_size]
+      compressed = self.codec.compress(raw)
+      self._index.append((self._raw_offset, self._output.tell()))
+      self._output.write(_block_header.pack(len(compressed), len(raw)))
+      self._output.write(compressed)
+      self._raw_offset += len(raw)
+      start += len(raw)
+    self._pending = [data[start:]] if start < len(data) else []
+    self._pending_size = len(data) - start
+
+  def close(self):
+    if self.closed:
+      return
+    self._write_blocks(partial=True)
+    output = self._output
+    output.write(_block_header.pack(0, 0))
+    index_offset = output.tell()
+    for entry in self._index:
+      output.write(_index_entry.pack(*entry))
+    output.write(_trailer.pack(len(self._index), index_offset, self._raw_offset,
+                               TRAILER_MAGIC))
+    output.close()
+
+class BlockReader(object):
+  ''' Read-only file-like object over a block compressed file. Offsets (seek,
+  tell) are offsets into the uncompressed data. '''
+  def __init__(self, path):
+    self.name = path
+    self._file = open(path, 'rb')
+    (magic, version, name_length) = _header.unpack(self._file.read(_header.size))
+    if magic != MAGIC:
+      raise ValueError("%s is not block compressed" % path)
+    if version != VERSION:
+      raise ValueError("Unsupported block compression version %d" % version)
+    codec = self._file.read(name_length)
+    if codec not in codecs:
+      raise ValueError("%s is compressed with unknown codec %s" % (path, codec))
+    self.codec = codecs[codec]
+    self._data_start = self._file.tell()
+    # [(raw offset, file offset)], and the uncompressed size
+    (self._index, self.raw_size) = self._read_index()
+    self._raw_offsets = [ raw_offset for (raw_offset, _) in self._index ]
+    self._position = 0
+    # (raw offset, data) of the block that was last decompressed
+    self._block_start = 0
+    self._block = ""
+
+  def _read_index(self):
+    f = self._file
+    f.seek(0, os.SEEK_END)
+    size = f.tell()
+    if size - self._data_start >= _trailer.size:
+      f.seek(size - _trailer.size)
+      (count, index_offset, raw_size, trailer_magic) = \
+          _trailer.unpack(f.read(_trailer.size))
+      if trailer_magic == TRAILER_MAGIC:
+        f.seek(index_offset)
+        entries = f.read(count * _index_entry.size)
+        index = [ _index_entry.unpack_from(entries, i * _index_entry.size)
+                  for i in xrange(count) ]
+        return (index, raw_size)
+    # Not closed properly: recover the complete blocks
+    index = []
+    (raw_offset, offset) = (0, self._data_start)
+    while offset + _block_header.size <= size:
+      f.seek(offset)
+      (compressed_length, raw_length) = _block_header.unpack(f.read(_block_header.size))
+      end = offset + _block_header.size + compressed_length
+      if raw_length == 0 or end > size:
+        break
+      index.append((raw_offset, offset))
+      raw_offset += raw_length
+      offset = end
+    return (index, raw_offset)
+
+  @property
+  def closed(self):
+    return self._file.closed
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *args):
+    self.close()
+
+  def close(self):
+    self._file.close()
+
+  def __iter__(self):
+    return self
+
+  def next(self):
+    line = self.readline()
+    if line == "":
+      raise StopIteration()
+    return line
+
+  def tell(self):
+    return self._position
+
+  def seek(self, offset, whence=os.SEEK_SET):
+    if whence == os.SEEK_CUR:
+      offset += self._position
+    elif whence == os.SEEK_END:
+      offset += self.raw_size
+    if offset < 0:
+      raise IOError("Invalid offset %d" % offset)
+    self._position = offset
+
+  def _load_block(self):
+    ''' Make sure the block holding self._position is decompressed. Returns
+    False at EOF. '''
+    if self._block_start <= self._position < self._block_start + len(self._block):
+      return True
+    if self._position >= self.raw_size:
+      return False
+    # The last block starting at or before self._position
+    (start, end) = (0, len(self._raw_offsets))
+    while start < end:
+      middle = (start + end) // 2
+      if self._raw_offsets[middle] <= self._position:
+        start = middle + 1
+      else:
+        end = middle
+    (raw_offset, offset) = self._index[start - 1]
+    self._file.seek(offset)
+    (compressed_length, _) = _block_header.unpack(self._file.read(_block_header.size))
+    self._block = self.codec.decompress(self._file.read(compressed_length))
+    self._block_start = raw_offset
+    return True
+
+  def read(self, size=-1):
+    chunks = []
+    while size != 0 and self._load_block():
+      start = self._position - self._block_start
+      end = len(self._block) if size < 0 else min(len(self._block), start + size)
+      chunks.append(self._block[start:end])
+      self._position += end - start
+      if size > 0:
+        size -= end - start
+    return "".join(chunks)
+
+  def readline(self, size=-1):
+    chunks = []
+    while size != 0 and self._load_block():
+      start = self._position - self._block_start
+      newline = self._block.find("\n", start)
+      end = len(self._block) if newline < 0 else newline + 1
+      if size > 0:
+        end = min(end, start + size)
+        size -= end - start
+      chunks.append(self._block[start:end])
+      self._position += end - start
+      if chunks[-1].endswith("\n"):
+        break
+    return "".join(chunks)
+
+  def readlines(self):
+    return list(self)
@@ -60,6 +60,9 @@ class IOMaster(object):
   """
   _select_timeout = 5
   _BUF_SIZE = 8192
+  # With a virtual clock, how long sleep() waits for I/O to go quiet before
+  # jumping the clock
+  _virtual_sleep_quantum = 0.005
 
   def __init__ (self):
     self._workers = set()
@@ -67,6 +70,10 @@ class IOMaster(object):
     self.closed = False
     self._close_requested = False
     self._in_select = 0
+    # When select() last handled a read, write, or error on a worker
+    self.last_activity = None
+    # If set, a VirtualClock that sleep() advances instead of waiting
+    self.clock = None
 
   def create_worker_for_socket(self, socket):
     '''
@@ -158,6 +165,9 @@ class IOMaster(object):
     self.select(0)
 
   def sleep(self, timeout):
+    if self.clock is not None:
+      self._virtual_sleep(timeout)
+      return
     start = time.time()
     while not self.closed:
       elapsed = time.time() - start
@@ -166,6 +176,25 @@ class IOMaster(object):
         break
       self.select(remaining)
 
+  def _virtual_sleep(self, timeout):
+    ''' Handle I/O until a select() of _virtual_sleep_quantum sees none (or
+    timeout seconds of real time have passed), then jump the clock forward
+    by timeout '''
+    end = time.time() + timeout
+    while not self.closed:
+      remaining = end - time.time()
+      if remaining <= 0:
+        break
+      last_activity = self.last_activity
+      self.select(min(self._virtual_sleep_quantum, remaining))
+      if self.last_activity == last_activity and not self.pending_io():
+        break
+    self.clock.advance(timeout)
+
+  def pending_io(self):
+    ''' Return whether any worker has data buffered waiting to be sent '''
+    return any(worker._ready_to_send for worker in self._workers)
+
   def grab_workers_rwe(self):
     # Now grab workers
     read_sockets = list(self._workers) + [ self.pinger ]
@@ -179,6 +208,9 @@ class IOMaster(object):
       read_sockets, write_sockets, exception_sockets = self.grab_workers_rwe()
       rlist, wlist, elist = select.select(read_sockets, write_sockets, exception_sockets, timeout)
       self.handle_workers_rwe(rlist, wlist, elist)
+      # (handle_workers_rwe removes the pinger from rlist)
+      if rlist or wlist or elist:
+        self.last_activity = time.time()
     except select.error:
       # TODO(cs): this is a hack: file descriptor is closed upon shut
       # down, and select throws up.
@@ -15,6 +15,11 @@
 
 from collections import defaultdict
 import itertools
+import fcntl
+import hashlib
+import json
+import os
+import time
 
 class PrecomputePowerSetCache(object):
   sequence_id = itertools.count(1)
@@ -38,4 +43,317 @@ class PrecomputeCache(object):
   def update(self, input_sequence):
     self.done_sequences.add(input_sequence)
 
+class LatticeOutcomeCache(object):
+  ''' Remembers which sets of inputs did or did not reproduce a violation
+  during one MCS run, and answers whether a new set's outcome is implied by
+  them under a monotonicity assumption:
 
+   - failures_downward_closed: subsets of a set that didn't reproduce won't
+     reproduce either.
+   - reproductions_upward_closed: supersets of a set that reproduced will
+     reproduce too.
+
+  Inputs are numbered as they are first seen. For every input we keep a
+  bitset (a long) of the recorded sets that contain it, so subset and superset
+  queries are a handful of bitwise ops per input of the query rather than a
+  scan over every recorded set or every input seen. '''
+  def __init__(self, failures_downward_closed=True,
+               reproductions_upward_closed=True):
+    self.failures_downward_closed = failures_downward_closed
+    self.reproductions_upward_closed = reproductions_upward_closed
+    # { input -> bit }
+    self._element2bit = {}
+    # [ input ], indexed by bit
+    self._elements = []
+    # [ input bitset ], indexed by set id
+    self._set_masks = []
+    # { input bitset -> set id }
+    self._exact = {}
+    # [ bitset of set ids ], indexed by input bit
+    self._failing_sets_containing = []
+    self._reproducing_sets_containing = []
+    # bitsets of set ids
+    self._failing_sets = 0
+    self._reproducing_sets = 0
+    self._empty_reproducing_sets = 0
+
+  def __len__(self):
+    return len(self._set_masks)
+
+  def record(self, input_sequence, reproduced):
+    mask = 0
+    for elem in input_sequence:
+      if elem not in self._element2bit:
+        self._element2bit[elem] = len(self._elements)
+        self._elements.append(elem)
+        self._failing_sets_containing.append(0)
+        self._reproducing_sets_containing.append(0)
+      mask |= 1 << self._element2bit[elem]
+    set_id = len(self._set_masks)
+    self._set_masks.append(mask)
+    if mask not in self._exact or reproduced:
+      self._exact[mask] = set_id
+    set_bit = 1 << set_id
+    if reproduced:
+      self._reproducing_sets |= set_bit
+      if mask == 0:
+        self._empty_reproducing_sets |= set_bit
+      index = self._reproducing_sets_containing
+    else:
+      self._failing_sets |= set_bit
+      index = self._failing_sets_containing
+    for elem in input_sequence:
+      index[self._element2bit[elem]] |= set_bit
+
+  def lookup(self, input_sequence):
+    ''' Return (reproduced, inputs of the recorded set that implies it) if
+    the outcome for input_sequence is known or implied, otherwise None.
+    Conflicting implications (the outcomes weren't actually monotone) give
+    None. '''
+    bits = []
+    for elem in input_sequence:
+      if elem not in self._element2bit:
+        # Not a subset of anything we've seen
+        bits = None
+        break
+      bits.append(self._element2bit[elem])
+
+    if bits is not None:
+      mask = 0
+      for bit in bits:
+        mask |= 1 << bit
+      if mask in self._exact:
+        set_id = self._exact[mask]
+        return (bool(self._reproducing_sets & (1 << set_id)),
+                self._set_inputs(set_id))
+
+    implied = []
+    if self.failures_downward_closed and bits is not None:
+      # Failing sets that contain every one of our inputs
+      candidates = self._failing_sets
+      for bit in bits:
+        candidates &= self._failing_sets_containing[bit]
+        if candidates == 0:
+          break
+      if candidates != 0:
+        implied.append((False, self._lowest_set(candidates)))
+    if self.reproductions_upward_closed:
+      # Reproducing sets without any input outside of ours. Only those that
+      # share an input with us (or are empty) can qualify; check each one's
+      # inputs against ours.
+      our_mask = 0
+      candidates = self._empty_reproducing_sets
+      for elem in input_sequence:
+        if elem in self._element2bit:
+          bit = self._element2bit[elem]
+          our_mask |= 1 << bit
+          candidates |= self._reproducing_sets_containing[bit]
+      while candidates != 0:
+        set_id = self._lowest_set(candidates)
+        if self._set_masks[set_id] & ~our_mask == 0:
+          implied.append((True, set_id))
+          break
+        candidates &= ~(1 << set_id)
+    if len(implied) != 1:
+      return None
+    (reproduced, set_id) = implied[0]
+    return (reproduced, self._set_inputs(set_id))
+
+  def _lowest_set(self, set_ids):
+    return (set_ids & -set_ids).bit_length() - 1
+
+  def _set_inputs(self, set_id):
+    mask = self._set_masks[set_id]
+    return [ elem for bit, elem in enumerate(self._elements) if mask & (1 << bit) ]
+
+class SharedReplayMemo(object):
+  ''' Remembers every violation seen by each replay of an input set, so
+  that MCS searches for different bug signatures over the same trace can
+  answer each other's subset tests. '''
+  def __init__(self):
+    # { frozenset of inputs -> [ (violations, complete) ] }, one per replay
+    self._runs = defaultdict(list)
+
+  def record(self, input_sequence, violations, complete=True):
+    ''' complete is False if the replay stopped early, i.e. violations may
+    be missing some that would have shown up later. '''
+    self._runs[frozenset(input_sequence)].append((list(violations), complete))
+
+  def replays(self, input_sequence):
+    return len(self._runs.get(frozenset(input_sequence), []))
+
+  def outcome(self, input_sequence, bug_signature, run):
+    ''' Return whether the run'th replay of input_sequence showed
+    bug_signature, or None if there was no such replay or it can't tell. '''
+    runs = self._runs.get(frozenset(input_sequence), [])
+    if run >= len(runs):
+      return None
+    (violations, complete) = runs[run]
+    if bug_signature in violations:
+      return True
+    if complete:
+      return False
+    return None
+
+def hash_file(path):
+  ''' Return the sha1 hex digest of the contents of path '''
+  h = hashlib.sha1()
+  with open(path, "rb") as f:
+    for chunk in iter(lambda: f.read(1 << 20), ""):
+      h.update(chunk)
+  return h.hexdigest()
+
+def hash_string(s):
+  return hashlib.sha1(s).hexdigest()
+
+class ReplayOutcomeCache(object):
+  ''' Remembers, across processes and restarts, which subsets of a trace's
+  inputs did or did not reproduce a violation.
+
+  Outcomes are keyed on (trace hash, config hash, invariant name, set of
+  input labels), and are appended as one JSON object per line to path. Writers
+  serialize on an flock()ed path + ".lock", so several MCS processes can share
+  one cache. A line that was cut short by a crash is ignored.
+  '''
+  def __init__(self, path):
+    self.path = path
+    self._lock_path = path + ".lock"
+    # { (key, signature json) -> (reproduced, verification runs) }
+    self._outcomes = {}
+    # How far into (which version of) path we have read
+    self._inode = None
+    self._offset = 0
+
+  @staticmethod
+  def make_key(trace_hash, config_hash, invariant_name, input_labels):
+    return (trace_hash, config_hash, invariant_name,
+            tuple(sorted(set(input_labels))))
+
+  @staticmethod
+  def _signature_json(bug_signature):
+    return json.dumps(bug_signature, sort_keys=True)
+
+  def lookup(self, key, bug_signature, verification_runs=1):
+    ''' Return True if the inputs in key are known to reproduce
+    bug_signature, False if they are known not to within verification_runs
+    replays, or None if we don't know. '''
+    self._refresh()
+    outcome = self._outcomes.get((key, self._signature_json(bug_signature)))
+    if outcome is None:
+      return None
+    (reproduced, runs) = outcome
+    if reproduced:
+      return True
+    if runs >= verification_runs:
+      return False
+    return None
+
+  def record(self, key, reproduced, bug_signature, verification_runs=1):
+    (trace_hash, config_hash, invariant_name, input_labels) = key
+    entry = {
+      'trace_hash' : trace_hash,
+      'config_hash' : config_hash,
+      'invariant' : invariant_name,
+      'inputs' : list(input_labels),
+      'reproduced' : reproduced,
+      'signature' : bug_signature,
+      'verification_runs' : verification_runs,
+      'time' : time.time(),
+    }
+    line = json.dumps(entry, sort_keys=True) + "\n"
+    with self._locked():
+      with open(self.path, "a+b") as f:
+        # Terminate a line that a crashed writer left incomplete
+        f.seek(0, os.SEEK_END)
+        if f.tell() > 0:
+          f.seek(-1, os.SEEK_END)
+          if f.read(1) != "\n":
+            f.write("\n")
+        f.write(line)
+        f.flush()
+        os.fsync(f.fileno())
+    self._add(entry)
+
+  def entries(self):
+    ''' Return every well-formed entry, oldest first. '''
+    if not os.path.exists(self.path):
+      return []
+    with open(self.path, "rb") as f:
+      return self._parse_lines(f.read())
+
+  def prune(self, should_remove):
+    ''' Remove every entry for which should_remove(entry) is true. Returns
+    the number of entries removed. '''
+    with self._locked():
+      entries = self.entries()
+      kept = [ e for e in entries if not should_remove(e) ]
+      tmp_path = self.path + ".tmp"
+      with open(tmp_path, "wb") as f:
+        for entry in kept:
+          f.write(json.dumps(entry, sort_keys=True) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+      # Readers notice the new inode and start over
+      os.rename(tmp_path, self.path)
+    self._inode = None
+    return len(entries) - len(kept)
+
+  def _locked(self):
+    return _FileLock(self._lock_path)
+
+  def _parse_lines(self, data):
+    entries = []
+    for line in data.split("\n"):
+      if line.strip() == "":
+        continue
+      try:
+        entries.append(json.loads(line))
+      except ValueError:
+        # Cut short by a crash
+        continue
+    return entries
+
+  def _add(self, entry):
+    key = self.make_key(entry['trace_hash'], entry['config_hash'],
+                        entry['invariant'], entry['inputs'])
+    signature = self._signature_json(entry['signature'])
+    (reproduced, runs) = self._outcomes.get((key, signature), (False, 0))
+    self._outcomes[(key, signature)] = (reproduced or entry['reproduced'],
+                                        max(runs, entry['verification_runs']))
+
+  def _refresh(self):
+    ''' Read whatever other processes have appended since we last looked '''
+    try:
+      f = open(self.path, "rb")
+    except IOError:
+      return
+    with f:
+      stat = os.fstat(f.fileno())
+      if stat.st_ino != self._inode or stat.st_size < self._offset:
+        # First read, or the file was pruned
+        self._outcomes = {}
+        self._inode = stat.st_ino
+        self._offset = 0
+      f.seek(self._offset)
+      data = f.read()
+    # Leave a trailing partial line for next time
+    complete = data.rfind("\n") + 1
+    self._offset += complete
+    for entry in self._parse_lines(data[:complete]):
+      self._add(entry)
+
+class _FileLock(object):
+  ''' Exclusive flock() on path, for use in a with statement '''
+  def __init__(self, path):
+    self.path = path
+    self._file = None
+
+  def __enter__(self):
+    self._file = open(self.path, "a")
+    fcntl.flock(self._file.fileno(), fcntl.LOCK_EX)
+    return self
+
+  def __exit__(self, *_):
+    fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+    self._file.close()
+    self._file = None
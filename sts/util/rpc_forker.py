@@ -4,8 +4,16 @@ import os
 from SimpleXMLRPCServer import SimpleXMLRPCServer, SimpleXMLRPCRequestHandler
 import xmlrpclib
 import sys
-import marshal
+import time
 import signal
+import socket
+import threading
+import Queue
+import select
+import struct
+import cPickle
+import hmac
+import urllib
 from sts.util.convenience import find_port
 from pox.lib.util import connect_with_backoff
 import logging
@@ -43,6 +51,9 @@ class TaskRegistry(object):
 class ReplayException(Exception):
   pass
 
+class ReplayCancelled(Exception):
+  pass
+
 class DebuggableHandler(SimpleXMLRPCRequestHandler):
   ''' Simple handler that extracts the stack trace of any exceptions that occur '''
   ''' on the server side, and encapsulates them in a new exception to send '''
@@ -54,6 +65,34 @@ class DebuggableHandler(SimpleXMLRPCRequestHandler):
       import traceback
       raise type(e)("\n" + traceback.format_exc())
 
+class _AuthenticatingHandler(DebuggableHandler):
+  ''' Only serves requests for the server's rpc_path, which embeds the shared
+  secret (if any) that clients were configured with. '''
+  def is_rpc_path_valid(self):
+    return hmac.compare_digest(self.path, self.server.rpc_path)
+
+def _rpc_path(secret):
+  ''' The URL path that RemoteForker and RemoteWorker serve RPCs on '''
+  if secret is None:
+    return "/"
+  return "/%s/" % urllib.quote(secret, safe="")
+
+def _is_loopback(address):
+  try:
+    return socket.gethostbyname(address).startswith("127.")
+  except socket.error:
+    return False
+
+def _start_rpc_server(address, port, secret):
+  server = SimpleXMLRPCServer((address, port), _AuthenticatingHandler,
+                              allow_none=True, logRequests=False,
+                              bind_and_activate=False)
+  server.rpc_path = _rpc_path(secret)
+  server.allow_reuse_address = True
+  server.server_bind()
+  server.server_activate()
+  return server
+
 class Forker(object):
   ''' Easily fork a job and retrieve the results '''
   # Implementation:
@@ -64,6 +103,15 @@ class Forker(object):
   #  - parent returns result to caller.
   __metaclass__ = ABCMeta
 
+  # Whether children may run in processes that were not forked from the
+  # caller at fork() time (e.g. on another machine), i.e. whether tasks must be
+  # shipped by name rather than as closures.
+  remote = False
+
+  # Whether children run on the caller's machine, i.e. whether the caller can
+  # choose free ports for them.
+  shares_host = True
+
   def __init__(self, strict_assertion_checking=False):
     self._task_registry = TaskRegistry()
     self.strict_assertion_checking = strict_assertion_checking
@@ -86,20 +134,25 @@ class Forker(object):
     Raises a ValueError if task_name is not registered.'''
     pass
 
-  def _new_child_url(self, ip='localhost', port=None):
+  def _new_child_url(self, ip='localhost', port=None, exclude=()):
     # Called within the parent process
     if port is None:
-      port = find_port(xrange(3000,6000))
+      port = find_port([ p for p in xrange(3000,6000) if p not in exclude ])
     return (ip, port)
 
-  def _invoke_child_rpc(self, ip, port, task_name, *args):
+  def _invoke_child_rpc(self, ip, port, task_name, *args, **kws):
     # Called within the parent process
     child_url = "http://" + str(ip) + ":" + str(port) + "/"
     log.debug("Invoking task %s on child %s" % (task_name, child_url,))
     if self.strict_assertion_checking:
       test_serialize_request(task_name, *args)
     proxy = xmlrpclib.ServerProxy(child_url, allow_none=True)
+    # Optional predicate to stop retrying the connection, e.g. because the
+    # child has been killed.
+    cancelled = kws.get("cancelled", lambda: False)
     def invoke_child():
+      if cancelled():
+        raise ReplayCancelled("Child %s was cancelled" % child_url)
       try:
         return getattr(proxy, task_name)(*args)
       except xmlrpclib.Fault as e:
@@ -136,6 +189,19 @@ class LocalForker(Forker):
   def register_task(self, task_name, code_block):
     self._task_registry.register_task(task_name, code_block)
 
+  def _run_child(self, task_name, task, ip, port):
+    # Called within the child process. Never returns.
+    # Send parents interrupts to the child
+    os.setsid()
+    # Our siblings (if any) are not ours to kill.
+    LocalForker._active_pids.clear()
+    # Let finally clauses in the task clean up when we are cancelled.
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(13))
+    self._initialize_child_rpc_server(ip, port)
+    self.server.register_function(task, task_name)
+    self.server.handle_request()
+    sys.exit(0)
+
   def fork(self, task_name, *args, **kws):
     # N.B. get_task raises an exception if task_name is not registered
     task = self._task_registry.get_task(task_name)
@@ -143,12 +209,7 @@ class LocalForker(Forker):
     # TODO(cs): use subprocess to spawn baby snakes instead of os.fork()
     pid = os.fork()
     if pid == 0: # Child
-      # Send parents interrupts to the child
-      os.setsid()
-      self._initialize_child_rpc_server(ip, port)
-      self.server.register_function(task, task_name)
-      self.server.handle_request()
-      sys.exit(0)
+      self._run_child(task_name, task, ip, port)
     else: # Parent
       LocalForker._active_pids.add(pid)
       child_return = self._invoke_child_rpc(ip, port,
@@ -158,22 +219,889 @@ class LocalForker(Forker):
       os.waitpid(pid, 0)
       return child_return
 
+  def fork_parallel(self, task_name, args_list, max_parallel=1, cutoff=None,
+                    cancel=None, durations=None):
+    ''' Fork off one child per element of args_list, running at most
+    max_parallel children at the same time. Return a list of the children's
+    return values, in the same order as args_list.
+
+    If cutoff is not None, it is invoked in the parent as cutoff(index,
+    child_return) for every child that returns. If it returns True, the
+    results of all children with a higher index are no longer needed: those
+    that have not started yet are never forked, and those that are still
+    running are killed. Their entries in the returned list are None.
+
+    cancel is a more general version of cutoff: cancel(index, child_return)
+    returns the indices of the children whose results are no longer needed.
+
+    If durations is not None, it should be a list as long as args_list. It
+    is filled in with how many seconds each child ran for, or None for
+    children that were never forked.
+
+    Raises a ValueError if task_name is not registered.'''
+    task = self._task_registry.get_task(task_name)
+    if max_parallel < 1:
+      raise ValueError("max_parallel must be at least 1")
+    results = [None] * len(args_list)
+    errors = {}
+    # Indices whose results are no longer needed
+    moot = set()
+    # { index -> (pid, rpc port, thread, start time) }
+    running = {}
+    killed = set()
+    finished = Queue.Queue()
+
+    def invoke(index, ip, port):
+      # Called within a parent thread.
+      try:
+        results[index] = self._invoke_child_rpc(ip, port, task_name,
+                                                *args_list[index],
+                                                cancelled=lambda: index in killed)
+      except Exception as e:
+        errors[index] = e
+      finished.put(index)
+
+    def make_moot(indices):
+      for i in indices:
+        moot.add(i)
+        if i in running and i not in killed:
+          pid = running[i][0]
+          log.debug("Killing child %d (index %d): no longer needed" % (pid, i))
+          killed.add(i)
+          os.kill(pid, signal.SIGTERM)
+
+    unstarted = range(len(args_list))
+    parent_pid = os.getpid()
+    try:
+      while True:
+        unstarted = [ i for i in unstarted if i not in moot ]
+        while len(running) < max_parallel and unstarted != []:
+          index = unstarted.pop(0)
+          exclude = set(p for (_, p, _, _) in running.values())
+          (ip, port) = self._new_child_url(exclude=exclude)
+          pid = os.fork()
+          if pid == 0: # Child
+            self._run_child(task_name, task, ip, port)
+          LocalForker._active_pids.add(pid)
+          thread = threading.Thread(target=invoke, args=(index, ip, port),
+                                    name="fork_parallel_%d" % index)
+          thread.daemon = True
+          thread.start()
+          running[index] = (pid, port, thread, time.time())
+        if running == {}:
+          break
+
+        # N.B. Queue.get() without a timeout is not interruptible by signals
+        index = None
+        while index is None:
+          try:
+            index = finished.get(True, 3600)
+          except Queue.Empty:
+            pass
+        (pid, _, thread, start) = running.pop(index)
+        thread.join()
+        LocalForker._active_pids.discard(pid)
+        os.waitpid(pid, 0)
+        if durations is not None:
+          durations[index] = time.time() - start
+        if index in killed:
+          results[index] = None
+          errors.pop(index, None)
+          continue
+        if index in errors:
+          raise errors[index]
+        if index in moot:
+          results[index] = None
+          continue
+        if cutoff is not None and cutoff(index, results[index]):
+          make_moot(range(index+1, len(args_list)))
+        if cancel is not None:
+          make_moot(cancel(index, results[index]))
+    except:
+      # N.B. children exit by raising SystemExit through here. Their copy of
+      # running holds their siblings, which are not theirs to kill.
+      if os.getpid() != parent_pid:
+        raise
+      # Don't leave orphaned replays lying around
+      for (pid, _, _, _) in running.values():
+        try:
+          os.kill(pid, signal.SIGTERM)
+        except OSError:
+          pass
+        LocalForker._active_pids.discard(pid)
+      raise
+    return results
+
+class _RemoteJob(object):
+  ''' Book-keeping for one fork()'ed task on the RemoteForker side. '''
+  def __init__(self, job_id, index, task_name, args, port_count):
+    self.job_id = job_id
+    self.index = index
+    self.task_name = task_name
+    self.args = args
+    # How many free ports the worker should pick for us
+    self.port_count = port_count
+    # URL of the worker currently running us, or None if unassigned
+    self.worker_url = None
+    # When the forker first handed us out, or None
+    self.started = None
+    self.done = False
+    self.cancelled = False
+    self.collected = False
+    self.result = None
+    # Traceback string, if the task raised
+    self.error = None
+
+class _RemoteWorkerInfo(object):
+  ''' Book-keeping for one replay_worker.py daemon on the RemoteForker side. '''
+  def __init__(self, url, slots):
+    self.url = url
+    self.slots = slots
+    self.last_heartbeat = time.time()
+    self.job_ids = set()
+
+  @property
+  def free_slots(self):
+    return self.slots - len(self.job_ids)
+
 class RemoteForker(Forker):
-  def __init__(self, server_info_list):
-    ''' cycles through server_info_list for each invocation of fork() '''
-    pass
+  ''' Hands tasks to replay_worker.py daemons, which may be running on other
+  machines. Workers register themselves with us over XML-RPC and then send
+  heartbeats every heartbeat_interval_seconds. A worker that has not sent a
+  heartbeat for heartbeat_timeout_seconds is declared dead, and the jobs it
+  was running are handed to other workers.
+
+  Workers only run tasks that they registered themselves, under the same
+  name as we did (see RemoteWorker.register_task()), so tasks must be
+  module-level functions. Their arguments and return values must be
+  serializable by xmlrpclib.
+
+  Binding to anything but a loopback address requires a secret, shared with
+  the workers, without which our RPCs are refused. N.B. it is sent in the
+  clear, so it only keeps out those who can't sniff our traffic.
+  '''
+  remote = True
+  shares_host = False
+
+  def __init__(self, address="127.0.0.1", port=7561,
+               heartbeat_interval_seconds=2, heartbeat_timeout_seconds=10,
+               strict_assertion_checking=False, secret=None):
+    super(RemoteForker, self).__init__(strict_assertion_checking=strict_assertion_checking)
+    if secret is None and not _is_loopback(address):
+      raise ValueError("Listening on non-loopback address %s requires a secret" %
+                       address)
+    self.address = address
+    self.port = port
+    self.secret = secret
+    self.heartbeat_interval_seconds = heartbeat_interval_seconds
+    self.heartbeat_timeout_seconds = heartbeat_timeout_seconds
+    # Protects _workers and _jobs, which are also touched by the server thread
+    self._lock = threading.Condition()
+    # { worker url -> _RemoteWorkerInfo }
+    self._workers = {}
+    # { job id -> _RemoteJob }
+    self._jobs = {}
+    self._next_job_id = 1
+    self._server = None
 
   def register_task(self, task_name, code_block):
-    # Serialize the code_block so we can send it across the wire to the child
-    serialized_code = marshal.dumps(code_block.func_code)\
-                             .encode('base64')
-    self._task_registry.register_task(task_name, serialized_code)
+    self._task_registry.register_task(task_name, _task_path(task_name, code_block))
+
+  def start(self):
+    ''' Start listening for workers. Idempotent. '''
+    if self._server is not None:
+      return
+    self._server = _start_rpc_server(self.address, self.port, self.secret)
+    self._server.register_function(self._register_worker, "register_worker")
+    self._server.register_function(self._heartbeat, "heartbeat")
+    self._server.register_function(self._job_finished, "job_finished")
+    self._server.register_function(self._job_failed, "job_failed")
+    thread = threading.Thread(target=self._server.serve_forever,
+                              name="RemoteForkerServer")
+    thread.daemon = True
+    thread.start()
+    log.info("Waiting for replay workers on %s:%d" % (self.address, self.port))
+
+  def wait_for_workers(self, count, timeout_seconds=None):
+    ''' Block until at least count workers are registered. Returns whether
+    they are. '''
+    self.start()
+    deadline = None if timeout_seconds is None else time.time() + timeout_seconds
+    with self._lock:
+      while len(self._workers) < count:
+        if deadline is not None and time.time() >= deadline:
+          return False
+        self._lock.wait(1.0)
+    return True
+
+  # -------- RPC methods invoked by workers, in the server thread -------- #
+
+  def _register_worker(self, worker_url, slots):
+    with self._lock:
+      if worker_url in self._workers:
+        # It restarted. Whatever it was running is gone.
+        self._declare_dead(worker_url)
+      log.info("Replay worker %s registered with %d slots" % (worker_url, slots))
+      self._workers[worker_url] = _RemoteWorkerInfo(worker_url, slots)
+      self._lock.notify_all()
+    return self.heartbeat_interval_seconds
+
+  def _heartbeat(self, worker_url):
+    with self._lock:
+      if worker_url not in self._workers:
+        # We already gave up on it. Tell it to register again.
+        return False
+      self._workers[worker_url].last_heartbeat = time.time()
+    return True
+
+  def _job_finished(self, worker_url, job_id, result):
+    return self._job_done(worker_url, job_id, result=result)
+
+  def _job_failed(self, worker_url, job_id, traceback_string):
+    return self._job_done(worker_url, job_id, error=traceback_string)
+
+  def _job_done(self, worker_url, job_id, result=None, error=None):
+    with self._lock:
+      job = self._jobs.get(job_id)
+      if (job is None or job.done or job.cancelled or
+          job.worker_url != worker_url):
+        # Cancelled, or already reassigned to another worker
+        return False
+      job.result = result
+      job.error = error
+      job.done = True
+      if worker_url in self._workers:
+        self._workers[worker_url].job_ids.discard(job_id)
+      self._lock.notify_all()
+    return True
+
+  # -------- Scheduling, in the caller's thread -------- #
+
+  def _declare_dead(self, worker_url):
+    ''' Pre: self._lock is held '''
+    worker = self._workers.pop(worker_url)
+    for job_id in worker.job_ids:
+      job = self._jobs.get(job_id)
+      if job is not None and not job.done:
+        log.warn("Reassigning job %d, which was running on %s" %
+                 (job_id, worker_url))
+        job.worker_url = None
+
+  def _reap_dead_workers(self):
+    ''' Pre: self._lock is held '''
+    now = time.time()
+    for worker in self._workers.values():
+      if now - worker.last_heartbeat > self.heartbeat_timeout_seconds:
+        log.warn("Replay worker %s missed its heartbeats. Declaring it dead" %
+                 worker.url)
+        self._declare_dead(worker.url)
+
+  def _dispatch(self, jobs):
+    ''' Hand the unassigned jobs in jobs to workers with free slots. '''
+    assignments = []
+    with self._lock:
+      self._reap_dead_workers()
+      for job in jobs:
+        if job.worker_url is not None or job.done or job.cancelled:
+          continue
+        workers = [ w for w in self._workers.values() if w.free_slots > 0 ]
+        if workers == []:
+          break
+        worker = max(workers, key=lambda w: w.free_slots)
+        job.worker_url = worker.url
+        worker.job_ids.add(job.job_id)
+        assignments.append((job, worker.url))
+
+    # N.B. don't hold the lock over RPCs; workers may call back into us.
+    for (job, worker_url) in assignments:
+      log.debug("Submitting job %d to %s" % (job.job_id, worker_url))
+      try:
+        proxy = xmlrpclib.ServerProxy(worker_url, allow_none=True)
+        proxy.submit(job.job_id, job.task_name, job.args, job.port_count)
+      except xmlrpclib.Fault as e:
+        # e.g. the worker doesn't know the task
+        with self._lock:
+          if worker_url in self._workers:
+            self._workers[worker_url].job_ids.discard(job.job_id)
+          job.error = e.faultString
+          job.done = True
+      except (socket.error, xmlrpclib.Error) as e:
+        log.warn("Could not submit job %d to %s: %s" % (job.job_id, worker_url, e))
+        with self._lock:
+          if worker_url in self._workers:
+            self._declare_dead(worker_url)
+
+  def _cancel(self, job):
+    with self._lock:
+      job.cancelled = True
+      worker_url = job.worker_url
+      if job.done or worker_url is None:
+        return
+      if worker_url in self._workers:
+        self._workers[worker_url].job_ids.discard(job.job_id)
+    try:
+      xmlrpclib.ServerProxy(worker_url, allow_none=True).cancel(job.job_id)
+    except (socket.error, xmlrpclib.Error) as e:
+      log.warn("Could not cancel job %d on %s: %s" % (job.job_id, worker_url, e))
 
   def fork(self, task_name, *args, **kws):
-    # TODO(cs): Need to define a main() method for the child process, tell child what URL
-    # to bind to via command line arguments, and have child boot
-    # up an RPC server. Then send over the TaskRegistry's task code over the wire,
-    # have the child deserialize the base64 encoded func object, and have the
-    # child register the tasks as RPC stubs.
+    return self.fork_parallel(task_name, [args])[0]
+
+  def fork_parallel(self, task_name, args_list, max_parallel=1, cutoff=None,
+                    cancel=None, durations=None, ports_per_child=0):
+    ''' Same semantics as LocalForker.fork_parallel(), but the children run on
+    whichever workers have free slots. Blocks until every needed job has
+    returned, waiting for workers to (re)appear if there are none.
+
+    If ports_per_child is positive, the worker picks that many ports that are
+    free on its machine and passes them to the task as an extra, final
+    argument (a list). '''
+    # N.B. get_task raises an exception if task_name is not registered
+    self._task_registry.get_task(task_name)
+    if max_parallel < 1:
+      raise ValueError("max_parallel must be at least 1")
+    if self.strict_assertion_checking:
+      for args in args_list:
+        test_serialize_request(task_name, *args)
+    self.start()
+
+    with self._lock:
+      jobs = []
+      for index, args in enumerate(args_list):
+        jobs.append(_RemoteJob(self._next_job_id, index, task_name, list(args),
+                               ports_per_child))
+        self._jobs[self._next_job_id] = jobs[-1]
+        self._next_job_id += 1
+
+    # Indices whose results are no longer needed
+    moot = set()
+    def make_moot(indices):
+      for i in indices:
+        moot.add(i)
+        job = jobs[i]
+        if job.started is not None and not job.collected and not job.cancelled:
+          log.debug("Cancelling job %d (index %d): no longer needed" %
+                    (job.job_id, job.index))
+          self._cancel(job)
+          if durations is not None:
+            durations[i] = time.time() - job.started
+
+    unstarted = list(jobs)
+    try:
+      while True:
+        outstanding = [ j for j in jobs if j.started is not None and
+                        not j.collected and not j.cancelled ]
+        unstarted = [ j for j in unstarted if j.index not in moot ]
+        while len(outstanding) < max_parallel and unstarted != []:
+          job = unstarted.pop(0)
+          job.started = time.time()
+          outstanding.append(job)
+        if outstanding == []:
+          break
+
+        self._dispatch(outstanding)
+        with self._lock:
+          if not any(j.done for j in outstanding):
+            if self._workers == {}:
+              log.info("No replay workers are registered. Waiting...")
+            self._lock.wait(1.0)
+          finished = [ j for j in outstanding if j.done ]
+
+        for job in finished:
+          job.collected = True
+          if durations is not None:
+            durations[job.index] = time.time() - job.started
+          if job.index in moot:
+            continue
+          if job.error is not None:
+            raise ReplayException("An Exception occured in the remote replay process: %s" %
+                                  job.error)
+          if cutoff is not None and cutoff(job.index, job.result):
+            make_moot(range(job.index+1, len(jobs)))
+          if cancel is not None:
+            make_moot(cancel(job.index, job.result))
+    finally:
+      for job in jobs:
+        if job.started is not None and not job.done and not job.cancelled:
+          self._cancel(job)
+      with self._lock:
+        for job in jobs:
+          self._jobs.pop(job.job_id, None)
+
+    return [ None if j.index in moot else j.result for j in jobs ]
+
+class RemoteWorker(object):
+  ''' The worker side of RemoteForker; see replay_worker.py. Runs each job it
+  is handed in a forked child, which reports the task's return value straight
+  back to the RemoteForker.
+
+  Only tasks registered through register_task() can be run. Unless
+  allow_remote is set and a secret (shared with the RemoteForker) is given,
+  we only listen on a loopback address. '''
+  def __init__(self, forker_address, forker_port, address="127.0.0.1", port=None,
+               advertised_address=None, slots=1, secret=None, allow_remote=False):
+    if not _is_loopback(address):
+      if not allow_remote:
+        raise ValueError("Refusing to accept jobs on non-loopback address %s" %
+                         address)
+      if secret is None:
+        raise ValueError("Accepting jobs on non-loopback address %s requires a secret" %
+                         address)
+    self.forker_url = "http://%s:%d%s" % (forker_address, forker_port,
+                                          _rpc_path(secret))
+    self.address = address
+    if port is None:
+      port = find_port(xrange(6000, 7000))
+    self.port = port
+    self.secret = secret
+    if advertised_address is None:
+      advertised_address = address if _is_loopback(address) else socket.getfqdn()
+    self.url = "http://%s:%d%s" % (advertised_address, port, _rpc_path(secret))
+    self.slots = slots
+    self.heartbeat_interval_seconds = 2
+    self._task_registry = TaskRegistry()
+    # { job id -> pid }
+    self._job2pid = {}
+    # { job id -> ports picked for it }
+    self._job2ports = {}
+    self._server = None
+
+  def register_task(self, task_name, code_block):
+    ''' Allow RemoteForkers to run code_block under the name task_name '''
+    self._task_registry.register_task(task_name, code_block)
+
+  def serve_forever(self):
+    ''' Never returns. '''
+    self._server = _start_rpc_server(self.address, self.port, self.secret)
+    self._server.register_function(self._submit, "submit")
+    self._server.register_function(self._cancel, "cancel")
+    # So that we notice exited children in a timely manner.
+    self._server.timeout = 0.5
+
+    self._register()
+    thread = threading.Thread(target=self._heartbeat_loop, name="heartbeat")
+    thread.daemon = True
+    thread.start()
+
+    while True:
+      self._server.handle_request()
+      self._reap_children()
+
+  def kill_all(self):
+    for pid in self._job2pid.values():
+      try:
+        os.kill(pid, signal.SIGTERM)
+      except OSError:
+        pass
+    self._job2pid.clear()
+    self._job2ports.clear()
+
+  def _forker(self):
+    # N.B. ServerProxy objects must not be shared across threads
+    return xmlrpclib.ServerProxy(self.forker_url, allow_none=True)
+
+  def _register(self):
+    def register():
+      return self._forker().register_worker(self.url, self.slots)
+    self.heartbeat_interval_seconds = connect_with_backoff(register)
+    log.info("Registered with %s" % self.forker_url)
+
+  def _heartbeat_loop(self):
+    while True:
+      time.sleep(self.heartbeat_interval_seconds)
+      try:
+        if not self._forker().heartbeat(self.url):
+          log.warn("%s forgot about us. Registering again" % self.forker_url)
+          self._register()
+      except (socket.error, xmlrpclib.Error) as e:
+        log.warn("Heartbeat to %s failed: %s" % (self.forker_url, e))
+
+  def _submit(self, job_id, task_name, args, port_count):
+    # N.B. get_task raises an exception if task_name is not registered
     task = self._task_registry.get_task(task_name)
-    pass
+    log.info("Starting job %d: %s" % (job_id, task_name))
+    if port_count > 0:
+      args = args + [self._claim_ports(job_id, port_count)]
+    pid = os.fork()
+    if pid == 0: # Child
+      self._run_child(job_id, task, args)
+    self._job2pid[job_id] = pid
+    return True
+
+  def _claim_ports(self, job_id, count):
+    ''' Pick count ports that are free here and not already handed to one of
+    our other jobs. '''
+    claimed = set([self.port])
+    for ports in self._job2ports.values():
+      claimed.update(ports)
+    ports = []
+    for _ in range(count):
+      port = find_port([ p for p in xrange(7000, 12000) if p not in claimed ])
+      claimed.add(port)
+      ports.append(port)
+    self._job2ports[job_id] = ports
+    return ports
+
+  def _run_child(self, job_id, task, args):
+    # Called within the child process. Never returns.
+    self._server.server_close()
+    # Our siblings are not ours to kill. Let finally clauses in the task
+    # clean up when we are cancelled.
+    self._job2pid.clear()
+    self._job2ports.clear()
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(13))
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    exit_code = 0
+    try:
+      try:
+        result = task(*args)
+        test_serialize_response(result)
+        self._forker().job_finished(self.url, job_id, result)
+      except Exception:
+        import traceback
+        self._forker().job_failed(self.url, job_id, traceback.format_exc())
+    except Exception as e:
+      log.warn("Could not report job %d to %s: %s" % (job_id, self.forker_url, e))
+      exit_code = 1
+    finally:
+      sys.stdout.flush()
+      sys.stderr.flush()
+      os._exit(exit_code)
+
+  def _cancel(self, job_id):
+    if job_id not in self._job2pid:
+      return False
+    log.info("Cancelling job %d" % job_id)
+    try:
+      os.kill(self._job2pid[job_id], signal.SIGTERM)
+    except OSError:
+      pass
+    return True
+
+  def _reap_children(self):
+    for (job_id, pid) in self._job2pid.items():
+      (reaped, status) = os.waitpid(pid, os.WNOHANG)
+      if reaped == 0:
+        continue
+      del self._job2pid[job_id]
+      self._job2ports.pop(job_id, None)
+      if status != 0:
+        # The child died without (successfully) reporting. The forker ignores
+        # this if the job was cancelled.
+        try:
+          self._forker().job_failed(self.url, job_id,
+              "Replay process %d exited with status %d" % (pid, status))
+        except (socket.error, xmlrpclib.Error) as e:
+          log.warn("Could not report job %d to %s: %s" % (job_id, self.forker_url, e))
+
+def _send_frame(sock, obj):
+  ''' Write obj to sock as a length-prefixed pickle '''
+  data = cPickle.dumps(obj, cPickle.HIGHEST_PROTOCOL)
+  sock.sendall(struct.pack("!I", len(data)) + data)
+
+def _recv_exactly(sock, length):
+  chunks = []
+  while length > 0:
+    try:
+      chunk = sock.recv(min(length, 1 << 20))
+    except socket.error:
+      # e.g. reset because the other end died
+      return None
+    if chunk == "":
+      return None
+    chunks.append(chunk)
+    length -= len(chunk)
+  return "".join(chunks)
+
+def _recv_frame(sock):
+  ''' Read one object written by _send_frame(). Returns None on EOF. '''
+  header = _recv_exactly(sock, 4)
+  if header is None:
+    return None
+  data = _recv_exactly(sock, struct.unpack("!I", header)[0])
+  if data is None:
+    return None
+  return cPickle.loads(data)
+
+def _task_path(task_name, code_block):
+  ''' Return "module.function" for a task that can be looked up by name '''
+  module = sys.modules.get(code_block.__module__)
+  if getattr(module, code_block.__name__, None) is not code_block:
+    raise ValueError("Task %s must be a module-level function" % task_name)
+  return "%s.%s" % (code_block.__module__, code_block.__name__)
+
+def _import_task(task_path):
+  (module_name, function_name) = task_path.rsplit(".", 1)
+  __import__(module_name)
+  return getattr(sys.modules[module_name], function_name)
+
+class _Zygote(object):
+  ''' Parent-side handle on a zygote process '''
+  def __init__(self, pid, sock):
+    self.pid = pid
+    self.sock = sock
+    # ids of the jobs it is running
+    self.job_ids = set()
+
+class ZygoteForker(Forker):
+  ''' Runs tasks in children of long-lived "zygote" processes, rather than
+  forking the caller and talking XML-RPC to the child for every task.
+
+  Zygotes are forked from the caller on first use (or start()), so they
+  already have everything the caller had imported, plus preload_modules.
+  The caller talks to each zygote over a UNIX socket pair, sending
+  length-prefixed pickles. For each task the zygote forks a fresh child,
+  which reports back to the zygote over its own socket pair. No TCP ports
+  are used. Zygotes that die are replaced, and the jobs they were running are
+  started again.
+
+  Like RemoteForker, tasks must be module-level functions, since zygotes
+  outlive any closure registered after they were forked. Their arguments and
+  return values must be picklable. '''
+  remote = True
+
+  def __init__(self, zygotes=1, preload_modules=(), strict_assertion_checking=False):
+    super(ZygoteForker, self).__init__(strict_assertion_checking=strict_assertion_checking)
+    if zygotes < 1:
+      raise ValueError("Need at least one zygote")
+    self.zygote_count = zygotes
+    self.preload_modules = preload_modules
+    self._zygotes = []
+    self._next_job_id = 1
+
+  def register_task(self, task_name, code_block):
+    self._task_registry.register_task(task_name, _task_path(task_name, code_block))
+
+  def start(self):
+    ''' Fork any zygotes that aren't running. Idempotent. '''
+    while len(self._zygotes) < self.zygote_count:
+      (ours, theirs) = socket.socketpair(socket.AF_UNIX, socket.SOCK_STREAM)
+      pid = os.fork()
+      if pid == 0: # Zygote
+        ours.close()
+        for zygote in self._zygotes:
+          zygote.sock.close()
+        self._run_zygote(theirs)
+      theirs.close()
+      self._zygotes.append(_Zygote(pid, ours))
+      log.debug("Started zygote %d" % pid)
+
+  def shutdown(self):
+    ''' Stop all zygotes, killing whatever they are running. '''
+    for zygote in self._zygotes:
+      self._retire(zygote)
+    self._zygotes = []
+
+  def _zygote_died(self, zygote):
+    ''' Replace a zygote that died. Returns the ids of the jobs it was
+    running, which died with it. '''
+    log.warn("Zygote %d died. Replacing it" % zygote.pid)
+    self._zygotes.remove(zygote)
+    self._retire(zygote)
+    self.start()
+    return zygote.job_ids
+
+  def _retire(self, zygote):
+    # Zygotes exit (and kill their children) when we hang up.
+    zygote.sock.close()
+    try:
+      os.waitpid(zygote.pid, 0)
+    except OSError:
+      pass
+
+  # -------- Within a zygote -------- #
+
+  def _run_zygote(self, sock):
+    # Called within the zygote process. Never returns.
+    # Keep the caller's interrupts away from us and our children.
+    os.setsid()
+    LocalForker._active_pids.clear()
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    exit_code = 0
+    # { job socket -> (job id, pid) }
+    jobs = {}
+    try:
+      for module_name in self.preload_modules:
+        __import__(module_name)
+      while True:
+        (readable, _, _) = select.select([sock] + jobs.keys(), [], [])
+        for s in readable:
+          if s is sock:
+            request = _recv_frame(sock)
+            if request is None:
+              # The caller is gone
+              return
+            if request[0] == "run":
+              (_, job_id, task_path, args) = request
+              (job_sock, pid) = self._start_job(sock, jobs, job_id, task_path, args)
+              jobs[job_sock] = (job_id, pid)
+            elif request[0] == "cancel":
+              for (job_id, pid) in jobs.values():
+                if job_id == request[1]:
+                  try:
+                    os.kill(pid, signal.SIGTERM)
+                  except OSError:
+                    pass
+          else:
+            (job_id, pid) = jobs.pop(s)
+            response = _recv_frame(s)
+            s.close()
+            (_, status) = os.waitpid(pid, 0)
+            if response is None:
+              response = ("failed", "Replay process %d exited with status %d" %
+                          (pid, status))
+            _send_frame(sock, (response[0], job_id, response[1]))
+    except Exception:
+      import traceback
+      log.error("Zygote failed:\n%s" % traceback.format_exc())
+      exit_code = 1
+    finally:
+      for (_, pid) in jobs.values():
+        try:
+          os.kill(pid, signal.SIGTERM)
+        except OSError:
+          pass
+      os._exit(exit_code)
+
+  def _start_job(self, zygote_sock, jobs, job_id, task_path, args):
+    # Called within the zygote. Import before forking, so that the next job
+    # finds the task's module already loaded.
+    try:
+      task = _import_task(task_path)
+    except Exception:
+      import traceback
+      task = None
+      import_error = traceback.format_exc()
+    (ours, theirs) = socket.socketpair(socket.AF_UNIX, socket.SOCK_STREAM)
+    pid = os.fork()
+    if pid == 0: # Child
+      ours.close()
+      zygote_sock.close()
+      for s in jobs.keys():
+        s.close()
+      if task is None:
+        _send_frame(theirs, ("failed", import_error))
+        os._exit(1)
+      self._run_job(theirs, task, args)
+    theirs.close()
+    return (ours, pid)
+
+  def _run_job(self, sock, task, args):
+    # Called within the job process. Never returns.
+    # Let finally clauses in the task clean up when we are cancelled.
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(13))
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    exit_code = 0
+    try:
+      try:
+        _send_frame(sock, ("finished", task(*args)))
+      except Exception:
+        import traceback
+        _send_frame(sock, ("failed", traceback.format_exc()))
+    except Exception as e:
+      log.warn("Could not report job result: %s" % e)
+      exit_code = 1
+    finally:
+      sys.stdout.flush()
+      sys.stderr.flush()
+      os._exit(exit_code)
+
+  # -------- Within the caller -------- #
+
+  def fork(self, task_name, *args, **kws):
+    return self.fork_parallel(task_name, [args])[0]
+
+  def fork_parallel(self, task_name, args_list, max_parallel=1, cutoff=None,
+                    cancel=None, durations=None):
+    ''' Same semantics as LocalForker.fork_parallel(). Jobs go to whichever
+    zygote is running the fewest. '''
+    task_path = self._task_registry.get_task(task_name)
+    if max_parallel < 1:
+      raise ValueError("max_parallel must be at least 1")
+    self.start()
+
+    results = [None] * len(args_list)
+    # Indices whose results are no longer needed
+    moot = set()
+    # { job id -> (index, zygote, start time) }
+    running = {}
+    # { index -> job id }
+    index2job_id = {}
+
+    def make_moot(indices):
+      for i in indices:
+        moot.add(i)
+        job_id = index2job_id.get(i)
+        if job_id in running:
+          (_, zygote, start) = running.pop(job_id)
+          log.debug("Cancelling job %d (index %d): no longer needed" % (job_id, i))
+          zygote.job_ids.discard(job_id)
+          _send_frame(zygote.sock, ("cancel", job_id))
+          if durations is not None:
+            durations[i] = time.time() - start
+
+    unstarted = range(len(args_list))
+
+    def replace_zygote(zygote):
+      # Run the jobs that died along with it again
+      for job_id in self._zygote_died(zygote):
+        if job_id in running:
+          (index, _, _) = running.pop(job_id)
+          log.warn("Restarting job %d (index %d)" % (job_id, index))
+          unstarted.append(index)
+      unstarted.sort()
+
+    try:
+      while True:
+        unstarted[:] = [ i for i in unstarted if i not in moot ]
+        while len(running) < max_parallel and unstarted != []:
+          index = unstarted.pop(0)
+          job_id = self._next_job_id
+          self._next_job_id += 1
+          zygote = min(self._zygotes, key=lambda z: len(z.job_ids))
+          try:
+            _send_frame(zygote.sock, ("run", job_id, task_path, list(args_list[index])))
+          except socket.error:
+            unstarted.insert(0, index)
+            replace_zygote(zygote)
+            continue
+          zygote.job_ids.add(job_id)
+          running[job_id] = (index, zygote, time.time())
+          index2job_id[index] = job_id
+        if running == {}:
+          break
+
+        socks = dict((z.sock, z) for z in self._zygotes if z.job_ids)
+        (readable, _, _) = select.select(socks.keys(), [], [])
+        for s in readable:
+          zygote = socks[s]
+          response = _recv_frame(s)
+          if response is None:
+            replace_zygote(zygote)
+            continue
+          (status, job_id, payload) = response
+          zygote.job_ids.discard(job_id)
+          if job_id not in running:
+            # Cancelled
+            continue
+          (index, _, start) = running.pop(job_id)
+          if durations is not None:
+            durations[index] = time.time() - start
+          if status == "failed":
+            raise ReplayException("An Exception occured in the replay process: %s" %
+                                  payload)
+          results[index] = payload
+          if cutoff is not None and cutoff(index, payload):
+            make_moot(range(index+1, len(args_list)))
+          if cancel is not None:
+            make_moot(cancel(index, payload))
+    finally:
+      # Don't leave orphaned replays lying around
+      for (job_id, (_, zygote, _)) in running.items():
+        zygote.job_ids.discard(job_id)
+        if zygote in self._zygotes:
+          try:
+            _send_frame(zygote.sock, ("cancel", job_id))
+          except socket.error:
+            pass
+    return [ None if i in moot else r for i, r in enumerate(results) ]
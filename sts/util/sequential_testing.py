@@ -0,0 +1,81 @@
+# Copyright 2011-2013 Colin Scott
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+'''
+Sequential hypothesis tests for deciding whether a nondeterministic bug
+reproduces, using as few replays as the observed reproduction rate allows.
+'''
+
+import math
+
+class SPRT(object):
+  ''' Wald's sequential probability ratio test over Bernoulli trials, between
+  H0: p = p0 ("does not reproduce") and H1: p = p1 ("reproduces").
+
+  alpha bounds the probability of accepting H1 when H0 holds, and beta the
+  probability of accepting H0 when H1 holds.
+
+  With p0 = 0 a single success is conclusive, as it is for MCS replays: a
+  replay only counts as a success if it ends in the bug signature. '''
+  def __init__(self, p0, p1, alpha=0.05, beta=0.05):
+    if not 0.0 <= p0 < p1 < 1.0:
+      raise ValueError("Need 0 <= p0 < p1 < 1, got p0=%f p1=%f" % (p0, p1))
+    if not (0.0 < alpha < 1.0 and 0.0 < beta < 1.0):
+      raise ValueError("Error bounds must be in (0, 1)")
+    self.p0 = p0
+    self.p1 = p1
+    self.alpha = alpha
+    self.beta = beta
+    self._accept_h1 = math.log((1 - beta) / alpha)
+    self._accept_h0 = math.log(beta / (1 - alpha))
+
+  def log_likelihood_ratio(self, successes, failures):
+    if successes > 0 and self.p0 == 0.0:
+      return float("inf")
+    llr = failures * math.log((1 - self.p1) / (1 - self.p0))
+    if successes > 0:
+      llr += successes * math.log(self.p1 / self.p0)
+    return llr
+
+  def decide(self, successes, failures):
+    ''' Return True if H1 is accepted, False if H0 is accepted, or None if
+    more trials are needed. '''
+    llr = self.log_likelihood_ratio(successes, failures)
+    if llr >= self._accept_h1:
+      return True
+    if llr <= self._accept_h0:
+      return False
+    return None
+
+class ReproductionEstimator(object):
+  ''' Estimates how likely a replay of an input sequence that does contain the
+  bug is to actually hit it, from the replays of sequences known to reproduce.
+
+  Uses the mean of a Beta posterior, so the estimate is defined (and
+  pessimistic) before any observations. '''
+  def __init__(self, successes=0, trials=0, prior_successes=1, prior_failures=1):
+    self.successes = successes
+    self.trials = trials
+    self.prior_successes = prior_successes
+    self.prior_failures = prior_failures
+
+  def observe(self, successes, trials):
+    ''' Record replays of a sequence that reproduced the bug '''
+    self.successes += successes
+    self.trials += trials
+
+  @property
+  def probability(self):
+    return ((self.successes + self.prior_successes) /
+            float(self.trials + self.prior_successes + self.prior_failures))
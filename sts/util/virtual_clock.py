@@ -0,0 +1,168 @@
+# Copyright 2011-2013 Colin Scott
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+'''
+A simulation-wide virtual clock.
+
+With SimulationConfig(virtual_time=True), the simulation's notion of "now"
+is a VirtualClock rather than the wall clock:
+  - SyncTime.now() reads the installed clock, so gettimeofday answers to
+    synced controllers and the timestamps of recorded events are virtual
+  - Switch flow tables are stamped and expired against it
+  - IOMaster.sleep() lets in-flight I/O land, then jumps the clock forward
+    instead of waiting, so idle periods cost (almost) no wall time
+  - EventScheduler keeps the clock in step with the recorded timeline
+
+The clock only moves when someone advances it, which makes runs that are
+driven by it deterministic, and arbitrarily faster than real time.
+
+Time is kept in integer microseconds (the resolution of SyncTime), so that
+advancing by many small steps does not accumulate floating point error.
+'''
+
+import heapq
+import itertools
+import logging
+import time
+
+log = logging.getLogger("virtual_clock")
+
+def to_micros(seconds):
+  return int(round(seconds * 1000000))
+
+class VirtualTimeModule(object):
+  ''' Stands in for the time module in modules whose timers should follow a
+  VirtualClock: time() is virtual, everything else is the real thing '''
+  def __init__(self, clock):
+    self._clock = clock
+
+  def time(self):
+    return self._clock.now()
+
+  def __getattr__(self, name):
+    return getattr(time, name)
+
+class VirtualClock(object):
+  '''
+  Timers are callables registered with call_at() or call_every(). They run,
+  in deadline order, from within advance() as the clock passes their
+  deadline, and are passed the (virtual) time they were due. Jumping the
+  clock forward still runs a periodic timer once for every period it jumps
+  over, each with the time it was due then.
+  '''
+  def __init__(self, start_seconds=None):
+    if start_seconds is None:
+      start_seconds = time.time()
+    self._now = to_micros(start_seconds)
+    # heap of (deadline micros, timer id)
+    self._deadlines = []
+    # { timer id -> (callback, period micros or None) }
+    self._timers = {}
+    # Timer ids increase, which breaks ties between timers with the same
+    # deadline: first registered, first run
+    self._sequence = itertools.count()
+    self._patched_modules = []
+
+  def now(self):
+    return self._now / 1e6
+
+  def now_micros(self):
+    return self._now
+
+  def call_at(self, when_seconds, callback):
+    ''' Run callback(now) once the clock reaches when_seconds. Returns an id
+    for cancel() '''
+    return self._add_timer(max(to_micros(when_seconds), self._now), callback,
+                           None)
+
+  def call_later(self, delay_seconds, callback):
+    return self.call_at(self.now() + delay_seconds, callback)
+
+  def call_every(self, period_seconds, callback):
+    ''' Run callback(now) every period_seconds, starting one period from
+    now '''
+    period = to_micros(period_seconds)
+    if period <= 0:
+      raise ValueError("period must be positive, not %s" % period_seconds)
+    return self._add_timer(self._now + period, callback, period)
+
+  def _add_timer(self, deadline, callback, period):
+    timer_id = next(self._sequence)
+    self._timers[timer_id] = (callback, period)
+    heapq.heappush(self._deadlines, (deadline, timer_id))
+    return timer_id
+
+  def cancel(self, timer_id):
+    self._timers.pop(timer_id, None)
+
+  def next_deadline(self):
+    ''' When the next timer is due, or None if there are none '''
+    while self._deadlines and self._deadlines[0][1] not in self._timers:
+      heapq.heappop(self._deadlines)
+    if not self._deadlines:
+      return None
+    return self._deadlines[0][0] / 1e6
+
+  def advance(self, seconds):
+    if seconds < 0:
+      raise ValueError("Cannot move the clock backwards by %s" % seconds)
+    self.advance_to(self.now() + seconds)
+
+  def advance_to(self, when_seconds):
+    ''' Move the clock forward to when_seconds, running the timers that are
+    due along the way. Times in the past are ignored. '''
+    target = to_micros(when_seconds)
+    while self._deadlines and self._deadlines[0][0] <= target:
+      (deadline, timer_id) = heapq.heappop(self._deadlines)
+      if timer_id not in self._timers:
+        continue
+      (callback, period) = self._timers[timer_id]
+      self._now = max(self._now, deadline)
+      if period is None:
+        del self._timers[timer_id]
+      else:
+        heapq.heappush(self._deadlines, (deadline + period, timer_id))
+      callback(self.now())
+    self._now = max(self._now, target)
+
+  def patch_time_module(self, module):
+    ''' Point module's `time' global at this clock. Undone by
+    uninstall_clock() '''
+    if not isinstance(module.time, VirtualTimeModule):
+      self._patched_modules.append((module, module.time))
+    module.time = VirtualTimeModule(self)
+
+  def unpatch_time_modules(self):
+    for (module, original) in reversed(self._patched_modules):
+      module.time = original
+    self._patched_modules = []
+
+_installed_clock = None
+
+def install_clock(clock):
+  ''' Make clock the simulation-wide source of virtual time '''
+  global _installed_clock
+  if _installed_clock is not None and _installed_clock is not clock:
+    uninstall_clock()
+  _installed_clock = clock
+
+def uninstall_clock():
+  global _installed_clock
+  if _installed_clock is not None:
+    _installed_clock.unpatch_time_modules()
+  _installed_clock = None
+
+def installed_clock():
+  ''' The installed VirtualClock, or None if we are running in real time '''
+  return _installed_clock
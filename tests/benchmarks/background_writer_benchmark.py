@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+#
+# Copyright 2011-2013 Colin Scott
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# How much of the cost of logging the simulation thread pays, with and
+# without InputLogger(background=True) (sts/input_traces/background_writer.py).
+#
+# A simulation mostly waits on sockets (in select), which releases the GIL.
+# That wait is modeled by sleeping --idle-us between events, which is when
+# the background writer gets to encode, compress and write. Reported are the
+# time spent inside log_input_event (the simulation thread's share), and the
+# wall time of the whole run. Usage:
+#
+#   ./tests/benchmarks/background_writer_benchmark.py [-n 20000] [-c zlib]
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "../.."))
+
+from tests.benchmarks.compression_benchmark import synthetic_superlog
+import sts.input_traces.log_parser as log_parser
+from sts.input_traces.input_logger import InputLogger
+
+def run(events, tmpdir, background, compression, idle_seconds):
+  logger = InputLogger(background=background, compression=compression,
+                       flush_every=256)
+  logger.open(tmpdir, output_filename="events.%s.trace" % background)
+  latencies = []
+  start = time.time()
+  for e in events:
+    if idle_seconds > 0:
+      time.sleep(idle_seconds)
+    before = time.time()
+    logger.log_input_event(e)
+    latencies.append(time.time() - before)
+  logger.sync(fsync=False)
+  wall_seconds = time.time() - start
+  if logger._writer is not None:
+    logger._writer.close()
+  logger.output.close()
+  latencies.sort()
+  return (sum(latencies), latencies[int(len(latencies) * 0.99)], wall_seconds)
+
+def main(args):
+  tmpdir = tempfile.mkdtemp()
+  try:
+    superlog = os.path.join(tmpdir, "superlog.trace")
+    synthetic_superlog(superlog, args.events)
+    events = log_parser.parse_path(superlog)
+    print "%d events, codec %s, %dus idle between events" % (
+        len(events), args.compression, args.idle_us)
+    print "  %-10s %14s %14s %10s" % ("mode", "in logger (s)", "p99 (us)", "wall (s)")
+    for background in [ False, True ]:
+      (logging_seconds, p99, wall_seconds) = run(events, tmpdir, background,
+          args.compression, args.idle_us / 1e6)
+      print "  %-10s %14.2f %14.0f %10.2f" % (
+          "background" if background else "inline", logging_seconds,
+          p99 * 1e6, wall_seconds)
+  finally:
+    shutil.rmtree(tmpdir)
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(description="Background trace writer benchmark")
+  parser.add_argument('-n', '--events', type=int, default=20000)
+  parser.add_argument('-c', '--compression', default="zlib",
+                      help='Codec to compress the trace with, or "none"')
+  parser.add_argument('-i', '--idle-us', type=int, default=200,
+                      help='Microseconds the simulation waits between events')
+  args = parser.parse_args()
+  if args.compression == "none":
+    args.compression = None
+  main(args)
@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+#
+# Copyright 2011-2013 Colin Scott
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Compression ratio vs. throughput of the trace codecs in
+# sts/util/compression.py. Runs over the bundled dataplane traces, plus any
+# traces given on the command line. Since no superlogs are bundled, a
+# synthetic one (control messages with base64 OpenFlow payloads) is included
+# unless --no-synthetic is given. Usage:
+#
+#   ./tests/benchmarks/compression_benchmark.py [experiments/*/events.trace]
+
+import argparse
+import base64
+import glob
+import json
+import os
+import shutil
+import struct
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "../.."))
+
+from sts.util.compression import codecs, open_trace_file
+
+bundled_traces = os.path.join(os.path.dirname(__file__), "../../dataplane_traces/*.trace")
+
+def synthetic_superlog(path, n):
+  with open(path, 'w') as superlog:
+    for i in xrange(n):
+      dpid = i % 8 + 1
+      # An ofp_packet_in header followed by a small ethernet frame
+      packet = struct.pack("!BBHIIHHBx", 1, 10, 60, i, 0xffffffff, 42, dpid, 0)
+      packet += struct.pack("!6s6sH", "\x00\x00\x00\x00\x00\x01",
+                            "\x00\x00\x00\x00\x00%s" % chr(dpid), 0x0800) + "\x00" * 28
+      superlog.write(json.dumps({
+        "class" : "ControlMessageReceive", "label" : "i%d" % i, "round" : i / 4,
+        "time" : [1370000000 + i / 100, (i * 7919) % 1000000], "dpid" : dpid,
+        "controller_id" : "c1", "dependent_labels" : [],
+        "b64_packet" : base64.b64encode(packet),
+        "fingerprint" : ["ControlMessageReceive",
+                         {"class" : "ofp_packet_in", "in_port" : i % 4 + 1},
+                         dpid, "c1"]}) + '\n')
+
+def measure(path, codec, output_path):
+  with open(path, 'rb') as f:
+    data = f.read()
+  start = time.time()
+  with open_trace_file(output_path, 'w', codec=codec) as output:
+    for i in xrange(0, len(data), 4096):
+      output.write(data[i:i+4096])
+  write_seconds = time.time() - start
+  start = time.time()
+  with open_trace_file(output_path) as f:
+    for _ in f:
+      pass
+  read_seconds = time.time() - start
+  return (len(data), os.path.getsize(output_path), write_seconds, read_seconds)
+
+def main(args):
+  tmpdir = tempfile.mkdtemp()
+  try:
+    paths = sorted(glob.glob(bundled_traces)) + args.traces
+    if not args.no_synthetic:
+      synthetic = os.path.join(tmpdir, "synthetic_superlog.trace")
+      synthetic_superlog(synthetic, args.events)
+      paths.append(synthetic)
+    for path in paths:
+      print os.path.basename(path)
+      print "  %-10s %8s %8s %12s %12s" % ("codec", "bytes", "ratio",
+                                            "write MB/s", "read MB/s")
+      for codec in sorted(codecs.keys()) + ["gzip"]:
+        (raw, compressed, write_seconds, read_seconds) = \
+            measure(path, codec, os.path.join(tmpdir, "out"))
+        megabytes = raw / (1024.0 * 1024.0)
+        print "  %-10s %8d %8.2f %12.1f %12.1f" % (codec, compressed,
+            raw / float(max(compressed, 1)), megabytes / max(write_seconds, 1e-9),
+            megabytes / max(read_seconds, 1e-9))
+  finally:
+    shutil.rmtree(tmpdir)
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(description="Trace compression benchmark")
+  parser.add_argument('traces', nargs='*', default=[],
+                      help='Additional (uncompressed) traces to measure')
+  parser.add_argument('-n', '--events', type=int, default=50000,
+                      help='Events in the synthetic superlog')
+  parser.add_argument('--no-synthetic', action="store_true", default=False,
+                      help="Don't measure a synthetic superlog")
+  main(parser.parse_args())
@@ -0,0 +1,150 @@
+#!/usr/bin/env python
+#
+# Copyright 2011-2013 Colin Scott
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Microbenchmark of EventDagView operations over a synthetic dag, comparing
+# the bitmask views against the list-copying views they replaced. Usage:
+#
+#   ./tests/benchmarks/event_dag_view_benchmark.py [-n 100000] [-r 5]
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "../.."))
+
+from sts.replay_event import InputEvent, InternalEvent, HostMigration
+from sts.event_dag import EventDag, split_list
+
+class SyntheticInput(InputEvent):
+  def proceed(self, simulation):
+    return True
+
+class SyntheticInternal(InternalEvent):
+  def proceed(self, simulation):
+    return True
+
+def synthetic_events(n, input_fraction=0.2, migration_every=1000):
+  ''' Internal events interleaved with inputs, plus a host that periodically
+  migrates so that the migration rewriting paths are exercised '''
+  events = []
+  input_every = int(1 / input_fraction)
+  location = 0
+  for i in xrange(n):
+    if i % migration_every == 0:
+      events.append(HostMigration(location, 1, location + 1, 1, "host1",
+                                  label="m%d" % i))
+      location += 1
+    elif i % input_every == 0:
+      events.append(SyntheticInput(label="e%d" % i))
+    else:
+      events.append(SyntheticInternal(label="i%d" % i))
+  return events
+
+class ListCopyView(object):
+  ''' The previous EventDagView: a copied list and set of the events, with
+  input_events recomputed on every access '''
+  def __init__(self, events_list):
+    self._events_list = list(events_list)
+    self._events_set = set(self._events_list)
+
+  @property
+  def input_events(self):
+    return [ e for e in self._events_list if isinstance(e, InputEvent) and e.prunable ]
+
+def list_copy_complement(dag, events_list, subset):
+  ignored = set(e for e in subset if isinstance(e, InputEvent) and e.prunable)
+  remaining = []
+  for event in events_list:
+    if event not in ignored:
+      remaining.append(event)
+    else:
+      for label in event.dependent_labels:
+        ignored.add(dag._get_event(label))
+  return ListCopyView(remaining)
+
+def list_copy_insert(dag, events_list, inputs):
+  inputs = sorted(inputs, key=dag._index_of)
+  result = []
+  for successor in events_list:
+    orig_successor_idx = dag._index_of(successor)
+    while len(inputs) > 0 and orig_successor_idx > dag._index_of(inputs[0]):
+      result.append(inputs.pop(0))
+    result.append(successor)
+  result += inputs
+  return ListCopyView(result)
+
+def timed(f, repeat):
+  best = None
+  for _ in xrange(repeat):
+    start = time.time()
+    f()
+    elapsed = time.time() - start
+    best = elapsed if best is None else min(best, elapsed)
+  return best
+
+def main(args):
+  events = synthetic_events(args.events)
+  dag = EventDag(events)
+  dag.mark_invalid_input_sequences()
+  subsets = split_list(dag.input_events, args.split_ways)
+  half = split_list(dag.input_events, 2)[0]
+  view = dag.input_complement(half)
+  list_view = list_copy_complement(dag, events, half)
+
+  def bitmask_complements():
+    for subset in subsets:
+      len(view.input_complement(subset).input_events)
+
+  def list_copy_complements():
+    for subset in subsets:
+      len(list_copy_complement(dag, list_view._events_list, subset).input_events)
+
+  def bitmask_inserts():
+    for subset in subsets:
+      len(view.insert_atomic_inputs(subset).input_events)
+
+  def list_copy_inserts():
+    for subset in subsets:
+      len(list_copy_insert(dag, list_view._events_list, subset).input_events)
+
+  other = dag.input_subset(subsets[0])
+  def bitmask_unions():
+    for _ in subsets:
+      len(view.union(other).input_events)
+
+  def list_copy_unions():
+    for _ in subsets:
+      len(list_copy_insert(dag, list_view._events_list,
+                           other.input_events).input_events)
+
+  print "%d events (%d inputs), %d-way split, best of %d" % \
+        (len(events), len(dag.input_events), args.split_ways, args.repeat)
+  print "%-12s %12s %12s %8s" % ("operation", "list copy", "bitmask", "speedup")
+  for (name, old, new) in [("complement", list_copy_complements, bitmask_complements),
+                           ("insert", list_copy_inserts, bitmask_inserts),
+                           ("union", list_copy_unions, bitmask_unions)]:
+    old_time = timed(old, args.repeat)
+    new_time = timed(new, args.repeat)
+    print "%-12s %11.3fs %11.3fs %7.1fx" % (name, old_time, new_time,
+                                            old_time / max(new_time, 1e-9))
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(description="EventDagView microbenchmark")
+  parser.add_argument('-n', '--events', type=int, default=100000)
+  parser.add_argument('-s', '--split-ways', type=int, default=8)
+  parser.add_argument('-r', '--repeat', type=int, default=3)
+  main(parser.parse_args())
@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+#
+# Copyright 2011-2013 Colin Scott
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Resident memory per event of a large synthetic trace (sts/replay_event.py),
+# and of the EventDag built over it (sts/event_dag.py). Usage:
+#
+#   ./tests/benchmarks/event_memory_benchmark.py [-n 200000]
+
+import argparse
+import gc
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "../.."))
+
+from sts.replay_event import LinkFailure, ControlMessageReceive
+from sts.fingerprints.messages import OFFingerprint
+from sts.syncproto.base import SyncTime
+from sts.event_dag import EventDag
+
+def resident_bytes():
+  gc.collect()
+  with open("/proc/self/statm") as statm:
+    return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+def synthetic_events(n):
+  ''' What the superlog parser produces: one third inputs, the rest control
+  messages sharing an interned fingerprint '''
+  fingerprint = OFFingerprint.from_dict({'class' : 'ofp_packet_in', 'in_port' : 1,
+                                          'data' : ()})
+  for i in xrange(n):
+    time = SyncTime(1370000000, i)
+    if i % 3 == 0:
+      yield LinkFailure(1, 1, 2, 1, label=u"e%d" % (i + 1), round=i, time=time)
+    else:
+      yield ControlMessageReceive(1, u"c1", fingerprint, round=i, time=time,
+                                  b64_packet=u"AQoAPAAAAAD/////ACoAAQA=",
+                                  label=u"i%d" % (i + 1))
+
+def main(args):
+  baseline = resident_bytes()
+  events = list(synthetic_events(args.events))
+  event_bytes = resident_bytes() - baseline
+  baseline = resident_bytes()
+  dag = EventDag(events)
+  dag_bytes = resident_bytes() - baseline
+  print "%d events" % len(dag.events)
+  print "events   %6.0f bytes/event" % (event_bytes / float(args.events))
+  print "EventDag %6.0f bytes/event" % (dag_bytes / float(args.events))
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(description="Event memory benchmark")
+  parser.add_argument('-n', '--events', type=int, default=200000)
+  main(parser.parse_args())
@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+#
+# Copyright 2011-2013 Colin Scott
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Memory and throughput of fingerprint interning (sts/fingerprints/base.py)
+# on a large synthetic trace of control messages. Each mode runs in a fresh
+# process so that resident memory can be compared. "plain" disables interning
+# and hash caching, to approximate the fingerprints as they were before.
+# Usage:
+#
+#   ./tests/benchmarks/fingerprint_interning_benchmark.py [-n 200000] [-d 500]
+
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "../.."))
+
+def resident_bytes():
+  with open("/proc/self/statm") as statm:
+    return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+def disable_interning():
+  import sts.fingerprints.base as base
+  base.Fingerprint.intern = lambda self: self
+  def uncached_hash(self):
+    return self._compute_hash()
+  base.Fingerprint.__hash__ = uncached_hash
+
+def json_fingerprints(n, distinct):
+  cid = ["127.0.0.1", 6633]
+  for i in xrange(n):
+    k = i % distinct
+    data = {'dl_src': '00:00:00:00:00:%02x' % (k % 256),
+            'dl_dst': '00:00:00:00:01:%02x' % (k / 256 % 256),
+            'nw_src': '10.0.%d.%d' % (k / 256 % 256, k % 256), 'nw_dst': '10.1.0.1'}
+    yield ["ControlMessageReceive",
+           {'class' : 'ofp_packet_in', 'in_port' : k % 4 + 1, 'data' : data},
+           k % 8 + 1, list(cid)]
+
+def run(mode, n, distinct):
+  if mode == "plain":
+    disable_interning()
+  from sts.replay_event import ControlMessageReceive
+  baseline = resident_bytes()
+  start = time.time()
+  events = [ ControlMessageReceive(None, None, fingerprint)
+             for fingerprint in json_fingerprints(n, distinct) ]
+  fingerprints = [ e.fingerprint for e in events ]
+  decode_seconds = time.time() - start
+  memory = resident_bytes() - baseline
+
+  # What the replayer's bookkeeping does with them: hash them into tables,
+  # and compare them against each other
+  start = time.time()
+  for _ in xrange(3):
+    counts = {}
+    for fingerprint in fingerprints:
+      counts[fingerprint] = counts.get(fingerprint, 0) + 1
+  matches = 0
+  for i in xrange(1, len(fingerprints)):
+    if fingerprints[i][1] == fingerprints[i - distinct if i >= distinct else 0][1]:
+      matches += 1
+  lookup_seconds = time.time() - start
+  assert len(counts) == distinct
+  print "%-8s decode %6.2fs  hash+eq %6.2fs  memory %7.1fMB" % (
+      mode, decode_seconds, lookup_seconds, memory / (1024.0 * 1024.0))
+
+def main(args):
+  if args.mode is not None:
+    run(args.mode, args.events, args.distinct)
+    return
+  print "%d events, %d distinct fingerprints" % (args.events, args.distinct)
+  for mode in [ "plain", "interned" ]:
+    subprocess.check_call([sys.executable, __file__, "--mode", mode,
+                           "-n", str(args.events), "-d", str(args.distinct)])
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(description="Fingerprint interning benchmark")
+  parser.add_argument('-n', '--events', type=int, default=200000)
+  parser.add_argument('-d', '--distinct', type=int, default=500,
+                      help="number of distinct fingerprints")
+  parser.add_argument('--mode', choices=["plain", "interned"], default=None,
+                      help=argparse.SUPPRESS)
+  main(parser.parse_args())
@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+#
+# Copyright 2011-2013 Colin Scott
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# How parse_path (sts/input_traces/log_parser.py) scales with the number of
+# worker processes, on a synthetic superlog of control messages (or the
+# superlogs given on the command line). processes=1 is the serial parser.
+# Usage:
+#
+#   ./tests/benchmarks/log_parser_benchmark.py [-n 200000] [-p 1,2,4,8]
+
+import argparse
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "../.."))
+
+from tests.benchmarks.compression_benchmark import synthetic_superlog
+import sts.input_traces.log_parser as log_parser
+
+def default_process_counts():
+  counts = [1]
+  while counts[-1] * 2 <= multiprocessing.cpu_count():
+    counts.append(counts[-1] * 2)
+  if counts[-1] != multiprocessing.cpu_count():
+    counts.append(multiprocessing.cpu_count())
+  return counts
+
+def measure(path, processes, repeat):
+  best = None
+  for _ in xrange(repeat):
+    start = time.time()
+    events = log_parser.parse_path(path, processes=processes)
+    seconds = time.time() - start
+    best = seconds if best is None else min(best, seconds)
+  return (len(events), best)
+
+def main(args):
+  process_counts = args.processes or default_process_counts()
+  tmpdir = tempfile.mkdtemp()
+  try:
+    paths = list(args.superlogs)
+    if not paths:
+      path = os.path.join(tmpdir, "synthetic_superlog.trace")
+      synthetic_superlog(path, args.events)
+      paths.append(path)
+    print "%d cores" % multiprocessing.cpu_count()
+    for path in paths:
+      megabytes = os.path.getsize(path) / (1024.0 * 1024.0)
+      print "%s (%.1fMB)" % (os.path.basename(path), megabytes)
+      print "  %9s %8s %10s %8s" % ("processes", "events", "seconds", "speedup")
+      serial_seconds = None
+      for processes in process_counts:
+        (events, seconds) = measure(path, processes, args.repeat)
+        if serial_seconds is None:
+          serial_seconds = seconds
+        print "  %9d %8d %10.2f %8.2f" % (processes, events, seconds,
+                                          serial_seconds / max(seconds, 1e-9))
+  finally:
+    shutil.rmtree(tmpdir)
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(description="Superlog parsing benchmark")
+  parser.add_argument('superlogs', nargs='*', default=[],
+                      help='json superlogs to parse instead of a synthetic one')
+  parser.add_argument('-n', '--events', type=int, default=200000,
+                      help='Events in the synthetic superlog')
+  parser.add_argument('-p', '--processes', default=None,
+                      type=lambda s: [ int(p) for p in s.split(",") ],
+                      help='Comma separated pool sizes to measure (the first '
+                           'is the baseline). Default: 1, 2, 4, ... cores')
+  parser.add_argument('-r', '--repeat', type=int, default=3,
+                      help='Take the best of this many runs')
+  main(parser.parse_args())
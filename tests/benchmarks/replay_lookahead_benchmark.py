@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+#
+# Copyright 2011-2013 Colin Scott
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Regression benchmark for the Replayer's per-event state change lookahead.
+# Replays the bookkeeping of Replayer.run_simulation_forward over a synthetic
+# trace (a next_state_change() lookup for every event, plus one more for every
+# input) and compares the indexed lookahead against a linear scan. Exits
+# non-zero if the indexed lookahead is slower than --max-seconds. Usage:
+#
+#   ./tests/benchmarks/replay_lookahead_benchmark.py [-n 80000]
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "../.."))
+
+from sts.replay_event import InputEvent, InternalEvent, ControllerStateChange
+from sts.event_dag import EventDag
+
+class SyntheticInput(InputEvent):
+  def proceed(self, simulation):
+    return True
+
+class SyntheticInternal(InternalEvent):
+  def proceed(self, simulation):
+    return True
+
+def synthetic_events(n, state_change_every, input_every=10):
+  events = []
+  for i in xrange(n):
+    if i % state_change_every == 0:
+      events.append(ControllerStateChange("c1", "f%d" % i, "name", [],
+                                          label="i%d" % i))
+    elif i % input_every == 0:
+      events.append(SyntheticInput(label="e%d" % i))
+    else:
+      events.append(SyntheticInternal(label="i%d" % i))
+  return events
+
+def linear_next_state_change(events, index):
+  ''' The lookahead as it was before SuccessorIndex '''
+  for event in events[index:]:
+    if type(event) == ControllerStateChange:
+      return event
+  return None
+
+def run(events, next_state_change):
+  start = time.time()
+  for i, event in enumerate(events):
+    if isinstance(event, InputEvent):
+      next_state_change(i)
+    next_state_change(i)
+  return time.time() - start
+
+def main(args):
+  events = synthetic_events(args.events, args.state_change_every)
+  view = EventDag(events).input_complement([])
+  indexed = run(view.events, lambda i: view.next_state_change(i))
+  print "%d events, a state change every %d" % (len(events), args.state_change_every)
+  print "indexed lookahead: %8.3fs" % indexed
+  if not args.skip_linear:
+    linear = run(view.events, lambda i: linear_next_state_change(view.events, i))
+    print "linear lookahead:  %8.3fs (%.1fx)" % (linear, linear / max(indexed, 1e-9))
+  if indexed > args.max_seconds:
+    print "Indexed lookahead exceeded %.3fs" % args.max_seconds
+    return 1
+  return 0
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(description="Replayer lookahead benchmark")
+  parser.add_argument('-n', '--events', type=int, default=80000)
+  parser.add_argument('-s', '--state-change-every', type=int, default=2000)
+  parser.add_argument('--max-seconds', type=float, default=2.0,
+                      help="fail if the indexed lookahead takes longer than this")
+  parser.add_argument('--skip-linear', action="store_true", default=False,
+                      help="only time the indexed lookahead")
+  sys.exit(main(parser.parse_args()))
@@ -0,0 +1,135 @@
+# Copyright 2011-2013 Colin Scott
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+import sys
+import os
+import json
+import shutil
+import tempfile
+
+sys.path.append(os.path.dirname(__file__) + "/../../..")
+
+import sts.input_traces.log_parser as log_parser
+from sts.input_traces.binary_trace import BinaryTrace, BinaryTraceWriter, is_binary_trace
+from sts.replay_event import LinkFailure, LinkRecovery
+
+json_hashes = [
+  {"dependent_labels": ["e2"], "start_dpid": 1, "class": "LinkFailure",
+   "start_port_no": 1, "end_dpid": 2, "end_port_no": 1, "label": "e1",
+   "time": [0,0], "round": 0},
+  {"dependent_labels": [], "start_dpid": 1, "class": "LinkRecovery",
+   "start_port_no": 1, "end_dpid": 2, "end_port_no": 1, "label": "e2",
+   "time": [0,0], "round": 3},
+  {"class": "ControlMessageReceive", "label": "i3", "round": 3,
+   "time": [12, 345678], "dpid": 1, "controller_id": "c1",
+   "b64_packet": "AQ4ASAAAAAA=", "timeout_disallowed": False,
+   "fingerprint": ["ControlMessageReceive", {"class": "ofp_flow_mod",
+                   "match": None, "priority": 32768}, 1, "c1"],
+   "big": 2**70, "ratio": 0.25, "unicode": u"\u00e9"},
+  {"class": "ControlMessageReceive", "label": "i4", "round": 4,
+   "time": [13, 0], "dpid": 1, "controller_id": "c1", "b64_packet": "not base64!",
+   "fingerprint": ["ControlMessageReceive", {"class": "ofp_flow_mod",
+                   "match": None, "priority": 32768}, 1, "c1"]},
+]
+
+class BinaryTraceTest(unittest.TestCase):
+  def setUp(self):
+    self.tmpdir = tempfile.mkdtemp()
+    self.path = os.path.join(self.tmpdir, "events.trace")
+
+  def tearDown(self):
+    shutil.rmtree(self.tmpdir)
+
+  def write(self, hashes):
+    writer = BinaryTraceWriter(self.path)
+    for json_hash in hashes:
+      writer.write_json_hash(json_hash)
+    writer.close()
+
+  def test_round_trip(self):
+    self.write(json_hashes)
+    self.assertTrue(is_binary_trace(self.path))
+    with BinaryTrace(self.path) as trace:
+      self.assertEqual(len(json_hashes), len(trace))
+      # Compare as json, the way a superlog would have been read back
+      self.assertEqual(json.loads(json.dumps(json_hashes)), list(trace.json_hashes()))
+
+  def test_superlog_lines(self):
+    writer = BinaryTraceWriter(self.path)
+    text = "".join(json.dumps(h) + "\n" for h in json_hashes[:2])
+    # Lines may be split across writes
+    writer.write(text[:17])
+    writer.write(text[17:])
+    writer.close()
+    with BinaryTrace(self.path) as trace:
+      self.assertEqual(["e1", "e2"], [ trace.label(i) for i in range(len(trace)) ])
+
+  def test_indices(self):
+    self.write(json_hashes)
+    with BinaryTrace(self.path) as trace:
+      self.assertEqual(2, trace.index_of_label("i3"))
+      self.assertEqual(None, trace.index_of_label("i5"))
+      self.assertEqual("i4", trace.json_hash_for_label("i4")["label"])
+      self.assertEqual([1, 2], trace.indices_for_round(3))
+      self.assertEqual([], trace.indices_for_round(2))
+      self.assertEqual([2, 3], trace.indices_for_class("ControlMessageReceive"))
+      self.assertEqual([], trace.indices_for_class("SwitchFailure"))
+      self.assertEqual("LinkRecovery", trace.class_name(1))
+      self.assertEqual(4, trace.round(3))
+
+  def test_parse_path(self):
+    self.write(json_hashes[:2])
+    events = log_parser.parse_path(self.path)
+    self.assertEqual([LinkFailure, LinkRecovery], [ type(e) for e in events ])
+
+  def test_unclosed(self):
+    # e.g. the run crashed: there is no footer
+    writer = BinaryTraceWriter(self.path)
+    for json_hash in json_hashes:
+      writer.write_json_hash(json_hash)
+    writer.flush()
+    with BinaryTrace(self.path) as trace:
+      self.assertEqual(json.loads(json.dumps(json_hashes)), list(trace.json_hashes()))
+      self.assertEqual(2, trace.index_of_label("i3"))
+      self.assertEqual(None, trace.index_of_label("i5"))
+      self.assertEqual([1, 2], trace.indices_for_round(3))
+      self.assertEqual([2, 3], trace.indices_for_class("ControlMessageReceive"))
+      self.assertEqual("LinkRecovery", trace.class_name(1))
+      self.assertEqual("e2", trace.label(1))
+    writer.close()
+
+  def test_truncated(self):
+    self.write(json_hashes)
+    with open(self.path, 'rb') as f:
+      data = f.read()
+    # Cut the last record in half, along with the footer
+    with BinaryTrace(self.path) as trace:
+      last_record = trace._record_entry(3)[0]
+    with open(self.path, 'wb') as f:
+      f.write(data[:last_record + 10])
+    with BinaryTrace(self.path) as trace:
+      self.assertEqual(3, len(trace))
+      self.assertEqual(json.loads(json.dumps(json_hashes[:3])), list(trace.json_hashes()))
+      self.assertEqual(None, trace.index_of_label("i4"))
+
+  def test_empty(self):
+    self.write([])
+    with BinaryTrace(self.path) as trace:
+      self.assertEqual(0, len(trace))
+      self.assertEqual(None, trace.index_of_label("e1"))
+      self.assertEqual([], trace.indices_for_round(0))
+
+if __name__ == '__main__':
+  unittest.main()
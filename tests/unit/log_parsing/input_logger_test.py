@@ -0,0 +1,154 @@
+# Copyright 2011-2013 Colin Scott
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+import sys
+import os
+import json
+import shutil
+import subprocess
+import tempfile
+
+sys.path.append(os.path.dirname(__file__) + "/../../..")
+
+import sts.input_traces.log_parser as log_parser
+from sts.input_traces.input_logger import InputLogger, default_compressed_flush_interval_ms
+from sts.input_traces.background_writer import BackgroundWriter
+from sts.replay_event import LinkFailure, LinkRecovery, InvariantViolation
+
+def link_flaps(n):
+  return [ (LinkFailure if i % 2 == 0 else LinkRecovery)(1, 1, 2, 1, round=i)
+           for i in range(n) ]
+
+class BrokenOutput(object):
+  closed = False
+  def write(self, data):
+    raise IOError("disk full")
+  def flush(self):
+    pass
+
+class InputLoggerTest(unittest.TestCase):
+  def setUp(self):
+    self.tmpdir = tempfile.mkdtemp()
+
+  def tearDown(self):
+    shutil.rmtree(self.tmpdir)
+
+  def read_lines(self, logger):
+    with open(logger.output_path) as trace:
+      return [ json.loads(line) for line in trace ]
+
+  def test_background_matches_synchronous(self):
+    events = link_flaps(100)
+    traces = []
+    for background in [ False, True ]:
+      logger = InputLogger(background=background, queue_size=8)
+      logger.open(self.tmpdir, output_filename="events.%s.trace" % background)
+      for e in events:
+        logger.log_input_event(e)
+      logger.sync()
+      traces.append(self.read_lines(logger))
+      if logger._writer is not None:
+        logger._writer.close()
+      logger.output.close()
+    self.assertEqual(traces[0], traces[1])
+    self.assertEqual([ e.label for e in events ], [ h['label'] for h in traces[1] ])
+
+  def test_snapshot_at_log_time(self):
+    logger = InputLogger(background=True)
+    logger.open(self.tmpdir)
+    e = link_flaps(1)[0]
+    logger.log_input_event(e)
+    e.round = 42
+    logger._writer.close()
+    logger.output.close()
+    self.assertEqual(0, self.read_lines(logger)[0]['round'])
+
+  def test_sync_on_violation(self):
+    logger = InputLogger(background=True)
+    logger.open(self.tmpdir)
+    for e in link_flaps(3):
+      logger.log_input_event(e)
+    logger.log_input_event(InvariantViolation(["loop"]))
+    # On disk before the trace is closed
+    self.assertEqual(4, len(self.read_lines(logger)))
+    self.assertEqual("InvariantViolation", self.read_lines(logger)[-1]['class'])
+    logger._writer.close()
+    logger.output.close()
+    events = log_parser.parse_path(logger.output_path)
+    self.assertEqual(4, len(events))
+
+  def test_flush_every(self):
+    logger = InputLogger(background=True, flush_every=1)
+    logger.open(self.tmpdir)
+    logger.log_input_event(link_flaps(1)[0])
+    logger._writer.sync(fsync=False)
+    self.assertEqual(1, len(self.read_lines(logger)))
+    logger._writer.close()
+    logger.output.close()
+
+  def test_flushed_events(self):
+    for background in [ False, True ]:
+      logger = InputLogger(background=background, flush_every=2)
+      logger.open(self.tmpdir, output_filename="events.%s.trace" % background)
+      self.assertEqual(0, logger.flushed_events)
+      for e in link_flaps(3):
+        logger.log_input_event(e)
+      if not background:
+        self.assertEqual(2, logger.flushed_events)
+      # Acknowledged events are on disk
+      self.assertTrue(len(self.read_lines(logger)) >= logger.flushed_events)
+      logger.sync(fsync=False)
+      self.assertEqual(3, logger.flushed_events)
+      self.assertEqual(3, len(self.read_lines(logger)))
+      if logger._writer is not None:
+        logger._writer.close()
+      logger.output.close()
+
+  def test_compressed_flush_default(self):
+    logger = InputLogger(compression="zlib")
+    self.assertEqual(default_compressed_flush_interval_ms,
+                     logger.flush_policy.interval_ms)
+    logger = InputLogger(compression="zlib", flush_every=1)
+    self.assertEqual(None, logger.flush_policy.interval_ms)
+    logger.open(self.tmpdir)
+    logger.log_input_event(link_flaps(1)[0])
+    # Readable (without an index) before the trace is closed
+    self.assertEqual(1, len(log_parser.parse_path(logger.output_path)))
+    logger.output.close()
+
+  def test_flushed_at_exit(self):
+    # The logger is never closed, and its one event is far from filling a
+    # compressed block
+    script = ("import sys; sys.path.insert(0, %r)\n"
+              "from sts.input_traces.input_logger import InputLogger\n"
+              "from sts.replay_event import LinkFailure\n"
+              "logger = InputLogger(compression='zlib', background=%s)\n"
+              "logger.open(%r)\n"
+              "logger.log_input_event(LinkFailure(1, 1, 2, 1))\n")
+    root = os.path.join(os.path.dirname(__file__), "../../..")
+    for background in [ False, True ]:
+      subprocess.check_call([sys.executable, "-c",
+                             script % (root, background, self.tmpdir)])
+      events = log_parser.parse_path(self.tmpdir + "/events.trace")
+      self.assertEqual(["LinkFailure"], [ e.__class__.__name__ for e in events ])
+
+  def test_writer_error(self):
+    writer = BackgroundWriter(BrokenOutput())
+    writer.write({"label" : "e1"})
+    self.assertRaises(IOError, writer.sync)
+    writer.close()
+
+if __name__ == '__main__':
+  unittest.main()
@@ -22,6 +22,7 @@ sys.path.append(os.path.dirname(__file__) + "/../../..")
 
 import sts.input_traces.log_parser as log_parser
 from sts.replay_event import LinkFailure, LinkRecovery
+from sts.util.compression import BlockWriter
 
 class superlog_parser_test(unittest.TestCase):
   tmpfile = '/tmp/superlog.tmp'
@@ -49,5 +50,61 @@ class superlog_parser_test(unittest.TestCase):
       if name is not None:
         os.unlink(name)
 
+  def test_iter_parse(self):
+    self.open_simple_superlog()
+    with open(self.tmpfile) as superlog:
+      events = log_parser.iter_parse(superlog)
+      self.assertEqual(LinkFailure, type(events.next()))
+      self.assertEqual(LinkRecovery, type(events.next()))
+      self.assertRaises(StopIteration, events.next)
+
+  def test_iter_parse_event_classes(self):
+    self.open_simple_superlog()
+    events = list(log_parser.iter_parse_path(self.tmpfile,
+                                             event_classes=set(["LinkRecovery"])))
+    self.assertEqual(1, len(events))
+    self.assertEqual(LinkRecovery, type(events[0]))
+
+  def test_iter_parse_missing_dependent(self):
+    superlog = ['{"dependent_labels": ["e2"], "start_dpid": 1, "class": "LinkFailure",'
+                ' "start_port_no": 1, "end_dpid": 2, "end_port_no": 1, "label": "e1",'
+                ' "time": [0,0], "round": 0}']
+    events = log_parser.iter_parse(superlog)
+    # The dependency can only be checked once the whole log has been read
+    self.assertEqual(LinkFailure, type(events.next()))
+    self.assertRaises(AssertionError, events.next)
+
+  def write_link_flaps(self, labels):
+    with open(self.tmpfile, 'w') as superlog:
+      for (i, label) in enumerate(labels):
+        cls = "LinkFailure" if i % 2 == 0 else "LinkRecovery"
+        superlog.write('{"dependent_labels": [], "start_dpid": 1, "class": "%s",'
+                       ' "start_port_no": 1, "end_dpid": 2, "end_port_no": 1,'
+                       ' "label": "%s", "time": [0,0], "round": %d}\n' %
+                       (cls, label, i))
+
+  def test_parse_path_parallel(self):
+    self.write_link_flaps([ "e%d" % i for i in range(50) ])
+    serial = log_parser.parse_path(self.tmpfile, processes=1)
+    parallel = log_parser.parse_path(self.tmpfile, processes=2)
+    self.assertEqual([ e.label for e in serial ], [ e.label for e in parallel ])
+    self.assertEqual([ type(e) for e in serial ], [ type(e) for e in parallel ])
+
+  def test_parse_path_parallel_duplicate_label(self):
+    # The duplicates land in different chunks
+    self.write_link_flaps([ "e%d" % i for i in range(49) ] + [ "e0" ])
+    self.assertRaises(RuntimeError, log_parser.parse_path, self.tmpfile, processes=2)
+
+  def test_parse_path_compressed(self):
+    self.write_link_flaps([ "e%d" % i for i in range(50) ])
+    expected = [ e.label for e in log_parser.parse_path(self.tmpfile) ]
+    with open(self.tmpfile) as superlog:
+      data = superlog.read()
+    with BlockWriter(self.tmpfile, block_size=500) as writer:
+      writer.write(data)
+    for processes in [ 1, 2 ]:
+      events = log_parser.parse_path(self.tmpfile, processes=processes)
+      self.assertEqual(expected, [ e.label for e in events ])
+
 if __name__ == '__main__':
   unittest.main()
@@ -0,0 +1,183 @@
+# Copyright 2011-2013 Colin Scott
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+import sys
+import os
+import time
+
+sys.path.append(os.path.dirname(__file__) + "/../../../..")
+
+from sts.replay_event import *
+from sts.control_flow.base import StateChange, DeterministicValueRequest
+from sts.control_flow.event_scheduler import EventScheduler
+from sts.control_flow.timeout_model import TimeoutModel
+from sts.syncproto.base import SyncTime
+from sts.util.virtual_clock import VirtualClock
+
+class MockPublisher(object):
+  ''' Stands in for a ReplaySyncCallback '''
+  _eventMixin_events = set([StateChange, DeterministicValueRequest])
+
+  def __init__(self):
+    self.handlers = []
+    self.pending = set()
+
+  def addListener(self, event_type, handler):
+    self.handlers.append((event_type, handler))
+
+  def publish(self, pending_state_change):
+    self.pending.add(pending_state_change)
+    for (event_type, handler) in self.handlers:
+      if event_type == StateChange:
+        handler(StateChange(pending_state_change))
+
+class MockIOMaster(object):
+  ''' Runs one scripted callback per call to select() '''
+  def __init__(self, script):
+    self.script = list(script)
+    self.selects = 0
+
+  def select(self, timeout):
+    self.selects += 1
+    if self.script:
+      self.script.pop(0)()
+
+class MockSimulation(object):
+  def __init__(self, script, publisher=None, clock=None):
+    self.io_master = MockIOMaster(script)
+    self.clock = clock
+    if publisher is not None:
+      self.controller_sync_callback = publisher
+
+class MockStateChange(InternalEvent):
+  def __init__(self, name):
+    InternalEvent.__init__(self)
+    self.pending = PendingStateChange("c1", None, ("StateChange", name), name, ())
+    self.proceeds = 0
+
+  @property
+  def wakeup_key(self):
+    return self.pending
+
+  def proceed(self, simulation):
+    self.proceeds += 1
+    publisher = getattr(simulation, "controller_sync_callback", None)
+    return publisher is not None and self.pending in publisher.pending
+
+def state_change(name):
+  return PendingStateChange("c1", None, ("StateChange", name), name, ())
+
+def poll(scheduler, event, seconds):
+  scheduler.stats.start_replay(event)
+  scheduler._poll_event(event, time.time() + seconds)
+
+class EventSchedulerTest(unittest.TestCase):
+  def test_woken_by_matching_item(self):
+    publisher = MockPublisher()
+    noise = lambda: None
+    script = [ noise, lambda: publisher.publish(state_change("other")), noise,
+               lambda: publisher.publish(state_change("mine")) ]
+    simulation = MockSimulation(script, publisher)
+    scheduler = EventScheduler(simulation, sleep_interval_seconds=0)
+    event = MockStateChange("mine")
+    poll(scheduler, event, 10)
+    self.assertFalse(event.timed_out)
+    # Once up front, and once when "mine" arrived
+    self.assertEqual(2, event.proceeds)
+    self.assertEqual(4, simulation.io_master.selects)
+
+  def test_already_pending(self):
+    publisher = MockPublisher()
+    publisher.publish(state_change("mine"))
+    simulation = MockSimulation([], publisher)
+    scheduler = EventScheduler(simulation)
+    event = MockStateChange("mine")
+    poll(scheduler, event, 10)
+    self.assertFalse(event.timed_out)
+    self.assertEqual(0, simulation.io_master.selects)
+
+  def test_timeout(self):
+    simulation = MockSimulation([], MockPublisher())
+    scheduler = EventScheduler(simulation, sleep_interval_seconds=0.01)
+    event = MockStateChange("mine")
+    poll(scheduler, event, 0.05)
+    self.assertTrue(event.timed_out)
+    self.assertEqual(1, event.proceeds)
+
+  def test_polls_without_publisher(self):
+    for (publisher, event_driven_wakeups) in [ (None, True),
+                                               (MockPublisher(), False) ]:
+      simulation = MockSimulation([], publisher)
+      scheduler = EventScheduler(simulation, sleep_interval_seconds=0.01,
+                                 event_driven_wakeups=event_driven_wakeups)
+      event = MockStateChange("mine")
+      poll(scheduler, event, 0.05)
+      self.assertTrue(event.timed_out)
+      self.assertEqual(simulation.io_master.selects + 1, event.proceeds)
+
+  def test_virtual_clock(self):
+    publisher = MockPublisher()
+    # (As Replayer.clock_start_seconds would start it)
+    clock = VirtualClock(1000 - 0.5)
+    simulation = MockSimulation([], publisher, clock)
+    scheduler = EventScheduler(simulation)
+    expired = []
+    clock.call_later(300, expired.append)
+    events = []
+    for (name, recorded) in [ ("a", 1000), ("b", 1600) ]:
+      publisher.publish(state_change(name))
+      event = MockStateChange(name)
+      event.time = SyncTime(recorded, 0)
+      events.append(event)
+    start = time.time()
+    for event in events:
+      scheduler.schedule(event)
+      self.assertFalse(event.timed_out)
+    # The ten minutes between the events were skipped, not waited out
+    self.assertTrue(time.time() - start < 5)
+    self.assertEqual(1600, clock.now())
+    self.assertEqual([999.5 + 300], expired)
+
+  def test_timeout_model_backs_off(self):
+    # The model only ever saw this event arrive right on time
+    model = TimeoutModel(min_samples=1, quantile=1)
+    event = MockStateChange("mine")
+    model.record(event, 0.0)
+    simulation = MockSimulation([], MockPublisher())
+    scheduler = EventScheduler(simulation, initial_wait=0.05, epsilon_seconds=0.2,
+                               sleep_interval_seconds=0.01, timeout_model=model)
+    event.time = SyncTime(1000, 0)
+    self.assertAlmostEqual(0.05, model.timeout(event, 0.05, 0.24))
+    scheduler.schedule(event)
+    self.assertTrue(event.timed_out)
+    # Timing out pushes the timeout up, to at least the default
+    model.record_replay([event], scheduler.stats.arrival_delays)
+    self.assertTrue(model.timeout(event, 0.05, 0.24) >= 0.24)
+
+  def test_arrival_delay_excludes_gap(self):
+    publisher = MockPublisher()
+    publisher.publish(state_change("mine"))
+    simulation = MockSimulation([], publisher)
+    scheduler = EventScheduler(simulation, initial_wait=0.5,
+                               timeout_model=TimeoutModel())
+    event = MockStateChange("mine")
+    event.time = SyncTime(1000, 0)
+    scheduler.schedule(event)
+    self.assertFalse(event.timed_out)
+    # It was already there, half a second before its recorded gap was up
+    self.assertTrue(-0.5 <= scheduler.stats.arrival_delays[event.label] < -0.4)
+
+if __name__ == '__main__':
+  unittest.main()
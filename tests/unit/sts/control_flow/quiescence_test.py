@@ -0,0 +1,113 @@
+# Copyright 2011-2013 Colin Scott
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+import sys
+import os
+import time
+
+sys.path.append(os.path.dirname(__file__) + "/../../../..")
+
+from sts.replay_event import ControlMessageReceive
+from sts.openflow_buffer import OpenFlowBuffer, PendingReceive
+from sts.control_flow.base import ReplaySyncCallback
+from sts.control_flow.quiescence import QuiescenceDetector
+from sts.control_flow.replayer import ExpectedMessageWindow
+
+class MockIOMaster(object):
+  ''' Runs one scripted callback per call to select(), then sleeps out the
+  timeout '''
+  def __init__(self, script=()):
+    self.script = list(script)
+    self.last_activity = None
+    self.sending = False
+
+  def pending_io(self):
+    return self.sending
+
+  def select(self, timeout):
+    if self.script:
+      self.script.pop(0)()
+    else:
+      time.sleep(timeout)
+
+class MockSimulation(object):
+  def __init__(self, script=()):
+    self.io_master = MockIOMaster(script)
+    self.openflow_buffer = OpenFlowBuffer()
+    self.controller_sync_callback = ReplaySyncCallback()
+
+def activity(simulation):
+  def touch():
+    simulation.io_master.last_activity = time.time()
+    time.sleep(0.01)
+  return touch
+
+class QuiescenceDetectorTest(unittest.TestCase):
+  def test_idle(self):
+    detector = QuiescenceDetector(MockSimulation(), grace_seconds=0.02)
+    start = time.time()
+    self.assertTrue(detector.wait(5))
+    self.assertTrue(time.time() - start < 1)
+
+  def test_activity_extends_grace(self):
+    simulation = MockSimulation()
+    simulation.io_master.script = [ activity(simulation) ] * 5
+    detector = QuiescenceDetector(simulation, grace_seconds=0.02)
+    start = time.time()
+    self.assertTrue(detector.wait(5))
+    # The last activity was 40ms in
+    self.assertTrue(time.time() - start >= 0.04 + 0.02)
+    self.assertEqual([], simulation.io_master.script)
+
+  def test_busy(self):
+    simulation = MockSimulation()
+    detector = QuiescenceDetector(simulation, grace_seconds=0.01)
+    self.assertFalse(detector.busy())
+    simulation.io_master.sending = True
+    self.assertTrue(detector.busy())
+    self.assertFalse(detector.wait(0.05))
+    simulation.io_master.sending = False
+    pending = PendingReceive(1, "c1", None)
+    simulation.openflow_buffer.pendingreceive2conn_messages[pending].append(None)
+    self.assertTrue(detector.busy())
+    del simulation.openflow_buffer.pendingreceive2conn_messages[pending]
+    simulation.controller_sync_callback.cid2deterministic_value["c1"] = None
+    self.assertTrue(detector.busy())
+
+  def test_unexpected_message_buffered(self):
+    # Replays that don't allow unexpected messages never release this one
+    simulation = MockSimulation()
+    unexpected = PendingReceive(1, "c1", "unexpected")
+    simulation.openflow_buffer.pendingreceive2conn_messages[unexpected].append(None)
+    events = [ ControlMessageReceive(1, "c1", ("ControlMessageReceive", "expected", 1, "c1"),
+                                     round=0) ]
+    window = ExpectedMessageWindow(events, 3)
+    window.advance(0)
+    detector = QuiescenceDetector(simulation, grace_seconds=0.02,
+                                  expected_messages=window)
+    self.assertFalse(detector.busy())
+    start = time.time()
+    self.assertTrue(detector.wait(5))
+    self.assertTrue(time.time() - start < 1)
+    # Messages that are still to come do keep it busy
+    expected = PendingReceive(1, "c1", "expected")
+    simulation.openflow_buffer.pendingreceive2conn_messages[expected].append(None)
+    self.assertTrue(detector.busy())
+    # ...until no remaining event expects them
+    window.advance(len(events))
+    self.assertFalse(detector.busy())
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,195 @@
+# Copyright 2011-2013 Colin Scott
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+import sys
+import os
+
+sys.path.append(os.path.dirname(__file__) + "/../../../..")
+
+from sts.replay_event import *
+from sts.openflow_buffer import PendingReceive, PendingSend
+import sts.control_flow.replayer as replayer_module
+from sts.control_flow.replayer import Replayer, ExpectedMessageWindow, DataplaneChecker
+from sts.event_dag import EventDag
+from sts.syncproto.base import SyncTime
+from sts.util.virtual_clock import VirtualClock
+from tests.unit.sts.event_dag_test import MockInternalEvent, MockInputEvent
+
+def receive(fingerprint, round, dpid=1, cid="c1"):
+  return ControlMessageReceive(dpid, cid,
+                               ("ControlMessageReceive", fingerprint, dpid, cid),
+                               round=round)
+
+def send(fingerprint, round, dpid=1, cid="c1"):
+  return ControlMessageSend(dpid, cid,
+                            ("ControlMessageSend", fingerprint, dpid, cid),
+                            round=round)
+
+def expected_by_rescan(events, index, round_window):
+  ''' How Replayer._check_unexpected_cp_messages used to compute the window '''
+  start_round = events[index].round
+  receives = set()
+  sends = set()
+  for event in events[index:]:
+    if event.round - start_round > round_window:
+      break
+    if type(event) == ControlMessageReceive:
+      receives.add(PendingReceive(event.dpid, event.controller_id, event.fingerprint[1]))
+    if type(event) == ControlMessageSend:
+      sends.add(PendingSend(event.dpid, event.controller_id, event.fingerprint[1]))
+  return (receives, sends)
+
+class ExpectedMessageWindowTest(unittest.TestCase):
+  def _check_matches_rescan(self, events, round_window):
+    window = ExpectedMessageWindow(events, round_window)
+    candidates = set()
+    for e in events:
+      if type(e) == ControlMessageReceive:
+        candidates.add(PendingReceive(e.dpid, e.controller_id, e.fingerprint[1]))
+      if type(e) == ControlMessageSend:
+        candidates.add(PendingSend(e.dpid, e.controller_id, e.fingerprint[1]))
+    for index in range(len(events)):
+      window.advance(index)
+      (receives, sends) = expected_by_rescan(events, index, round_window)
+      for candidate in candidates:
+        expected = receives if type(candidate) == PendingReceive else sends
+        self.assertEqual(candidate in expected, window.expects(candidate),
+                         "index %d: %s" % (index, str(candidate)))
+
+  def test_monotone_rounds(self):
+    events = [ receive("a", 0), MockInternalEvent("x"), send("a", 1),
+               receive("b", 2), receive("a", 4), send("b", 5), receive("a", 5),
+               receive("c", 9) ]
+    events[1].round = 0
+    self._check_matches_rescan(events, 3)
+    self._check_matches_rescan(events, 0)
+
+  def test_non_monotone_rounds(self):
+    events = [ receive("a", 3), receive("b", 0), send("a", 7), receive("a", 1),
+               receive("c", 8), send("c", 2) ]
+    self._check_matches_rescan(events, 3)
+
+  def test_receive_and_send_distinct(self):
+    events = [ receive("a", 0) ]
+    window = ExpectedMessageWindow(events, 3)
+    window.advance(0)
+    self.assertTrue(window.expects(PendingReceive(1, "c1", "a")))
+    self.assertFalse(window.expects(PendingSend(1, "c1", "a")))
+    self.assertFalse(window.expects(PendingReceive(2, "c1", "a")))
+
+class MockScheduler(object):
+  ''' Records the events it is asked to schedule. Each takes a second of
+  clock time, if there is a clock '''
+  def __init__(self, clock=None):
+    self.clock = clock
+    self.scheduled = []
+    self.stats = None
+
+  def set_input_logger(self, input_logger):
+    pass
+
+  def schedule(self, event):
+    self.scheduled.append(event)
+    if self.clock is not None:
+      self.clock.advance(1)
+
+class EarlyInvariantCheckTest(unittest.TestCase):
+  def setUp(self):
+    # Alternating inputs and internal events, a round (and second) apart
+    self.events = [ MockInputEvent(label="e%d" % i) if i % 2 == 0 else
+                    MockInternalEvent("f%d" % i, label="e%d" % i)
+                    for i in range(8) ]
+    for (i, e) in enumerate(self.events):
+      e.round = i
+      e.time = SyncTime(i, 0)
+    self.checks = []
+
+  def replay(self, violation_after, clock=None, **kwargs):
+    ''' Replay self.events. The invariant check reports each of
+    violation_after's signatures once that many events have been
+    scheduled '''
+    scheduler = MockScheduler(clock)
+    def invariant_check(simulation):
+      self.checks.append(len(scheduler.scheduled))
+      return [ signature for (signature, after) in violation_after.items()
+               if len(scheduler.scheduled) >= after ]
+    replayer = Replayer(None, EventDag(self.events),
+                        create_event_scheduler=lambda simulation: scheduler,
+                        early_invariant_check=invariant_check, **kwargs)
+    replayer.simulation = None
+    replayer.logical_time = 0
+    replayer.run_simulation_forward(replayer.dag)
+    return (replayer, scheduler)
+
+  def test_stops_at_signature(self):
+    (replayer, scheduler) = self.replay({ "other" : 2, "bug" : 4 },
+                                        early_check_event_types=["MockInternalEvent"],
+                                        early_check_signature="bug")
+    # Checked after e1 and e3; only the check after e3 saw the bug
+    self.assertEqual([2, 4], self.checks)
+    self.assertEqual(self.events[:4], scheduler.scheduled)
+    self.assertEqual(3, replayer.early_violation_event_index)
+    self.assertEqual(set(["other", "bug"]), set(replayer.early_violations))
+
+  def test_any_violation(self):
+    (replayer, scheduler) = self.replay({ "other" : 2 },
+                                        early_check_event_types=["MockInternalEvent"])
+    self.assertEqual(1, replayer.early_violation_event_index)
+    self.assertEqual(["other"], replayer.early_violations)
+
+  def test_runs_to_completion(self):
+    (replayer, scheduler) = self.replay({ "other" : 1 },
+                                        early_check_event_types=["MockInternalEvent"],
+                                        early_check_signature="bug")
+    self.assertEqual(self.events, scheduler.scheduled)
+    self.assertEqual([2, 4, 6, 8], self.checks)
+    self.assertEqual(None, replayer.early_violation_event_index)
+    self.assertEqual(None, replayer.early_violations)
+
+  def test_interval(self):
+    # Measure the interval in clock time rather than real time
+    clock = VirtualClock(0)
+    clock.patch_time_module(replayer_module)
+    try:
+      (replayer, scheduler) = self.replay({ "bug" : 5 }, clock=clock,
+                                          early_check_interval_seconds=2.5,
+                                          early_check_signature="bug")
+    finally:
+      clock.unpatch_time_modules()
+    # Due once 2.5 seconds have passed since the replay (or the last check)
+    # started: after e2 (3s) and e5 (6s)
+    self.assertEqual([3, 6], self.checks)
+    self.assertEqual(5, replayer.early_violation_event_index)
+
+class DataplaneCheckerTest(unittest.TestCase):
+  def test_window(self):
+    events = [ DataplanePermit(("DataplanePermit", "p", 1, 1), round=0),
+               DataplaneDrop(("DataplaneDrop", "p", 1, 1), round=5),
+               DataplaneDrop(("DataplaneDrop", "q", 1, 1), round=12) ]
+    checker = DataplaneChecker(EventDag(events), slop_buffer=2)
+    checker.update_window(1)
+    self.assertEqual(None, checker._pop_expected(("q", 1, 1)))
+    self.assertEqual(events[0].fingerprint, checker._pop_expected(("p", 1, 1)))
+    # Already matched
+    self.assertEqual(None, checker._pop_expected(("p", 1, 1)))
+    checker.update_window(4)
+    self.assertEqual(events[1].fingerprint, checker._pop_expected(("p", 1, 1)))
+    # The window has moved past the drop of "q"
+    checker.update_window(15)
+    self.assertEqual(None, checker._pop_expected(("q", 1, 1)))
+    self.assertEqual([], list(checker.fingerprint2pending[("q", 1, 1)]))
+
+if __name__ == '__main__':
+  unittest.main()
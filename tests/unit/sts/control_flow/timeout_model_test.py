@@ -0,0 +1,111 @@
+# Copyright 2011-2013 Colin Scott
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+import sys
+import os
+import shutil
+import tempfile
+
+sys.path.append(os.path.dirname(__file__) + "/../../../..")
+
+from sts.replay_event import ControllerStateChange
+from sts.control_flow.timeout_model import TimeoutModel, quantile
+
+def state_change(name):
+  return ControllerStateChange("c1", name, name, [])
+
+class TimeoutModelTest(unittest.TestCase):
+  def test_quantile(self):
+    self.assertEqual(1, quantile([3, 1, 2], 0))
+    self.assertEqual(3, quantile([3, 1, 2], 1))
+    self.assertEqual(2, quantile([3, 1, 2], 0.5))
+    self.assertAlmostEqual(1.5, quantile([1, 2], 0.5))
+
+  def test_timeout(self):
+    model = TimeoutModel(quantile=1, min_samples=3, min_timeout_seconds=0.01)
+    slow = state_change("slow")
+    self.assertEqual(7, model.timeout(slow, 0, 7))
+    for delay in [0.1, 0.2, 0.3]:
+      model.record(slow, delay)
+    self.assertAlmostEqual(0.3, model.timeout(state_change("slow"), 0, 7))
+    # Too few samples for this fingerprint: fall back to the whole class
+    fast = state_change("fast")
+    model.record(fast, 0.0)
+    self.assertAlmostEqual(0.3, model.timeout(fast, 0, 7))
+    for _ in range(3):
+      model.record(fast, 0.0)
+    self.assertAlmostEqual(0.01, model.timeout(fast, 0, 7))
+
+  def test_gap(self):
+    model = TimeoutModel(quantile=1, min_samples=1)
+    event = state_change("a")
+    model.record(event, 0.25)
+    # Delays are on top of each event's own recorded gap
+    self.assertAlmostEqual(3.25, model.timeout(event, 3, 7))
+    self.assertAlmostEqual(0.25, model.timeout(event, 0, 7))
+
+  def test_censored_delay(self):
+    model = TimeoutModel(backoff_factor=2, max_backoff_seconds=5)
+    # Never less than the default
+    self.assertAlmostEqual(0.5, model.censored_delay(0.1, 0.5))
+    self.assertAlmostEqual(2, model.censored_delay(1, 0.5))
+    self.assertAlmostEqual(5, model.censored_delay(4, 0.5))
+    self.assertAlmostEqual(8, model.censored_delay(4, 8))
+    # Repeated timeouts keep backing off, up to max_backoff_seconds
+    model = TimeoutModel(quantile=0.95, min_samples=1, max_backoff_seconds=5)
+    event = state_change("slow")
+    for _ in range(20):
+      model.record(event, 0.1)
+    timeouts = []
+    for _ in range(12):
+      timeout = model.timeout(event, 0, 0.5)
+      timeouts.append(timeout)
+      model.record(event, model.censored_delay(timeout, 0.5))
+    self.assertTrue(timeouts[0] < 0.5)
+    self.assertEqual(sorted(timeouts), timeouts)
+    self.assertAlmostEqual(5, timeouts[-1])
+
+  def test_record_replay(self):
+    model = TimeoutModel(min_samples=1)
+    events = [ state_change("a"), state_change("b") ]
+    model.record_replay(events, { events[0].label : 0.5 })
+    self.assertAlmostEqual(0.5, model.timeout(events[0], 0, 7))
+    # "b" never arrived: the class as a whole has been observed
+    self.assertAlmostEqual(0.5, model.timeout(events[1], 0, 7))
+
+  def test_persistence(self):
+    tmpdir = tempfile.mkdtemp()
+    try:
+      path = os.path.join(tmpdir, "events.trace.timeouts")
+      model = TimeoutModel(min_samples=1, max_samples=2)
+      for delay in [1, 2, 3]:
+        model.record(state_change("a"), delay)
+      model.save(path)
+      loaded = TimeoutModel(min_samples=1, max_samples=2)
+      loaded.load(path)
+      self.assertEqual(model.class2fingerprint2delays,
+                       loaded.class2fingerprint2delays)
+      loaded.load(path)
+      self.assertEqual([2, 3], loaded.class2fingerprint2delays.values()[0].values()[0])
+      # Missing and corrupt models are ignored
+      TimeoutModel().load(os.path.join(tmpdir, "missing"))
+      with open(path, "w") as f:
+        f.write("{")
+      TimeoutModel().load(path)
+    finally:
+      shutil.rmtree(tmpdir)
+
+if __name__ == '__main__':
+  unittest.main()
@@ -16,6 +16,7 @@
 import unittest
 import sys
 import os.path
+import pickle
 
 sys.path.append(os.path.dirname(__file__) + "/../../..")
 
@@ -161,6 +162,97 @@ class event_dag_test(unittest.TestCase):
     fingerprint = ('HostMigration',1,1,2,2,"host1")
     self.assertEqual(fingerprint, new_dag.events[1].fingerprint)
 
+  def test_view_complement_of_view(self):
+    inputs = [ MockInputEvent() for _ in range(4) ]
+    events = [ MockInternalEvent('a') ] + inputs
+    event_dag = EventDag(events)
+    view = event_dag.input_complement(inputs[:1])
+    self.assertEqual(4, len(view))
+    new_view = view.input_complement(inputs[2:3])
+    self.assertEqual([events[0], inputs[1], inputs[3]], new_view.events)
+    self.assertEqual([inputs[1], inputs[3]], new_view.input_events)
+
+  def test_insert_migration_straightens(self):
+    events = [ MockInternalEvent('a'), HostMigration(1,1,2,2,"host1"),
+               MockInternalEvent('b'), HostMigration(2,2,3,3,"host1"),
+               MockInputEvent() ]
+    event_dag = EventDag(events)
+    view = event_dag.input_complement([events[1]])
+    self.assertEqual(('HostMigration',1,1,3,3,"host1"), view.events[2].fingerprint)
+    # Adding the first migration back in restores the original locations
+    restored = view.insert_atomic_inputs([events[1]])
+    self.assertEqual([ e.fingerprint for e in events ],
+                     [ e.fingerprint for e in restored.events ])
+
+  def test_union(self):
+    inputs = [ MockInputEvent() for _ in range(4) ]
+    events = [ MockInternalEvent('a') ] + inputs
+    event_dag = EventDag(events)
+    left = event_dag.input_subset(inputs[:1])
+    right = event_dag.input_subset(inputs[2:])
+    self.assertEqual([events[0], inputs[0], inputs[2], inputs[3]],
+                     left.union(right).events)
+
+  def test_successor_index(self):
+    c1_change = ControllerStateChange("c1", "f", "name", [])
+    c2_change = ControllerStateChange("c2", "f", "name", [])
+    input_event = MockInputEvent()
+    events = [ MockInternalEvent('a'), c1_change, input_event,
+               MockInternalEvent('b'), c2_change ]
+    event_dag = EventDag(events)
+    self.assertEqual(c1_change, event_dag.next_state_change(0))
+    self.assertEqual(c1_change, event_dag.next_state_change(1))
+    self.assertEqual(c2_change, event_dag.next_state_change(2))
+    self.assertEqual(c2_change, event_dag.next_state_change(0, controller_id="c2"))
+    self.assertEqual(None, event_dag.next_state_change(2, controller_id="c1"))
+    self.assertEqual(None, event_dag.next_state_change(5))
+    self.assertEqual(input_event, event_dag.next_input(0))
+    self.assertEqual(None, event_dag.next_input(3))
+    self.assertEqual(c2_change, event_dag.next_controller_event("c2", 2))
+    self.assertEqual(None, event_dag.next_controller_event("c3", 0))
+    # Views index their own events
+    view = event_dag.input_complement([input_event])
+    self.assertEqual(c2_change, view.next_state_change(2))
+    self.assertEqual(None, view.next_input(0))
+
+  def test_view_successor_index(self):
+    # Views derive their index from the parent's; check it against an index
+    # built from scratch over the view's events
+    events = []
+    for i in range(30):
+      if i % 3 == 0:
+        events.append(MockInputEvent())
+      elif i % 4 == 1:
+        events.append(ControllerStateChange("c%d" % (i % 2), "f", "name", []))
+      else:
+        events.append(MockInternalEvent('x'))
+    event_dag = EventDag(events)
+    inputs = event_dag.input_events
+    views = [ event_dag.input_complement(inputs[::2]),
+              event_dag.input_subset(inputs[1:4]),
+              event_dag.input_complement([]) ]
+    views.append(views[0].input_complement(views[0].input_events[:2]))
+    for view in views:
+      fresh = SuccessorIndex(view.events)
+      for i in range(len(view.events) + 1):
+        self.assertTrue(view.next_state_change(i) is fresh.next_state_change(i))
+        self.assertTrue(view.next_state_change(i, controller_id="c1") is
+                        fresh.next_state_change(i, controller_id="c1"))
+        self.assertTrue(view.next_input(i) is fresh.next_input(i))
+
+  def test_compact_events(self):
+    e = ControlMessageReceive(1, u"c1", ("ControlMessageReceive", "x", 1, "c1"))
+    self.assertFalse(hasattr(e, "__dict__"))
+    self.assertEqual(str, type(e.controller_id))
+    e.replay_time = 3
+    copy = pickle.loads(pickle.dumps(e, pickle.HIGHEST_PROTOCOL))
+    self.assertEqual(e.json_fields(), copy.json_fields())
+    self.assertEqual(3, copy.replay_time)
+    # Generated labels never collide with labels read from a trace
+    Event.reserve_label_id(Event._max_label_id + 10)
+    self.assertEqual(Event._max_label_id + 1, int(MockInputEvent().label[1:]))
+    self.assertRaises(AttributeError, setattr, LinkFailure(1, 1, 2, 1), "foo", 1)
+
 
 if __name__ == '__main__':
   unittest.main()
@@ -0,0 +1,94 @@
+# Copyright 2011-2013 Colin Scott
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+import sys
+import os
+import gc
+
+sys.path.append(os.path.dirname(__file__) + "/../../..")
+
+from sts.fingerprints.base import _interned
+from sts.fingerprints.messages import OFFingerprint, DPFingerprint
+from sts.replay_event import ControlMessageReceive, DataplaneDrop
+
+ip_fields = {'dl_src': '00:00:00:00:00:01', 'dl_dst': '00:00:00:00:00:02',
+             'nw_src': '10.0.0.1', 'nw_dst': '10.0.0.2'}
+
+class FingerprintInterningTest(unittest.TestCase):
+  def test_from_dict(self):
+    a = DPFingerprint.from_dict(ip_fields)
+    b = DPFingerprint.from_dict(dict(ip_fields))
+    self.assertTrue(a is b)
+    # Not interned, but still equal
+    c = DPFingerprint(dict(ip_fields))
+    self.assertFalse(a is c)
+    self.assertEqual(a, c)
+    self.assertEqual(hash(a), hash(c))
+    self.assertTrue(c.intern() is a)
+    self.assertNotEqual(a, DPFingerprint.from_dict({'class' : 'arp'}))
+
+  def test_nested(self):
+    fields = {'class' : 'ofp_packet_in', 'in_port' : 1, 'data' : ip_fields}
+    a = OFFingerprint.from_dict(fields)
+    b = OFFingerprint.from_dict({'class' : 'ofp_packet_in', 'in_port' : 1,
+                                 'data' : dict(ip_fields)})
+    self.assertTrue(a is b)
+    self.assertTrue(a['data'] is DPFingerprint.from_dict(ip_fields))
+    self.assertEqual(fields, a.to_dict())
+    self.assertNotEqual(a, OFFingerprint.from_dict({'class' : 'ofp_packet_in',
+                                                    'in_port' : 2, 'data' : ip_fields}))
+
+  def test_hash_cached(self):
+    a = DPFingerprint(dict(ip_fields))
+    self.assertEqual(None, a._hash)
+    h = a.__hash__()
+    self.assertEqual(h, a._hash)
+    self.assertEqual(hash(a), hash(DPFingerprint(dict(ip_fields))))
+
+  def test_weak(self):
+    DPFingerprint.from_dict({'dl_type' : 0x1234})
+    gc.collect()
+    self.assertFalse(any(type(k[0]) == DPFingerprint and dict(k[1]) == {'dl_type' : 0x1234}
+                         for k in _interned.keys()))
+
+  def test_events_share_fingerprints(self):
+    of_fields = {'class' : 'ofp_packet_in', 'in_port' : 1, 'data' : ip_fields}
+    # Controller ids are (address, port) pairs, so json turns them into lists
+    cid = ("127.0.0.1", 6633)
+    json_fingerprint = ["ControlMessageReceive", of_fields, 1, list(cid)]
+    a = ControlMessageReceive(1, cid, list(json_fingerprint))
+    b = ControlMessageReceive(1, cid, list(json_fingerprint))
+    c = ControlMessageReceive(1, cid, OFFingerprint.from_dict(of_fields))
+    self.assertEqual(a.fingerprint, b.fingerprint)
+    self.assertTrue(a.fingerprint[1] is b.fingerprint[1])
+    self.assertTrue(a.fingerprint[1] is c.fingerprint[1])
+    d = DataplaneDrop(["DataplaneDrop", ip_fields, 1, 2])
+    e = DataplaneDrop(["DataplaneDrop", ip_fields, 1, 2])
+    self.assertTrue(d.fingerprint[1] is e.fingerprint[1])
+
+  def test_events_dont_pin_fingerprints(self):
+    fields = {'class' : 'ofp_packet_in', 'in_port' : 4321,
+              'data' : {'dl_type' : 0x4321}}
+    event = ControlMessageReceive(1, ("127.0.0.1", 6633),
+                                  ["ControlMessageReceive", fields, 1,
+                                   ["127.0.0.1", 6633]])
+    self.assertEqual(fields, event.fingerprint[1].to_dict())
+    del event
+    gc.collect()
+    self.assertFalse(any(('in_port', 4321) in k[1] or ('dl_type', 0x4321) in k[1]
+                         for k in _interned.keys()))
+
+if __name__ == '__main__':
+  unittest.main()
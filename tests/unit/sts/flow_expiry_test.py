@@ -0,0 +1,86 @@
+# Copyright 2011-2013 Colin Scott
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+import sys
+import os
+
+sys.path.append(os.path.dirname(__file__) + "/../../..")
+
+from sts.entities import FuzzSoftwareSwitch
+from sts.util.virtual_clock import VirtualClock
+
+class StubFlowTable(object):
+  ''' Expires entries the way pox.openflow.flow_table does, against the
+  `now' it is handed '''
+  def __init__(self):
+    # { name -> [created, last touched, idle_timeout, hard_timeout] }
+    self.entries = {}
+    self.expiry_times = []
+
+  def add(self, name, now, idle_timeout=0, hard_timeout=0):
+    self.entries[name] = [now, now, idle_timeout, hard_timeout]
+
+  def touch(self, name, now):
+    self.entries[name][1] = now
+
+  def remove_expired_entries(self, now):
+    self.expiry_times.append(now)
+    for (name, (created, touched, idle, hard)) in self.entries.items():
+      if ((idle > 0 and now > touched + idle) or
+          (hard > 0 and now > created + hard)):
+        del self.entries[name]
+
+class FlowExpiryTest(unittest.TestCase):
+  def setUp(self):
+    self.clock = VirtualClock(1000)
+    # Don't boot a whole switch just to expire its table
+    self.switch = FuzzSoftwareSwitch.__new__(FuzzSoftwareSwitch)
+    self.switch.table = StubFlowTable()
+    self.switch.use_virtual_clock(self.clock)
+
+  def test_hard_timeout(self):
+    table = self.switch.table
+    table.add("hard", self.clock.now(), hard_timeout=10)
+    self.clock.advance(10)
+    self.assertTrue("hard" in table.entries)
+    self.clock.advance(1)
+    self.assertFalse("hard" in table.entries)
+    self.assertEqual(range(1001, 1012), table.expiry_times)
+
+  def test_idle_timeout(self):
+    table = self.switch.table
+    table.add("idle", self.clock.now(), idle_timeout=5)
+    table.add("hard", self.clock.now(), idle_timeout=5, hard_timeout=8)
+    self.clock.advance(4)
+    table.touch("idle", self.clock.now())
+    table.touch("hard", self.clock.now())
+    # Touching an entry pushes back its idle timeout, but not its hard one
+    self.clock.advance_to(1009)
+    self.assertTrue("idle" in table.entries)
+    self.assertFalse("hard" in table.entries)
+    self.clock.advance(1)
+    self.assertFalse("idle" in table.entries)
+
+  def test_jump(self):
+    table = self.switch.table
+    table.add("idle", self.clock.now(), idle_timeout=5)
+    # Skipping an idle minute still expires the entry, as of when it was due
+    self.clock.advance(60)
+    self.assertEqual({}, table.entries)
+    self.assertEqual(1060, self.clock.now())
+    self.assertEqual(1006, table.expiry_times[5])
+
+if __name__ == '__main__':
+  unittest.main()
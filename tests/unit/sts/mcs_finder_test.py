@@ -17,19 +17,27 @@ import unittest
 import sys
 import os
 import shutil
+import tempfile
 
 from sts.control_flow import MCSFinder, EfficientMCSFinder
+import sts.control_flow.mcs_finder as mcs_finder_module
+from sts.control_flow.replayer import Replayer
 from sts.replay_event import InputEvent, InvariantViolation
 from sts.event_dag import EventDag
+from tests.unit.sts.event_dag_test import MockInternalEvent
 import logging
 
 sys.path.append(os.path.dirname(__file__) + "/../../..")
 
+class MockCrash(Exception):
+  pass
+
 class MockMCSFinderBase(MCSFinder):
   ''' Overrides self.invariant_check and run_simulation_forward() '''
-  def __init__(self, event_dag, mcs):
+  def __init__(self, event_dag, mcs, **kwargs):
     super(MockMCSFinderBase, self).__init__(None, event_dag,
-                                            invariant_check_name="InvariantChecker.check_liveness")
+                                            invariant_check_name="InvariantChecker.check_liveness",
+                                            **kwargs)
     # Hack! Give a fake name in config.invariant_checks.name_to_invariant_checks, but
     # but remove it from our dict directly after. This is to prevent
     # sanity check exceptions from being thrown.
@@ -38,6 +46,11 @@ class MockMCSFinderBase(MCSFinder):
     self.mcs = mcs
     self.simulation = None
     self.transform_dag = None
+    self.replays = 0
+    # Simulate the machine dying after this many replays
+    self.crash_after_replays = None
+    # Seconds each replay_all() replay reports having taken
+    self.replay_duration = 1
 
   def log(self, message):
     self._log.info(message)
@@ -49,8 +62,31 @@ class MockMCSFinderBase(MCSFinder):
     return ["violation"]
 
   def replay(self, new_dag, hook=None, ignore_runtime_stats=False):
+    if self.replays == self.crash_after_replays:
+      raise MockCrash()
     self.new_dag = new_dag
-    return self.invariant_check(new_dag)
+    self.replays += 1
+    violations = self.invariant_check(new_dag)
+    self._record_replay(new_dag, violations)
+    return self.bug_signature in violations
+
+  def replay_all(self, dags_and_labels, ignore_runtime_stats=False,
+                 cancel=None, durations=None):
+    # Mimic fork_parallel(): by default nothing after the first violation is
+    # needed
+    bugs_found = [ None ] * len(dags_and_labels)
+    moot = set()
+    for i, (new_dag, label) in enumerate(dags_and_labels):
+      if i in moot:
+        continue
+      bugs_found[i] = self.replay(new_dag, label)
+      if durations is not None:
+        durations[i] = self.replay_duration
+      if cancel is not None:
+        moot.update(cancel(i, bugs_found[i]))
+      elif bugs_found[i]:
+        break
+    return bugs_found
 
 # Horrible horrible hack. This way lies insanity
 class MockMCSFinder(MockMCSFinderBase, MCSFinder):
@@ -58,6 +94,49 @@ class MockMCSFinder(MockMCSFinderBase, MCSFinder):
     MockMCSFinderBase.__init__(self, event_dag, mcs)
     self._log = logging.getLogger("mock_mcs_finder")
 
+class MockParallelMCSFinder(MockMCSFinderBase, MCSFinder):
+  def __init__(self, event_dag, mcs):
+    MockMCSFinderBase.__init__(self, event_dag, mcs, max_parallel_replays=4)
+    self._log = logging.getLogger("mock_parallel_mcs_finder")
+
+class MockSpeculativeEfficientMCSFinder(MockMCSFinderBase, EfficientMCSFinder):
+  def __init__(self, event_dag, mcs):
+    MockMCSFinderBase.__init__(self, event_dag, mcs, speculate=True,
+                               max_parallel_replays=4)
+    self.replay_duration = 2.5
+    self._log = logging.getLogger("mock_speculative_efficient_mcs_finder")
+
+class MockCachedMCSFinder(MockMCSFinderBase, MCSFinder):
+  def __init__(self, event_dag, mcs, replay_outcome_cache_path):
+    MockMCSFinderBase.__init__(self, event_dag, mcs,
+                               replay_outcome_cache_path=replay_outcome_cache_path)
+    self._log = logging.getLogger("mock_cached_mcs_finder")
+
+class MockAdaptiveMCSFinder(MockMCSFinderBase, MCSFinder):
+  def __init__(self, event_dag, mcs):
+    MockMCSFinderBase.__init__(self, event_dag, mcs, adaptive_verification=True)
+    self._log = logging.getLogger("mock_adaptive_mcs_finder")
+
+class MockMonotoneMCSFinder(MockMCSFinderBase, MCSFinder):
+  def __init__(self, event_dag, mcs):
+    MockMCSFinderBase.__init__(self, event_dag, mcs,
+                               monotonicity_assumption='both')
+    self._log = logging.getLogger("mock_monotone_mcs_finder")
+
+class MockMultiMCSFinder(MockMCSFinderBase, MCSFinder):
+  ''' mcses is { bug signature -> inputs that trigger it } '''
+  def __init__(self, event_dag, mcses, bug_signatures):
+    MockMCSFinderBase.__init__(self, event_dag, None,
+                               bug_signatures=bug_signatures)
+    self.mcses = mcses
+    self._log = logging.getLogger("mock_multi_mcs_finder")
+
+  def _invariant_check(self, new_dag):
+    # N.B. each search is a copy of us, but self.invariant_check stays bound
+    # to the original
+    return [ signature for signature, mcs in sorted(self.mcses.items())
+             if all(e in new_dag._events_set for e in mcs) ]
+
 class MockEfficientMCSFinder(MockMCSFinderBase, EfficientMCSFinder):
   def __init__(self, event_dag, mcs):
     MockMCSFinderBase.__init__(self, event_dag, mcs)
@@ -98,6 +177,47 @@ class MCSFinderTest(unittest.TestCase):
     finally:
       shutil.rmtree(mcs_results_path)
     self.assertEqual(mcs, mcs_finder.dag.input_events)
+    return mcs_finder
+
+  def test_basic_parallel(self):
+    self.basic(MockParallelMCSFinder)
+
+  def test_basic_speculative(self):
+    mcs_finder = self.basic(MockSpeculativeEfficientMCSFinder)
+    stats = mcs_finder._runtime_stats
+    useful = stats.useful_speculative_replays
+    # Speculated outcomes that delta debugging never asked for
+    wasted = len(mcs_finder._speculated)
+    self.assertTrue(useful > 0)
+    self.assertEqual(stats.speculative_replays, useful + wasted)
+    self.assertEqual(2.5 * useful, stats.useful_speculative_replay_seconds)
+    self.assertEqual(2.5 * wasted, stats.wasted_speculative_replay_seconds)
+
+  def test_basic_adaptive(self):
+    mcs_finder = self.basic(MockAdaptiveMCSFinder)
+    stats = mcs_finder._runtime_stats
+    self.assertTrue(len(stats.subset_verification) > 0)
+    self.assertEqual(1, stats.subset_verification[" ".join(e.label for e in mcs_finder.dag.input_events)]['successes'])
+    # Every replay of a reproducing subset hit the bug, so it shouldn't take
+    # many failed replays to rule a subset out.
+    self.assertTrue(stats.reproduction_probability_estimate() > 0.5)
+    self.assertTrue(mcs_finder._verification_runs() < mcs_finder.max_verification_runs)
+
+  def test_adaptive_unreproducible(self):
+    trace = [ MockInputEvent(fingerprint=("class",f)) for f in range(1,7) ]
+    trace.append(InvariantViolation(["violation"], persistent=True))
+    # The bug needs an input that isn't in the trace
+    mcs_finder = MockAdaptiveMCSFinder(EventDag(trace), [MockInputEvent()])
+    try:
+      os.makedirs(mcs_results_path)
+      mcs_finder.init_results(mcs_results_path)
+      self.assertRaises(SystemExit, mcs_finder.simulate)
+    finally:
+      shutil.rmtree(mcs_results_path)
+    # Gave up once the sequential test was satisfied, not after
+    # max_verification_runs
+    self.assertEqual(mcs_finder._verification_runs(), mcs_finder.replays)
+    self.assertTrue(mcs_finder.replays < mcs_finder.max_verification_runs)
 
   def test_straddle(self):
     self.straddle(MockMCSFinder)
@@ -118,6 +238,20 @@ class MCSFinderTest(unittest.TestCase):
     finally:
       shutil.rmtree(mcs_results_path)
     self.assertEqual(mcs, mcs_finder.dag.input_events)
+    return mcs_finder
+
+  def test_straddle_monotone(self):
+    plain = self.straddle(MockMCSFinder)
+    monotone = self.straddle(MockMonotoneMCSFinder)
+    implied = monotone._runtime_stats.implied_replay_outcomes
+    self.assertTrue(implied > 0)
+    self.assertEqual(plain.replays, monotone.replays + implied)
+
+  def test_straddle_parallel(self):
+    self.straddle(MockParallelMCSFinder)
+
+  def test_straddle_speculative(self):
+    self.straddle(MockSpeculativeEfficientMCSFinder)
 
   def test_all(self):
     self.all(MockMCSFinder)
@@ -125,6 +259,12 @@ class MCSFinderTest(unittest.TestCase):
   def test_all_efficient(self):
     self.all(MockEfficientMCSFinder)
 
+  def test_all_parallel(self):
+    self.all(MockParallelMCSFinder)
+
+  def test_all_speculative(self):
+    self.all(MockSpeculativeEfficientMCSFinder)
+
   def all(self, mcs_finder_type):
     trace = [ MockInputEvent(fingerprint=("class",f)) for f in range(1,7) ]
     trace.append(InvariantViolation(["violation"], persistent=True))
@@ -139,5 +279,162 @@ class MCSFinderTest(unittest.TestCase):
       shutil.rmtree(mcs_results_path)
     self.assertEqual(mcs, mcs_finder.dag.input_events)
 
+  def test_replay_outcome_cache(self):
+    trace = [ MockInputEvent(fingerprint=("class",f)) for f in range(1,7) ]
+    trace.append(InvariantViolation(["violation"], persistent=True))
+    dag = EventDag(trace)
+    mcs = [trace[0],trace[5]]
+    cache_path = "/tmp/mcs_replay_outcomes"
+    mcs_finders = []
+    try:
+      for _ in range(2):
+        mcs_finder = MockCachedMCSFinder(dag, mcs, cache_path)
+        try:
+          os.makedirs(mcs_results_path)
+          mcs_finder.init_results(mcs_results_path)
+          mcs_finder.simulate()
+        finally:
+          shutil.rmtree(mcs_results_path)
+        mcs_finders.append(mcs_finder)
+    finally:
+      for path in [cache_path, cache_path + ".lock"]:
+        if os.path.exists(path):
+          os.remove(path)
+    self.assertEqual(mcs, mcs_finders[1].dag.input_events)
+    # Only the initial reproducibility check and the final MCS were replayed
+    # the second time
+    self.assertEqual(2, mcs_finders[1].replays)
+    self.assertTrue(mcs_finders[0].replays > 2)
+
+  def test_multiple_signatures(self):
+    trace = [ MockInputEvent(fingerprint=("class",f)) for f in range(1,9) ]
+    trace.append(InvariantViolation(["a", "b"], persistent=True))
+    dag = EventDag(trace)
+    mcses = { "a" : [trace[1],trace[6]], "b" : [trace[1],trace[5]] }
+
+    separate_replays = 0
+    for signature in ["a", "b"]:
+      mcs_finder = MockMultiMCSFinder(dag, mcses, [signature])
+      try:
+        os.makedirs(mcs_results_path)
+        mcs_finder.init_results(mcs_results_path)
+        mcs_finder.simulate()
+      finally:
+        shutil.rmtree(mcs_results_path)
+      self.assertEqual(mcses[signature], mcs_finder.dag.input_events)
+      separate_replays += mcs_finder.replays
+
+    mcs_finder = MockMultiMCSFinder(dag, mcses, "all")
+    try:
+      os.makedirs(mcs_results_path)
+      mcs_finder.init_results(mcs_results_path)
+      mcs_finder.simulate()
+      for i in range(2):
+        self.assertTrue(os.path.exists(os.path.join(mcs_results_path,
+                                                    "signature_%d" % i,
+                                                    "mcs.trace")))
+      self.assertTrue(os.path.exists(os.path.join(mcs_results_path,
+                                                  "bug_signatures.json")))
+    finally:
+      shutil.rmtree(mcs_results_path)
+    (a, b) = mcs_finder._searches
+    self.assertEqual(mcses["a"], a.dag.input_events)
+    self.assertEqual(mcses["b"], b.dag.input_events)
+    self.assertTrue(b._runtime_stats.shared_replay_outcomes > 0)
+    self.assertTrue(a.replays + b.replays < separate_replays)
+
+  def test_resume(self):
+    self.resume(MockMCSFinder)
+
+  def test_resume_efficient(self):
+    self.resume(MockEfficientMCSFinder)
+
+  def resume(self, mcs_finder_type):
+    trace = [ MockInputEvent(fingerprint=("class",f)) for f in range(1,9) ]
+    trace.append(InvariantViolation(["violation"], persistent=True))
+    dag = EventDag(trace)
+    mcs = [trace[1],trace[6]]
+
+    uninterrupted = mcs_finder_type(dag, mcs)
+    try:
+      os.makedirs(mcs_results_path)
+      uninterrupted.init_results(mcs_results_path)
+      uninterrupted.simulate()
+    finally:
+      shutil.rmtree(mcs_results_path)
+
+    crashed = mcs_finder_type(dag, mcs)
+    crashed.crash_after_replays = 4
+    resumed = mcs_finder_type(dag, mcs)
+    try:
+      os.makedirs(mcs_results_path)
+      crashed.init_results(mcs_results_path)
+      self.assertRaises(MockCrash, crashed.simulate)
+      resumed.init_results(mcs_results_path)
+      resumed.simulate()
+    finally:
+      shutil.rmtree(mcs_results_path)
+    self.assertEqual(mcs, resumed.dag.input_events)
+    # Nothing that was decided before the crash was replayed again
+    self.assertEqual(uninterrupted.replays, crashed.replays + resumed.replays)
+
+class MockSimulation(object):
+  def clean_up(self):
+    pass
+
+class MockSimulationConfig(object):
+  controller_configs = []
+
+class MockSimulationReplayer(Replayer):
+  ''' Replays against a MockSimulation '''
+  def simulate(self):
+    self.simulation = MockSimulation()
+    self.logical_time = 0
+    self.run_simulation_forward(self.dag)
+    return self.simulation
+
+class MockScheduler(object):
+  def __init__(self):
+    self.scheduled = []
+    self.stats = None
+
+  def set_input_logger(self, input_logger):
+    pass
+
+  def schedule(self, event):
+    self.scheduled.append(event)
+
+class PlayForwardTest(unittest.TestCase):
+  def setUp(self):
+    self.results_dir = tempfile.mkdtemp()
+    self.old_replayer = mcs_finder_module.Replayer
+    mcs_finder_module.Replayer = MockSimulationReplayer
+
+  def tearDown(self):
+    mcs_finder_module.Replayer = self.old_replayer
+    shutil.rmtree(self.results_dir)
+
+  def test_early_violation(self):
+    trace = [ MockInputEvent(fingerprint=("class", 1)) ]
+    trace += [ MockInternalEvent("f%d" % i) for i in range(5) ]
+    scheduler = MockScheduler()
+    checks = []
+    def invariant_check(simulation):
+      checks.append(len(scheduler.scheduled))
+      if len(scheduler.scheduled) >= 3:
+        return ["bug"]
+      return ["other"]
+    (violations, client_dict, _, _) = mcs_finder_module.play_forward(
+        MockSimulationConfig(), EventDag(trace), self.results_dir, 7,
+        invariant_check, bug_signature="bug",
+        early_check_event_types=["MockInternalEvent"],
+        create_event_scheduler=lambda simulation: scheduler)
+    self.assertEqual(["bug"], violations)
+    # Stopped after the first internal event at which the bug showed, and
+    # skipped the check at the end of the replay
+    self.assertEqual(trace[:3], scheduler.scheduled)
+    self.assertEqual([2, 3], checks)
+    self.assertEqual({"7" : 2}, client_dict['early_violation_event_index'])
+
 if __name__ == '__main__':
   unittest.main()
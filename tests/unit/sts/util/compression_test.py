@@ -0,0 +1,92 @@
+# Copyright 2011-2013 Colin Scott
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+import sys
+import os
+import tempfile
+import shutil
+
+sys.path.append(os.path.dirname(__file__) + "/../../../..")
+
+from sts.util.compression import *
+
+lines = [ '{"label": "e%d", "b64_packet": "AQ4ASAAAAAA="}\n' % i for i in range(500) ]
+data = "".join(lines)
+
+class CompressionTest(unittest.TestCase):
+  def setUp(self):
+    self.tmpdir = tempfile.mkdtemp()
+    self.path = os.path.join(self.tmpdir, "events.trace")
+
+  def tearDown(self):
+    shutil.rmtree(self.tmpdir)
+
+  def write(self, codec, block_size=1000):
+    with BlockWriter(self.path, codec=codec, block_size=block_size) as writer:
+      for line in lines:
+        writer.write(line)
+
+  def test_round_trip(self):
+    for codec in codecs.keys():
+      self.write(codec)
+      self.assertEqual(codec, compression_of(self.path))
+      with open_trace_file(self.path) as reader:
+        self.assertEqual(lines, list(reader))
+      with open_trace_file(self.path) as reader:
+        self.assertEqual(data, reader.read())
+    self.assertTrue(os.path.getsize(self.path) < len(data))
+
+  def test_seek(self):
+    self.write("zlib")
+    with open_trace_file(self.path) as reader:
+      for offset in [ 0, 999, 1000, 1001, 4321, len(data) - 1, len(data) ]:
+        reader.seek(offset)
+        self.assertEqual(data[offset:offset+1500], reader.read(1500))
+        self.assertEqual(min(len(data), offset + 1500), reader.tell())
+      reader.seek(-10, os.SEEK_END)
+      self.assertEqual(data[-10:], reader.readline())
+      self.assertEqual("", reader.readline())
+
+  def test_unclosed(self):
+    writer = BlockWriter(self.path, block_size=1000)
+    for line in lines:
+      writer.write(line)
+    # Simulate a crash: only complete blocks made it to disk
+    writer._output.close()
+    with open_trace_file(self.path) as reader:
+      recovered = reader.read()
+    self.assertTrue(len(recovered) >= len(data) - 1000)
+    self.assertEqual(data[:len(recovered)], recovered)
+
+  def test_plain_and_gzip(self):
+    for codec in [ None, "gzip" ]:
+      with open_trace_file(self.path, 'w', codec=codec) as output:
+        output.write(data)
+      self.assertEqual(codec, compression_of(self.path))
+      with open_trace_file(self.path) as reader:
+        self.assertEqual(lines, list(reader))
+
+  def test_register_codec(self):
+    register_codec(Codec("reversed", lambda s: s[::-1], lambda s: s[::-1]))
+    try:
+      self.write("reversed")
+      with open_trace_file(self.path) as reader:
+        self.assertEqual(data, reader.read())
+    finally:
+      del codecs["reversed"]
+    self.assertRaises(ValueError, open_trace_file, self.path)
+
+if __name__ == '__main__':
+  unittest.main()
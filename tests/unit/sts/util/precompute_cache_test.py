@@ -16,6 +16,9 @@
 import unittest
 import sys
 import os.path
+import random
+import tempfile
+import shutil
 
 sys.path.append(os.path.dirname(__file__) + "/../../..")
 
@@ -56,3 +59,166 @@ class precompute_cache_test(unittest.TestCase):
     self.assertTrue(p.already_done( (4,)))
     self.assertFalse(p.already_done( (1,2,3,4)))
 
+class lattice_outcome_cache_test(unittest.TestCase):
+  def test_exact(self):
+    c = LatticeOutcomeCache(False, False)
+    self.assertEqual(None, c.lookup( (1,2) ))
+    c.record( (1,2), False)
+    self.assertEqual((False, [1,2]), c.lookup( (2,1) ))
+    self.assertEqual(None, c.lookup( (1,) ))
+    c.record( (1,2), True)
+    self.assertEqual((True, [1,2]), c.lookup( (1,2) ))
+
+  def test_failures_downward_closed(self):
+    c = LatticeOutcomeCache(reproductions_upward_closed=False)
+    c.record( (1,2,3,4), False)
+    c.record( (5,6), False)
+    self.assertEqual((False, [1,2,3,4]), c.lookup( (2,4) ))
+    self.assertEqual((False, [5,6]), c.lookup( (6,) ))
+    self.assertEqual(None, c.lookup( (4,5) ))
+    self.assertEqual(None, c.lookup( (1,7) ))
+
+  def test_reproductions_upward_closed(self):
+    c = LatticeOutcomeCache(failures_downward_closed=False)
+    c.record( (2,3), True)
+    c.record( (1,2,3,4), False)
+    self.assertEqual((True, [2,3]), c.lookup( (1,2,3) ))
+    self.assertEqual((True, [2,3]), c.lookup( (2,3,7) ))
+    self.assertEqual(None, c.lookup( (1,2) ))
+    self.assertEqual(None, c.lookup( (3,) ))
+
+  def test_conflict(self):
+    c = LatticeOutcomeCache()
+    c.record( (1,), True)
+    c.record( (1,2,3), False)
+    # Implied to reproduce by (1,), and not to by (1,2,3)
+    self.assertEqual(None, c.lookup( (1,2) ))
+
+  def test_many_sets(self):
+    c = LatticeOutcomeCache()
+    for i in range(0, 2000):
+      c.record( (i, i+1), False)
+    self.assertEqual(2000, len(c))
+    self.assertEqual((False, [1500,1501]), c.lookup( (1501,) ))
+    self.assertEqual(None, c.lookup( (1500,1502) ))
+
+  def test_matches_scan(self):
+    # Check lookups against a scan over every recorded set
+    rng = random.Random(7)
+    c = LatticeOutcomeCache()
+    recorded = []
+    for _ in range(300):
+      inputs = tuple(rng.sample(range(40), rng.randint(0, 8)))
+      reproduced = rng.random() < 0.3
+      c.record(inputs, reproduced)
+      recorded.append((frozenset(inputs), reproduced))
+    for _ in range(500):
+      query = frozenset(rng.sample(range(45), rng.randint(0, 20)))
+      implied = set()
+      exact = [ r for (inputs, r) in recorded if inputs == query ]
+      if exact:
+        implied.add(max(exact))
+      else:
+        for (inputs, reproduced) in recorded:
+          if not reproduced and query <= inputs:
+            implied.add(False)
+          if reproduced and inputs <= query:
+            implied.add(True)
+      result = c.lookup(tuple(query))
+      if len(implied) != 1:
+        self.assertEqual(None, result)
+        continue
+      (reproduced, inputs) = result
+      self.assertEqual(implied.pop(), reproduced)
+      if reproduced:
+        self.assertTrue(set(inputs) <= query)
+      else:
+        self.assertTrue(query <= set(inputs))
+
+  def test_empty_reproduces(self):
+    c = LatticeOutcomeCache()
+    c.record( (1,2), True)
+    c.record( (), True)
+    self.assertEqual((True, []), c.lookup( (3,) ))
+
+class shared_replay_memo_test(unittest.TestCase):
+  def test_outcome(self):
+    m = SharedReplayMemo()
+    self.assertEqual(None, m.outcome( (1,2), "a", 0))
+    m.record( (1,2), ["a", "b"])
+    m.record( (2,1), [])
+    self.assertEqual(2, m.replays( (1,2) ))
+    self.assertEqual(True, m.outcome( (2,1), "b", 0))
+    self.assertEqual(False, m.outcome( (1,2), "c", 0))
+    self.assertEqual(False, m.outcome( (1,2), "a", 1))
+    self.assertEqual(None, m.outcome( (1,2), "a", 2))
+
+  def test_incomplete(self):
+    m = SharedReplayMemo()
+    m.record( (1,2), ["a"], complete=False)
+    self.assertEqual(True, m.outcome( (1,2), "a", 0))
+    self.assertEqual(None, m.outcome( (1,2), "b", 0))
+
+class replay_outcome_cache_test(unittest.TestCase):
+  def setUp(self):
+    self.tmp_dir = tempfile.mkdtemp()
+    self.path = os.path.join(self.tmp_dir, "replay_outcomes")
+
+  def tearDown(self):
+    shutil.rmtree(self.tmp_dir)
+
+  def test_lookup(self):
+    c = ReplayOutcomeCache(self.path)
+    key = ReplayOutcomeCache.make_key("trace", "config", "check", ["e2", "e1"])
+    self.assertEqual(None, c.lookup(key, "violation"))
+    c.record(key, True, "violation")
+    self.assertTrue(c.lookup(key, "violation"))
+    # Label order doesn't matter
+    key = ReplayOutcomeCache.make_key("trace", "config", "check", ["e1", "e2"])
+    self.assertTrue(c.lookup(key, "violation"))
+    self.assertEqual(None, c.lookup(key, "other violation"))
+    other = ReplayOutcomeCache.make_key("trace", "config2", "check", ["e1", "e2"])
+    self.assertEqual(None, c.lookup(other, "violation"))
+
+  def test_verification_runs(self):
+    c = ReplayOutcomeCache(self.path)
+    key = ReplayOutcomeCache.make_key("trace", "config", "check", ["e1"])
+    c.record(key, False, "violation", verification_runs=2)
+    self.assertFalse(c.lookup(key, "violation", verification_runs=2))
+    self.assertFalse(c.lookup(key, "violation", verification_runs=1))
+    # Not enough evidence
+    self.assertEqual(None, c.lookup(key, "violation", verification_runs=3))
+
+  def test_shared(self):
+    writer = ReplayOutcomeCache(self.path)
+    reader = ReplayOutcomeCache(self.path)
+    key = ReplayOutcomeCache.make_key("trace", "config", "check", ["e1"])
+    self.assertEqual(None, reader.lookup(key, "violation"))
+    writer.record(key, False, "violation")
+    self.assertFalse(reader.lookup(key, "violation"))
+
+  def test_truncated_append(self):
+    c = ReplayOutcomeCache(self.path)
+    key1 = ReplayOutcomeCache.make_key("trace", "config", "check", ["e1"])
+    key2 = ReplayOutcomeCache.make_key("trace", "config", "check", ["e2"])
+    c.record(key1, True, "violation")
+    # Simulate a writer that crashed halfway through an append
+    with open(self.path, "a") as f:
+      f.write('{"config_hash": "con')
+    c.record(key2, True, "violation")
+    c = ReplayOutcomeCache(self.path)
+    self.assertTrue(c.lookup(key1, "violation"))
+    self.assertTrue(c.lookup(key2, "violation"))
+    self.assertEqual(2, len(c.entries()))
+
+  def test_prune(self):
+    c = ReplayOutcomeCache(self.path)
+    key1 = ReplayOutcomeCache.make_key("trace1", "config", "check", ["e1"])
+    key2 = ReplayOutcomeCache.make_key("trace2", "config", "check", ["e1"])
+    c.record(key1, True, "violation")
+    c.record(key2, True, "violation")
+    other = ReplayOutcomeCache(self.path)
+    self.assertTrue(other.lookup(key1, "violation"))
+    self.assertEqual(1, c.prune(lambda e: e['trace_hash'] == "trace1"))
+    self.assertEqual(None, other.lookup(key1, "violation"))
+    self.assertTrue(other.lookup(key2, "violation"))
@@ -0,0 +1,293 @@
+# Copyright 2011-2013 Colin Scott
+# Copyright 2011-2013 Andreas Wundsam
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+import sys
+import os
+import signal
+import subprocess
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(__file__) + "/../../..")
+
+from sts.util.rpc_forker import *
+from sts.util.convenience import find_port
+
+sts_root = os.path.abspath(os.path.dirname(__file__) + "/../../../..")
+# Where workers find our tasks, even when we are run as __main__
+test_module = "tests.unit.sts.util.rpc_forker_test"
+
+# Tasks are looked up by name on the workers, so they must live at module level.
+def add(a, b):
+  return a + b
+
+def sleep_then_return(seconds, value):
+  time.sleep(seconds)
+  return value
+
+def raise_error():
+  raise RuntimeError("expected failure")
+
+def return_ports(ports):
+  return ports
+
+class LocalForkerTest(unittest.TestCase):
+  def setUp(self):
+    self.forker = LocalForker()
+    self.forker.register_task("sleep_then_return", sleep_then_return)
+    self.marker = tempfile.mktemp()
+    def sleep_then_clean_up(seconds, value):
+      try:
+        time.sleep(seconds)
+        return value
+      finally:
+        open(self.marker + value, "w").close()
+    self.forker.register_task("sleep_then_clean_up", sleep_then_clean_up)
+
+  def tearDown(self):
+    for value in ("fast", "slow"):
+      if os.path.exists(self.marker + value):
+        os.remove(self.marker + value)
+
+  def fork_parallel(self, *args, **kws):
+    try:
+      return self.forker.fork_parallel(*args, **kws)
+    except SystemExit:
+      # We are one of the children. Don't go on to run the rest of the tests.
+      os._exit(0)
+
+  def test_fork_parallel_cutoff(self):
+    results = self.fork_parallel("sleep_then_return",
+                                 [ (0, 0), (0.5, 1), (30, 2) ],
+                                 max_parallel=3,
+                                 cutoff=lambda i, r: r == 0)
+    self.assertEqual([0, None, None], results)
+
+  def test_cancelled_child_cleans_up(self):
+    results = self.fork_parallel("sleep_then_clean_up",
+                                 [ (1, "fast"), (30, "slow") ],
+                                 max_parallel=2,
+                                 cutoff=lambda i, r: r == "fast")
+    self.assertEqual(["fast", None], results)
+    # The killed child still ran its finally clause
+    self.assertTrue(os.path.exists(self.marker + "slow"))
+
+class RemoteForkerTest(unittest.TestCase):
+  def setUp(self):
+    self.forker = RemoteForker(address="localhost",
+                               port=find_port(xrange(7600, 7700)),
+                               heartbeat_interval_seconds=0.5,
+                               heartbeat_timeout_seconds=2)
+    self.forker.register_task("add", add)
+    self.forker.register_task("sleep_then_return", sleep_then_return)
+    self.forker.register_task("raise_error", raise_error)
+    self.forker.start()
+    self.workers = []
+
+  def tearDown(self):
+    for worker in self.workers:
+      self.kill_worker(worker)
+    self.forker._server.shutdown()
+    self.forker._server.server_close()
+
+  def start_worker(self, slots=1, tasks=("add", "sleep_then_return", "raise_error")):
+    # Each worker gets its own process group, so that we can kill it along
+    # with its replays.
+    task_args = []
+    for task_name in tasks:
+      task_args += ["-t", "%s=%s.%s" % (task_name, test_module, task_name)]
+    worker = subprocess.Popen([sys.executable, "replay_worker.py",
+                               "-f", "localhost:%d" % self.forker.port,
+                               "-a", "localhost", "-A", "localhost",
+                               "-s", str(slots)] + task_args,
+                              cwd=sts_root, preexec_fn=os.setsid)
+    self.workers.append(worker)
+    return worker
+
+  def kill_worker(self, worker):
+    if worker.poll() is None:
+      os.killpg(worker.pid, signal.SIGKILL)
+      worker.wait()
+
+  def test_register_closure(self):
+    self.assertRaises(ValueError, self.forker.register_task, "closure",
+                      lambda: 1)
+
+  def test_fork(self):
+    self.start_worker()
+    self.assertTrue(self.forker.wait_for_workers(1, timeout_seconds=30))
+    self.assertEqual(3, self.forker.fork("add", 1, 2))
+
+  def test_fork_error(self):
+    self.start_worker()
+    self.assertTrue(self.forker.wait_for_workers(1, timeout_seconds=30))
+    self.assertRaises(ReplayException, self.forker.fork, "raise_error")
+
+  def test_unregistered_task(self):
+    # Workers only run what they registered themselves
+    self.start_worker(tasks=("add",))
+    self.assertTrue(self.forker.wait_for_workers(1, timeout_seconds=30))
+    self.assertRaises(ReplayException, self.forker.fork, "raise_error")
+    self.assertEqual(3, self.forker.fork("add", 1, 2))
+
+  def test_ports_picked_by_worker(self):
+    self.forker.register_task("return_ports", return_ports)
+    self.start_worker(slots=2, tasks=("return_ports",))
+    self.assertTrue(self.forker.wait_for_workers(1, timeout_seconds=30))
+    results = self.forker.fork_parallel("return_ports", [(), ()],
+                                        max_parallel=2, ports_per_child=2)
+    ports = results[0] + results[1]
+    self.assertEqual(4, len(set(ports)))
+
+  def test_non_loopback_requires_secret(self):
+    self.assertRaises(ValueError, RemoteForker, address="0.0.0.0")
+    self.assertRaises(ValueError, RemoteWorker, "localhost", self.forker.port,
+                      address="0.0.0.0", secret="s3cret")
+    self.assertRaises(ValueError, RemoteWorker, "localhost", self.forker.port,
+                      address="0.0.0.0", allow_remote=True)
+
+  def test_wrong_secret(self):
+    forker = RemoteForker(address="localhost",
+                          port=find_port(xrange(7700, 7800)), secret="s3cret")
+    forker.start()
+    try:
+      url = "http://localhost:%d/wrong/" % forker.port
+      self.assertRaises(xmlrpclib.ProtocolError,
+                        xmlrpclib.ServerProxy(url).heartbeat, "x")
+      url = "http://localhost:%d/s3cret/" % forker.port
+      self.assertFalse(xmlrpclib.ServerProxy(url).heartbeat("x"))
+    finally:
+      forker._server.shutdown()
+      forker._server.server_close()
+
+  def test_fork_parallel_multiple_workers(self):
+    for _ in range(3):
+      self.start_worker(slots=2)
+    self.assertTrue(self.forker.wait_for_workers(3, timeout_seconds=30))
+    args_list = [ (1, i) for i in range(6) ]
+    start = time.time()
+    results = self.forker.fork_parallel("sleep_then_return", args_list,
+                                        max_parallel=6)
+    self.assertEqual(range(6), results)
+    # All six ran at once
+    self.assertTrue(time.time() - start < 5.5)
+
+  def test_fork_parallel_cutoff(self):
+    self.start_worker(slots=3)
+    self.assertTrue(self.forker.wait_for_workers(1, timeout_seconds=30))
+    args_list = [ (3, "slow"), (0, "fast"), (3, "slow") ]
+    results = self.forker.fork_parallel("sleep_then_return", args_list,
+                                        max_parallel=3,
+                                        cutoff=lambda i, r: r == "fast")
+    self.assertEqual(["slow", "fast", None], results)
+
+  def test_reassign_from_dead_worker(self):
+    doomed = self.start_worker()
+    self.assertTrue(self.forker.wait_for_workers(1, timeout_seconds=30))
+    self.start_worker()
+    self.assertTrue(self.forker.wait_for_workers(2, timeout_seconds=30))
+    results = []
+    def fork():
+      results.append(self.forker.fork_parallel("sleep_then_return",
+                                               [ (3, 0), (3, 1) ],
+                                               max_parallel=2))
+    thread = threading.Thread(target=fork)
+    thread.start()
+    # Both jobs are running by now; take one worker (and its replay) down.
+    time.sleep(1)
+    self.kill_worker(doomed)
+    thread.join(60)
+    self.assertEqual([[0, 1]], results)
+
+def task_pid():
+  return os.getpid()
+
+class ZygoteForkerTest(unittest.TestCase):
+  def setUp(self):
+    self.forker = ZygoteForker(zygotes=2)
+    self.forker.register_task("add", add)
+    self.forker.register_task("sleep_then_return", sleep_then_return)
+    self.forker.register_task("raise_error", raise_error)
+    self.forker.register_task("task_pid", task_pid)
+
+  def tearDown(self):
+    self.forker.shutdown()
+
+  def test_register_closure(self):
+    self.assertRaises(ValueError, self.forker.register_task, "closure",
+                      lambda: 1)
+
+  def test_fork(self):
+    self.assertEqual(3, self.forker.fork("add", 1, 2))
+    # Every job runs in a fresh process
+    pids = [ self.forker.fork("task_pid") for _ in range(3) ]
+    self.assertEqual(3, len(set(pids)))
+    self.assertTrue(os.getpid() not in pids)
+
+  def test_fork_error(self):
+    self.assertRaises(ReplayException, self.forker.fork, "raise_error")
+    # The zygotes survive failed jobs
+    self.assertEqual(5, self.forker.fork("add", 2, 3))
+
+  def test_fork_parallel(self):
+    durations = [None] * 4
+    start = time.time()
+    results = self.forker.fork_parallel("sleep_then_return",
+                                        [ (1, i) for i in range(4) ],
+                                        max_parallel=4, durations=durations)
+    self.assertEqual(range(4), results)
+    self.assertTrue(time.time() - start < 3)
+    self.assertTrue(all(d is not None for d in durations))
+
+  def test_fork_parallel_cutoff(self):
+    start = time.time()
+    results = self.forker.fork_parallel("sleep_then_return",
+                                        [ (0, 0), (0.5, 1), (30, 2), (0, 3) ],
+                                        max_parallel=3,
+                                        cutoff=lambda i, r: r == 1)
+    self.assertEqual([0, 1, None, None], results)
+    self.assertTrue(time.time() - start < 10)
+    # Cancelled jobs don't confuse later ones
+    self.assertEqual(7, self.forker.fork("add", 3, 4))
+
+  def test_zygote_died(self):
+    self.forker.start()
+    dead = [ z.pid for z in self.forker._zygotes ]
+    for pid in dead:
+      os.kill(pid, signal.SIGKILL)
+    # Dead zygotes are replaced
+    self.assertEqual(3, self.forker.fork("add", 1, 2))
+    self.assertEqual(2, len(self.forker._zygotes))
+    self.assertEqual([], [ z for z in self.forker._zygotes if z.pid in dead ])
+
+  def test_zygote_died_while_running(self):
+    self.forker.start()
+    results = []
+    def fork():
+      results.append(self.forker.fork_parallel("sleep_then_return",
+                                               [ (2, 0), (2, 1) ],
+                                               max_parallel=2))
+    thread = threading.Thread(target=fork)
+    thread.start()
+    # Both jobs are running by now; take one zygote (and its job) down.
+    time.sleep(1)
+    os.kill(self.forker._zygotes[0].pid, signal.SIGKILL)
+    thread.join(60)
+    # Its job was run again
+    self.assertEqual([[0, 1]], results)
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,62 @@
+# Copyright 2011-2013 Colin Scott
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+import sys
+import os
+
+sys.path.append(os.path.dirname(__file__) + "/../../..")
+
+from sts.util.sequential_testing import SPRT, ReproductionEstimator
+
+class SPRTTest(unittest.TestCase):
+  def test_success_is_conclusive_with_zero_p0(self):
+    sprt = SPRT(0.0, 0.5)
+    self.assertEqual(True, sprt.decide(1, 10))
+    self.assertEqual(None, sprt.decide(0, 1))
+
+  def test_failures_needed_scale_with_p1(self):
+    def failures_needed(p1):
+      sprt = SPRT(0.0, p1, alpha=0.05, beta=0.05)
+      failures = 0
+      while sprt.decide(0, failures) is None:
+        failures += 1
+      return failures
+    self.assertEqual(1, failures_needed(0.99))
+    self.assertEqual(5, failures_needed(0.5))
+    self.assertTrue(failures_needed(0.1) > failures_needed(0.5))
+
+  def test_nonzero_p0(self):
+    sprt = SPRT(0.1, 0.5)
+    self.assertEqual(None, sprt.decide(1, 1))
+    self.assertEqual(True, sprt.decide(5, 0))
+    self.assertEqual(False, sprt.decide(0, 6))
+
+  def test_bad_parameters(self):
+    self.assertRaises(ValueError, SPRT, 0.5, 0.5)
+    self.assertRaises(ValueError, SPRT, 0.0, 1.0)
+    self.assertRaises(ValueError, SPRT, 0.0, 0.5, 0.0)
+
+class ReproductionEstimatorTest(unittest.TestCase):
+  def test_estimate(self):
+    estimator = ReproductionEstimator()
+    self.assertEqual(0.5, estimator.probability)
+    estimator.observe(1, 1)
+    estimator.observe(1, 1)
+    self.assertEqual(0.75, estimator.probability)
+    estimator.observe(1, 8)
+    self.assertAlmostEqual(1/3.0, estimator.probability)
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,90 @@
+# Copyright 2011-2013 Colin Scott
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+import sys
+import os
+import time
+import types
+
+sys.path.append(os.path.dirname(__file__) + "/../../../..")
+
+from sts.util.virtual_clock import *
+from sts.syncproto.base import SyncTime
+
+class VirtualClockTest(unittest.TestCase):
+  def test_timers(self):
+    clock = VirtualClock(100)
+    fired = []
+    clock.call_at(103, lambda now: fired.append(("at", now)))
+    clock.call_every(2, lambda now: fired.append(("every", now)))
+    cancelled = clock.call_later(1, lambda now: fired.append(("cancelled", now)))
+    clock.cancel(cancelled)
+    self.assertEqual(102, clock.next_deadline())
+    clock.advance(4)
+    self.assertEqual([("every", 102), ("at", 103), ("every", 104)], fired)
+    self.assertEqual(104, clock.now())
+    # Timers in the past are never run; the clock doesn't go backwards
+    clock.advance_to(50)
+    self.assertEqual(104, clock.now())
+    self.assertRaises(ValueError, clock.advance, -1)
+
+  def test_periodic(self):
+    clock = VirtualClock(0)
+    fired = []
+    clock.call_every(1, fired.append)
+    clock.advance(3600)
+    self.assertEqual(range(1, 3601), fired)
+    clock.call_every(1800, fired.append)
+    del fired[:]
+    clock.advance(1800.5)
+    self.assertEqual(1800 + 1, len(fired))
+    # Same deadline: first registered runs first
+    self.assertEqual([5399, 5400, 5400], fired[-3:])
+
+  def test_small_steps(self):
+    clock = VirtualClock(0)
+    for _ in xrange(1000):
+      clock.advance(0.001)
+    self.assertEqual(1000000, clock.now_micros())
+
+  def test_never_backwards(self):
+    clock = VirtualClock(1000)
+    fired = []
+    clock.call_later(5, fired.append)
+    clock.advance_to(900)
+    self.assertEqual(1000, clock.now())
+    self.assertRaises(ValueError, clock.advance, -1)
+    clock.advance(5)
+    self.assertEqual([1005], fired)
+
+  def test_install(self):
+    clock = VirtualClock(1234.5)
+    module = types.ModuleType("timer_module")
+    module.time = time
+    install_clock(clock)
+    try:
+      clock.patch_time_module(module)
+      self.assertTrue(installed_clock() is clock)
+      self.assertEqual(SyncTime(1234, 500000), SyncTime.now())
+      self.assertEqual(1234.5, module.time.time())
+      self.assertTrue(module.time.sleep is time.sleep)
+    finally:
+      uninstall_clock()
+    self.assertTrue(installed_clock() is None)
+    self.assertTrue(module.time is time)
+    self.assertTrue(SyncTime.now().seconds > 1234)
+
+if __name__ == '__main__':
+  unittest.main()
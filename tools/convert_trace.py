@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+#
+# Copyright 2011-2013 Colin Scott
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Convert an event trace between the json superlog format and the indexed
+# binary format (sts/input_traces/binary_trace.py). The direction is picked
+# from the format of the input. json superlogs may be compressed (see
+# sts/util/compression.py); --codec compresses the json output.
+
+import argparse
+import itertools
+import json
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+from sts.input_traces.binary_trace import BinaryTrace, BinaryTraceWriter, is_binary_trace
+from sts.util.compression import open_trace_file
+
+def json_hashes(path):
+  if is_binary_trace(path):
+    with BinaryTrace(path) as trace:
+      for json_hash in trace.json_hashes():
+        yield json_hash
+  else:
+    with open_trace_file(path) as superlog:
+      for line in superlog:
+        if line.strip() != "":
+          yield json.loads(line)
+
+def to_binary(input_path, output_path):
+  writer = BinaryTraceWriter(output_path)
+  try:
+    for json_hash in json_hashes(input_path):
+      writer.write_json_hash(json_hash)
+  finally:
+    writer.close()
+
+def to_json(input_path, output_path, codec=None):
+  with open_trace_file(output_path, 'w', codec=codec) as output:
+    for json_hash in json_hashes(input_path):
+      output.write(json.dumps(json_hash) + '\n')
+
+def verify(input_path, output_path):
+  ''' Check that both traces hold the same json hashes, in the same order '''
+  count = 0
+  for count, (original, converted) in enumerate(
+        itertools.izip_longest(json_hashes(input_path), json_hashes(output_path)), 1):
+    if original != converted:
+      raise ValueError("Record %d differs: %s vs. %s" % (count, original, converted))
+  return count
+
+def main(args):
+  # With --codec, json superlogs are (re)compressed rather than converted
+  json_output = is_binary_trace(args.input) or args.codec is not None
+  if json_output:
+    to_json(args.input, args.output, codec=args.codec)
+  else:
+    to_binary(args.input, args.output)
+  print "Wrote %s trace %s" % ("json" if json_output else "binary", args.output)
+  if args.verify:
+    print "Verified %d records" % verify(args.input, args.output)
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(description="Convert between json and binary traces")
+  parser.add_argument('input', metavar="INPUT",
+                      help='The trace to convert')
+  parser.add_argument('output', metavar="OUTPUT",
+                      help='Where to write the converted trace')
+  parser.add_argument('-c', '--codec', default=None,
+                      help='Compress json output with this codec (e.g. zlib)')
+  parser.add_argument('-v', '--verify', action="store_true", default=False,
+                      help='Re-read both traces and check that they match')
+  main(parser.parse_args())
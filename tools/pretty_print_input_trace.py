@@ -11,7 +11,7 @@ sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
 
 import sts.replay_event as replay_events
 from sts.dataplane_traces.trace import Trace
-from sts.input_traces.log_parser import parse
+from sts.input_traces.log_parser import iter_parse_path
 
 default_fields = ['class_with_label', 'fingerprint', 'event_delimiter']
 default_filtered_classes = set()
@@ -145,15 +145,13 @@ def main(args):
   # all events are printed with a fixed number of lines, and (optionally)
   # separated by delimiter lines of the form:
   # ----------------------------------
-  with open(args.input) as input_file:
-    trace = parse(input_file)
-    for event in trace:
-      if type(event) not in filtered_classes:
-        if dp_trace is not None and type(event) == replay_events.TrafficInjection:
-          event.dp_event = dp_trace.pop(0)
-        for field in fields:
-          field_formatters[field](event)
-        stats.update(event)
+  for event in iter_parse_path(args.input):
+    if type(event) not in filtered_classes:
+      if dp_trace is not None and type(event) == replay_events.TrafficInjection:
+        event.dp_event = dp_trace.pop(0)
+      for field in fields:
+        field_formatters[field](event)
+      stats.update(event)
 
   if args.stats:
     print "Stats: %s" % stats
@@ -161,7 +159,7 @@ def main(args):
 if __name__ == '__main__':
   parser = argparse.ArgumentParser()
   parser.add_argument('input', metavar="INPUT",
-                      help='The input json file to be printed')
+                      help='The input trace (json or binary) to be printed')
   parser.add_argument('-f', '--format-file',
                       help=str('''The output format configuration file.'''
   ''' ----- config file format: ----'''
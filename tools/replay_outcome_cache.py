@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+#
+# Copyright 2011-2013 Colin Scott
+# Copyright 2011-2013 Andreas Wundsam
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Inspect or prune a replay outcome cache, as written by MCSFinder's
+# replay_outcome_cache_path option.
+
+import argparse
+import os
+import sys
+import time
+from collections import Counter
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+from sts.util.precompute_cache import ReplayOutcomeCache, hash_file
+
+def show(cache, args):
+  entries = [ e for e in cache.entries() if matches(e, args) ]
+  groups = Counter((e['trace_hash'], e['config_hash'], e['invariant'])
+                   for e in entries)
+  print "%d entries" % len(entries)
+  for (trace_hash, config_hash, invariant), count in sorted(groups.items()):
+    group = [ e for e in entries if (e['trace_hash'], e['config_hash'],
+                                     e['invariant']) == (trace_hash, config_hash, invariant) ]
+    reproduced = len([ e for e in group if e['reproduced'] ])
+    print ("trace %s config %s invariant %s: %d entries (%d reproduced)" %
+           (trace_hash[:12], config_hash[:12], invariant, count, reproduced))
+    if args.verbose:
+      for e in group:
+        print "  %s %-14s runs=%d signature=%s inputs=%s" % \
+              (time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(e['time'])),
+               "reproduced" if e['reproduced'] else "not reproduced",
+               e['verification_runs'], e['signature'], " ".join(e['inputs']))
+
+def prune(cache, args):
+  removed = cache.prune(lambda e: matches(e, args))
+  print "Removed %d entries" % removed
+
+def matches(entry, args):
+  if args.trace_hash is not None and not entry['trace_hash'].startswith(args.trace_hash):
+    return False
+  if args.config_hash is not None and not entry['config_hash'].startswith(args.config_hash):
+    return False
+  if args.invariant is not None and entry['invariant'] != args.invariant:
+    return False
+  if args.older_than_days is not None and \
+     time.time() - entry['time'] < args.older_than_days * 24 * 3600:
+    return False
+  if args.not_reproduced and entry['reproduced']:
+    return False
+  return True
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(description="Inspect or prune a replay outcome cache")
+  parser.add_argument('command', choices=['show', 'prune'])
+  parser.add_argument('cache', metavar="CACHE_FILE",
+                      help='''path to the replay outcome cache''')
+  parser.add_argument('-t', '--trace-hash', dest="trace_hash", default=None,
+                      help='''only entries whose trace hash starts with this''')
+  parser.add_argument('-T', '--trace', default=None,
+                      help='''only entries for this superlog''')
+  parser.add_argument('-c', '--config-hash', dest="config_hash", default=None,
+                      help='''only entries whose config hash starts with this''')
+  parser.add_argument('-i', '--invariant', default=None,
+                      help='''only entries for this invariant check''')
+  parser.add_argument('-o', '--older-than-days', dest="older_than_days",
+                      type=float, default=None,
+                      help='''only entries older than this many days''')
+  parser.add_argument('-n', '--not-reproduced', dest="not_reproduced",
+                      action="store_true", default=False,
+                      help='''only entries that did not reproduce the violation''')
+  parser.add_argument('-v', '--verbose', action="store_true", default=False,
+                      help='''show individual entries''')
+  args = parser.parse_args()
+
+  if args.trace is not None:
+    args.trace_hash = hash_file(args.trace)
+  if not os.path.exists(args.cache):
+    print >> sys.stderr, "No such cache: %s" % args.cache
+    sys.exit(1)
+
+  cache = ReplayOutcomeCache(args.cache)
+  if args.command == "show":
+    show(cache, args)
+  else:
+    if all(getattr(args, f) is None for f in ['trace_hash', 'config_hash',
+                                              'invariant', 'older_than_days']) \
+       and not args.not_reproduced:
+      print >> sys.stderr, "Refusing to prune everything. Remove the file instead."
+      sys.exit(1)
+    prune(cache, args)
@@ -11,7 +11,7 @@ sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
 
 from sts.replay_event import *
 from sts.dataplane_traces.trace import Trace
-from sts.input_traces.log_parser import parse
+from sts.input_traces.log_parser import iter_parse_path
 from tools.pretty_print_input_trace import default_fields, field_formatters
 
 class EventGrouping(object):
@@ -56,11 +56,11 @@ def main(args):
     # TODO(cs): support TrafficInjection, DataplaneDrop? Might get too noisy.
   }
 
-  with open(args.input) as input_file:
-    trace = parse(input_file)
-    for event in trace:
-      if type(event) in event2grouping:
-        event2grouping[type(event)].append(event)
+  trace = iter_parse_path(args.input,
+                          event_classes=set(klass.__name__ for klass in event2grouping))
+  for event in trace:
+    if type(event) in event2grouping:
+      event2grouping[type(event)].append(event)
 
   for grouping in [network_failure_events, controlplane_failure_events,
                    controller_failure_events, host_events]:
@@ -70,7 +70,7 @@ def main(args):
 if __name__ == '__main__':
   parser = argparse.ArgumentParser()
   parser.add_argument('input', metavar="INPUT",
-                      help='The input json file to be printed')
+                      help='The input trace (json or binary) to be printed')
   args = parser.parse_args()
 
   main(args)
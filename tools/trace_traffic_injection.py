@@ -8,6 +8,7 @@
 
 import time
 import argparse
+import itertools
 import os
 import sys
 
@@ -18,7 +19,8 @@ from pox.openflow.libopenflow_01 import *
 from pox.lib.packet.ethernet import *
 import sts.replay_event as replay_events
 from sts.dataplane_traces.trace import Trace
-from sts.input_traces.log_parser import parse
+from sts.input_traces.log_parser import iter_parse_path, build_event
+from sts.input_traces.binary_trace import BinaryTrace, is_binary_trace
 from sts.fingerprints.messages import DPFingerprint
 from tools.pretty_print_input_trace import field_formatters, default_fields
 
@@ -60,28 +62,33 @@ dp_class_to_filter = {
 }
 
 def main(args):
-  with open(args.input) as input_file:
-    trace = parse(input_file)
-    # TODO(cs): binary search instead of linear?
-    while len(trace) > 0 and trace[0].label_id < args.ti_id:
-      trace.pop(0)
-
-    ti_event = trace[0]
-    if type(ti_event) != replay_events.TrafficInjection:
-      raise ValueError("Event %s with is not a TrafficInjection" % str(ti_event))
-
-    pkt_fingerprint = DPFingerprint.from_pkt(ti_event.dp_event.packet)
-
-    for event in trace:
-      t = type(event)
-      if t in dp_class_to_filter and dp_class_to_filter[t](event, pkt_fingerprint):
-        for field in default_fields:
-          field_formatters[field](event)
+  if is_binary_trace(args.input):
+    # Seek straight to the traffic injection
+    binary_trace = BinaryTrace(args.input)
+    start = binary_trace.index_of_label("e%d" % args.ti_id)
+    if start is None:
+      raise ValueError("No event labeled e%d" % args.ti_id)
+    trace = (build_event(h) for h in binary_trace.json_hashes(start))
+  else:
+    trace = itertools.dropwhile(lambda e: e.label_id < args.ti_id,
+                                iter_parse_path(args.input))
+
+  ti_event = next(trace)
+  if type(ti_event) != replay_events.TrafficInjection:
+    raise ValueError("Event %s with is not a TrafficInjection" % str(ti_event))
+
+  pkt_fingerprint = DPFingerprint.from_pkt(ti_event.dp_event.packet)
+
+  for event in itertools.chain([ti_event], trace):
+    t = type(event)
+    if t in dp_class_to_filter and dp_class_to_filter[t](event, pkt_fingerprint):
+      for field in default_fields:
+        field_formatters[field](event)
 
 if __name__ == '__main__':
   parser = argparse.ArgumentParser()
   parser.add_argument('input', metavar="INPUT",
-                      help='The input json file to be printed')
+                      help='The input trace (json or binary) to be printed')
   parser.add_argument('ti_id', metavar="TRAFFIC_INJECTION_ID",
                       help='The event number of the traffic injection event to trace')
   args = parser.parse_args()